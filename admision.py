@@ -0,0 +1,140 @@
+"""Control de admisión para los caminos que llaman al modelo de lenguaje.
+
+Dos barreras independientes:
+
+- por usuario: un cubo de fichas por usuario y tipo de acción (consultas al
+  modelo, pulsaciones de botones), de modo que un solo chat no pueda
+  acaparar la cuota;
+- global: un máximo de llamadas en curso y una cola de espera acotada. Si la
+  cola está llena, o la espera supera ``espera_max``, la petición se rechaza
+  enseguida para que el bot responda con contenido local en lugar de agotar
+  el plazo del modelo.
+
+Cada decisión se contabiliza en ``estadisticas``.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from ia import IA_MAX_CONCURRENCIA
+from limitador import CuboTokens
+
+ADMISION_MAX_EN_CURSO = int(os.getenv('ADMISION_MAX_EN_CURSO', str(IA_MAX_CONCURRENCIA)))
+ADMISION_MAX_EN_ESPERA = int(os.getenv('ADMISION_MAX_EN_ESPERA', '32'))
+ADMISION_ESPERA_MAX = float(os.getenv('ADMISION_ESPERA_MAX', '5'))
+
+# Límites por usuario: (fichas por segundo, ráfaga máxima)
+LIMITES_USUARIO = {
+    'ia': (
+        float(os.getenv('ADMISION_TASA_USUARIO', '0.1')),
+        float(os.getenv('ADMISION_RAFAGA_USUARIO', '3')),
+    ),
+    'boton': (
+        float(os.getenv('ADMISION_TASA_BOTONES', '1')),
+        float(os.getenv('ADMISION_RAFAGA_BOTONES', '5')),
+    ),
+}
+# Cubos por usuario que se mantienen en memoria (los menos recientes se descartan)
+ADMISION_MAX_USUARIOS = int(os.getenv('ADMISION_MAX_USUARIOS', '10000'))
+
+
+class ControlAdmision:
+    """Limita la tasa por usuario y la concurrencia global hacia el modelo."""
+
+    def __init__(
+        self,
+        max_en_curso: int = ADMISION_MAX_EN_CURSO,
+        max_en_espera: int = ADMISION_MAX_EN_ESPERA,
+        espera_max: float = ADMISION_ESPERA_MAX,
+        limites: dict = None,
+        max_usuarios: int = ADMISION_MAX_USUARIOS,
+    ):
+        self.max_en_curso = max_en_curso
+        self.max_en_espera = max_en_espera
+        self.espera_max = espera_max
+        self.limites = limites or LIMITES_USUARIO
+        self.max_usuarios = max_usuarios
+        self._cubos = OrderedDict()
+        self._semaforo = None
+        self.en_curso = 0
+        self.en_espera = 0
+        self._espera_total = 0.0
+        self.estadisticas = {
+            'admitidas': 0,
+            'limitadas_usuario': 0,
+            'limitadas_botones': 0,
+            'rechazadas_cola_llena': 0,
+            'rechazadas_espera': 0,
+            'max_en_espera': 0,
+        }
+
+    # ----- Límite por usuario -----
+    def permitir(self, user_id, tipo: str = 'ia') -> bool:
+        """Consume una ficha del cubo del usuario; ``False`` si está agotado."""
+        clave = (tipo, user_id)
+        cubo = self._cubos.get(clave)
+        if cubo is None:
+            tasa, rafaga = self.limites[tipo]
+            cubo = self._cubos[clave] = CuboTokens(tasa, rafaga)
+            if len(self._cubos) > self.max_usuarios:
+                self._cubos.popitem(last=False)
+        else:
+            self._cubos.move_to_end(clave)
+        if cubo.intentar():
+            return True
+        self.estadisticas['limitadas_botones' if tipo == 'boton' else 'limitadas_usuario'] += 1
+        return False
+
+    # ----- Límite global -----
+    def _obtener_semaforo(self):
+        # Se crea de forma diferida para que pertenezca al bucle en ejecución
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.max_en_curso)
+        return self._semaforo
+
+    @asynccontextmanager
+    async def turno(self):
+        """Espera un hueco para llamar al modelo; produce ``False`` si se rechaza."""
+        semaforo = self._obtener_semaforo()
+        if semaforo.locked() and self.en_espera >= self.max_en_espera:
+            self.estadisticas['rechazadas_cola_llena'] += 1
+            yield False
+            return
+
+        self.en_espera += 1
+        self.estadisticas['max_en_espera'] = max(self.estadisticas['max_en_espera'], self.en_espera)
+        inicio = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.espera_max):
+                await semaforo.acquire()
+            admitida = True
+        except TimeoutError:
+            admitida = False
+        finally:
+            self.en_espera -= 1
+            self._espera_total += time.perf_counter() - inicio
+
+        if not admitida:
+            self.estadisticas['rechazadas_espera'] += 1
+            yield False
+            return
+        self.estadisticas['admitidas'] += 1
+        self.en_curso += 1
+        try:
+            yield True
+        finally:
+            self.en_curso -= 1
+            semaforo.release()
+
+    def resumen(self) -> dict:
+        e = self.estadisticas
+        decididas = e['admitidas'] + e['rechazadas_cola_llena'] + e['rechazadas_espera']
+        return {
+            **e,
+            'en_curso': self.en_curso,
+            'en_espera': self.en_espera,
+            'usuarios': len(self._cubos),
+            'espera_media_ms': self._espera_total / decididas * 1000 if decididas else 0.0,
+        }
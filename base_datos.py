@@ -0,0 +1,676 @@
+"""Capa de persistencia SQLite del bot.
+
+Una única conexión de larga duración vive en un hilo dedicado: todas las
+operaciones se ejecutan en ese hilo, de modo que el bucle de eventos nunca
+espera a SQLite y no hay competencia entre conexiones por el bloqueo de
+escritura. La base de datos usa WAL con ``synchronous=NORMAL`` y las
+sentencias se reutilizan desde la caché de sentencias preparadas de la
+conexión. El esquema se versiona con ``PRAGMA user_version`` y ``init_db``
+migra en el sitio las bases de datos existentes.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from metricas import BD_SEGUNDOS
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv('DB_PATH', 'sismos_bot.db')
+
+
+class BaseDatos:
+    """Conexión SQLite compartida, accesible solo desde su hilo de trabajo."""
+
+    def __init__(self, ruta: str = DB_PATH):
+        self.ruta = ruta
+        self._hilo = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite')
+        self._conn = None
+
+    def _conexion(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.ruta, cached_statements=256)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=5000')
+            conn.execute('PRAGMA temp_store=MEMORY')
+            self._conn = conn
+        return self._conn
+
+    def _ejecutar(self, funcion, args):
+        inicio = time.perf_counter()
+        try:
+            return funcion(self._conexion(), *args)
+        finally:
+            BD_SEGUNDOS.etiquetas(funcion.__name__).observar(time.perf_counter() - inicio)
+
+    def ejecutar_sync(self, funcion, *args):
+        """Ejecuta ``funcion(conn, *args)`` en el hilo de la base de datos y espera."""
+        return self._hilo.submit(self._ejecutar, funcion, args).result()
+
+    async def ejecutar(self, funcion, *args):
+        """Versión asíncrona de ``ejecutar_sync``: no bloquea el bucle de eventos."""
+        return await asyncio.wrap_future(self._hilo.submit(self._ejecutar, funcion, args))
+
+    def enviar(self, funcion, *args):
+        """Encola ``funcion`` sin esperar su resultado; los errores se registran."""
+        futuro = self._hilo.submit(self._ejecutar, funcion, args)
+        futuro.add_done_callback(_registrar_error)
+        return futuro
+
+    def cerrar(self):
+        def _cerrar(conn):
+            conn.close()
+            self._conn = None
+        if self._conn is not None:
+            self.ejecutar_sync(_cerrar)
+        self._hilo.shutdown(wait=True)
+
+
+class ColaEscritura:
+    """Cola de escritura diferida para los registros de auditoría.
+
+    Las filas de ``consultas`` y ``medios`` no necesitan ser duraderas de
+    inmediato: se agrupan y se escriben con ``executemany`` en una única
+    transacción cada ``max_filas`` filas o cada ``intervalo`` segundos, en el
+    orden en que se encolaron (una actualización nunca adelanta a la
+    inserción de la fila que modifica). La cola está acotada; cuando se
+    llena, ``encolar`` espera (contrapresión).
+    """
+
+    def __init__(self, bd, max_filas=200, intervalo=0.05, capacidad=10000):
+        self.bd = bd
+        self.max_filas = max_filas
+        self.intervalo = intervalo
+        self.capacidad = capacidad
+        self._cola = None
+        self._tarea = None
+        self.estadisticas = {
+            'filas': 0,
+            'lotes': 0,
+            'errores': 0,
+            'esperas': 0,
+            'latencia_ultima_ms': 0.0,
+            'latencia_max_ms': 0.0,
+            'latencia_total_ms': 0.0,
+        }
+
+    def iniciar(self):
+        """Arranca la tarea de volcado en el bucle de eventos actual."""
+        self._cola = asyncio.Queue(self.capacidad)
+        self._tarea = asyncio.create_task(self._bucle(), name='cola_escritura')
+
+    async def detener(self):
+        """Vuelca las filas pendientes y termina la tarea."""
+        if self._tarea is None:
+            return
+        await self._cola.put(None)
+        await self._tarea
+        self._tarea = None
+
+    async def encolar(self, sql, params):
+        if self._tarea is None:
+            # Sin tarea de volcado (p. ej. scripts): escritura directa
+            await self.bd.ejecutar(_escribir_lote, [(sql, [params])])
+            return
+        if self._cola.full():
+            self.estadisticas['esperas'] += 1
+        await self._cola.put((sql, params))
+
+    async def _bucle(self):
+        while True:
+            lote = [await self._cola.get()]
+            if self._cola.qsize() < self.max_filas - 1 and lote[0] is not None:
+                # Dar tiempo a que se acumulen más filas antes de escribir
+                await asyncio.sleep(self.intervalo)
+            while len(lote) < self.max_filas and not self._cola.empty() and lote[-1] is not None:
+                lote.append(self._cola.get_nowait())
+
+            fin = lote[-1] is None
+            filas = [f for f in lote if f is not None]
+            if filas:
+                await self._volcar(filas)
+            if fin:
+                # Lo que quede tras la señal de cierre también se escribe
+                restantes = []
+                while not self._cola.empty():
+                    restantes.append(self._cola.get_nowait())
+                if restantes:
+                    await self._volcar([f for f in restantes if f is not None])
+                return
+
+    async def _volcar(self, filas):
+        # Las filas consecutivas con la misma sentencia van en un executemany
+        grupos = []
+        for sql, params in filas:
+            if grupos and grupos[-1][0] == sql:
+                grupos[-1][1].append(params)
+            else:
+                grupos.append((sql, [params]))
+        inicio = time.perf_counter()
+        try:
+            await self.bd.ejecutar(_escribir_lote, grupos)
+        except Exception as e:
+            self.estadisticas['errores'] += 1
+            logger.error(f"Error al volcar {len(filas)} filas: {e}")
+            return
+        ms = (time.perf_counter() - inicio) * 1000
+        e = self.estadisticas
+        e['filas'] += len(filas)
+        e['lotes'] += 1
+        e['latencia_ultima_ms'] = ms
+        e['latencia_max_ms'] = max(e['latencia_max_ms'], ms)
+        e['latencia_total_ms'] += ms
+
+    def resumen(self) -> dict:
+        e = self.estadisticas
+        return {
+            **e,
+            'profundidad': self._cola.qsize() if self._cola else 0,
+            'latencia_media_ms': e['latencia_total_ms'] / e['lotes'] if e['lotes'] else 0.0,
+        }
+
+
+def _escribir_lote(conn, grupos):
+    with conn:
+        for sql, filas in grupos:
+            conn.executemany(sql, filas)
+
+
+def _registrar_error(futuro):
+    if not futuro.cancelled() and futuro.exception() is not None:
+        logger.error(f"Error en operación de base de datos: {futuro.exception()}")
+
+
+def ahora() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+bd = BaseDatos()
+cola_escritura = ColaEscritura(
+    bd,
+    max_filas=int(os.getenv('DB_LOTE_FILAS', '200')),
+    intervalo=float(os.getenv('DB_LOTE_MS', '50')) / 1000,
+    capacidad=int(os.getenv('DB_COLA_CAPACIDAD', '10000')),
+)
+
+
+# ========== ESQUEMA Y MIGRACIONES ==========
+def _migracion_1(conn):
+    """Esquema original (usuarios, consultas, medios) y caché de respuestas."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS usuarios (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        nombre TEXT NOT NULL,
+        apellidos TEXT NOT NULL,
+        edad INTEGER NOT NULL,
+        sexo TEXT NOT NULL,
+        nivel_academico TEXT NOT NULL,
+        residencia TEXT NOT NULL,
+        email TEXT,
+        recibir_info TEXT NOT NULL,
+        fecha_registro TEXT NOT NULL,
+        UNIQUE(user_id)
+    )''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS consultas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        tipo_consulta TEXT NOT NULL,
+        contenido TEXT NOT NULL,
+        respuesta TEXT NOT NULL,
+        fecha TEXT NOT NULL,
+        FOREIGN KEY(user_id) REFERENCES usuarios(user_id)
+    )''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS medios (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        tipo_medio TEXT NOT NULL,
+        file_id TEXT NOT NULL,
+        fecha TEXT NOT NULL,
+        FOREIGN KEY(user_id) REFERENCES usuarios(user_id)
+    )''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS cache_respuestas (
+        espacio TEXT NOT NULL,
+        clave TEXT NOT NULL,
+        version TEXT NOT NULL,
+        respuesta TEXT NOT NULL,
+        creada REAL NOT NULL,
+        latencia REAL,
+        PRIMARY KEY(espacio, clave)
+    )''')
+
+
+def _migracion_2(conn):
+    """Difusiones de alertas con su punto de control para reanudarlas."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS difusiones (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        mensaje TEXT NOT NULL,
+        estado TEXT NOT NULL,
+        ultimo_user_id INTEGER NOT NULL DEFAULT 0,
+        entregados INTEGER NOT NULL DEFAULT 0,
+        fallidos INTEGER NOT NULL DEFAULT 0,
+        segundos REAL NOT NULL DEFAULT 0,
+        creada TEXT NOT NULL,
+        terminada TEXT
+    )''')
+
+
+def _migracion_3(conn):
+    """Estado persistente de conversaciones y user_data."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS estado_usuarios (
+        user_id INTEGER PRIMARY KEY,
+        datos TEXT NOT NULL,
+        actualizado REAL NOT NULL
+    )''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS estado_conversaciones (
+        nombre TEXT NOT NULL,
+        clave TEXT NOT NULL,
+        estado TEXT NOT NULL,
+        actualizado REAL NOT NULL,
+        PRIMARY KEY(nombre, clave)
+    )''')
+
+
+# Condición de usuario suscrito: la única definición, para la difusión, los
+# envíos programados y los índices parciales (``{}`` es la tabla o su alias)
+SUSCRITO_SQL = "lower({}.recibir_info) IN ('sí', 'si')"
+
+def _migracion_4(conn):
+    """Índices de las consultas habituales y tablas de resumen para /stats.
+
+    Las tablas ``resumen_*`` se mantienen con disparadores en cada escritura,
+    de modo que los informes leen unas pocas filas agregadas en lugar de
+    recorrer el registro completo. El resumen por hora no se descuenta al
+    borrar consultas: sobrevive a la purga del registro antiguo.
+    """
+    # Las fechas son texto "%Y-%m-%d %H:%M:%S": el orden alfabético coincide
+    # con el cronológico, así que el índice sirve para rangos y
+    # ``substr(fecha, 1, 13)`` es la hora
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_consultas_user_id ON consultas(user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_consultas_fecha ON consultas(fecha)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_consultas_tipo_fecha ON consultas(tipo_consulta, fecha)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_medios_user_id ON medios(user_id)')
+    # Índice parcial para paginar los suscritos en la difusión
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_usuarios_suscritos ON usuarios(user_id) '
+        f"WHERE {SUSCRITO_SQL.format('usuarios')}"
+    )
+    # Municipio resuelto a partir de la residencia (texto libre)
+    conn.execute('ALTER TABLE usuarios ADD COLUMN municipio TEXT')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS resumen_consultas_hora (
+        hora TEXT NOT NULL,
+        tipo_consulta TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        PRIMARY KEY(hora, tipo_consulta)
+    ) WITHOUT ROWID''')
+
+    # "Palma Soriano" y "palma soriano " cuentan como la misma residencia
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS resumen_residencias (
+        residencia TEXT NOT NULL COLLATE NOCASE PRIMARY KEY,
+        usuarios INTEGER NOT NULL,
+        suscritos INTEGER NOT NULL
+    ) WITHOUT ROWID''')
+
+    # municipio = '' agrupa a los usuarios cuya residencia no se pudo resolver
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS resumen_municipios (
+        municipio TEXT NOT NULL PRIMARY KEY,
+        usuarios INTEGER NOT NULL,
+        suscritos INTEGER NOT NULL
+    ) WITHOUT ROWID''')
+
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS resumen_consultas_insertar AFTER INSERT ON consultas BEGIN
+        INSERT INTO resumen_consultas_hora (hora, tipo_consulta, total)
+        VALUES (substr(NEW.fecha, 1, 13), NEW.tipo_consulta, 1)
+        ON CONFLICT(hora, tipo_consulta) DO UPDATE SET total = total + 1;
+    END''')
+
+    def sumar(fila, signo):
+        suscrito = SUSCRITO_SQL.format(fila)
+        return f'''
+        INSERT INTO resumen_residencias (residencia, usuarios, suscritos)
+        VALUES (trim({fila}.residencia), {signo}1, {signo}({suscrito}))
+        ON CONFLICT(residencia) DO UPDATE SET
+            usuarios = usuarios + excluded.usuarios, suscritos = suscritos + excluded.suscritos;
+        INSERT INTO resumen_municipios (municipio, usuarios, suscritos)
+        VALUES (coalesce({fila}.municipio, ''), {signo}1, {signo}({suscrito}))
+        ON CONFLICT(municipio) DO UPDATE SET
+            usuarios = usuarios + excluded.usuarios, suscritos = suscritos + excluded.suscritos;'''
+
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS resumen_usuarios_insertar AFTER INSERT ON usuarios BEGIN
+        {sumar('NEW', '+')}
+    END''')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS resumen_usuarios_actualizar
+    AFTER UPDATE OF residencia, municipio, recibir_info ON usuarios BEGIN
+        {sumar('OLD', '-')}
+        {sumar('NEW', '+')}
+    END''')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS resumen_usuarios_borrar AFTER DELETE ON usuarios BEGIN
+        {sumar('OLD', '-')}
+    END''')
+
+    # Resúmenes iniciales a partir de los datos existentes
+    conn.execute('''
+    INSERT INTO resumen_consultas_hora (hora, tipo_consulta, total)
+    SELECT substr(fecha, 1, 13), tipo_consulta, count(*) FROM consultas GROUP BY 1, 2''')
+    suscrito = SUSCRITO_SQL.format('usuarios')
+    conn.execute(f'''
+    INSERT INTO resumen_residencias (residencia, usuarios, suscritos)
+    SELECT trim(residencia), count(*), sum({suscrito}) FROM usuarios
+    GROUP BY trim(residencia) COLLATE NOCASE''')
+    conn.execute(f'''
+    INSERT INTO resumen_municipios (municipio, usuarios, suscritos)
+    SELECT coalesce(municipio, ''), count(*), sum({suscrito}) FROM usuarios
+    GROUP BY 1''')
+
+
+def _migracion_5(conn):
+    """Últimas recomendaciones personalizadas de cada usuario."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS recomendaciones (
+        user_id INTEGER PRIMARY KEY,
+        perfil TEXT NOT NULL,
+        consejos TEXT NOT NULL,
+        actualizada TEXT NOT NULL
+    )''')
+
+
+def _migracion_6(conn):
+    """Procesamiento de medios: contenido descargado y resultado de cada envío."""
+    # estado NULL: medio anterior al procesamiento en segundo plano
+    for columna in ('file_unique_id TEXT', 'sha256 TEXT', 'estado TEXT', 'resultado TEXT', 'procesado TEXT'):
+        conn.execute(f'ALTER TABLE medios ADD COLUMN {columna}')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_medios_file_unique_id ON medios(file_unique_id)')
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_medios_pendientes ON medios(id) WHERE estado = 'pendiente'"
+    )
+
+    # Un registro por contenido (SHA-256), compartido por todos sus envíos
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS archivos_medios (
+        sha256 TEXT PRIMARY KEY,
+        tipo_medio TEXT NOT NULL,
+        ruta TEXT,
+        tamano INTEGER NOT NULL,
+        huella TEXT,
+        duplicado_de TEXT,
+        estado TEXT,
+        resultado TEXT,
+        procesado TEXT
+    ) WITHOUT ROWID''')
+
+
+def _migracion_7(conn):
+    """VACUUM incremental: la retención devuelve al sistema el espacio que libera."""
+    # En una base de datos existente, auto_vacuum solo cambia tras un VACUUM
+    # completo (una única vez; VACUUM no puede ir dentro de una transacción)
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+
+
+# Se ejecuta fuera de transacción; repetirla si se interrumpe no hace daño
+_migracion_7.sin_transaccion = True
+
+
+def _migracion_8(conn):
+    """Envíos programados: ventana de entrega de cada usuario y avisos por localidad."""
+    # Horas NULL: ventana por defecto (PROGRAMACION_VENTANA)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS preferencias_envio (
+        user_id INTEGER PRIMARY KEY,
+        hora_desde INTEGER,
+        hora_hasta INTEGER,
+        resumenes INTEGER NOT NULL DEFAULT 1,
+        ultimo_resumen TEXT
+    )''')
+    # Un aviso por localidad y suceso (clave única); los destinatarios se
+    # apuntan en avisos_entregados a medida que se les entrega
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS avisos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        clave TEXT NOT NULL UNIQUE,
+        nivel INTEGER NOT NULL,
+        localidad TEXT NOT NULL,
+        mensaje TEXT NOT NULL,
+        creado TEXT NOT NULL,
+        caduca TEXT NOT NULL
+    )''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_avisos_caduca ON avisos(caduca)')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS avisos_entregados (
+        aviso_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        PRIMARY KEY (aviso_id, user_id)
+    ) WITHOUT ROWID''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_usuarios_municipio ON usuarios(municipio)')
+
+
+# Cada migración lleva el esquema de la versión n-1 a la n
+MIGRACIONES = [
+    _migracion_1,
+    _migracion_2,
+    _migracion_3,
+    _migracion_4,
+    _migracion_5,
+    _migracion_6,
+    _migracion_7,
+    _migracion_8,
+]
+
+
+def _migrar(conn):
+    """Aplica las migraciones pendientes, cada una en su propia transacción.
+
+    El módulo sqlite3 no abre transacción antes de CREATE o ALTER, así que
+    ``with conn`` no deshace una migración a medias: se abre a mano con
+    ``BEGIN IMMEDIATE`` y ``user_version`` sube en la misma transacción. Si
+    una migración falla, la base de datos queda en la versión anterior y la
+    siguiente ejecución la repite entera.
+    """
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    nivel = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        for numero, migracion in enumerate(MIGRACIONES[version:], start=version + 1):
+            if getattr(migracion, 'sin_transaccion', False):
+                migracion(conn)
+                conn.execute(f'PRAGMA user_version = {numero}')
+            else:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    migracion(conn)
+                    conn.execute(f'PRAGMA user_version = {numero}')
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+                conn.execute('COMMIT')
+            logger.info(f"Base de datos migrada a la versión {numero}")
+    finally:
+        conn.isolation_level = nivel
+    return version
+
+
+def init_db():
+    """Crea o migra el esquema en el sitio (también activa WAL)."""
+    bd.ejecutar_sync(_migrar)
+
+
+# ========== OPERACIONES ==========
+COLUMNAS_USUARIO = (
+    'user_id', 'nombre', 'apellidos', 'edad', 'sexo', 'nivel_academico',
+    'residencia', 'email', 'recibir_info', 'fecha_registro', 'municipio',
+)
+
+
+def sql_guardar_usuario(actualizar=COLUMNAS_USUARIO):
+    """UPSERT de un usuario: alta o actualización en una sola sentencia.
+
+    Los disparadores de resumen ven un INSERT o un UPDATE, según el caso. Si
+    el usuario ya existe solo se actualizan las columnas de ``actualizar``, y
+    ``fecha_registro`` conserva siempre la del alta.
+    """
+    asignaciones = ', '.join(
+        f'{c} = excluded.{c}' for c in actualizar if c not in ('user_id', 'fecha_registro')
+    )
+    return f'''
+INSERT INTO usuarios ({', '.join(COLUMNAS_USUARIO)})
+VALUES ({', '.join('?' * len(COLUMNAS_USUARIO))})
+ON CONFLICT(user_id) DO UPDATE SET {asignaciones}
+'''
+
+
+SQL_GUARDAR_USUARIO = sql_guardar_usuario()
+
+SQL_INSERTAR_CONSULTA = '''
+INSERT INTO consultas (
+    user_id, tipo_consulta, contenido, respuesta, fecha
+) VALUES (?, ?, ?, ?, ?)
+'''
+
+SQL_INSERTAR_MEDIO = '''
+INSERT INTO medios (
+    user_id, tipo_medio, file_id, file_unique_id, fecha, estado
+) VALUES (?, ?, ?, ?, ?, 'pendiente')
+'''
+
+SQL_ACTUALIZAR_MEDIO = '''
+UPDATE medios SET sha256 = ?, estado = ?, resultado = ?, procesado = ?
+WHERE file_unique_id = ? AND estado = 'pendiente'
+'''
+
+
+def _guardar_usuario(conn, user_data, user_id):
+    datos = (
+        user_id,
+        user_data['nombre'],
+        user_data['apellidos'],
+        user_data['edad'],
+        user_data['sexo'],
+        user_data['nivel_academico'],
+        user_data['residencia'],
+        user_data.get('email', None),
+        user_data['recibir_info'],
+        ahora(),
+        user_data.get('municipio'),
+    )
+    with conn:
+        conn.execute(SQL_GUARDAR_USUARIO, datos)
+
+
+async def save_user(user_data, user_id):
+    try:
+        await bd.ejecutar(_guardar_usuario, dict(user_data), user_id)
+        return True
+    except Exception as e:
+        logger.error(f"Error al guardar usuario: {e}")
+        return False
+
+
+async def save_query(user_id, query_type, content, response):
+    try:
+        await cola_escritura.encolar(
+            SQL_INSERTAR_CONSULTA,
+            (user_id, query_type, content, response, ahora())
+        )
+        return True
+    except Exception as e:
+        logger.error(f"Error al guardar consulta: {e}")
+        return False
+
+
+async def save_media(user_id, media_type, file_id, file_unique_id=None):
+    try:
+        await cola_escritura.encolar(
+            SQL_INSERTAR_MEDIO,
+            (user_id, media_type, file_id, file_unique_id, ahora())
+        )
+        return True
+    except Exception as e:
+        logger.error(f"Error al guardar medio: {e}")
+        return False
+
+
+# ========== ESTADÍSTICAS ==========
+def _asignar_municipios(conn, resolver):
+    """Resuelve el municipio de los usuarios registrados antes de guardarlo.
+
+    ``resolver(residencia)`` devuelve el municipio o ``None``; los que no se
+    resuelven quedan con '' para no volver a intentarlo en cada arranque.
+    """
+    filas = conn.execute('SELECT user_id, residencia FROM usuarios WHERE municipio IS NULL').fetchall()
+    with conn:
+        conn.executemany(
+            'UPDATE usuarios SET municipio = ? WHERE user_id = ?',
+            [(resolver(residencia) or '', user_id) for user_id, residencia in filas]
+        )
+    return len(filas)
+
+
+def asignar_municipios(resolver) -> int:
+    return bd.ejecutar_sync(_asignar_municipios, resolver)
+
+
+def _consultas_por_periodo(conn, desde, largo):
+    # largo=13 agrupa por hora ("2025-05-22 10"), largo=10 por día
+    return conn.execute(
+        f'SELECT substr(hora, 1, {largo}), sum(total) FROM resumen_consultas_hora '
+        'WHERE hora >= ? GROUP BY 1 ORDER BY 1',
+        (desde,)
+    ).fetchall()
+
+
+def _consultas_por_tipo(conn, desde):
+    return conn.execute(
+        'SELECT tipo_consulta, sum(total) FROM resumen_consultas_hora '
+        'WHERE hora >= ? GROUP BY 1 ORDER BY 2 DESC',
+        (desde,)
+    ).fetchall()
+
+
+def _top_residencias(conn, limite):
+    return conn.execute(
+        'SELECT residencia, usuarios, suscritos FROM resumen_residencias '
+        'WHERE usuarios > 0 ORDER BY usuarios DESC, residencia LIMIT ?',
+        (limite,)
+    ).fetchall()
+
+
+def _suscritos_por_municipio(conn):
+    return conn.execute(
+        'SELECT municipio, suscritos, usuarios FROM resumen_municipios '
+        'WHERE suscritos > 0 ORDER BY suscritos DESC, municipio'
+    ).fetchall()
+
+
+async def estadisticas_uso(horas: int = 24, top: int = 10) -> dict:
+    """Informe de uso leído de las tablas de resumen (no recorre el registro)."""
+    desde = (datetime.now() - timedelta(hours=horas - 1)).strftime("%Y-%m-%d %H")
+    largo = 13 if horas <= 48 else 10
+    return {
+        'consultas': await bd.ejecutar(_consultas_por_periodo, desde, largo),
+        'por_tipo': await bd.ejecutar(_consultas_por_tipo, desde),
+        'residencias': await bd.ejecutar(_top_residencias, top),
+        'municipios': await bd.ejecutar(_suscritos_por_municipio),
+    }
@@ -0,0 +1,113 @@
+"""Benchmark del arranque en frío del bot.
+
+Mide dos cosas en procesos nuevos:
+
+- ``python -X importtime -c "import bot"``: tiempo total de importación y
+  los módulos de primer nivel que más tardan;
+- tiempo hasta la primera actualización: desde que se lanza ``bot.py``
+  (con ``main()``, como en producción) contra la Bot API falsa hasta que
+  empieza a sondear ``getUpdates`` y hasta que responde a un ``/start`` que
+  ya esperaba en la cola.
+
+Uso:
+    python -m benchmarks.bench_arranque
+    python -m benchmarks.bench_arranque --repeticiones 5 --modulos 15
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks.telegram_falso import ServidorTelegramFalso, update_mensaje
+
+
+def tiempos_importacion(modulo='bot'):
+    """Total (s) y tiempo propio de cada paquete de primer nivel según ``-X importtime``."""
+    salida = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+        capture_output=True, text=True, check=True,
+    ).stderr
+    total = 0.0
+    por_paquete = defaultdict(float)
+    for linea in salida.splitlines():
+        if not linea.startswith('import time:') or 'self [us]' in linea:
+            continue
+        propio, acumulado, nombre = linea[len('import time:'):].split('|')
+        por_paquete[nombre.strip().split('.')[0]] += int(propio) / 1e6
+        # Cada nivel de anidamiento añade dos espacios delante del nombre
+        if not nombre[1:].startswith(' '):
+            total += int(acumulado) / 1e6
+    return total, por_paquete
+
+
+async def primera_actualizacion(entorno, plazo):
+    servidor = ServidorTelegramFalso()
+    await servidor.iniciar()
+    sondeo = asyncio.get_running_loop().create_future()
+    original = servidor._get_updates
+
+    async def _get_updates(offset, timeout):
+        if not sondeo.done():
+            sondeo.set_result(time.perf_counter())
+        return await original(offset, timeout)
+    servidor._get_updates = _get_updates
+
+    uid = 4242
+    await servidor.encolar_update(update_mensaje(0, uid, '/start'))
+    respuesta = servidor.esperar_respuesta(uid)
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, 'bot.py'],
+        env={**os.environ, **entorno, 'TELEGRAM_API_URL': servidor.url},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        listo = await asyncio.wait_for(sondeo, plazo)
+        respondido = await asyncio.wait_for(respuesta, plazo)
+    finally:
+        proceso.send_signal(signal.SIGINT)
+        await asyncio.to_thread(proceso.wait, 30)
+        await servidor.detener()
+    return listo - inicio, respondido - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--modulos', type=int, default=10, help="paquetes más lentos que se muestran")
+    parser.add_argument('--plazo', type=float, default=120)
+    args = parser.parse_args()
+
+    importaciones = [tiempos_importacion() for _ in range(args.repeticiones)]
+    total = statistics.median(t for t, _ in importaciones)
+    print(f"import bot: {total * 1000:.0f} ms (mediana de {args.repeticiones})")
+    _, por_paquete = importaciones[-1]
+    for nombre, segundos in sorted(por_paquete.items(), key=lambda p: -p[1])[:args.modulos]:
+        print(f"  {nombre:28} {segundos * 1000:8.1f} ms")
+
+    directorio = tempfile.mkdtemp()
+    try:
+        shutil.copy('sismos_bot.db', os.path.join(directorio, 'bot.db'))
+        entorno = {
+            'TELEGRAM_TOKEN': '123:falso',
+            'DB_PATH': os.path.join(directorio, 'bot.db'),
+            'CATALOGO_RUTA': os.path.join(directorio, 'catalogo'),
+            'MEDIOS_RUTA': os.path.join(directorio, 'medios'),
+            'METRICAS_PUERTO': '0',
+        }
+        tiempos = [asyncio.run(primera_actualizacion(entorno, args.plazo)) for _ in range(args.repeticiones)]
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+    print(f"\nHasta sondear getUpdates:    {statistics.median(t for t, _ in tiempos) * 1000:8.0f} ms")
+    print(f"Hasta responder el /start:   {statistics.median(t for _, t in tiempos) * 1000:8.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Benchmark del catálogo local de sismos.
+
+Genera un catálogo sintético (magnitudes de Gutenberg-Richter, epicentros en
+la región del Caribe y décadas de historia) y mide la ingestión desde CSV y
+desde columnas ya construidas, el tiempo de apertura y la latencia de
+``ultimos`` y ``cerca``.
+
+Uso:
+    python -m benchmarks.bench_catalogo
+    python -m benchmarks.bench_catalogo --eventos 5000000 --csv 500000
+"""
+import argparse
+import csv
+import math
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from catalogo import COLUMNAS, CatalogoSismos, leer_csv
+
+# Puntos de consulta: Santiago de Cuba, Palma Soriano y Guamá
+PUNTOS = [(20.02, -75.82), (20.21, -76.00), (19.98, -76.41)]
+INICIO = datetime(1970, 1, 1, tzinfo=timezone.utc).timestamp()
+FIN = datetime(2026, 1, 1, tzinfo=timezone.utc).timestamp()
+
+
+def eventos_sinteticos(cantidad, semilla=0, desde=INICIO, hasta=FIN, prefijo='s'):
+    rng = np.random.default_rng(semilla)
+    tiempo = np.sort(rng.uniform(desde, hasta, cantidad))
+    # Gutenberg-Richter con b = 1 a partir de M2
+    magnitud = 2.0 + rng.exponential(1 / math.log(10), cantidad)
+    return {
+        'tiempo': tiempo.astype(COLUMNAS['tiempo']),
+        'lat': rng.uniform(17.0, 23.0, cantidad).astype(COLUMNAS['lat']),
+        'lon': rng.uniform(-80.0, -72.0, cantidad).astype(COLUMNAS['lon']),
+        'profundidad': rng.gamma(2.0, 10.0, cantidad).astype(COLUMNAS['profundidad']),
+        'magnitud': np.minimum(magnitud, 8.5).astype(COLUMNAS['magnitud']),
+        'id': np.char.add(prefijo, np.arange(cantidad).astype('U12')).astype(COLUMNAS['id']),
+        'lugar': np.full(cantidad, 'region sintetica'.encode(), dtype=COLUMNAS['lugar']),
+    }
+
+
+def escribir_csv(ruta, columnas):
+    with open(ruta, 'w', encoding='utf-8', newline='') as f:
+        escritor = csv.writer(f)
+        escritor.writerow(['time', 'latitude', 'longitude', 'depth', 'mag', 'id', 'place'])
+        for i in range(len(columnas['tiempo'])):
+            escritor.writerow([
+                datetime.fromtimestamp(float(columnas['tiempo'][i]), timezone.utc).isoformat(),
+                f"{columnas['lat'][i]:.4f}", f"{columnas['lon'][i]:.4f}",
+                f"{columnas['profundidad'][i]:.1f}", f"{columnas['magnitud'][i]:.1f}",
+                columnas['id'][i].decode(), columnas['lugar'][i].decode(),
+            ])
+
+
+def latencia(funcion, repeticiones):
+    tiempos = []
+    for i in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(i)
+        tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+    return statistics.median(tiempos) * 1000, tiempos[int(len(tiempos) * 0.99)] * 1000
+
+
+def cronometrar(funcion):
+    inicio = time.perf_counter()
+    resultado = funcion()
+    return resultado, time.perf_counter() - inicio
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--eventos', type=int, default=2_000_000)
+    parser.add_argument('--csv', type=int, default=200_000, help="eventos que se ingieren desde CSV")
+    parser.add_argument('--repeticiones', type=int, default=200)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp()
+    try:
+        # Ingestión desde CSV: lectura en flujo + lotes + escritura
+        ruta_csv = os.path.join(directorio, 'feed.csv')
+        escribir_csv(ruta_csv, eventos_sinteticos(args.csv, semilla=1, prefijo='c'))
+        catalogo = CatalogoSismos(os.path.join(directorio, 'csv'))
+        catalogo.abrir()
+        nuevos, segundos = cronometrar(lambda: catalogo.ingerir(leer_csv(ruta_csv)))
+        print(f"CSV: {nuevos} eventos en {segundos:.2f}s ({nuevos / segundos:,.0f} eventos/s)")
+        repetidos, segundos = cronometrar(lambda: catalogo.ingerir(leer_csv(ruta_csv)))
+        print(f"CSV repetido: {repetidos} nuevos en {segundos:.2f}s")
+
+        # Catálogo grande desde columnas
+        catalogo = CatalogoSismos(os.path.join(directorio, 'grande'))
+        catalogo.abrir()
+        columnas = eventos_sinteticos(args.eventos)
+        nuevos, segundos = cronometrar(lambda: catalogo.agregar(columnas))
+        print(f"\nColumnas: {nuevos} eventos en {segundos:.2f}s ({nuevos / segundos:,.0f} eventos/s)")
+        tamano = sum(os.path.getsize(catalogo._fichero(n)) for n in COLUMNAS)
+        print(f"En disco: {tamano / 2 ** 20:.0f} MiB")
+
+        # Añadido incremental de un lote reciente y de uno antiguo (reescritura)
+        reciente = eventos_sinteticos(1000, semilla=2, desde=FIN, hasta=FIN + 86400, prefijo='r')
+        _, segundos = cronometrar(lambda: catalogo.agregar(reciente))
+        print(f"Añadir 1000 recientes: {segundos * 1000:.1f} ms")
+        antiguo = eventos_sinteticos(1000, semilla=3, prefijo='a')
+        _, segundos = cronometrar(lambda: catalogo.agregar(antiguo))
+        print(f"Añadir 1000 antiguos (reescritura): {segundos * 1000:.1f} ms")
+
+        catalogo = CatalogoSismos(catalogo.ruta)
+        _, segundos = cronometrar(catalogo.abrir)
+        print(f"Apertura de {catalogo.total} eventos: {segundos * 1000:.2f} ms")
+
+        print()
+        for nombre, funcion in [
+            ('ultimos(5)', lambda i: catalogo.ultimos(5)),
+            ('ultimos(20, M≥5)', lambda i: catalogo.ultimos(20, 5.0)),
+            ('cerca 100 km, 30 días', lambda i: catalogo.cerca(*PUNTOS[i % 3], 100, desde=FIN - 30 * 86400)),
+            ('cerca 100 km, 5 años', lambda i: catalogo.cerca(*PUNTOS[i % 3], 100, desde=FIN - 5 * 365 * 86400)),
+            ('cerca 50 km, todo', lambda i: catalogo.cerca(*PUNTOS[i % 3], 50)),
+            ('cerca 300 km, M≥6', lambda i: catalogo.cerca(*PUNTOS[i % 3], 300, magnitud_min=6.0)),
+        ]:
+            p50, p99 = latencia(funcion, args.repeticiones)
+            print(f"{nombre:24} p50 {p50:8.2f} ms   p99 {p99:8.2f} ms")
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
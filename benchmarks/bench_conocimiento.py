@@ -0,0 +1,126 @@
+"""Benchmark de la base de conocimiento local.
+
+Mide el tiempo de construcción y de apertura del índice, la latencia de
+``responder_faq`` y ``buscar`` y la tasa de preguntas que se responden sin
+llamar al modelo. Con ``--sinteticos`` añade pasajes generados al azar para
+ver cómo escala el índice con una base mucho mayor que la real.
+
+Uso:
+    python -m benchmarks.bench_conocimiento
+    python -m benchmarks.bench_conocimiento --sinteticos 100000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from benchmarks.carga import PREGUNTAS
+from conocimiento import RUTA_CONOCIMIENTO, BaseConocimiento, construir_indice
+
+# Variantes y preguntas que no están en la FAQ, como las escriben los usuarios
+PREGUNTAS_USUARIOS = PREGUNTAS + [
+    "que hago si tiembla",
+    "q hago si esta temblando",
+    "habra replicas?",
+    "habra mas replicas hoy",
+    "que lleva la mochila de emergencia",
+    "puedo entrar a mi casa si tiene grietas",
+    "huele a gas que hago",
+    "se pueden predecir los terremotos",
+    "dicen que mañana habra un terremoto fuerte es verdad",
+    "cual es la diferencia entre magnitud e intensidad",
+    "cuando fue el terremoto de 1932",
+    "que es la falla oriente",
+    "por que santiago tiene tantos sismos",
+    "como ayudo a un herido",
+    "puedo dormir dentro de la casa esta noche",
+    "hay peligro de tsunami en la costa de santiago",
+    "que hago si estoy en la guagua cuando tiembla",
+    "mi perro le tiene miedo a los temblores",
+]
+
+
+def medir(funcion, preguntas, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        for pregunta in preguntas:
+            inicio = time.perf_counter()
+            funcion(pregunta)
+            tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+    return statistics.median(tiempos) * 1e6, tiempos[int(len(tiempos) * 0.99)] * 1e6
+
+
+def base_sintetica(ruta_origen, ruta_destino, cantidad):
+    # Pasajes con las palabras de la base real en proporciones de Zipf
+    with open(ruta_origen, encoding='utf-8') as f:
+        datos = json.load(f)
+    palabras = sorted({p for doc in datos['documentos'] for t in doc['texto'] for p in t.split()})
+    random.shuffle(palabras)
+    pesos = [1 / (i + 1) for i in range(len(palabras))]
+    por_documento = 100
+    for d in range(0, cantidad, por_documento):
+        datos['documentos'].append({
+            'id': f'sintetico-{d}',
+            'tipo': 'sintetico',
+            'titulo': f'Documento sintético {d}',
+            'texto': [
+                ' '.join(random.choices(palabras, pesos, k=random.randint(30, 80)))
+                for _ in range(min(por_documento, cantidad - d))
+            ],
+        })
+    with open(ruta_destino, 'w', encoding='utf-8') as f:
+        json.dump(datos, f, ensure_ascii=False)
+
+
+def evaluar(nombre, ruta, directorio, repeticiones):
+    ruta_indice = os.path.join(directorio, f'{nombre}.idx')
+    inicio = time.perf_counter()
+    pasajes = construir_indice(ruta, ruta_indice)
+    construccion = time.perf_counter() - inicio
+
+    base = BaseConocimiento(ruta=ruta, ruta_indice=ruta_indice)
+    inicio = time.perf_counter()
+    base.cargar()
+    apertura = time.perf_counter() - inicio
+
+    faq_p50, faq_p99 = medir(base.responder_faq, PREGUNTAS_USUARIOS, repeticiones)
+    buscar_p50, buscar_p99 = medir(base.buscar, PREGUNTAS_USUARIOS, repeticiones)
+
+    base.estadisticas = dict.fromkeys(base.estadisticas, 0)
+    for pregunta in PREGUNTAS_USUARIOS:
+        if base.responder_faq(pregunta) is None:
+            base.buscar(pregunta)
+    r = base.resumen()
+    base.cerrar()
+
+    print(f"\n== {nombre}: {pasajes} pasajes, índice de {os.path.getsize(ruta_indice) / 1024:.0f} KiB")
+    print(f"construcción {construccion * 1000:10.1f} ms")
+    print(f"apertura     {apertura * 1000:10.1f} ms")
+    print(f"responder_faq p50 {faq_p50:8.1f} µs   p99 {faq_p99:8.1f} µs")
+    print(f"buscar        p50 {buscar_p50:8.1f} µs   p99 {buscar_p99:8.1f} µs")
+    print(
+        f"{len(PREGUNTAS_USUARIOS)} preguntas: {r['faq_directas']} sin modelo "
+        f"({r['tasa_sin_modelo']:.0%}), {r['con_contexto']} con pasajes, {r['sin_contexto']} sin pasajes"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sinteticos', type=int, default=0, help="pasajes sintéticos adicionales")
+    parser.add_argument('--repeticiones', type=int, default=50)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp()
+    try:
+        evaluar('real', RUTA_CONOCIMIENTO, directorio, args.repeticiones)
+        if args.sinteticos:
+            ruta = os.path.join(directorio, 'sintetica.json')
+            base_sintetica(RUTA_CONOCIMIENTO, ruta, args.sinteticos)
+            evaluar('sintetica', ruta, directorio, max(1, args.repeticiones // 10))
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
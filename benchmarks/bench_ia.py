@@ -0,0 +1,52 @@
+"""Benchmark: llamadas bloqueantes vs ``ClienteIA`` con el modelo falso.
+
+Simula una ráfaga de consultas simultáneas (como tras un sismo real) y mide
+el tiempo total y el rendimiento en consultas por segundo.
+
+Uso:
+    python -m benchmarks.bench_ia --consultas 200 --latencia 0.5
+"""
+import argparse
+import asyncio
+import time
+
+from ia import ClienteIA, ModeloFalso
+
+
+async def rafaga_bloqueante(modelo, consultas):
+    # Reproduce el comportamiento anterior: generate_content dentro del manejador
+    async def manejador(i):
+        modelo.generate_content(f"Pregunta {i}")
+
+    await asyncio.gather(*(manejador(i) for i in range(consultas)))
+
+
+async def rafaga_cliente(cliente, consultas):
+    await asyncio.gather(*(cliente.generar(f"Pregunta {i}") for i in range(consultas)))
+
+
+async def medir(nombre, corrutina, consultas):
+    inicio = time.perf_counter()
+    await corrutina
+    total = time.perf_counter() - inicio
+    print(f"{nombre:<12} {consultas} consultas en {total:7.2f}s -> {consultas / total:8.1f} consultas/s")
+
+
+async def principal(args):
+    modelo = ModeloFalso(latencia=args.latencia)
+    if args.consultas_bloqueantes:
+        await medir("bloqueante", rafaga_bloqueante(modelo, args.consultas_bloqueantes), args.consultas_bloqueantes)
+
+    cliente = ClienteIA(modelo=ModeloFalso(latencia=args.latencia), max_concurrencia=args.concurrencia)
+    await medir("asíncrono", rafaga_cliente(cliente, args.consultas), args.consultas)
+    cliente.cerrar()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--consultas', type=int, default=200)
+    parser.add_argument('--consultas-bloqueantes', type=int, default=10,
+                        help="consultas para el modo bloqueante (0 para omitirlo)")
+    parser.add_argument('--latencia', type=float, default=0.5)
+    parser.add_argument('--concurrencia', type=int, default=32)
+    asyncio.run(principal(parser.parse_args()))
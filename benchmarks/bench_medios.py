@@ -0,0 +1,115 @@
+"""Benchmark del procesamiento de medios (``medios.py``).
+
+Envía al bot, contra la Bot API falsa, una ráfaga de fotos y notas de voz
+de muchos usuarios en la que una parte son reenvíos (mismo
+``file_unique_id``) y otra copias recomprimidas de las mismas imágenes.
+Mide la latencia de la respuesta del manejador, que no debe depender del
+tamaño de los archivos, el tiempo hasta que todo queda procesado y la
+duración de cada etapa. Sin Pillow ni faster-whisper instalados solo se
+miden la descarga y la deduplicación exacta.
+
+Uso:
+    python -m benchmarks.bench_medios
+    python -m benchmarks.bench_medios --archivos 200 --envios 2000 --tamano 2000000
+"""
+import argparse
+import asyncio
+import io
+import random
+import time
+
+import numpy as np
+
+from benchmarks.entorno import entorno_bot, resumen_latencias
+from benchmarks.telegram_falso import update_medio
+
+
+def imagen(semilla, tamano, calidad=90):
+    """JPEG de bloques aleatorios; sin Pillow, bytes al azar del tamaño pedido."""
+    rng = np.random.default_rng(semilla)
+    try:
+        from PIL import Image
+    except ImportError:
+        return rng.bytes(tamano)
+    bloques = rng.integers(0, 255, (24, 32, 3)).astype(np.uint8)
+    lado = max(1, int((tamano / 3 / 768) ** 0.5))
+    salida = io.BytesIO()
+    Image.fromarray(np.kron(bloques, np.ones((lado, lado, 1), dtype=np.uint8))).save(
+        salida, 'JPEG', quality=calidad
+    )
+    return salida.getvalue()
+
+
+async def medir(archivos, envios, usuarios, tamano, ritmo, plazo):
+    async with entorno_bot() as e:
+        from medios import MEDIOS_SEGUNDOS
+        servidor = e.servidor
+        for i in range(archivos):
+            servidor.archivos[f'f{i}'] = imagen(i, tamano)
+            # La misma imagen recomprimida: otro contenido, casi la misma huella
+            servidor.archivos[f'r{i}'] = imagen(i, tamano, calidad=60)
+            servidor.archivos[f'v{i}'] = random.randbytes(tamano // 20)
+        medios = e.application.bot_data['medios']
+
+        enviados = []
+        inicio = time.perf_counter()
+        for n in range(envios):
+            uid = 200000 + n % usuarios
+            i = random.randrange(archivos)
+            tipo, file_id = random.choice([('foto', f'f{i}'), ('foto', f'f{i}'), ('foto', f'r{i}'), ('voz', f'v{i}')])
+            futuro = servidor.esperar_respuesta(uid)
+            enviados.append((time.perf_counter(), futuro))
+            await e.entregar(update_medio(0, uid, tipo, file_id))
+            await asyncio.sleep(max(0.0, inicio + (n + 1) / ritmo - time.perf_counter()))
+        respuestas = await asyncio.gather(*(f for _, f in enviados))
+        latencias = [r - t for (t, _), r in zip(enviados, respuestas)]
+
+        limite = time.monotonic() + plazo
+        while time.monotonic() < limite:
+            r = medios.resumen()
+            if not (r['por_descargar'] or r['por_analizar'] or r['descargando'] or r['analizando']):
+                break
+            await asyncio.sleep(0.05)
+        total = time.perf_counter() - inicio
+        etapas = {
+            etapa: (v.cuenta, v.suma / v.cuenta)
+            for (etapa,), v in sorted(MEDIOS_SEGUNDOS._valores.items()) if v.cuenta
+        }
+        return latencias, total, medios.resumen(), servidor.llamadas['descarga'], etapas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--archivos', type=int, default=50, help="imágenes y audios distintos")
+    parser.add_argument('--envios', type=int, default=500)
+    parser.add_argument('--usuarios', type=int, default=100)
+    parser.add_argument('--tamano', type=int, default=500_000, help="bytes aproximados de cada foto")
+    parser.add_argument('--ritmo', type=float, default=100, help="envíos por segundo")
+    parser.add_argument('--plazo', type=float, default=600)
+    args = parser.parse_args()
+
+    random.seed(0)
+    latencias, total, r, descargas, etapas = asyncio.run(
+        medir(args.archivos, args.envios, args.usuarios, args.tamano, args.ritmo, args.plazo)
+    )
+    l = resumen_latencias(latencias)
+    # Después de entorno_bot: medios lee la ruta de la base de datos al importarse
+    from medios import PILLOW, TRANSCRIPTOR
+    print(f"Pillow: {'sí' if PILLOW else 'no'}, transcriptor: {'sí' if TRANSCRIPTOR else 'no'}")
+    print(
+        f"{args.envios} envíos: respuesta p50 {l['p50_ms']:.1f} ms  p95 {l['p95_ms']:.1f} ms  "
+        f"p99 {l['p99_ms']:.1f} ms  máx {l['max_ms']:.1f} ms"
+    )
+    print(f"Todo procesado en {total:.2f}s ({args.envios / total:.0f} envíos/s)")
+    print(
+        f"Descargas: {descargas} ({r['bytes_descargados'] / 2 ** 20:.1f} MiB); duplicados "
+        f"reenvío/contenido/parecido {r['duplicados_id']}/{r['duplicados_contenido']}/"
+        f"{r['duplicados_perceptuales']}; analizados {r['analizados']}, sin análisis {r['sin_analisis']}, "
+        f"errores {r['errores']}"
+    )
+    for etapa, (cuenta, media) in etapas.items():
+        print(f"  {etapa:16} {cuenta:6d} × {media * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Benchmark de la importación masiva de usuarios y de la retención de consultas.
+
+Genera un CSV de residentes sintético, lo importa dos veces (altas y luego
+actualizaciones del mismo padrón), lo exporta y compara con el alta fila a
+fila de ``save_user``. Después llena ``consultas`` con registros antiguos,
+ejecuta un pase de retención y mide el tamaño de la base de datos antes y
+después y el del archivo comprimido. ``MonitorBucle`` mide el bloqueo del
+bucle de eventos en cada fase.
+
+Uso:
+    python -m benchmarks.bench_padron
+    python -m benchmarks.bench_padron --usuarios 200000 --consultas 500000
+"""
+import argparse
+import asyncio
+import csv
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from benchmarks.entorno import MonitorBucle
+
+RESIDENCIAS = ['Santiago de Cuba', 'Palma Soriano', 'Contramaestre', 'San Luis', 'Songo-La Maya', 'Vista Alegre']
+
+
+def escribir_csv(ruta, usuarios, semilla):
+    azar = random.Random(semilla)
+    with open(ruta, 'w', encoding='utf-8', newline='') as f:
+        escritor = csv.writer(f, delimiter=';')
+        escritor.writerow(['user_id', 'nombre', 'apellidos', 'edad', 'sexo', 'nivel_academico', 'residencia', 'email', 'recibir_info'])
+        for i in range(usuarios):
+            escritor.writerow([
+                500000 + i, f'Nombre{i}', f'Apellido{i} Pérez', azar.randint(1, 99),
+                azar.choice(['Masculino', 'Femenino']), 'Universitario',
+                azar.choice(RESIDENCIAS), f'residente{i}@ejemplo.cu', azar.choice(['Sí', 'No']),
+            ])
+
+
+def tamano_bd(ruta):
+    return sum(os.path.getsize(ruta + s) for s in ('', '-wal') if os.path.exists(ruta + s))
+
+
+def _llenar_consultas(conn, cantidad):
+    respuesta = 'Mantén la calma y aléjate de ventanas. ' * 20
+    with conn:
+        conn.executemany(
+            'INSERT INTO consultas (user_id, tipo_consulta, contenido, respuesta, fecha) VALUES (?, ?, ?, ?, ?)',
+            (
+                (i % 1000, 'consulta_ia', f'¿Pregunta número {i}?', respuesta,
+                 f'2024-{1 + i % 12:02d}-{1 + i % 28:02d} 10:00:00')
+                for i in range(cantidad)
+            )
+        )
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+async def medir(args, directorio):
+    import bot
+    from base_datos import save_user
+    from padron import exportar_csv, importar_csv
+    from retencion import Retencion
+
+    bot.init_db()
+    bot.indice_riesgo.cargar()
+    bot.cola_escritura.iniciar()
+    ruta_csv = os.path.join(directorio, 'padron.csv')
+    escribir_csv(ruta_csv, args.usuarios, 1)
+    monitor = MonitorBucle()
+    monitor.iniciar()
+
+    async def fase(nombre, corrutina, unidades):
+        bloqueado = monitor.bloqueado
+        inicio = time.perf_counter()
+        resultado = await corrutina
+        segundos = time.perf_counter() - inicio
+        print(
+            f"{nombre:28s} {segundos:7.2f}s  {unidades / segundos:9.0f} filas/s  "
+            f"bucle bloqueado {(monitor.bloqueado - bloqueado) * 1000:6.0f} ms"
+        )
+        return resultado
+
+    r = await fase('importar (altas)', importar_csv(bot.bd, ruta_csv, args.lote), args.usuarios)
+    assert r['nuevas'] == args.usuarios, r
+    escribir_csv(ruta_csv, args.usuarios, 2)
+    r = await fase('importar (actualizaciones)', importar_csv(bot.bd, ruta_csv, args.lote), args.usuarios)
+    assert r['nuevas'] == 0, r
+    await fase('asignar municipios', asyncio.to_thread(bot.asignar_municipios, bot.municipio_de), args.usuarios)
+    ruta_exportado = os.path.join(directorio, 'usuarios.csv.gz')
+    total = await fase('exportar (.csv.gz)', exportar_csv(bot.bd, ruta_exportado, args.lote), args.usuarios)
+    print(f"{'':28s} {total} usuarios, {os.path.getsize(ruta_exportado) / 1e6:.1f} MB")
+
+    async def fila_a_fila():
+        for i in range(args.comparar):
+            await save_user(
+                {'nombre': 'N', 'apellidos': 'A', 'edad': 30, 'sexo': 'Femenino',
+                 'nivel_academico': 'Universitario', 'residencia': 'San Luis', 'recibir_info': 'Sí'},
+                900000 + i
+            )
+    if args.comparar:
+        await fase('save_user fila a fila', fila_a_fila(), args.comparar)
+
+    ruta_bd = os.environ['DB_PATH']
+    await bot.bd.ejecutar(_llenar_consultas, args.consultas)
+    antes = tamano_bd(ruta_bd)
+    retencion = Retencion(bot.bd, ruta=os.path.join(directorio, 'archivo'), dias=30, lote=args.lote)
+    await fase('retención (archivo + vacuum)', retencion.ejecutar(), args.consultas)
+    archivo = sum(e.stat().st_size for e in os.scandir(retencion.ruta))
+    print(
+        f"{'':28s} {retencion.estadisticas['archivadas']} consultas, base de datos "
+        f"{antes / 1e6:.1f} → {tamano_bd(ruta_bd) / 1e6:.1f} MB, archivo {archivo / 1e6:.1f} MB"
+    )
+    await monitor.detener()
+    await bot.cola_escritura.detener()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--usuarios', type=int, default=50000)
+    parser.add_argument('--consultas', type=int, default=100000)
+    parser.add_argument('--lote', type=int, default=5000)
+    parser.add_argument('--comparar', type=int, default=2000, help="altas con save_user (0: no comparar)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    directorio = tempfile.mkdtemp()
+    try:
+        # base_datos lee DB_PATH al importarse
+        shutil.copy('sismos_bot.db', os.path.join(directorio, 'bot.db'))
+        os.environ['DB_PATH'] = os.path.join(directorio, 'bot.db')
+        os.environ['GEMINI_MODEL'] = 'falso'
+        os.environ['CATALOGO_RUTA'] = os.path.join(directorio, 'catalogo')
+        os.environ['MEDIOS_RUTA'] = os.path.join(directorio, 'medios')
+        asyncio.run(medir(args, directorio))
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
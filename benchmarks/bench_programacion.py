@@ -0,0 +1,148 @@
+"""Benchmark de los envíos programados (``programacion.py``) contra la Bot API falsa.
+
+Registra suscritos repartidos en varias localidades, todos dentro de su
+ventana de entrega, añade al catálogo un sismo reciente cerca de Palma
+Soriano y deja correr el planificador mientras otros usuarios consultan el
+bot. Mide la tasa máxima de envíos programados por segundo, cuántos textos
+se generan (uno por localidad), la latencia de las respuestas interactivas
+antes y durante los envíos, y que una /alerta lanzada a mitad detiene los
+envíos programados mientras dura.
+
+Uso:
+    python -m benchmarks.bench_programacion
+    python -m benchmarks.bench_programacion --suscritos 3000 --tasa 10 --paso 5
+"""
+import argparse
+import asyncio
+import logging
+import time
+from collections import Counter
+
+from benchmarks.entorno import entorno_bot, resumen_latencias
+from benchmarks.telegram_falso import update_mensaje
+
+RESIDENCIAS = ['Palma Soriano', 'San Luis', 'Contramaestre', 'Songo-La Maya', 'Reparto Vista Alegre', 'Caney']
+ADMIN = 1
+PRIMER_SUSCRITO = 200000
+
+
+async def interactivo(e, segundos, ritmo, usuarios):
+    """Consultas /ultimos a ``ritmo`` por segundo; devuelve sus latencias."""
+    latencias = []
+
+    async def una(uid):
+        espera = e.servidor.esperar_respuesta(uid)
+        inicio = time.perf_counter()
+        await e.entregar(update_mensaje(0, uid, '/ultimos 5'))
+        latencias.append(await asyncio.wait_for(espera, 30) - inicio)
+
+    tareas = []
+    fin = time.monotonic() + segundos
+    i = 0
+    while time.monotonic() < fin:
+        tareas.append(asyncio.create_task(una(1000 + i % usuarios)))
+        i += 1
+        await asyncio.sleep(1 / ritmo)
+    await asyncio.gather(*tareas, return_exceptions=True)
+    return latencias
+
+
+def tasa_maxima(instantes):
+    """Máximo de envíos en una ventana de un segundo."""
+    por_segundo = Counter(int(t) for t in instantes)
+    return max(por_segundo.values(), default=0)
+
+
+async def medir(args):
+    configuracion = {
+        'ADMIN_IDS': str(ADMIN),
+        'PROGRAMACION_PASO': str(args.paso),
+        'PROGRAMACION_TASA': str(args.tasa),
+        'PROGRAMACION_VENTANA': '0-24',
+    }
+    async with entorno_bot(configuracion=configuracion) as e:
+        bot = e.bot
+        from base_datos import SQL_GUARDAR_USUARIO
+
+        latencias_base = await interactivo(e, args.segundos, args.ritmo, 50)
+
+        # Un sismo de hace una hora cerca de Palma Soriano: seguimiento para los
+        # municipios a menos de PROGRAMACION_RADIO_KM
+        zona = bot.indice_riesgo.resolver('Palma Soriano').zona
+        lat, lon = bot.indice_riesgo.centros[zona.id]
+        bot.catalogo.ingerir([(time.time() - 3600, lat + 0.1, lon, 12.0, 4.8, 'bench-seguimiento', 'Sur de Palma Soriano')])
+
+        filas = []
+        for i in range(args.suscritos):
+            residencia = RESIDENCIAS[i % len(RESIDENCIAS)]
+            filas.append((
+                PRIMER_SUSCRITO + i, f'Nombre{i}', 'Apellido', 30, 'Femenino', 'Universitario',
+                residencia, None, 'Sí', '2020-01-01 00:00:00', bot.municipio_de(residencia),
+            ))
+
+        def guardar(conn):
+            with conn:
+                conn.executemany(SQL_GUARDAR_USUARIO, filas)
+        await bot.bd.ejecutar(guardar)
+
+        planificador = e.application.bot_data['planificador']
+        motor = e.application.bot_data['difusion']
+        inicio = time.perf_counter()
+        carga = asyncio.create_task(interactivo(e, args.segundos, args.ritmo, 50))
+
+        # /alerta cuando va la mitad de los resúmenes
+        while planificador.estadisticas['resumenes'] < args.suscritos // 2:
+            await asyncio.sleep(0.05)
+        await e.entregar(update_mensaje(0, ADMIN, '/alerta Simulacro de alerta'))
+        while not motor.activas:
+            await asyncio.sleep(0.01)
+        antes = planificador.estadisticas['resumenes'] + planificador.estadisticas['seguimientos']
+        inicio_alerta = time.perf_counter()
+        while motor.activas:
+            await asyncio.sleep(0.05)
+        fin_alerta = time.perf_counter()
+        duracion_alerta = fin_alerta - inicio_alerta
+        durante = planificador.estadisticas['resumenes'] + planificador.estadisticas['seguimientos'] - antes
+
+        limite = time.monotonic() + args.plazo
+        while planificador.estadisticas['resumenes'] < args.suscritos and time.monotonic() < limite:
+            await asyncio.sleep(0.1)
+        segundos = time.perf_counter() - inicio
+        latencias_carga = await carga
+
+        # Envíos programados: los que no caen dentro de la alerta
+        envios = [
+            t for uid, respuestas in e.servidor.respuestas.items() if uid >= PRIMER_SUSCRITO
+            for _, t in respuestas if not inicio_alerta - 1 <= t <= fin_alerta
+        ]
+        s = planificador.resumen()
+        print(f"{args.suscritos} suscritos en {len(RESIDENCIAS)} residencias, tasa {args.tasa}/s, paso {args.paso}s")
+        print(
+            f"resúmenes: {s['resumenes']} con {s['textos']} textos, seguimientos: {s['seguimientos']}, "
+            f"en {segundos:.1f}s (pasos {s['pasos']}, cedidos {s['pasos_cedidos']}, esperas {s['esperas_prioridad']})"
+        )
+        print(
+            f"alerta: {duracion_alerta:.1f}s, envíos programados durante la alerta: {durante}; "
+            f"máximo de envíos programados por segundo: {tasa_maxima(envios)}"
+        )
+        for nombre, latencias in (('sin envíos', latencias_base), ('con envíos', latencias_carga)):
+            r = resumen_latencias(latencias)
+            print(f"/ultimos {nombre:11s} p50 {r['p50_ms']:6.1f} ms  p95 {r['p95_ms']:6.1f} ms  máx {r['max_ms']:6.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--suscritos', type=int, default=600)
+    parser.add_argument('--tasa', type=float, default=20, help="mensajes programados por segundo")
+    parser.add_argument('--paso', type=float, default=2, help="segundos entre pasos del planificador")
+    parser.add_argument('--ritmo', type=float, default=20, help="consultas interactivas por segundo")
+    parser.add_argument('--segundos', type=float, default=10, help="duración de cada fase interactiva")
+    parser.add_argument('--plazo', type=float, default=300)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(medir(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Benchmark del despliegue en varios procesos (``reparto.py``).
+
+Arranca el receptor y sus trabajadores contra la Bot API falsa con 1, 2,
+4… trabajadores, deja en ``getUpdates`` una ráfaga de mensajes de muchos
+usuarios y mide cuántas actualizaciones por segundo se responden. La mejora
+depende de los núcleos disponibles: el servidor falso y el receptor
+comparten el proceso del benchmark.
+
+Uso:
+    python -m benchmarks.bench_reparto
+    python -m benchmarks.bench_reparto --trabajadores 1 2 4 8 --usuarios 500 --mensajes 10
+"""
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.telegram_falso import ServidorTelegramFalso, update_mensaje
+
+# Comandos que no llaman al modelo: se mide el coste del propio bot
+MENSAJES = ['/ultimos 5', '/cerca Santiago de Cuba 200 50000', '/cerca Palma Soriano', 'hola']
+
+
+async def medir(trabajadores, usuarios, mensajes, plazo):
+    from reparto import Receptor
+
+    servidor = ServidorTelegramFalso()
+    await servidor.iniciar()
+    receptor = Receptor('123:falso', base_url=servidor.url, trabajadores=trabajadores, modo='polling')
+    inicio = time.perf_counter()
+    await receptor.iniciar()
+    while receptor.resumen()['trabajadores_activos'] < trabajadores:
+        await asyncio.sleep(0.1)
+    arranque = time.perf_counter() - inicio
+
+    async def rafaga(por_usuario):
+        esperadas = servidor.llamadas['sendMessage'] + usuarios * por_usuario
+        inicio = time.perf_counter()
+        for i in range(por_usuario):
+            for uid in range(1, usuarios + 1):
+                await servidor.encolar_update(update_mensaje(0, 100000 + uid, MENSAJES[(uid + i) % len(MENSAJES)]))
+        limite = time.monotonic() + plazo
+        while servidor.llamadas['sendMessage'] < esperadas and time.monotonic() < limite:
+            await asyncio.sleep(0.01)
+        return usuarios * por_usuario - max(0, esperadas - servidor.llamadas['sendMessage']), time.perf_counter() - inicio
+
+    # Calentamiento: primera interacción de cada usuario
+    await rafaga(1)
+    atendidas, segundos = await rafaga(mensajes)
+    await receptor.detener()
+    await servidor.detener()
+    return arranque, atendidas, segundos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trabajadores', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--usuarios', type=int, default=300)
+    parser.add_argument('--mensajes', type=int, default=10, help="mensajes por usuario en la ráfaga")
+    parser.add_argument('--plazo', type=float, default=300)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    directorio = tempfile.mkdtemp()
+    try:
+        # Los trabajadores heredan este entorno al arrancar
+        shutil.copy('sismos_bot.db', os.path.join(directorio, 'bot.db'))
+        os.environ['DB_PATH'] = os.path.join(directorio, 'bot.db')
+        os.environ['GEMINI_MODEL'] = 'falso'
+        os.environ['CATALOGO_RUTA'] = os.path.join(directorio, 'catalogo')
+        os.environ['MEDIOS_RUTA'] = os.path.join(directorio, 'medios')
+        os.environ['METRICAS_PUERTO'] = '0'
+        os.environ['REPARTO_LOG_NIVEL'] = 'WARNING'
+
+        print(f"{os.cpu_count()} núcleos, {args.usuarios} usuarios × {args.mensajes} mensajes")
+        base = None
+        for n in args.trabajadores:
+            arranque, atendidas, segundos = asyncio.run(medir(n, args.usuarios, args.mensajes, args.plazo))
+            tasa = atendidas / segundos
+            base = base or tasa
+            print(
+                f"{n:3d} trabajadores: {tasa:8.0f} act/s  ×{tasa / base:4.2f}  "
+                f"({atendidas} en {segundos:.2f}s, arranque {arranque:.1f}s)"
+            )
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Benchmark del vigilante del bucle y del perfilador (``vigilancia.py``) contra la Bot API falsa.
+
+Mide el coste del vigilante encendido frente a apagado (CPU del proceso en
+reposo y latencia de /ultimos bajo carga), comprueba que un manejador que
+bloquea el bucle con una llamada síncrona queda registrado con su pila, su
+manejador y su actualización, y lanza un /perfil con carga para ver el
+archivo plegado que devuelve.
+
+Uso:
+    python -m benchmarks.bench_vigilancia
+    python -m benchmarks.bench_vigilancia --ritmo 50 --segundos 20 --bloqueo 1
+"""
+import argparse
+import asyncio
+import logging
+import time
+from collections import Counter
+
+from benchmarks.entorno import entorno_bot, resumen_latencias
+from benchmarks.telegram_falso import update_mensaje
+
+ADMIN = 1
+
+
+class Capturas(logging.Handler):
+    """Guarda los avisos de los módulos vigilados."""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.mensajes = []
+
+    def emit(self, record):
+        self.mensajes.append(record.getMessage())
+
+
+async def interactivo(e, segundos, ritmo, usuarios):
+    """Consultas /ultimos a ``ritmo`` por segundo; devuelve sus latencias."""
+    latencias = []
+
+    async def una(uid):
+        espera = e.servidor.esperar_respuesta(uid)
+        inicio = time.perf_counter()
+        await e.entregar(update_mensaje(0, uid, '/ultimos 5'))
+        latencias.append(await asyncio.wait_for(espera, 30) - inicio)
+
+    tareas = []
+    fin = time.monotonic() + segundos
+    i = 0
+    while time.monotonic() < fin:
+        tareas.append(asyncio.create_task(una(1000 + i % usuarios)))
+        i += 1
+        await asyncio.sleep(1 / ritmo)
+    await asyncio.gather(*tareas, return_exceptions=True)
+    return latencias
+
+
+async def cpu_en_reposo(segundos):
+    inicio = time.process_time()
+    await asyncio.sleep(segundos)
+    return (time.process_time() - inicio) / segundos
+
+
+async def medir(args):
+    configuracion = {
+        'ADMIN_IDS': str(ADMIN),
+        'MANEJADOR_LENTO': str(args.bloqueo / 2),
+        'PERFIL_RUTA': args.ruta,
+    }
+    async with entorno_bot(configuracion=configuracion) as e:
+        from metricas import medir as medir_manejador
+        from telegram.ext import CommandHandler
+
+        capturas = Capturas()
+        for nombre in ('vigilancia', 'metricas'):
+            logging.getLogger(nombre).addHandler(capturas)
+
+        @medir_manejador
+        async def bloquear(update, context):
+            # Una llamada síncrona en un manejador: lo que el vigilante debe delatar
+            time.sleep(args.bloqueo)
+            await update.message.reply_text("hecho")
+
+        e.application.add_handler(CommandHandler('bloquear', bloquear))
+        vigilante = e.application.bot_data['vigilante']
+
+        # Coste: la misma carga con el vigilante encendido y apagado
+        fases = {}
+        for fase in ('encendido', 'apagado'):
+            if fase == 'apagado':
+                vigilante.detener()
+            cpu = await cpu_en_reposo(args.reposo)
+            latencias = await interactivo(e, args.segundos, args.ritmo, 50)
+            fases[fase] = (cpu, latencias)
+        vigilante.iniciar()
+        for fase, (cpu, latencias) in fases.items():
+            r = resumen_latencias(latencias)
+            print(
+                f"vigilante {fase:9s} CPU en reposo {cpu:6.2%}  /ultimos p50 {r['p50_ms']:6.1f} ms  "
+                f"p95 {r['p95_ms']:6.1f} ms  máx {r['max_ms']:6.1f} ms"
+            )
+
+        # Bloqueo: pila capturada mientras dura y registro del manejador lento
+        espera = e.servidor.esperar_respuesta(ADMIN)
+        await e.entregar(update_mensaje(0, ADMIN, '/bloquear'))
+        await asyncio.wait_for(espera, 30)
+        await asyncio.sleep(0.2)
+        pila = next((m for m in capturas.mensajes if 'sin responder' in m), '')
+        lento = next((m for m in capturas.mensajes if m.startswith('Manejador lento')), '')
+        print(f"bloqueo de {args.bloqueo}s: {vigilante.estadisticas['bloqueos']} bloqueos, máx {vigilante.estadisticas['bloqueo_max_s']:.2f}s")
+        print(f"  pila capturada: {'sí' if pila else 'no'}; señala el manejador: {'manejador bloquear (update' in pila}; "
+              f"señala la llamada: {'time.sleep' in pila}")
+        print(f"  {lento or 'sin registro de manejador lento'}")
+
+        # Perfil con carga
+        espera = e.servidor.esperar_respuesta(ADMIN)
+        await e.entregar(update_mensaje(0, ADMIN, f'/perfil {args.perfil}'))
+        await asyncio.wait_for(espera, 30)
+        inicio = time.perf_counter()
+        await interactivo(e, args.perfil, args.ritmo, 50)
+        while not e.servidor.documentos.get(ADMIN):
+            await asyncio.sleep(0.1)
+        nombre, contenido = e.servidor.documentos[ADMIN][-1]
+        lineas = contenido.decode().splitlines()
+        print(f"perfil: {nombre}, {len(lineas)} pilas distintas, recibido a los {time.perf_counter() - inicio:.1f}s")
+        propias = Counter()
+        for linea in lineas:
+            pila, _, n = linea.rpartition(' ')
+            propias[pila.rsplit(';', 1)[-1]] += int(n)
+        for funcion, n in propias.most_common(5):
+            print(f"  {n:5d}  {funcion}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ritmo', type=float, default=30, help="consultas interactivas por segundo")
+    parser.add_argument('--segundos', type=float, default=10, help="duración de cada fase con carga")
+    parser.add_argument('--reposo', type=float, default=5, help="segundos en reposo para medir la CPU")
+    parser.add_argument('--bloqueo', type=float, default=0.8, help="segundos que bloquea /bloquear")
+    parser.add_argument('--perfil', type=int, default=5, help="segundos del /perfil")
+    parser.add_argument('--ruta', default='benchmarks/resultados/perfiles')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(medir(args))
+
+
+if __name__ == "__main__":
+    main()
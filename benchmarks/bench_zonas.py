@@ -0,0 +1,63 @@
+"""Benchmark del índice espacial de zonas con miles de polígonos sintéticos.
+
+Genera una malla de hexágonos sobre la provincia y mide el tiempo medio de
+``IndiceRiesgo.localizar`` (punto en polígono y zona más cercana) y de
+``IndiceRiesgo.resolver`` con las zonas reales.
+
+Uso:
+    python -m benchmarks.bench_zonas --poligonos 20000
+"""
+import argparse
+import math
+import random
+import time
+
+from riesgo import IndiceRiesgo, Zona
+
+
+def hexagono(lat, lon, radio_km):
+    dlat = radio_km / 111.32
+    dlon = radio_km / (111.32 * math.cos(math.radians(lat)))
+    return [
+        (lat + dlat * math.sin(math.radians(a)), lon + dlon * math.cos(math.radians(a)))
+        for a in range(0, 360, 60)
+    ]
+
+
+def indice_sintetico(n, radio_km):
+    indice = IndiceRiesgo()
+    lado = math.ceil(math.sqrt(n))
+    for k in range(n):
+        lat = 19.85 + 0.6 * (k // lado) / lado
+        lon = -76.75 + 1.4 * (k % lado) / lado
+        zona = Zona(f"z{k}", f"Zona {k}", "Sintético", "localidad", "C", 8, "mixta", "alto")
+        indice.agregar(zona, poligono=hexagono(lat, lon, radio_km), centro=(lat, lon))
+    return indice
+
+
+def medir(nombre, funcion, puntos):
+    inicio = time.perf_counter()
+    for p in puntos:
+        funcion(*p)
+    media = (time.perf_counter() - inicio) / len(puntos)
+    print(f"{nombre:<28} {media * 1e6:8.1f} µs/consulta")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--poligonos', type=int, default=20000)
+    parser.add_argument('--consultas', type=int, default=20000)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    sintetico = indice_sintetico(args.poligonos, radio_km=0.3)
+    print(f"Índice de {args.poligonos} polígonos construido en {time.perf_counter() - inicio:.2f}s")
+
+    puntos = [(random.uniform(19.85, 20.45), random.uniform(-76.75, -75.35)) for _ in range(args.consultas)]
+    medir("localizar (sintético)", sintetico.localizar, puntos)
+
+    real = IndiceRiesgo()
+    real.cargar()
+    medir("localizar (zonas reales)", real.localizar, puntos)
+    textos = [("Vivo en Vista Alegre, Santiago de Cuba",), ("reparto sueño",), ("vista alegr",), ("La Habana",)]
+    medir("resolver texto (zonas reales)", real.resolver, textos * (args.consultas // 4))
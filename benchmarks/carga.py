@@ -0,0 +1,294 @@
+"""Pruebas de carga del bot sin conexión (Bot API y Gemini falsos).
+
+Escenarios:
+
+- ``consultas``: oleada de consultas a la IA tras un sismo. Cada usuario
+  pulsa «Consultar» y escribe una pregunta; muchas se repiten.
+- ``registro``: avalancha de registros completos (ocho pasos y los
+  consejos personalizados del final).
+- ``difusion``: un administrador envía ``/alerta`` a miles de suscritos.
+
+Cada escenario informa del rendimiento, de las latencias p50/p95/p99 y del
+tiempo que el bucle de eventos estuvo bloqueado. Los resultados se guardan
+en JSON (``benchmarks/resultados``) para compararlos con ``--comparar``.
+
+Uso:
+    python -m benchmarks.carga --escenario consultas --usuarios 500 --rampa 5
+    python -m benchmarks.carga --escenario difusion --suscriptores 5000 --tasa 1000
+    python -m benchmarks.carga --escenario todos --comparar benchmarks/resultados/base.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from benchmarks.entorno import MonitorBucle, entorno_bot, esperar_calma, resumen_latencias
+from benchmarks.telegram_falso import update_boton, update_mensaje
+
+ESCENARIOS = ('consultas', 'registro', 'difusion')
+DIRECTORIO_RESULTADOS = os.path.join('benchmarks', 'resultados')
+PAUSA_CALMA = float(os.getenv('EDICION_INTERVALO', '1.0')) + 0.25
+
+PREGUNTAS = [
+    "¿Qué hago durante un sismo?",
+    "¿Habrá réplicas?",
+    "¿Cómo preparo una mochila de emergencia?",
+    "¿Es seguro quedarme en un edificio prefabricado?",
+    "¿Qué magnitud tuvo el sismo de hoy?",
+    "¿Dónde están los puntos de reunión de mi barrio?",
+    "¿Puedo volver a entrar a mi casa?",
+    "¿Cómo cierro la llave del gas?",
+]
+PASOS_REGISTRO = [
+    'Ana', 'Pérez Soler', '34', 'Femenino', 'Universitario', 'Santiago de Cuba', 'no', 'Sí'
+]
+ADMIN_ID = 999
+
+
+class Sesion:
+    """Envía actualizaciones de un chat y mide el tiempo hasta sus respuestas."""
+
+    def __init__(self, entorno, chat_id, plazo):
+        self.entorno = entorno
+        self.chat_id = chat_id
+        self.plazo = plazo
+        self._update_id = 0
+
+    async def enviar(self, update):
+        """Entrega ``update`` y devuelve (primera respuesta, última respuesta) en segundos."""
+        servidor = self.entorno.servidor
+        respuesta = servidor.esperar_respuesta(self.chat_id)
+        inicio = time.perf_counter()
+        await self.entorno.entregar(update)
+        try:
+            primera = await asyncio.wait_for(respuesta, self.plazo) - inicio
+        except TimeoutError:
+            return None, None
+        await esperar_calma(servidor, self.chat_id, PAUSA_CALMA)
+        return primera, servidor.respuestas[self.chat_id][-1][1] - inicio
+
+    async def mensaje(self, texto):
+        self._update_id += 1
+        return await self.enviar(update_mensaje(self._update_id, self.chat_id, texto))
+
+    async def boton(self, datos):
+        self._update_id += 1
+        return await self.enviar(update_boton(self._update_id, self.chat_id, datos))
+
+
+def _zipf(opciones, s=1.1):
+    # Unas pocas preguntas concentran la mayoría de las consultas
+    pesos = [1 / (i + 1) ** s for i in range(len(opciones))]
+    return random.choices(opciones, pesos)[0]
+
+
+# ========== ESCENARIOS ==========
+async def escenario_consultas(entorno, args):
+    preguntas = PREGUNTAS[:args.distintas] if args.distintas <= len(PREGUNTAS) else [
+        f"{PREGUNTAS[i % len(PREGUNTAS)]} ({i})" for i in range(args.distintas)
+    ]
+    primeras, finales = [], []
+
+    async def usuario(n):
+        await asyncio.sleep(random.uniform(0, args.rampa))
+        sesion = Sesion(entorno, 100000 + n, args.plazo)
+        await sesion.boton('consulta_ia')
+        primera, final = await sesion.mensaje(_zipf(preguntas))
+        primeras.append(primera)
+        finales.append(final)
+
+    await asyncio.gather(*(usuario(n) for n in range(args.usuarios)))
+    return {
+        'actualizaciones': args.usuarios * 2,
+        'sin_respuesta': primeras.count(None),
+        'latencias': {
+            'primera_respuesta': resumen_latencias(primeras),
+            'respuesta_completa': resumen_latencias(finales),
+        },
+    }
+
+
+async def escenario_registro(entorno, args):
+    por_paso = {paso: [] for paso in ['inicio'] + list(range(1, len(PASOS_REGISTRO) + 1))}
+
+    async def usuario(n):
+        await asyncio.sleep(random.uniform(0, args.rampa))
+        sesion = Sesion(entorno, 200000 + n, args.plazo)
+        primera, _ = await sesion.boton('registro')
+        por_paso['inicio'].append(primera)
+        for i, texto in enumerate(PASOS_REGISTRO, 1):
+            primera, _ = await sesion.mensaje(texto)
+            por_paso[i].append(primera)
+
+    await asyncio.gather(*(usuario(n) for n in range(args.usuarios)))
+    todas = [v for valores in por_paso.values() for v in valores]
+    return {
+        'actualizaciones': len(todas),
+        'sin_respuesta': todas.count(None),
+        'latencias': {
+            'paso': resumen_latencias(todas),
+            'final_con_consejos': resumen_latencias(por_paso[len(PASOS_REGISTRO)]),
+        },
+    }
+
+
+def _crear_suscriptores(conn, cantidad):
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO usuarios (user_id, nombre, apellidos, edad, sexo, "
+            "nivel_academico, residencia, email, recibir_info, fecha_registro) "
+            "VALUES (?, 'Suscriptor', 'Prueba', 30, 'Otro', 'Otro', 'Santiago', NULL, 'Sí', '2024-01-01')",
+            [(300000 + i,) for i in range(cantidad)]
+        )
+    return conn.execute(
+        "SELECT COUNT(*) FROM usuarios WHERE lower(recibir_info) IN ('sí', 'si')"
+    ).fetchone()[0]
+
+
+async def escenario_difusion(entorno, args):
+    destinatarios = await entorno.bot.bd.ejecutar(_crear_suscriptores, args.suscriptores)
+    servidor = entorno.servidor
+    # Primera respuesta: «Difusión iniciada»; segunda: el informe final
+    confirmacion = servidor.esperar_respuesta(ADMIN_ID)
+    informe = servidor.esperar_respuesta(ADMIN_ID)
+    inicio = time.perf_counter()
+    await entorno.entregar(update_mensaje(
+        1, ADMIN_ID, '/alerta Simulacro: réplica fuerte esperada. Aléjese de edificios dañados.'
+    ))
+    await asyncio.wait_for(confirmacion, args.plazo)
+    await asyncio.wait_for(informe, args.plazo + destinatarios / args.tasa * 2)
+    entregas = [
+        respuestas[0][1] - inicio
+        for chat_id, respuestas in servidor.respuestas.items()
+        if chat_id != ADMIN_ID and respuestas
+    ]
+    return {
+        'actualizaciones': len(entregas),
+        'destinatarios': destinatarios,
+        'sin_respuesta': destinatarios - len(entregas),
+        'latencias': {'entrega': resumen_latencias(entregas)},
+    }
+
+
+# ========== EJECUCIÓN Y RESULTADOS ==========
+async def ejecutar(args):
+    random.seed(args.semilla)
+    configuracion = {
+        'IA_FALSO_LATENCIA': str(args.latencia_ia),
+        'IA_FALSO_LATENCIA_MAX': str(args.latencia_ia_max),
+        'IA_FALSO_DISTRIBUCION': args.distribucion,
+        'IA_FALSO_LONGITUD': str(args.longitud),
+        'IA_FALSO_LONGITUD_MAX': str(args.longitud_max),
+        'DIFUSION_TASA': str(args.tasa),
+        'ADMIN_IDS': str(ADMIN_ID),
+    }
+    escenario = globals()[f'escenario_{args.escenario}']
+    async with entorno_bot(args.modo, args.latencia_api, args.puerto, configuracion) as entorno:
+        monitor = MonitorBucle()
+        monitor.iniciar()
+        inicio = time.perf_counter()
+        resultado = await escenario(entorno, args)
+        duracion = time.perf_counter() - inicio
+        await monitor.detener()
+        return {
+            'escenario': args.escenario,
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'parametros': {k: v for k, v in vars(args).items() if k not in ('comparar', 'salida')},
+            'duracion_s': duracion,
+            'rendimiento_por_s': resultado['actualizaciones'] / duracion,
+            **resultado,
+            'bucle': monitor.resumen(),
+            'ia': dict(entorno.bot.cliente_ia.estadisticas),
+            'admision': entorno.bot.admision.resumen(),
+        }
+
+
+def _valores(datos, prefijo=''):
+    # Aplana las métricas numéricas comparables de un resultado
+    for clave, valor in datos.items():
+        nombre = f'{prefijo}{clave}'
+        if isinstance(valor, dict):
+            yield from _valores(valor, nombre + '.')
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            yield nombre, valor
+
+
+def imprimir(resultado, base=None):
+    print(f"\n== {resultado['escenario']} ({resultado['parametros']['modo']}) ==")
+    anteriores = dict(_valores(base)) if base else {}
+    for nombre, valor in _valores(resultado):
+        if nombre.startswith(('parametros.', 'admision.', 'ia.')):
+            continue
+        linea = f"{nombre:<45} {valor:12.2f}"
+        if nombre in anteriores:
+            previo = anteriores[nombre]
+            cambio = (valor - previo) / previo * 100 if previo else 0.0
+            linea += f"   (antes {previo:10.2f}, {cambio:+6.1f}%)"
+        print(linea)
+
+
+def guardar(resultado, salida=None):
+    if salida is None:
+        os.makedirs(DIRECTORIO_RESULTADOS, exist_ok=True)
+        marca = resultado['fecha'].replace(':', '').replace('-', '')
+        salida = os.path.join(DIRECTORIO_RESULTADOS, f"{resultado['escenario']}-{marca}.json")
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"Resultado guardado en {salida}")
+
+
+def cargar_base(ruta, escenario):
+    """Resultado anterior del mismo escenario (un JSON o un directorio de resultados)."""
+    if not ruta:
+        return None
+    if os.path.isdir(ruta):
+        candidatos = sorted(
+            os.path.join(ruta, n) for n in os.listdir(ruta)
+            if n.startswith(f'{escenario}-') and n.endswith('.json')
+        )
+        if not candidatos:
+            return None
+        ruta = candidatos[-1]
+    with open(ruta, encoding='utf-8') as f:
+        base = json.load(f)
+    return base if base.get('escenario') == escenario else None
+
+
+def principal(args):
+    if args.escenario == 'todos':
+        # Cada escenario en su propio proceso: el bot lee la configuración al importarse
+        for escenario in ESCENARIOS:
+            subprocess.run([sys.executable, '-m', 'benchmarks.carga', *sys.argv[1:], '--escenario', escenario], check=True)
+        return
+    base = cargar_base(args.comparar, args.escenario)
+    resultado = asyncio.run(ejecutar(args))
+    imprimir(resultado, base)
+    guardar(resultado, args.salida)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--escenario', choices=ESCENARIOS + ('todos',), default='consultas')
+    parser.add_argument('--modo', choices=['webhook', 'polling'], default='webhook')
+    parser.add_argument('--usuarios', type=int, default=200)
+    parser.add_argument('--rampa', type=float, default=2.0, help="segundos en los que llegan los usuarios")
+    parser.add_argument('--distintas', type=int, default=8, help="preguntas distintas en la oleada")
+    parser.add_argument('--suscriptores', type=int, default=2000)
+    parser.add_argument('--tasa', type=float, default=500, help="mensajes/s de la difusión")
+    parser.add_argument('--latencia-ia', type=float, default=0.5, help="mediana o mínimo (s)")
+    parser.add_argument('--latencia-ia-max', type=float, default=3.0)
+    parser.add_argument('--distribucion', choices=['uniforme', 'lognormal'], default='lognormal')
+    parser.add_argument('--longitud', type=int, default=300)
+    parser.add_argument('--longitud-max', type=int, default=1500)
+    parser.add_argument('--latencia-api', type=float, default=0.02)
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--plazo', type=float, default=30.0)
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--salida', help="ruta del JSON de resultados")
+    parser.add_argument('--comparar', help="JSON o directorio con resultados anteriores")
+    principal(parser.parse_args())
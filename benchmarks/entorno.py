@@ -0,0 +1,160 @@
+"""Entorno común de los benchmarks del bot sin conexión.
+
+``entorno_bot`` prepara una copia temporal de la base de datos, el modelo de
+IA falso y el servidor falso de la Bot API, y arranca la aplicación real de
+``bot.crear_aplicacion`` en modo webhook o sondeo. ``MonitorBucle`` mide
+cuánto tiempo queda bloqueado el bucle de eventos mientras tanto.
+
+La configuración del bot se lee de variables de entorno al importarlo, así
+que cada proceso admite un único entorno.
+"""
+import asyncio
+import logging
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+
+from benchmarks.telegram_falso import ServidorTelegramFalso
+
+SECRETO = 'secreto-de-prueba'
+
+
+def percentil(valores, p):
+    if len(valores) < 2:
+        return valores[0] if valores else 0.0
+    return statistics.quantiles(valores, n=100, method='inclusive')[p - 1]
+
+
+def resumen_latencias(valores):
+    """p50/p95/p99 y máximo en milisegundos."""
+    validas = sorted(v for v in valores if v is not None)
+    if not validas:
+        return {'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+    return {
+        'p50_ms': percentil(validas, 50) * 1000,
+        'p95_ms': percentil(validas, 95) * 1000,
+        'p99_ms': percentil(validas, 99) * 1000,
+        'max_ms': validas[-1] * 1000,
+    }
+
+
+class MonitorBucle:
+    """Mide el bloqueo del bucle de eventos por el retraso de un temporizador."""
+
+    def __init__(self, intervalo=0.01, umbral=0.005):
+        self.intervalo = intervalo
+        self.umbral = umbral
+        self.bloqueado = 0.0
+        self.maximo = 0.0
+        self.eventos = 0
+        self._tarea = None
+
+    async def _bucle(self):
+        while True:
+            inicio = time.perf_counter()
+            await asyncio.sleep(self.intervalo)
+            retraso = time.perf_counter() - inicio - self.intervalo
+            if retraso > self.umbral:
+                self.bloqueado += retraso
+                self.eventos += 1
+                self.maximo = max(self.maximo, retraso)
+
+    def iniciar(self):
+        self._tarea = asyncio.create_task(self._bucle())
+
+    async def detener(self):
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except asyncio.CancelledError:
+            pass
+
+    def resumen(self):
+        return {
+            'bloqueado_ms': self.bloqueado * 1000,
+            'bloqueo_max_ms': self.maximo * 1000,
+            'bloqueos': self.eventos,
+        }
+
+
+class Entorno:
+    def __init__(self, bot, application, servidor, entregar, url=None, cliente=None):
+        self.bot = bot
+        self.application = application
+        self.servidor = servidor
+        self.entregar = entregar
+        self.url = url
+        self.cliente = cliente
+
+
+async def esperar_calma(servidor, chat_id, pausa):
+    # Un manejador puede enviar varios mensajes (o editar uno en flujo); se
+    # espera a que termine antes de enviar la siguiente actualización
+    anterior = -1
+    while len(servidor.respuestas[chat_id]) != anterior:
+        anterior = len(servidor.respuestas[chat_id])
+        await asyncio.sleep(pausa)
+
+
+@asynccontextmanager
+async def entorno_bot(modo='polling', latencia_api=0.0, puerto=8765, configuracion=None):
+    """Arranca el bot contra la Bot API falsa y lo detiene al salir."""
+    directorio = tempfile.mkdtemp()
+    shutil.copy('sismos_bot.db', os.path.join(directorio, 'bot.db'))
+    os.environ['DB_PATH'] = os.path.join(directorio, 'bot.db')
+    os.environ['GEMINI_MODEL'] = 'falso'
+    os.environ['CATALOGO_RUTA'] = os.path.join(directorio, 'catalogo')
+    os.environ['MEDIOS_RUTA'] = os.path.join(directorio, 'medios')
+    os.environ.setdefault('METRICAS_PUERTO', '0')
+    os.environ.update(configuracion or {})
+    import bot
+    logging.getLogger().setLevel(logging.WARNING)
+
+    servidor = ServidorTelegramFalso(latencia=latencia_api)
+    await servidor.iniciar()
+    bot.init_db()
+    bot.indice_riesgo.cargar()
+    bot.base_conocimiento.cargar()
+    bot.catalogo.abrir()
+    bot.catalogo.ingerir_directorio()
+    application = bot.crear_aplicacion(token='123:falso', base_url=servidor.url)
+    allowed_updates = bot.tipos_de_actualizacion(application)
+    await application.initialize()
+    await application.post_init(application)
+
+    cliente = httpx.AsyncClient(timeout=30)
+    url = None
+    if modo == 'webhook':
+        url = f'http://127.0.0.1:{puerto}/webhook'
+        await application.updater.start_webhook(
+            listen='127.0.0.1',
+            port=puerto,
+            url_path='webhook',
+            webhook_url=url,
+            secret_token=SECRETO,
+            allowed_updates=allowed_updates,
+        )
+
+        async def entregar(update):
+            await cliente.post(url, json=update, headers={'X-Telegram-Bot-Api-Secret-Token': SECRETO})
+    else:
+        await application.updater.start_polling(poll_interval=0, timeout=10, allowed_updates=allowed_updates)
+        entregar = servidor.encolar_update
+    await application.start()
+
+    try:
+        yield Entorno(bot, application, servidor, entregar, url, cliente)
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.post_shutdown(application)
+        await application.shutdown()
+        await cliente.aclose()
+        await servidor.detener()
+        bot.bd.cerrar()
+        shutil.rmtree(directorio, ignore_errors=True)
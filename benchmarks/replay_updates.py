@@ -0,0 +1,132 @@
+"""Reproduce actualizaciones grabadas contra el bot (webhook o sondeo).
+
+Levanta el servidor falso de la Bot API, construye la aplicación real con
+``bot.crear_aplicacion`` (modelo de IA falso y base de datos temporal) y
+envía las actualizaciones de cada chat en orden, con todos los chats en
+paralelo. Para cada actualización mide la latencia extremo a extremo: desde
+que se entrega al bot hasta que el servidor falso recibe la primera respuesta
+para ese chat.
+
+Uso:
+    python -m benchmarks.replay_updates --modo webhook --usuarios 200
+    python -m benchmarks.replay_updates --modo polling --grabacion updates.jsonl
+    python -m benchmarks.replay_updates --usuarios 50 --grabar updates.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import defaultdict
+
+from benchmarks.entorno import entorno_bot, esperar_calma, percentil
+from benchmarks.telegram_falso import update_boton, update_mensaje
+
+PREGUNTAS = [
+    "¿Qué hago durante un sismo?",
+    "¿Habrá réplicas?",
+    "¿Cómo preparo una mochila de emergencia?",
+    "¿Es seguro quedarme en un edificio prefabricado?",
+]
+# Algo más que el intervalo entre ediciones de las respuestas en flujo
+PAUSA_CALMA = float(os.getenv('EDICION_INTERVALO', '1.0')) + 0.25
+
+
+def generar_sesiones(usuarios: int, primer_id: int = 1000):
+    """Sesiones típicas tras un sismo: menú, consejos, consulta y evaluación."""
+    updates = []
+    update_id = 1
+    for n in range(usuarios):
+        uid = primer_id + n
+        pasos = [
+            update_mensaje(update_id, uid, '/start'),
+            update_boton(update_id + 1, uid, 'consejos'),
+            update_boton(update_id + 2, uid, 'consulta_ia'),
+            update_mensaje(update_id + 3, uid, PREGUNTAS[n % len(PREGUNTAS)]),
+            update_boton(update_id + 4, uid, 'evaluar_riesgo'),
+            update_mensaje(update_id + 5, uid, 'Vista Alegre'),
+        ]
+        update_id += len(pasos)
+        updates.extend(pasos)
+    return updates
+
+
+def chat_de(update):
+    if 'message' in update:
+        return update['message']['chat']['id']
+    return update['callback_query']['from']['id']
+
+
+async def reproducir_chat(servidor, entregar, chat_id, updates, latencias, plazo):
+    for update in updates:
+        respuesta = servidor.esperar_respuesta(chat_id)
+        inicio = time.perf_counter()
+        await entregar(update)
+        try:
+            instante = await asyncio.wait_for(respuesta, plazo)
+            latencias.append(instante - inicio)
+        except TimeoutError:
+            latencias.append(None)
+        await esperar_calma(servidor, chat_id, PAUSA_CALMA)
+
+
+async def principal(args):
+    if args.grabacion:
+        with open(args.grabacion, encoding='utf-8') as f:
+            updates = [json.loads(linea) for linea in f if linea.strip()]
+    else:
+        updates = generar_sesiones(args.usuarios)
+    if args.grabar:
+        with open(args.grabar, 'w', encoding='utf-8') as f:
+            for u in updates:
+                f.write(json.dumps(u, ensure_ascii=False) + '\n')
+        print(f"{len(updates)} actualizaciones grabadas en {args.grabar}")
+        return
+
+    configuracion = {
+        'IA_FALSO_LATENCIA': str(args.latencia_ia),
+        'IA_FALSO_LATENCIA_MAX': str(args.latencia_ia * 3),
+    }
+    async with entorno_bot(args.modo, args.latencia_api, args.puerto, configuracion) as entorno:
+        if args.modo == 'webhook':
+            rechazo = await entorno.cliente.post(
+                entorno.url, json=updates[0], headers={'X-Telegram-Bot-Api-Secret-Token': 'malo'}
+            )
+            print(f"Petición con secreto incorrecto -> HTTP {rechazo.status_code}")
+
+        por_chat = defaultdict(list)
+        for u in updates:
+            por_chat[chat_de(u)].append(u)
+
+        latencias = []
+        inicio = time.perf_counter()
+        await asyncio.gather(*(
+            reproducir_chat(entorno.servidor, entorno.entregar, chat_id, lista, latencias, args.plazo)
+            for chat_id, lista in por_chat.items()
+        ))
+        total = time.perf_counter() - inicio
+
+    validas = sorted(x for x in latencias if x is not None)
+    print(f"Modo: {args.modo} | chats: {len(por_chat)} | actualizaciones: {len(updates)}")
+    print(f"Sin respuesta: {len(latencias) - len(validas)}")
+    print(f"Tiempo total: {total:.2f}s | {len(updates) / total:.1f} actualizaciones/s")
+    if validas:
+        print(
+            "Latencia extremo a extremo (ms): "
+            f"p50={percentil(validas, 50) * 1000:.1f} "
+            f"p95={percentil(validas, 95) * 1000:.1f} "
+            f"p99={percentil(validas, 99) * 1000:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modo', choices=['webhook', 'polling'], default='webhook')
+    parser.add_argument('--usuarios', type=int, default=100)
+    parser.add_argument('--grabacion', help="JSONL con actualizaciones grabadas")
+    parser.add_argument('--grabar', help="guarda las actualizaciones generadas y termina")
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--latencia-ia', type=float, default=0.3)
+    parser.add_argument('--latencia-api', type=float, default=0.0)
+    parser.add_argument('--plazo', type=float, default=30.0)
+    asyncio.run(principal(parser.parse_args()))
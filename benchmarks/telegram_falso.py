@@ -0,0 +1,247 @@
+"""Servidor falso de la Bot API de Telegram para pruebas sin conexión.
+
+Implementa lo mínimo que usa el bot sobre HTTP/1.1 con ``asyncio``:
+``getMe``, ``getUpdates`` (sondeo largo sobre una cola interna),
+``setWebhook``/``deleteWebhook``, ``getFile`` con la descarga de los
+archivos registrados en ``archivos`` y los métodos de envío
+(``sendMessage``, ``editMessageText``…), que se registran con su instante de
+llegada para medir la latencia extremo a extremo de cada chat. Los ficheros
+subidos con ``sendDocument`` se guardan en ``documentos`` por chat.
+"""
+import asyncio
+import json
+import time
+from collections import defaultdict
+from email.parser import BytesParser
+from email.policy import HTTP
+from urllib.parse import parse_qsl
+
+# Métodos que cuentan como respuesta visible para el usuario
+METODOS_RESPUESTA = {'sendMessage', 'editMessageText', 'sendPhoto', 'sendDocument'}
+
+USUARIO_BOT = {
+    'id': 1,
+    'is_bot': True,
+    'first_name': 'Bot falso',
+    'username': 'bot_falso',
+    'can_join_groups': False,
+    'can_read_all_group_messages': False,
+    'supports_inline_queries': False,
+}
+
+
+class ServidorTelegramFalso:
+
+    def __init__(self, host='127.0.0.1', puerto=0, latencia=0.0):
+        self.host = host
+        self.puerto = puerto
+        # Latencia simulada de cada llamada a la API (segundos)
+        self.latencia = latencia
+        self._servidor = None
+        self._updates = []
+        self._ultimo_update = 0
+        self._nuevas = None
+        self._esperas = defaultdict(list)
+        self._mensaje_id = 0
+        self.llamadas = defaultdict(int)
+        self.respuestas = defaultdict(list)
+        # file_id -> contenido que se sirve en /file/bot<token>/<file_id>
+        self.archivos = {}
+        # chat_id -> [(nombre, contenido)] de los ficheros enviados al chat
+        self.documentos = defaultdict(list)
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.puerto}"
+
+    async def iniciar(self):
+        self._nuevas = asyncio.Condition()
+        self._servidor = await asyncio.start_server(self._conexion, self.host, self.puerto)
+        self.puerto = self._servidor.sockets[0].getsockname()[1]
+
+    async def detener(self):
+        self._servidor.close()
+        await self._servidor.wait_closed()
+
+    # ----- Inyección de actualizaciones y espera de respuestas -----
+    async def encolar_update(self, update: dict):
+        """Deja una actualización disponible para ``getUpdates``.
+
+        Como Telegram, numera las actualizaciones en orden de llegada: las
+        grabadas pueden reproducirse intercaladas entre chats.
+        """
+        async with self._nuevas:
+            self._ultimo_update += 1
+            self._updates.append({**update, 'update_id': self._ultimo_update})
+            self._nuevas.notify_all()
+
+    def esperar_respuesta(self, chat_id) -> asyncio.Future:
+        """Futuro que se resuelve con el instante de la próxima respuesta al chat."""
+        futuro = asyncio.get_running_loop().create_future()
+        self._esperas[chat_id].append(futuro)
+        return futuro
+
+    # ----- HTTP -----
+    async def _conexion(self, reader, writer):
+        try:
+            while True:
+                linea = await reader.readline()
+                if not linea:
+                    break
+                _, ruta, _ = linea.decode('latin-1').split(' ', 2)
+                cabeceras = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b'\r\n', b'\n', b''):
+                        break
+                    nombre, _, valor = h.decode('latin-1').partition(':')
+                    cabeceras[nombre.strip().lower()] = valor.strip()
+                cuerpo = await reader.readexactly(int(cabeceras.get('content-length', 0)))
+                if ruta.startswith('/file/'):
+                    self.llamadas['descarga'] += 1
+                    datos = self.archivos.get(ruta.rsplit('/', 1)[-1])
+                    estado, tipo = ('200 OK', 'application/octet-stream') if datos is not None else ('404 Not Found', 'text/plain')
+                    datos = datos if datos is not None else b'no encontrado'
+                else:
+                    resultado = await self._atender(ruta, cabeceras.get('content-type', ''), cuerpo)
+                    datos = json.dumps({'ok': True, 'result': resultado}).encode('utf-8')
+                    estado, tipo = '200 OK', 'application/json'
+                writer.write(
+                    f'HTTP/1.1 {estado}\r\nContent-Type: {tipo}\r\n'
+                    f'Content-Length: {len(datos)}\r\n\r\n'.encode('latin-1')
+                    + datos
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # CancelledError: sondeo largo pendiente al detener el servidor
+            pass
+        finally:
+            writer.close()
+
+    async def _atender(self, ruta, tipo, cuerpo):
+        metodo = ruta.rstrip('/').rsplit('/', 1)[-1]
+        if 'json' in tipo:
+            params = json.loads(cuerpo or b'{}')
+        elif tipo.startswith('multipart/'):
+            params = self._multipart(tipo, cuerpo)
+        else:
+            params = dict(parse_qsl(cuerpo.decode('utf-8')))
+        self.llamadas[metodo] += 1
+        if self.latencia:
+            await asyncio.sleep(self.latencia)
+
+        if metodo == 'getMe':
+            return USUARIO_BOT
+        if metodo == 'getUpdates':
+            return await self._get_updates(
+                int(params.get('offset', 0) or 0), float(params.get('timeout', 0) or 0)
+            )
+        if metodo in ('sendMessage', 'editMessageText', 'sendPhoto', 'sendDocument'):
+            return self._registrar_envio(metodo, params)
+        if metodo == 'getFile':
+            file_id = params.get('file_id')
+            return {
+                'file_id': file_id,
+                'file_unique_id': f'u{file_id}',
+                'file_size': len(self.archivos.get(file_id, b'')),
+                'file_path': file_id,
+            }
+        return True
+
+    def _multipart(self, tipo, cuerpo):
+        # Envío con fichero adjunto: los campos de texto son los parámetros
+        formulario = BytesParser(policy=HTTP).parsebytes(f'Content-Type: {tipo}\r\n\r\n'.encode() + cuerpo)
+        params, ficheros = {}, []
+        for parte in formulario.iter_parts():
+            if parte.get_filename() is None:
+                params[parte.get_param('name', header='content-disposition')] = parte.get_content().strip()
+            else:
+                ficheros.append((parte.get_filename(), parte.get_payload(decode=True)))
+        self.documentos[int(params.get('chat_id', 0) or 0)].extend(ficheros)
+        return params
+
+    async def _get_updates(self, offset, timeout):
+        async with self._nuevas:
+            pendientes = [u for u in self._updates if u['update_id'] >= offset]
+            if not pendientes and timeout:
+                try:
+                    await asyncio.wait_for(self._nuevas.wait(), timeout)
+                except TimeoutError:
+                    pass
+                pendientes = [u for u in self._updates if u['update_id'] >= offset]
+            # Las ya confirmadas (update_id < offset) se descartan
+            self._updates = pendientes
+            return pendientes[:100]
+
+    def _registrar_envio(self, metodo, params):
+        instante = time.perf_counter()
+        chat_id = int(params.get('chat_id', 0) or 0)
+        self._mensaje_id += 1
+        if metodo in METODOS_RESPUESTA:
+            self.respuestas[chat_id].append((metodo, instante))
+            esperas = self._esperas.get(chat_id)
+            while esperas:
+                futuro = esperas.pop(0)
+                if not futuro.done():
+                    futuro.set_result(instante)
+                    break
+        return {
+            'message_id': int(params.get('message_id', 0) or 0) or self._mensaje_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': USUARIO_BOT,
+            'text': params.get('text', ''),
+        }
+
+
+# ========== GENERACIÓN DE ACTUALIZACIONES ==========
+def _usuario(uid):
+    return {'id': uid, 'is_bot': False, 'first_name': f'Usuario{uid}'}
+
+
+def update_mensaje(update_id, uid, texto):
+    mensaje = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': uid, 'type': 'private', 'first_name': f'Usuario{uid}'},
+        'from': _usuario(uid),
+        'text': texto,
+    }
+    if texto.startswith('/'):
+        mensaje['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(texto.split()[0])}]
+    return {'update_id': update_id, 'message': mensaje}
+
+
+def update_medio(update_id, uid, tipo, file_id, file_unique_id=None):
+    """Foto (``tipo='foto'``) o nota de voz con el archivo ``file_id``."""
+    archivo = {'file_id': file_id, 'file_unique_id': file_unique_id or f'u{file_id}'}
+    mensaje = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': uid, 'type': 'private', 'first_name': f'Usuario{uid}'},
+        'from': _usuario(uid),
+    }
+    if tipo == 'foto':
+        mensaje['photo'] = [{**archivo, 'width': 1280, 'height': 960}]
+    else:
+        mensaje['voice'] = {**archivo, 'duration': 5, 'mime_type': 'audio/ogg'}
+    return {'update_id': update_id, 'message': mensaje}
+
+
+def update_boton(update_id, uid, datos):
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': _usuario(uid),
+            'chat_instance': str(uid),
+            'data': datos,
+            'message': {
+                'message_id': 1,
+                'date': int(time.time()),
+                'chat': {'id': uid, 'type': 'private'},
+                'from': USUARIO_BOT,
+                'text': 'Menú',
+            },
+        },
+    }
@@ -1,9 +1,34 @@
+import asyncio
+import csv
 import logging
-import sqlite3
-from datetime import datetime
+import math
 from dotenv import load_dotenv
 import os
-import google.generativeai as genai
+import secrets
+import tempfile
+import time
+from contextlib import nullcontext
+from ia import ClienteIA
+from admision import ControlAdmision
+from base_datos import (
+    bd, cola_escritura, init_db, save_user, save_query, save_media,
+    asignar_municipios, estadisticas_uso
+)
+from cache_respuestas import CacheRespuestas, version_plantilla
+from catalogo import CATALOGO_INTERVALO, CatalogoSismos, formatear_sismo
+from conocimiento import BaseConocimiento
+from difusion import MotorDifusion
+from medios import ProcesadorMedios
+from padron import COLUMNAS as COLUMNAS_PADRON, ErrorPadron, exportar_csv, formatear_resumen, importar_csv
+from recomendaciones import GeneradorRecomendaciones, PROMPT_CONSEJOS
+from persistencia import PersistenciaSQLite
+from procesador import ProcesadorPorUsuario
+from programacion import PROGRAMACION_PASO, Planificador, leer_ventana
+from respuesta_progresiva import RespuestaProgresiva
+from retencion import RETENCION_DIAS, RETENCION_INTERVALO, Retencion
+from metricas import ACTUALIZACION_RETRASO, ESTADOS_CONVERSACION, iniciar_servidor, medir, registro
+from riesgo import AVISO_ORIENTATIVO, IndiceRiesgo, PLANTILLA_REDACCION, formatear_evaluacion, prompt_redaccion
+from vigilancia import PERFIL_MAX_SEGUNDOS, Perfilador, VigilanteBucle
 from telegram import (
     Update,
     ReplyKeyboardMarkup,
@@ -11,6 +36,7 @@ from telegram import (
     InlineKeyboardButton,
     InlineKeyboardMarkup
 )
+from telegram.error import TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -18,7 +44,8 @@ from telegram.ext import (
     filters,
     ConversationHandler,
     ContextTypes,
-    CallbackQueryHandler
+    CallbackQueryHandler,
+    TypeHandler
 )
 
 # Cargar variables de entorno
@@ -31,12 +58,123 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Configura API de Gemini
-genai.configure(
-    api_key=os.getenv('GEMINI_API_KEY'),
-    client_options={
-        'api_endpoint': 'https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent'
-    }
+# Cliente asíncrono compartido por todos los manejadores; Gemini se importa y
+# configura con el primer uso (ver ia.cargar_genai)
+cliente_ia = ClienteIA()
+# Cargar los clientes pesados en segundo plano en cuanto el bot ya atiende
+BOT_PRECALENTAR = os.getenv('BOT_PRECALENTAR', '1') == '1'
+
+RESPUESTA_IA_SATURADA = (
+    "⏳ El servicio de consultas está muy ocupado en este momento. "
+    "Mientras tanto, recuerda: mantén la calma, aléjate de ventanas y "
+    "sigue las indicaciones de la Defensa Civil. Intenta tu consulta de nuevo en unos minutos."
+)
+RESPUESTA_LIMITE_USUARIO = "⏳ Estás enviando consultas muy rápido. Espera unos segundos e inténtalo de nuevo."
+
+# Límites por usuario y cola global para las llamadas al modelo
+admision = ControlAdmision()
+
+def turno_ia(prompt, temperatura=0.7, max_tokens=None):
+    """Turno de admisión para una llamada al modelo.
+
+    Si ya hay una llamada idéntica en curso, la petición se une a ella sin
+    ocupar otro hueco de la cola global.
+    """
+    if cliente_ia.en_vuelo(prompt, temperatura, max_tokens):
+        return nullcontext(True)
+    return admision.turno()
+
+RESPUESTA_IA_INCOMPLETA = "\n\n⚠️ La respuesta quedó incompleta. Intenta tu consulta de nuevo en unos minutos."
+
+# Administradores del bot (IDs de Telegram separados por comas)
+ADMIN_IDS = {
+    int(uid) for uid in os.getenv('ADMIN_IDS', '').replace(' ', '').split(',') if uid
+}
+
+def es_admin(user_id) -> bool:
+    return user_id in ADMIN_IDS
+
+# Prompt de consultas y caché de respuestas asociada
+PROMPT_CONSULTA_IA = "Eres un experto en sismología en Cuba. Responde de forma clara y concisa. Pregunta: {pregunta}"
+CONFIG_CONSULTA_IA = {'temperatura': 0.7, 'max_tokens': 500}
+
+# Con pasajes de la base de conocimiento la respuesta se apoya en ellos y es más corta
+PROMPT_CONSULTA_CONTEXTO = (
+    "Eres un experto en sismología en Cuba. Responde de forma clara y concisa, en no más de "
+    "150 palabras, usando la información de referencia cuando sea pertinente.\n"
+    "Referencia:\n{contexto}\n\nPregunta: {pregunta}"
+)
+CONFIG_CONSULTA_CONTEXTO = {'temperatura': 0.4, 'max_tokens': 250}
+
+# Guías, catálogo y preguntas frecuentes locales (se carga en main)
+base_conocimiento = BaseConocimiento()
+
+def prompt_consulta(pregunta):
+    """Prompt y configuración de una consulta, con los pasajes relevantes si los hay."""
+    pasajes = base_conocimiento.buscar(pregunta)
+    if not pasajes:
+        return PROMPT_CONSULTA_IA.format(pregunta=pregunta), CONFIG_CONSULTA_IA
+    contexto = "\n".join(f"- {p.titulo}: {p.texto}" for p in pasajes)
+    return PROMPT_CONSULTA_CONTEXTO.format(contexto=contexto, pregunta=pregunta), CONFIG_CONSULTA_CONTEXTO
+
+cache_consultas = CacheRespuestas(
+    'consulta_ia',
+    version=version_plantilla(
+        PROMPT_CONSULTA_IA, CONFIG_CONSULTA_IA, PROMPT_CONSULTA_CONTEXTO, CONFIG_CONSULTA_CONTEXTO
+    ),
+    max_entradas=int(os.getenv('CACHE_MAX_ENTRADAS', '2000')),
+    ttl=float(os.getenv('CACHE_TTL', str(6 * 3600))),
+    similitud=float(os.getenv('CACHE_SIMILITUD', '1.0')),
+    bd=bd if os.getenv('CACHE_PERSISTENTE', '1') == '1' else None
+)
+
+# Índice local de riesgo por municipio/localidad (se carga en main)
+indice_riesgo = IndiceRiesgo()
+
+PROMPT_EVALUACION_RIESGO = "Evalúa el riesgo sísmico en Santiago de Cuba considerando: historia sísmica, tipo de construcciones y geología. Ubicación: {ubicacion}"
+# Respuesta local para una ubicación desconocida si el modelo no responde a tiempo
+EVALUACION_GENERAL = (
+    "Santiago de Cuba es la región de mayor peligro sísmico del país. Sin datos de tu "
+    "ubicación no podemos precisar el nivel de riesgo: revisa el estado de tu vivienda, "
+    "identifica los lugares seguros y las rutas de evacuación, y sigue las indicaciones "
+    "de la Defensa Civil."
+)
+
+# Si está activo, el modelo redacta la evaluación de las zonas conocidas (una vez por zona)
+RIESGO_REDACCION_IA = os.getenv('RIESGO_REDACCION_IA', '0') == '1'
+cache_redaccion_riesgo = CacheRespuestas(
+    'evaluacion_riesgo',
+    version=version_plantilla(PLANTILLA_REDACCION),
+    ttl=float(os.getenv('RIESGO_REDACCION_TTL', str(7 * 24 * 3600))),
+    similitud=1.0
+)
+
+def municipio_de(residencia):
+    """Municipio de una residencia escrita libremente, o ``None`` si no se reconoce."""
+    coincidencia = indice_riesgo.resolver(residencia or '')
+    return coincidencia.zona.municipio if coincidencia else None
+
+# Si está activo, el modelo redacta el recordatorio de cada localidad en los resúmenes periódicos
+PROGRAMACION_REDACCION_IA = os.getenv('PROGRAMACION_REDACCION_IA', '0') == '1'
+CONFIG_RECORDATORIO = {'temperatura': 0.5, 'max_tokens': 150}
+
+# Con varios procesos (reparto.py) solo uno ingiere el catálogo y reanuda las difusiones
+TAREAS_UNICAS = os.getenv('BOT_TAREAS_UNICAS', '1') == '1'
+REANUDAR_DIFUSIONES = os.getenv('BOT_REANUDAR_DIFUSIONES', '1') == '1'
+
+# Catálogo local de sismos (se abre en preparar)
+catalogo = CatalogoSismos()
+CERCA_RADIO_KM = 100
+CERCA_DIAS = 30
+
+# Recomendaciones personalizadas por grupo de perfil (ver recomendaciones.py)
+CONFIG_CONSEJOS = {'temperatura': 0.5, 'max_tokens': 300}
+cache_consejos = CacheRespuestas(
+    'consejos',
+    version=version_plantilla(PROMPT_CONSEJOS, CONFIG_CONSEJOS),
+    ttl=float(os.getenv('CONSEJOS_TTL', str(30 * 24 * 3600))),
+    similitud=1.0,
+    bd=bd
 )
 
 # Estados de la conversación
@@ -46,150 +184,17 @@ genai.configure(
     EVALUACION_RIESGO, FINAL
 ) = range(11)
 
-# ========== FUNCIONES DE BASE DE DATOS ==========
-def init_db():
-    conn = sqlite3.connect('sismos_bot.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS usuarios (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        nombre TEXT NOT NULL,
-        apellidos TEXT NOT NULL,
-        edad INTEGER NOT NULL,
-        sexo TEXT NOT NULL,
-        nivel_academico TEXT NOT NULL,
-        residencia TEXT NOT NULL,
-        email TEXT,
-        recibir_info TEXT NOT NULL,
-        fecha_registro TEXT NOT NULL,
-        UNIQUE(user_id)
-    )''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS consultas (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        tipo_consulta TEXT NOT NULL,
-        contenido TEXT NOT NULL,
-        respuesta TEXT NOT NULL,
-        fecha TEXT NOT NULL,
-        FOREIGN KEY(user_id) REFERENCES usuarios(user_id)
-    )''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS medios (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        tipo_medio TEXT NOT NULL,
-        file_id TEXT NOT NULL,
-        fecha TEXT NOT NULL,
-        FOREIGN KEY(user_id) REFERENCES usuarios(user_id)
-    )''')
-    
-    conn.commit()
-    conn.close()
-
-def save_user(user_data, user_id):
-    conn = sqlite3.connect('sismos_bot.db')
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute('''
-        INSERT INTO usuarios (
-            user_id, nombre, apellidos, edad, sexo, 
-            nivel_academico, residencia, email, recibir_info, fecha_registro
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            user_id,
-            user_data['nombre'],
-            user_data['apellidos'],
-            user_data['edad'],
-            user_data['sexo'],
-            user_data['nivel_academico'],
-            user_data['residencia'],
-            user_data.get('email', None),
-            user_data['recibir_info'],
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        ))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        cursor.execute('''
-        UPDATE usuarios SET
-            nombre = ?, apellidos = ?, edad = ?, sexo = ?,
-            nivel_academico = ?, residencia = ?, email = ?,
-            recibir_info = ?, fecha_registro = ?
-        WHERE user_id = ?
-        ''', (
-            user_data['nombre'],
-            user_data['apellidos'],
-            user_data['edad'],
-            user_data['sexo'],
-            user_data['nivel_academico'],
-            user_data['residencia'],
-            user_data.get('email', None),
-            user_data['recibir_info'],
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            user_id
-        ))
-        conn.commit()
-        return True
-    except Exception as e:
-        logger.error(f"Error al guardar usuario: {e}")
-        return False
-    finally:
-        conn.close()
-
-def save_query(user_id, query_type, content, response):
-    conn = sqlite3.connect('sismos_bot.db')
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute('''
-        INSERT INTO consultas (
-            user_id, tipo_consulta, contenido, respuesta, fecha
-        ) VALUES (?, ?, ?, ?, ?)
-        ''', (
-            user_id,
-            query_type,
-            content,
-            response,
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        ))
-        conn.commit()
-        return True
-    except Exception as e:
-        logger.error(f"Error al guardar consulta: {e}")
-        return False
-    finally:
-        conn.close()
-
-def save_media(user_id, media_type, file_id):
-    conn = sqlite3.connect('sismos_bot.db')
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute('''
-        INSERT INTO medios (
-            user_id, tipo_medio, file_id, fecha
-        ) VALUES (?, ?, ?, ?)
-        ''', (
-            user_id,
-            media_type,
-            file_id,
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        ))
-        conn.commit()
-        return True
-    except Exception as e:
-        logger.error(f"Error al guardar medio: {e}")
-        return False
-    finally:
-        conn.close()
+NOMBRES_ESTADOS = {
+    NOMBRE: 'nombre', APELLIDOS: 'apellidos', EDAD: 'edad', SEXO: 'sexo',
+    NIVEL_ACADEMICO: 'nivel_academico', RESIDENCIA: 'residencia', EMAIL: 'email',
+    INFO_SISMOS: 'info_sismos', CONSULTA_IA: 'consulta_ia',
+    EVALUACION_RIESGO: 'evaluacion_riesgo', FINAL: 'final'
+}
+# Para los registros de manejadores lentos (ver metricas.medir)
+ESTADOS_CONVERSACION.update(NOMBRES_ESTADOS)
 
 # ========== FUNCIONES DEL BOT ==========
+@medir
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Inicia la conversación y presenta el menú principal."""
     # Limpiar cualquier estado previo
@@ -226,9 +231,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     
     return ConversationHandler.END
 
-async def send_consejos_basicos(query):
-    """Envía consejos básicos con opción de volver al menú."""
-    consejos = """
+CONSEJOS_BASICOS = """
 🚨 **Consejos básicos ante sismos**:
 
 🔷 **Antes**:
@@ -248,16 +251,36 @@ async def send_consejos_basicos(query):
 - Verifica fugas de gas o cables eléctricos
 - Sigue indicaciones de Defensa Civil
 """
+
+async def send_consejos_basicos(query, personalizados=None):
+    """Envía consejos básicos con opción de volver al menú."""
     keyboard = [[InlineKeyboardButton("🏠 Menú Principal", callback_data='menu')]]
     await query.edit_message_text(
-        consejos, 
+        CONSEJOS_BASICOS, 
         parse_mode="Markdown",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
+    if personalizados:
+        await query.message.reply_text(f"🔍 Tus recomendaciones personalizadas:\n{personalizados}")
+
+async def responder_saturado(message):
+    """Respuesta inmediata cuando no hay capacidad para consultar al modelo.
+
+    Sin teclado: el manejador termina con el mismo menú que en los demás casos.
+    """
+    await message.reply_text(
+        "⏳ El servicio de consultas está saturado en este momento. "
+        "Mientras tanto, revisa estas recomendaciones:\n" + CONSEJOS_BASICOS,
+        parse_mode="Markdown"
+    )
 
+@medir
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Maneja las opciones del menú principal."""
     query = update.callback_query
+    if not admision.permitir(query.from_user.id, 'boton'):
+        await query.answer("⏳ Vas muy rápido, espera un momento.")
+        return None
     await query.answer()
     
     if query.data == 'consulta_ia':
@@ -279,7 +302,8 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return EVALUACION_RIESGO
     
     elif query.data == 'consejos':
-        await send_consejos_basicos(query)
+        personalizados = await context.bot_data['recomendaciones'].de_usuario(query.from_user.id)
+        await send_consejos_basicos(query, personalizados)
         return ConversationHandler.END
     
     elif query.data == 'menu':
@@ -296,18 +320,21 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return NOMBRE
 
 # ========== FLUJO DE REGISTRO ==========
+@medir
 async def recibir_nombre(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_data = context.user_data
     user_data['nombre'] = update.message.text
     await update.message.reply_text("Gracias. Ahora ingresa tus apellidos:")
     return APELLIDOS
 
+@medir
 async def recibir_apellidos(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_data = context.user_data
     user_data['apellidos'] = update.message.text
     await update.message.reply_text("Por favor, ingresa tu edad:")
     return EDAD
 
+@medir
 async def recibir_edad(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_data = context.user_data
     try:
@@ -328,6 +355,7 @@ async def recibir_edad(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     )
     return SEXO
 
+@medir
 async def recibir_sexo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_data = context.user_data
     user_data['sexo'] = update.message.text
@@ -347,6 +375,7 @@ async def recibir_sexo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     )
     return NIVEL_ACADEMICO
 
+@medir
 async def recibir_nivel_academico(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_data = context.user_data
     user_data['nivel_academico'] = update.message.text
@@ -356,14 +385,17 @@ async def recibir_nivel_academico(update: Update, context: ContextTypes.DEFAULT_
     )
     return RESIDENCIA
 
+@medir
 async def recibir_residencia(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_data = context.user_data
     user_data['residencia'] = update.message.text
+    user_data['municipio'] = municipio_de(user_data['residencia'])
     await update.message.reply_text(
         "¿Tienes correo electrónico? Si es así, escríbelo. Si no, escribe 'no':"
     )
     return EMAIL
 
+@medir
 async def recibir_email(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_data = context.user_data
     email = update.message.text.lower()
@@ -377,12 +409,13 @@ async def recibir_email(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         reply_markup=ReplyKeyboardMarkup(reply_keyboard, one_time_keyboard=True))
     return INFO_SISMOS
 
+@medir
 async def recibir_info_sismos(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_data = context.user_data
     user_data['recibir_info'] = update.message.text
     user_id = update.message.from_user.id
     
-    save_user(user_data, user_id)
+    await save_user(user_data, user_id)
     
     resumen = (
         "📝 **Resumen de tus datos:**\n\n"
@@ -397,8 +430,14 @@ async def recibir_info_sismos(update: Update, context: ContextTypes.DEFAULT_TYPE
     )
     
     if user_data['recibir_info'] == 'Sí':
-        consejos = await generar_consejos_personalizados(user_data)
-        resumen += f"🔍 **Recomendaciones personalizadas:**\n{consejos}"
+        # Si el grupo de perfil ya tiene recomendaciones se muestran aquí; si
+        # no, se generan en segundo plano y llegan en otro mensaje
+        consejos = context.bot_data['recomendaciones'].solicitar(user_id, user_data)
+        if consejos is None:
+            resumen += "🔍 Tus recomendaciones personalizadas llegarán en un momento."
+        else:
+            resumen += f"🔍 **Recomendaciones personalizadas:**\n{consejos}"
+        resumen += "\n\n⏰ También recibirás un resumen sísmico periódico; elige la hora con /horario."
     
     await update.message.reply_text(resumen, parse_mode="Markdown")
     
@@ -413,29 +452,24 @@ async def recibir_info_sismos(update: Update, context: ContextTypes.DEFAULT_TYPE
     )
     return ConversationHandler.END
 
-async def generar_consejos_personalizados(datos_usuario):
-    try:
-        contexto = f"""Genera recomendaciones para preparación ante sismos basadas en estos datos:
-        - Nombre: {datos_usuario.get('nombre', '')}
-        - Edad: {datos_usuario.get('edad', '')}
-        - Sexo: {datos_usuario.get('sexo', '')}
-        - Residencia: {datos_usuario.get('residencia', '')}
-        - Nivel académico: {datos_usuario.get('nivel_academico', '')}"""
-        
-        model = genai.GenerativeModel('gemini-pro')
-        response = model.generate_content(
-            contexto,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.5,
-                max_output_tokens=300
-            )
-        )
-        return response.text
-    except Exception as e:
-        logger.error(f"Error al generar consejos: {e}")
-        return "Aquí tienes algunos consejos generales:\n- Prepara un kit de emergencia\n- Identifica zonas seguras en tu vivienda"
+async def generar_consejos(prompt) -> str:
+    """Genera las recomendaciones de un grupo de perfil (en segundo plano)."""
+    async with turno_ia(prompt, **CONFIG_CONSEJOS) as admitida:
+        if not admitida:
+            raise RuntimeError("servicio de IA saturado")
+        response = await cliente_ia.generar(prompt, **CONFIG_CONSEJOS, tipo='consejos')
+    return response.texto
+
+async def redactar_recordatorio(prompt) -> str:
+    """Redacta el recordatorio de preparación de una localidad (envíos programados)."""
+    async with turno_ia(prompt, **CONFIG_RECORDATORIO) as admitida:
+        if not admitida:
+            raise RuntimeError("servicio de IA saturado")
+        response = await cliente_ia.generar(prompt, **CONFIG_RECORDATORIO, tipo='recordatorio')
+    return response.texto
 
 # ========== FUNCIONALIDADES DE IA ==========
+@medir
 async def consulta_ia(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     pregunta = update.message.text
     user_id = update.message.from_user.id
@@ -446,25 +480,45 @@ async def consulta_ia(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
             await update.message.reply_text("❌ Por favor escribe una pregunta válida.")
             return CONSULTA_IA
         
-        model = genai.GenerativeModel('gemini-pro')
-        response = model.generate_content(
-            f"Eres un experto en sismología en Cuba. Responde de forma clara y concisa. Pregunta: {pregunta}",
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.7,
-                max_output_tokens=500
-            )
-        )
-        
-        respuesta = response.text
-        
-        if len(respuesta) > 4000:
-            partes = [respuesta[i:i+4000] for i in range(0, len(respuesta), 4000)]
-            for parte in partes:
-                await update.message.reply_text(parte)
+        progreso = RespuestaProgresiva(update.message)
+        # Preguntas frecuentes y caché: se responden sin llamar al modelo
+        respuesta = base_conocimiento.responder_faq(pregunta)
+        if respuesta is None:
+            respuesta = cache_consultas.obtener(pregunta)
+        if respuesta is not None:
+            await progreso.terminar(respuesta)
         else:
-            await update.message.reply_text(respuesta)
+            # Solo lo que llega al modelo gasta la cuota del usuario: las
+            # preguntas frecuentes y la caché no cuestan nada
+            if not admision.permitir(user_id):
+                await update.message.reply_text(RESPUESTA_LIMITE_USUARIO)
+                return CONSULTA_IA
+            prompt, config = prompt_consulta(pregunta)
+            fragmentos = None
+            async with turno_ia(prompt, **config) as admitida:
+                if admitida:
+                    # La respuesta se muestra mientras el modelo la escribe
+                    await progreso.iniciar()
+                    fragmentos = []
+                    inicio = time.perf_counter()
+                    try:
+                        async for fragmento in cliente_ia.generar_flujo(prompt, **config, tipo='consulta'):
+                            fragmentos.append(fragmento)
+                            await progreso.agregar(fragmento)
+                    except Exception as e:
+                        logger.error(f"Consulta IA interrumpida: {e}")
+                        await progreso.terminar(RESPUESTA_IA_INCOMPLETA if fragmentos else RESPUESTA_IA_SATURADA)
+                        fragmentos = None
+            if not admitida:
+                # Sin capacidad: respuesta local inmediata en lugar de esperar al modelo
+                await responder_saturado(update.message)
+            elif fragmentos is not None:
+                await progreso.terminar()
+                respuesta = ''.join(fragmentos)
+                cache_consultas.guardar(pregunta, respuesta, time.perf_counter() - inicio)
         
-        save_query(user_id, "consulta_ia", pregunta, respuesta)
+        if respuesta is not None:
+            await save_query(user_id, "consulta_ia", pregunta, respuesta)
         
     except Exception as e:
         logger.error(f"Error en consulta IA: {str(e)}")
@@ -481,20 +535,71 @@ async def consulta_ia(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     )
     return ConversationHandler.END
 
+async def redactar_evaluacion(zona) -> str:
+    """Evaluación de una zona conocida, desde el índice o redactada por el modelo."""
+    evaluacion = formatear_evaluacion(zona)
+    if not RIESGO_REDACCION_IA:
+        return evaluacion
+
+    redactada = cache_redaccion_riesgo.obtener(zona.id)
+    if redactada is None:
+        async with admision.turno() as admitida:
+            if not admitida:
+                return evaluacion
+            response = await cliente_ia.generar(
+                prompt_redaccion(zona),
+                temperatura=0.3,
+                max_tokens=250,
+                alternativa=evaluacion,
+                tipo='redaccion_zona'
+            )
+        if response.alternativa:
+            return evaluacion
+        redactada = response.texto
+        cache_redaccion_riesgo.guardar(zona.id, redactada, response.latencia)
+    return redactada
+
+@medir
 async def evaluar_riesgo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    ubicacion = update.message.text
     user_id = update.message.from_user.id
+    location = update.message.location
+    if location:
+        # Ubicación compartida por GPS: búsqueda en el índice espacial de zonas
+        ubicacion = f"{location.latitude:.5f}, {location.longitude:.5f}"
+    else:
+        ubicacion = update.message.text
     
     try:
-        model = genai.GenerativeModel('gemini-pro')
-        response = model.generate_content(
-            f"Evalúa el riesgo sísmico en Santiago de Cuba considerando: historia sísmica, tipo de construcciones y geología. Ubicación: {ubicacion}",
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.3
-            )
-        )
-        evaluacion = response.text
-        save_query(user_id, "evaluacion_riesgo", ubicacion, evaluacion)
+        if location:
+            coincidencia = indice_riesgo.localizar(location.latitude, location.longitude)
+        else:
+            coincidencia = indice_riesgo.resolver(ubicacion)
+        if coincidencia:
+            evaluacion = await redactar_evaluacion(coincidencia.zona)
+            aviso = indice_riesgo.aviso()
+        else:
+            # Ubicación desconocida: se recurre al modelo con un límite de
+            # tokens; solo este camino gasta la cuota del usuario
+            if not admision.permitir(user_id):
+                await update.message.reply_text(RESPUESTA_LIMITE_USUARIO)
+                return EVALUACION_RIESGO
+            prompt = PROMPT_EVALUACION_RIESGO.format(ubicacion=ubicacion)
+            response = None
+            async with turno_ia(prompt, temperatura=0.3, max_tokens=400) as admitida:
+                if admitida:
+                    response = await cliente_ia.generar(
+                        prompt, temperatura=0.3, max_tokens=400,
+                        alternativa=EVALUACION_GENERAL, tipo='evaluacion_riesgo'
+                    )
+            # Sin capacidad o sin respuesta a tiempo: la evaluación general local
+            evaluacion = response.texto if response else EVALUACION_GENERAL
+            if response is None or response.alternativa:
+                aviso = AVISO_ORIENTATIVO
+            else:
+                aviso = f"{AVISO_ORIENTATIVO}\nRedactada por un modelo de lenguaje, sin datos de la zona."
+        # Sea cual sea su origen (tabla, caché o modelo), la evaluación no es oficial
+        evaluacion = f"{evaluacion}\n\n{aviso}"
+        await save_query(user_id, "evaluacion_riesgo", ubicacion, evaluacion)
     except Exception as e:
         logger.error(f"Error al evaluar riesgo: {e}")
         evaluacion = "Lo siento, hubo un error al evaluar el riesgo."
@@ -516,18 +621,25 @@ async def evaluar_riesgo(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     return ConversationHandler.END
 
 # ========== MANEJADORES AUXILIARES ==========
+@medir
 async def manejar_media(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Registra la foto o nota de voz y la deja en la cola de procesamiento (ver medios.py)."""
     user_id = update.message.from_user.id
     
     if update.message.photo:
-        file_id = update.message.photo[-1].file_id
-        save_media(user_id, "foto", file_id)
-        await update.message.reply_text("✅ Imagen recibida. ¿En qué puedo ayudarte? Usa /start para opciones.")
+        archivo = update.message.photo[-1]
+        await save_media(user_id, "foto", archivo.file_id, archivo.file_unique_id)
+        context.bot_data['medios'].encolar(user_id, "foto", archivo.file_id, archivo.file_unique_id)
+        await update.message.reply_text(
+            "✅ Imagen recibida. La revisaremos junto con los demás reportes. Usa /start para ver las opciones.")
     elif update.message.voice:
-        file_id = update.message.voice.file_id
-        save_media(user_id, "voz", file_id)
-        await update.message.reply_text("✅ Audio recibido. Actualmente solo procesamos texto. Escribe tu consulta.")
+        archivo = update.message.voice
+        await save_media(user_id, "voz", archivo.file_id, archivo.file_unique_id)
+        context.bot_data['medios'].encolar(user_id, "voz", archivo.file_id, archivo.file_unique_id)
+        await update.message.reply_text(
+            "✅ Audio recibido. Lo procesaremos en segundo plano; si tu consulta es urgente, escríbela.")
 
+@medir
 async def manejar_texto_libre(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "ℹ️ Usa /start para acceder al menú de opciones.",
@@ -536,6 +648,7 @@ async def manejar_texto_libre(update: Update, context: ContextTypes.DEFAULT_TYPE
         ])
     )
 
+@medir
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.message.reply_text(
         "Operación cancelada. Usa /start para comenzar de nuevo.",
@@ -543,23 +656,521 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     )
     return ConversationHandler.END
 
+@medir
 async def menu_principal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await start(update, context)
 
+@medir
+async def estado(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Muestra a los administradores el estado de la caché, la cola de escritura y la admisión."""
+    if not es_admin(update.message.from_user.id):
+        return
+    r = cache_consultas.resumen()
+    c = cola_escritura.resumen()
+    a = admision.resumen()
+    k = base_conocimiento.resumen()
+    i = cliente_ia.estadisticas
+    m = context.bot_data['medios'].resumen()
+    t = context.bot_data['retencion'].resumen()
+    p = context.bot_data['planificador'].resumen()
+    v = context.bot_data['vigilante'].resumen()
+    await update.message.reply_text(
+        "🗄️ Caché de consultas:\n"
+        f"- Entradas: {r['entradas']}\n"
+        f"- Aciertos: {r['aciertos']} (similares: {r['aciertos_similares']})\n"
+        f"- Fallos: {r['fallos']}\n"
+        f"- Tasa de aciertos: {r['tasa_aciertos']:.1%}\n"
+        f"- Caducadas/desalojadas: {r['caducadas']}/{r['desalojadas']}\n"
+        f"- Latencia de IA ahorrada: {r['segundos_ahorrados']:.1f}s\n\n"
+        "📚 Base de conocimiento:\n"
+        f"- Respuestas directas de preguntas frecuentes: {k['faq_directas']} ({k['tasa_sin_modelo']:.1%})\n"
+        f"- Consultas con/sin pasajes de referencia: {k['con_contexto']}/{k['sin_contexto']}\n\n"
+        "💾 Cola de escritura:\n"
+        f"- Pendientes: {c['profundidad']}\n"
+        f"- Filas/lotes escritos: {c['filas']}/{c['lotes']}\n"
+        f"- Volcado (último/medio/máx): {c['latencia_ultima_ms']:.1f}/"
+        f"{c['latencia_media_ms']:.1f}/{c['latencia_max_ms']:.1f} ms\n"
+        f"- Esperas por cola llena: {c['esperas']}, errores: {c['errores']}\n\n"
+        "🤖 Modelo de IA:\n"
+        f"- Llamadas: {i['llamadas']}, compartidas con otra idéntica: {i['compartidas']}\n"
+        f"- Errores/plazos agotados: {i['errores']}/{i['agotadas']}\n\n"
+        "🖼️ Medios:\n"
+        f"- Recibidos: {m['recibidos']}, por descargar/analizar: {m['por_descargar']}/{m['por_analizar']}\n"
+        f"- Descargados: {m['descargados']}, analizados: {m['analizados']}, sin análisis: {m['sin_analisis']}\n"
+        f"- Duplicados (reenvío/contenido/parecido): {m['duplicados_id']}/"
+        f"{m['duplicados_contenido']}/{m['duplicados_perceptuales']}\n"
+        f"- Descartados por cola llena: {m['descartados']}, errores: {m['errores']}\n\n"
+        "🗓️ Envíos programados:\n"
+        f"- Resúmenes: {p['resumenes']} ({p['textos']} textos por localidad), seguimientos: {p['seguimientos']}\n"
+        f"- Pasos: {p['pasos']}, cedidos a alertas: {p['pasos_cedidos']}, esperas por prioridad: {p['esperas_prioridad']}\n"
+        f"- Fallidos: {p['fallidos']}, errores: {p['errores']}\n\n"
+        "🗃️ Retención de consultas:\n"
+        f"- Archivadas: {t['archivadas']}, páginas liberadas: {t['paginas_liberadas']}\n"
+        f"- Pases: {t['pases']} (último: {t['ultimo_pase_s']:.1f}s), errores: {t['errores']}\n\n"
+        "⏱️ Bucle de eventos:\n"
+        f"- Bloqueos: {v['bloqueos']} ({v['bloqueado_s']:.1f}s en total, máx. {v['bloqueo_max_s']:.2f}s)\n"
+        f"- Retraso máximo del latido: {v['retraso_max_s'] * 1000:.0f} ms\n\n"
+        "🚦 Control de admisión:\n"
+        f"- En curso/en espera: {a['en_curso']}/{a['en_espera']} (máx. en espera: {a['max_en_espera']})\n"
+        f"- Admitidas: {a['admitidas']}, espera media: {a['espera_media_ms']:.1f} ms\n"
+        f"- Rechazadas (cola llena/espera): {a['rechazadas_cola_llena']}/{a['rechazadas_espera']}\n"
+        f"- Limitadas por usuario (consultas/botones): {a['limitadas_usuario']}/{a['limitadas_botones']}"
+    )
+
+@medir
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/stats [horas]: consultas por hora, residencias y suscritos por municipio (solo administradores)."""
+    if not es_admin(update.message.from_user.id):
+        return
+    try:
+        horas = min(max(int(context.args[0]), 1), 24 * 90) if context.args else 24
+    except ValueError:
+        await update.message.reply_text("Uso: /stats [horas]")
+        return
+    s = await estadisticas_uso(horas)
+    total = sum(n for _, n in s['consultas'])
+    maximo = max((n for _, n in s['consultas']), default=0)
+    lineas = [f"📊 Consultas en las últimas {horas} h: {total}"]
+    for periodo, n in s['consultas']:
+        barra = '▇' * max(1, round(10 * n / maximo))
+        lineas.append(f"{periodo[5:]}  {barra} {n}")
+    if s['por_tipo']:
+        lineas.append("Por tipo: " + ", ".join(f"{tipo} {n}" for tipo, n in s['por_tipo']))
+    lineas.append("\n🏠 Residencias con más usuarios:")
+    for residencia, usuarios, suscritos in s['residencias']:
+        lineas.append(f"- {residencia}: {usuarios} ({suscritos} suscritos)")
+    lineas.append("\n🔔 Suscritos por municipio:")
+    for municipio, suscritos, usuarios in s['municipios']:
+        lineas.append(f"- {municipio or 'Sin determinar'}: {suscritos} de {usuarios}")
+    await update.message.reply_text("\n".join(lineas))
+
+# ========== CATÁLOGO DE SISMOS ==========
+def _numero_argumento(texto):
+    try:
+        numero = float(texto.replace(',', '.'))
+    except ValueError:
+        return None
+    # «nan» e «inf» también los acepta float()
+    return numero if math.isfinite(numero) else None
+
+@medir
+async def ultimos(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/ultimos [cantidad] [magnitud mínima]: sismos más recientes del catálogo local."""
+    numeros = [_numero_argumento(a) for a in context.args]
+    if None in numeros:
+        await update.message.reply_text("Uso: /ultimos [cantidad] [magnitud mínima], por ejemplo /ultimos 5 3,5")
+        return
+    cantidad = int(min(max(numeros[0], 1), 20)) if numeros else 5
+    magnitud = numeros[1] if len(numeros) > 1 else 0.0
+    sismos = catalogo.ultimos(cantidad, magnitud)
+    if not sismos:
+        await update.message.reply_text("No hay sismos registrados en el catálogo local.")
+        return
+    titulo = f"🌐 Últimos sismos del catálogo local (M ≥ {magnitud:.1f}):" if magnitud else "🌐 Últimos sismos del catálogo local:"
+    await update.message.reply_text("\n".join([titulo] + [formatear_sismo(s) for s in sismos]))
+
+@medir
+async def cerca(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/cerca [lugar] [radio en km] [días]: sismos cercanos a un lugar conocido."""
+    numeros = [n for n in map(_numero_argumento, context.args) if n is not None]
+    palabras = [a for a in context.args if _numero_argumento(a) is None]
+    lugar = ' '.join(palabras) or context.user_data.get('residencia') or 'Santiago de Cuba'
+    radio = min(max(numeros[0], 1), 1000) if numeros else CERCA_RADIO_KM
+    dias = max(numeros[1], 1) if len(numeros) > 1 else CERCA_DIAS
+
+    coincidencia = indice_riesgo.resolver(lugar)
+    centro = indice_riesgo.centros.get(coincidencia.zona.id) if coincidencia else None
+    if centro is None:
+        await update.message.reply_text(
+            f"No reconozco «{lugar}». Uso: /cerca [municipio o reparto] [radio en km] [días], "
+            "por ejemplo /cerca Palma Soriano 50 7"
+        )
+        return
+
+    zona = coincidencia.zona.nombre
+    total, sismos = catalogo.cerca(*centro, radio, desde=time.time() - dias * 86400)
+    if total:
+        lineas = [f"📍 {total} sismos a menos de {radio:.0f} km de {zona} en los últimos {dias:.0f} días:"]
+        lineas += [formatear_sismo(s) for s in sismos]
+        if total > len(sismos):
+            lineas.append(f"(se muestran los {len(sismos)} más recientes)")
+    else:
+        lineas = [f"📍 Ningún sismo a menos de {radio:.0f} km de {zona} en los últimos {dias:.0f} días."]
+        _, anteriores = catalogo.cerca(*centro, radio, limite=1)
+        if anteriores:
+            lineas += ["El más reciente del catálogo:", formatear_sismo(anteriores[0])]
+    await update.message.reply_text("\n".join(lineas))
+
+async def actualizar_catalogo(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Ingiere los ficheros nuevos del directorio de entrada sin bloquear el bucle."""
+    await asyncio.to_thread(catalogo.ingerir_directorio)
+
+async def reabrir_catalogo(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """En los procesos que no ingieren: vuelve a mapear el catálogo para ver los sismos nuevos."""
+    catalogo.abrir(reparar=False)
+
+# ========== ALERTAS ==========
+async def ejecutar_alerta(context: ContextTypes.DEFAULT_TYPE, chat_id, texto) -> None:
+    motor = context.bot_data['difusion']
+    try:
+        informe = await motor.difundir(texto)
+    except Exception as e:
+        # La difusión queda 'en_curso' en la base de datos y se reanuda al arrancar
+        logger.error(f"Difusión de la alerta interrumpida: {e}")
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=(
+                f"❌ La difusión de la alerta se interrumpió: {e}\n"
+                "Quedó pendiente y se reanudará en el próximo arranque del bot."
+            )
+        )
+        return
+    await context.bot.send_message(
+
+        chat_id=chat_id,
+        text=(
+            f"✅ Alerta #{informe.difusion_id} difundida.\n"
+            f"- Entregados: {informe.entregados}\n"
+            f"- Fallidos: {informe.fallidos}\n"
+            f"- Tiempo total: {informe.segundos:.1f}s"
+        )
+    )
+
+@medir
+async def alerta(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/alerta <mensaje>: envía el mensaje a todos los usuarios suscritos (solo administradores)."""
+    if not es_admin(update.message.from_user.id):
+        return
+    texto = update.message.text.partition(' ')[2].strip()
+    if not texto:
+        await update.message.reply_text("Uso: /alerta <mensaje para los usuarios suscritos>")
+        return
+    context.application.create_task(
+        ejecutar_alerta(context, update.effective_chat.id, texto),
+        update=update
+    )
+    await update.message.reply_text("🚨 Difusión iniciada. Te avisaré al terminar.")
+
+# ========== PADRÓN DE USUARIOS ==========
+async def ejecutar_importacion(context: ContextTypes.DEFAULT_TYPE, chat_id, documento) -> None:
+    nombre = documento.file_name or ''
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'padron.csv.gz' if nombre.endswith('.gz') else 'padron.csv')
+        try:
+            archivo = await documento.get_file()
+            await archivo.download_to_drive(ruta)
+            resumen = await importar_csv(bd, ruta)
+        except (ErrorPadron, csv.Error, UnicodeDecodeError, OSError, TelegramError) as e:
+            await context.bot.send_message(chat_id=chat_id, text=f"❌ No se pudo importar «{nombre}»: {e}")
+            return
+    # Municipio de las residencias importadas sin él
+    asignados = await asyncio.to_thread(asignar_municipios, municipio_de)
+    await context.bot.send_message(
+        chat_id=chat_id,
+        text=f"{formatear_resumen(resumen)}\n🏘️ Municipios asignados: {asignados}"
+    )
+
+@medir
+async def importar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/importar como pie de un CSV: alta o actualización masiva de usuarios (solo administradores)."""
+    if not es_admin(update.message.from_user.id):
+        return
+    documento = update.message.document
+    if documento is None:
+        await update.message.reply_text(
+            "Envía el CSV (o .csv.gz) como documento con /importar en el pie.\n"
+            f"Columnas: {', '.join(COLUMNAS_PADRON)}.\n"
+            "user_id es el id de Telegram del usuario; los ya registrados se actualizan."
+        )
+        return
+    context.application.create_task(
+        ejecutar_importacion(context, update.effective_chat.id, documento),
+        update=update
+    )
+    await update.message.reply_text("📥 Importación iniciada. Te avisaré al terminar.")
+
+@medir
+async def exportar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/exportar: envía todos los usuarios registrados en un CSV comprimido (solo administradores)."""
+    if not es_admin(update.message.from_user.id):
+        return
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, f"usuarios-{time.strftime('%Y%m%d')}.csv.gz")
+        total = await exportar_csv(bd, ruta)
+        with open(ruta, 'rb') as f:
+            await update.message.reply_document(f, caption=f"👥 {total} usuarios registrados")
+
+# ========== ENVÍOS PROGRAMADOS ==========
+@medir
+async def horario(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/horario [desde hasta | no | sí]: ventana de entrega de los resúmenes y seguimientos."""
+    planificador = context.bot_data['planificador']
+    user_id = update.message.from_user.id
+    opcion = ' '.join(context.args).strip().lower()
+    if opcion in ('no', 'off'):
+        await planificador.guardar_preferencias(user_id, resumenes=False)
+    elif opcion in ('sí', 'si', 'on'):
+        await planificador.guardar_preferencias(user_id, resumenes=True)
+    elif opcion:
+        try:
+            ventana = leer_ventana(opcion)
+        except ValueError:
+            await update.message.reply_text(
+                "Uso: /horario 8 20 (entre las 8:00 y las 20:00), /horario no para dejar de "
+                "recibir los resúmenes o /horario sí para volver a recibirlos."
+            )
+            return
+        await planificador.guardar_preferencias(user_id, ventana)
+    desde, hasta, resumenes = await planificador.preferencias(user_id)
+    if resumenes:
+        texto = f"⏰ Recibirás los resúmenes y seguimientos entre las {desde}:00 y las {hasta}:00."
+    else:
+        texto = (
+            f"🔕 No recibirás resúmenes periódicos. Los seguimientos de sismos cercanos llegan "
+            f"entre las {desde}:00 y las {hasta}:00. Para reactivarlos: /horario sí"
+        )
+    await update.message.reply_text(
+        f"{texto}\nSolo se envían a quienes aceptaron recibir información de la Defensa Civil en el registro."
+    )
+
+async def programar_envios(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Lanza un paso de los envíos programados (ver programacion.py)."""
+    context.bot_data['planificador'].programar()
+
+# ========== DIAGNÓSTICO ==========
+async def ejecutar_perfil(context: ContextTypes.DEFAULT_TYPE, chat_id, segundos) -> None:
+    try:
+        p = await context.bot_data['perfilador'].perfilar(segundos)
+    except RuntimeError as e:
+        await context.bot.send_message(chat_id=chat_id, text=f"❌ No se pudo perfilar: {e}")
+        return
+    activas = p['activas'] / p['muestras'] if p['muestras'] else 0
+    lineas = [f"🔥 Perfil de {p['segundos']:.0f}s: {p['muestras']} muestras, {activas:.0%} con trabajo"]
+    lineas.extend(f"- {funcion}: {n}" for funcion, n in p['mas_costosas'])
+    with open(p['ruta'], 'rb') as f:
+        await context.bot.send_document(
+            chat_id=chat_id, document=f, filename=os.path.basename(p['ruta']),
+            caption="\n".join(lineas)[:1024]
+        )
+
+@medir
+async def perfil(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/perfil [segundos]: perfil por muestreo del proceso en formato plegado (solo administradores)."""
+    if not es_admin(update.message.from_user.id):
+        return
+    try:
+        segundos = int(context.args[0]) if context.args else 30
+    except ValueError:
+        segundos = 0
+    if not 1 <= segundos <= PERFIL_MAX_SEGUNDOS:
+        await update.message.reply_text(f"Uso: /perfil [segundos, de 1 a {PERFIL_MAX_SEGUNDOS}]")
+        return
+    if context.bot_data['perfilador'].en_curso:
+        await update.message.reply_text("⏳ Ya hay un perfil en curso.")
+        return
+    context.application.create_task(
+        ejecutar_perfil(context, update.effective_chat.id, segundos),
+        update=update
+    )
+    await update.message.reply_text(
+        f"🔬 Perfilando {segundos}s. Te enviaré el archivo para flamegraph.pl o speedscope."
+    )
+
+# ========== RETENCIÓN ==========
+async def aplicar_retencion(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Archiva las consultas antiguas y compacta la base de datos (ver retencion.py)."""
+    await context.bot_data['retencion'].ejecutar()
+
+# ========== MÉTRICAS ==========
+async def registrar_retraso(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Mide cuánto tarda cada mensaje en empezar a procesarse (precisión de segundos)."""
+    if update.message:
+        ACTUALIZACION_RETRASO.observar(max(0.0, time.time() - update.message.date.timestamp()))
+
+def registrar_metricas(application: Application) -> None:
+    registro.estadisticas('bot_cache_consultas', cache_consultas.resumen)
+    registro.estadisticas('bot_conocimiento', base_conocimiento.resumen)
+    registro.indicador('bot_catalogo_sismos', 'Sismos en el catálogo local', lambda: catalogo.total)
+    registro.estadisticas('bot_cola_escritura', cola_escritura.resumen)
+    registro.estadisticas('bot_admision', admision.resumen)
+    registro.estadisticas('bot_ia', lambda: cliente_ia.estadisticas)
+    registro.indicador(
+        'bot_cola_actualizaciones',
+        'Actualizaciones recibidas de Telegram pendientes de procesar',
+        application.update_queue.qsize
+    )
+
+    async def conversaciones_activas():
+        conteo = await application.persistence.conversaciones_activas()
+        return {
+            (nombre, NOMBRES_ESTADOS.get(estado, str(estado))): n
+            for (nombre, estado), n in conteo.items()
+        }
+    registro.indicador(
+        'bot_conversaciones_activas',
+        'Conversaciones en curso por conversación y estado',
+        conversaciones_activas,
+        ('conversacion', 'estado')
+    )
+
+async def precalentar(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Carga el cliente de Gemini y el pool de medios con el bot ya en marcha."""
+    inicio = time.perf_counter()
+    await cliente_ia.precalentar()
+    await context.bot_data['medios'].precalentar()
+    logger.info(f"Precalentamiento terminado en {time.perf_counter() - inicio:.2f}s")
+
+async def post_init(application: Application) -> None:
+    cola_escritura.iniciar()
+    vigilante = VigilanteBucle()
+    vigilante.iniciar()
+    application.bot_data['vigilante'] = vigilante
+    registro.estadisticas('bot_vigilancia', vigilante.resumen)
+    application.bot_data['perfilador'] = Perfilador()
+    registrar_metricas(application)
+    application.bot_data['servidor_metricas'] = await iniciar_servidor()
+    motor = MotorDifusion(application.bot, bd)
+    application.bot_data['difusion'] = motor
+    recomendaciones = GeneradorRecomendaciones(application.bot, bd, generar_consejos, cache_consejos)
+    recomendaciones.iniciar()
+    application.bot_data['recomendaciones'] = recomendaciones
+    registro.estadisticas('bot_recomendaciones', recomendaciones.resumen)
+    medios = ProcesadorMedios(application.bot, bd, cola_escritura)
+    await medios.iniciar()
+    application.bot_data['medios'] = medios
+    registro.estadisticas('bot_medios', medios.resumen)
+    retencion = Retencion(bd)
+    application.bot_data['retencion'] = retencion
+    registro.estadisticas('bot_retencion', retencion.resumen)
+    # Los envíos programados ceden ante /alerta y ante las actualizaciones en cola
+    planificador = Planificador(
+        application.bot, bd, motor, catalogo, indice_riesgo,
+        redactar=redactar_recordatorio if PROGRAMACION_REDACCION_IA else None,
+        ocupado=lambda: application.update_queue.qsize() > 0 or admision.en_espera > 0
+    )
+    application.bot_data['planificador'] = planificador
+    registro.estadisticas('bot_programacion', planificador.resumen)
+    if application.job_queue is not None:
+        application.job_queue.run_repeating(
+            actualizar_catalogo if TAREAS_UNICAS else reabrir_catalogo,
+            interval=CATALOGO_INTERVALO, first=CATALOGO_INTERVALO
+        )
+        # El primer pase, unos minutos después del arranque
+        if TAREAS_UNICAS and RETENCION_DIAS:
+            application.job_queue.run_repeating(
+                aplicar_retencion, interval=RETENCION_INTERVALO, first=min(RETENCION_INTERVALO, 600)
+            )
+        if TAREAS_UNICAS:
+            application.job_queue.run_repeating(
+                programar_envios, interval=PROGRAMACION_PASO, first=PROGRAMACION_PASO
+            )
+        # El job_queue arranca después del sondeo o el webhook: las primeras
+        # actualizaciones no esperan a las importaciones pesadas
+        if BOT_PRECALENTAR:
+            application.job_queue.run_once(precalentar, when=1)
+    # Con varios procesos solo uno retoma los medios pendientes
+    if TAREAS_UNICAS:
+        reanudados = await medios.reanudar()
+        if reanudados:
+            logger.info(f"Reanudando el procesamiento de {reanudados} medios")
+    # Reanudar las difusiones que un reinicio dejó a medias
+    if REANUDAR_DIFUSIONES:
+        for difusion_id in await motor.pendientes():
+            logger.info(f"Reanudando difusión {difusion_id}")
+            application.create_task(motor.reanudar(difusion_id))
+
+async def post_shutdown(application: Application) -> None:
+    recomendaciones = application.bot_data.get('recomendaciones')
+    if recomendaciones is not None:
+        await recomendaciones.detener()
+    medios = application.bot_data.get('medios')
+    if medios is not None:
+        await medios.detener()
+    planificador = application.bot_data.get('planificador')
+    if planificador is not None:
+        await planificador.detener()
+    servidor = application.bot_data.get('servidor_metricas')
+    if servidor is not None:
+        servidor.close()
+        await servidor.wait_closed()
+    # Escribir los registros pendientes antes de salir
+    await cola_escritura.detener()
+    vigilante = application.bot_data.get('vigilante')
+    if vigilante is not None:
+        vigilante.detener()
+
 # ========== CONFIGURACIÓN PRINCIPAL ==========
-def main() -> None:
-    """Ejecuta el bot."""
-    init_db()
-    application = Application.builder().token(os.getenv('TELEGRAM_TOKEN')).build()
+def tipos_de_actualizacion(application: Application) -> list:
+    """Tipos de actualización que atienden los handlers registrados.
+
+    Se envían como ``allowed_updates`` para que Telegram no entregue
+    actualizaciones que nadie procesa (mensajes editados, encuestas, etc.).
+    """
+    tipos = set()
+    pendientes = [h for grupo in application.handlers.values() for h in grupo]
+    while pendientes:
+        handler = pendientes.pop()
+        if isinstance(handler, ConversationHandler):
+            pendientes.extend(handler.entry_points)
+            pendientes.extend(handler.fallbacks)
+            for handlers_estado in handler.states.values():
+                pendientes.extend(handlers_estado)
+        elif isinstance(handler, TypeHandler) and handler.type is Update:
+            # Observadores de todas las actualizaciones (métricas): no piden tipos nuevos
+            continue
+        elif isinstance(handler, CallbackQueryHandler):
+            tipos.add(Update.CALLBACK_QUERY)
+        elif isinstance(handler, (CommandHandler, MessageHandler)):
+            tipos.add(Update.MESSAGE)
+        else:
+            # Handler desconocido: no se restringe nada
+            return Update.ALL_TYPES
+    return sorted(tipos)
+
+def crear_aplicacion(token=None, base_url=None, concurrencia=None) -> Application:
+    """Construye la aplicación con todos sus handlers.
+
+    ``base_url`` permite apuntar a un servidor de la Bot API distinto del
+    oficial (por ejemplo, el servidor falso de ``benchmarks``).
+    ``concurrencia`` admite un ``BaseUpdateProcessor`` propio (``reparto.py``).
+    """
+    # Procesar varias actualizaciones a la vez (las llamadas a la IA ya no bloquean
+    # el bucle), pero las de cada usuario en orden por sus conversaciones
+    builder = (
+        Application.builder()
+        .token(token or os.getenv('TELEGRAM_TOKEN'))
+        .concurrent_updates(concurrencia or ProcesadorPorUsuario())
+        .persistence(PersistenciaSQLite(bd))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+    application = builder.build()
+
+    # Retraso de cada actualización, antes de cualquier otro handler
+    application.add_handler(TypeHandler(Update, registrar_retraso), group=-1)
 
     # Handlers básicos
     application.add_handler(CommandHandler('start', start))
     application.add_handler(CommandHandler('menu', menu_principal))
     application.add_handler(CommandHandler('cancel', cancel))
+    application.add_handler(CommandHandler(['estado', 'cache'], estado))
+    application.add_handler(CommandHandler('alerta', alerta))
+    application.add_handler(CommandHandler('stats', stats))
+    application.add_handler(CommandHandler('ultimos', ultimos))
+    application.add_handler(CommandHandler('cerca', cerca))
+    application.add_handler(CommandHandler('importar', importar))
+    application.add_handler(MessageHandler(filters.Document.ALL & filters.CaptionRegex(r'^/importar\b'), importar))
+    application.add_handler(CommandHandler('exportar', exportar))
+    application.add_handler(CommandHandler('horario', horario))
+    application.add_handler(CommandHandler('perfil', perfil))
 
     # Handlers de conversación en orden de prioridad
     registro_handler = ConversationHandler(
         entry_points=[CallbackQueryHandler(button_handler, pattern='^registro$')],
+        name='registro',
+        persistent=True,
         states={
             NOMBRE: [MessageHandler(filters.TEXT & ~filters.COMMAND, recibir_nombre)],
             APELLIDOS: [MessageHandler(filters.TEXT & ~filters.COMMAND, recibir_apellidos)],
@@ -577,6 +1188,8 @@ def main() -> None:
     
     consulta_ia_handler = ConversationHandler(
         entry_points=[CallbackQueryHandler(button_handler, pattern='^consulta_ia$')],
+        name='consulta_ia',
+        persistent=True,
         states={
             CONSULTA_IA: [MessageHandler(filters.TEXT & ~filters.COMMAND, consulta_ia)],
         },
@@ -586,8 +1199,10 @@ def main() -> None:
     
     evaluar_riesgo_handler = ConversationHandler(
         entry_points=[CallbackQueryHandler(button_handler, pattern='^evaluar_riesgo$')],
+        name='evaluar_riesgo',
+        persistent=True,
         states={
-            EVALUACION_RIESGO: [MessageHandler(filters.TEXT & ~filters.COMMAND, evaluar_riesgo)],
+            EVALUACION_RIESGO: [MessageHandler((filters.TEXT & ~filters.COMMAND) | filters.LOCATION, evaluar_riesgo)],
         },
         fallbacks=[CommandHandler('cancel', cancel)]
     )
@@ -602,7 +1217,51 @@ def main() -> None:
     # Handler de texto libre con grupo más bajo (para que no intercepte los mensajes de los ConversationHandlers)
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, manejar_texto_libre), group=1)
     
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    return application
+
+def preparar() -> None:
+    """Migra la base de datos y carga las cachés, los índices y el catálogo."""
+    init_db()
+    cache_consultas.cargar()
+    cache_consejos.cargar()
+    base_conocimiento.cargar()
+    indice_riesgo.cargar()
+    catalogo.abrir(reparar=TAREAS_UNICAS)
+    if TAREAS_UNICAS:
+        catalogo.ingerir_directorio()
+        asignados = asignar_municipios(municipio_de)
+        if asignados:
+            logger.info(f"Municipio asignado a {asignados} usuarios registrados")
+    logger.info(f"Catálogo de sismos: {catalogo.total} eventos")
+
+def main() -> None:
+    """Ejecuta el bot."""
+    modo = os.getenv('BOT_MODO', 'polling')
+    webhook_url = os.getenv('WEBHOOK_URL', '').strip()
+    if modo == 'webhook' and not webhook_url:
+        # Sin ella, PTB registraría en Telegram una URL hecha con listen y port
+        # (https://0.0.0.0:8443/webhook) a la que nunca llegaría nada
+        raise SystemExit("BOT_MODO=webhook necesita WEBHOOK_URL: la URL pública a la que Telegram envía las actualizaciones")
+    preparar()
+    # TELEGRAM_API_URL: servidor propio de la Bot API (o el falso de benchmarks)
+    application = crear_aplicacion(base_url=os.getenv('TELEGRAM_API_URL'))
+    allowed_updates = tipos_de_actualizacion(application)
+
+    if modo == 'webhook':
+        # Telegram envía las actualizaciones a WEBHOOK_URL; el servidor HTTP
+        # local solo acepta peticiones con el token secreto correcto
+        application.run_webhook(
+            listen=os.getenv('WEBHOOK_LISTEN', '0.0.0.0'),
+            port=int(os.getenv('WEBHOOK_PORT', '8443')),
+            url_path=os.getenv('WEBHOOK_PATH', 'webhook'),
+            webhook_url=webhook_url,
+            secret_token=os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32),
+            max_connections=int(os.getenv('WEBHOOK_MAX_CONEXIONES', '40')),
+            allowed_updates=allowed_updates
+        )
+    else:
+        application.run_polling(allowed_updates=allowed_updates)
+    bd.cerrar()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,219 @@
+"""Caché de respuestas del modelo para preguntas repetidas.
+
+Tras un sismo llegan miles de variantes de las mismas preguntas. La clave de
+la caché es el texto normalizado (sin tildes, mayúsculas, signos ni espacios
+repetidos). Con un umbral de similitud menor que 1 también se busca la
+entrada más parecida por trigramas de caracteres, pero nunca se juntan dos
+preguntas que difieren en una negación o un contraste («¿es seguro…?» y
+«¿no es seguro…?» se parecen mucho y piden respuestas opuestas). Las
+entradas caducan (TTL), se desalojan por LRU y pueden persistirse en SQLite. La versión de la caché se deriva de la
+plantilla del prompt, de modo que cambiarla invalida las respuestas previas.
+"""
+import hashlib
+import logging
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Palabras que cambian el sentido de una pregunta parecida (ya normalizadas)
+CONTRASTE = frozenset({
+    'no', 'nunca', 'jamas', 'sin', 'ni', 'tampoco', 'nada', 'nadie',
+    'ningun', 'ninguno', 'ninguna', 'pero', 'excepto', 'salvo',
+    'antes', 'durante', 'despues',
+})
+
+
+def normalizar(texto: str) -> str:
+    """Pliega tildes, mayúsculas, signos de puntuación y espacios."""
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    texto = ''.join(
+        c if c.isalnum() else ' '
+        for c in texto
+        if not unicodedata.combining(c)
+    )
+    return ' '.join(texto.split())
+
+
+def trigramas(texto: str) -> frozenset:
+    texto = f"  {texto} "
+    return frozenset(texto[i:i + 3] for i in range(len(texto) - 2))
+
+
+def contraste(clave: str) -> frozenset:
+    """Palabras de negación o contraste de una clave normalizada."""
+    return CONTRASTE.intersection(clave.split())
+
+
+def version_plantilla(*partes) -> str:
+    """Huella de la plantilla del prompt y su configuración."""
+    return hashlib.sha1(repr(partes).encode('utf-8')).hexdigest()[:12]
+
+
+class _Entrada:
+    __slots__ = ('respuesta', 'creada', 'latencia', 'trigramas')
+
+    def __init__(self, respuesta, creada, latencia, trigramas):
+        self.respuesta = respuesta
+        self.creada = creada
+        self.latencia = latencia
+        self.trigramas = trigramas
+
+
+class CacheRespuestas:
+    """Caché LRU con caducidad, búsqueda por similitud y persistencia opcional."""
+
+    def __init__(
+        self,
+        espacio: str,
+        version: str,
+        max_entradas: int = 2000,
+        ttl: float = 6 * 3600,
+        similitud: float = 1.0,
+        bd=None,
+    ):
+        self.espacio = espacio
+        self.version = version
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        # Umbral de Jaccard sobre trigramas; 1.0 desactiva la búsqueda aproximada
+        self.similitud = similitud
+        # BaseDatos donde persistir las entradas (opcional)
+        self.bd = bd
+        self._entradas = OrderedDict()
+        self._indice = defaultdict(set)
+        self.estadisticas = {
+            'aciertos': 0,
+            'aciertos_similares': 0,
+            'fallos': 0,
+            'caducadas': 0,
+            'desalojadas': 0,
+            'segundos_ahorrados': 0.0,
+        }
+
+    # ----- Persistencia -----
+    def _leer(self, conn):
+        # Las respuestas generadas con otra plantilla dejan de ser válidas
+        with conn:
+            conn.execute(
+                'DELETE FROM cache_respuestas WHERE espacio = ? AND (version != ? OR creada < ?)',
+                (self.espacio, self.version, time.time() - self.ttl)
+            )
+        return conn.execute(
+            'SELECT clave, respuesta, creada, latencia FROM cache_respuestas '
+            'WHERE espacio = ? ORDER BY creada DESC LIMIT ?',
+            (self.espacio, self.max_entradas)
+        ).fetchall()
+
+    def cargar(self):
+        """Carga las respuestas persistidas que siguen vigentes."""
+        if self.bd is None:
+            return
+        filas = self.bd.ejecutar_sync(self._leer)
+        for clave, respuesta, creada, latencia in reversed(filas):
+            self._insertar(clave, _Entrada(respuesta, creada, latencia, trigramas(clave)))
+        logger.info(f"Caché '{self.espacio}': {len(filas)} respuestas cargadas")
+
+    def _escribir(self, conn, clave, entrada):
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO cache_respuestas VALUES (?, ?, ?, ?, ?, ?)',
+                (self.espacio, clave, self.version, entrada.respuesta, entrada.creada, entrada.latencia)
+            )
+
+    def _borrar(self, conn):
+        with conn:
+            conn.execute('DELETE FROM cache_respuestas WHERE espacio = ?', (self.espacio,))
+
+    # ----- Estructura en memoria -----
+    def _insertar(self, clave, entrada):
+        if clave in self._entradas:
+            self._quitar(clave)
+        self._entradas[clave] = entrada
+        for t in entrada.trigramas:
+            self._indice[t].add(clave)
+        while len(self._entradas) > self.max_entradas:
+            antigua = next(iter(self._entradas))
+            self._quitar(antigua)
+            self.estadisticas['desalojadas'] += 1
+
+    def _quitar(self, clave):
+        entrada = self._entradas.pop(clave)
+        for t in entrada.trigramas:
+            claves = self._indice[t]
+            claves.discard(clave)
+            if not claves:
+                del self._indice[t]
+
+    def _vigente(self, clave, entrada, ahora):
+        if ahora - entrada.creada <= self.ttl:
+            return True
+        self._quitar(clave)
+        self.estadisticas['caducadas'] += 1
+        return False
+
+    def _mas_parecida(self, pregunta):
+        tri = trigramas(pregunta)
+        comunes = defaultdict(int)
+        for t in tri:
+            for clave in self._indice.get(t, ()):
+                comunes[clave] += 1
+        sentido = None
+        mejor, mejor_valor = None, self.similitud
+        for clave, n in comunes.items():
+            valor = n / (len(tri) + len(self._entradas[clave].trigramas) - n)
+            if valor < mejor_valor or (valor == mejor_valor and mejor is not None):
+                continue
+            if sentido is None:
+                sentido = contraste(pregunta)
+            if contraste(clave) == sentido:
+                mejor, mejor_valor = clave, valor
+        return mejor
+
+    # ----- API pública -----
+    def obtener(self, pregunta: str):
+        """Devuelve la respuesta almacenada para la pregunta o ``None``."""
+        clave = normalizar(pregunta)
+        ahora = time.time()
+        entrada = self._entradas.get(clave)
+        similar = False
+
+        if entrada is None and self.similitud < 1.0:
+            clave = self._mas_parecida(clave)
+            entrada = self._entradas.get(clave) if clave else None
+            similar = True
+
+        if entrada is None or not self._vigente(clave, entrada, ahora):
+            self.estadisticas['fallos'] += 1
+            return None
+
+        self._entradas.move_to_end(clave)
+        self.estadisticas['aciertos_similares' if similar else 'aciertos'] += 1
+        self.estadisticas['segundos_ahorrados'] += entrada.latencia or 0.0
+        return entrada.respuesta
+
+    def guardar(self, pregunta: str, respuesta: str, latencia: float = None):
+        clave = normalizar(pregunta)
+        if not clave:
+            return
+        entrada = _Entrada(respuesta, time.time(), latencia, trigramas(clave))
+        self._insertar(clave, entrada)
+        if self.bd is not None:
+            # La escritura se encola en el hilo de la base de datos
+            self.bd.enviar(self._escribir, clave, entrada)
+
+    def vaciar(self):
+        self._entradas.clear()
+        self._indice.clear()
+        if self.bd is not None:
+            self.bd.enviar(self._borrar)
+
+    def resumen(self) -> dict:
+        e = self.estadisticas
+        consultas = e['aciertos'] + e['aciertos_similares'] + e['fallos']
+        return {
+            **e,
+            'entradas': len(self._entradas),
+            'tasa_aciertos': (consultas - e['fallos']) / consultas if consultas else 0.0,
+        }
@@ -0,0 +1,431 @@
+"""Catálogo local de sismos en columnas de NumPy.
+
+Cada columna (tiempo, latitud, longitud, profundidad, magnitud, id, lugar)
+es un fichero binario de ancho fijo en ``datos/catalogo`` que se abre con
+``np.memmap``: abrir el catálogo no lee los datos y las consultas son
+operaciones vectorizadas sobre las columnas. Los eventos se mantienen
+ordenados por tiempo, así que «desde T» es una búsqueda binaria. Los lotes
+nuevos y posteriores al último evento se añaden al final de cada fichero;
+solo un lote con eventos antiguos obliga a reescribir el catálogo.
+
+Los ficheros de entrada (CSV, GeoJSON o QuakeML, como los que publican el
+CENAIS o el USGS) se leen en flujo desde ``datos/sismos``, que hace de
+buzón del feed: cada fichero nuevo o modificado se ingiere una vez y los
+eventos repetidos (mismo id) se descartan.
+"""
+import csv
+import json
+import logging
+import math
+import os
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RUTA_CATALOGO = os.getenv('CATALOGO_RUTA', 'datos/catalogo')
+RUTA_ENTRADA = os.getenv('CATALOGO_ENTRADA', 'datos/sismos')
+CATALOGO_LOTE = int(os.getenv('CATALOGO_LOTE', '50000'))
+# Cada cuántos segundos se revisa el directorio de entrada
+CATALOGO_INTERVALO = float(os.getenv('CATALOGO_INTERVALO', '300'))
+
+COLUMNAS = {
+    'tiempo': np.dtype('<f8'),       # segundos desde 1970 (UTC)
+    'lat': np.dtype('<f4'),
+    'lon': np.dtype('<f4'),
+    'profundidad': np.dtype('<f4'),  # km
+    'magnitud': np.dtype('<f4'),
+    'id': np.dtype('S40'),
+    'lugar': np.dtype('S80'),        # UTF-8, recortado
+}
+
+RADIO_TIERRA_KM = 6371.0
+
+
+class Sismo(NamedTuple):
+    tiempo: datetime
+    lat: float
+    lon: float
+    profundidad: float
+    magnitud: float
+    id: str
+    lugar: str
+    distancia_km: Optional[float] = None
+
+
+def _texto(valor: bytes) -> str:
+    # El recorte a ancho fijo puede partir un carácter multibyte
+    return valor.decode('utf-8', errors='ignore')
+
+
+def _segundos(valor) -> float:
+    """Instante en segundos UTC desde un texto ISO 8601 o milisegundos."""
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return valor / 1000.0
+    if not isinstance(valor, str):
+        raise ValueError(f"instante no válido: {valor!r}")
+    instante = datetime.fromisoformat(valor.strip().replace('Z', '+00:00'))
+    if instante.tzinfo is None:
+        instante = instante.replace(tzinfo=timezone.utc)
+    return instante.timestamp()
+
+
+def _numero(valor, defecto=math.nan) -> float:
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return defecto
+
+
+# ========== LECTURA DE FICHEROS ==========
+def _evento(tiempo, lat, lon, profundidad, magnitud, id_, lugar):
+    """Tupla de un evento; ``ValueError`` si le falta el instante o las coordenadas."""
+    tiempo = _segundos(tiempo)
+    lat, lon = _numero(lat), _numero(lon)
+    if not (math.isfinite(lat) and math.isfinite(lon)):
+        raise ValueError("sin coordenadas")
+    return (
+        tiempo, lat, lon, _numero(profundidad), _numero(magnitud),
+        str(id_ or f"{tiempo:.0f}:{lat:.3f}:{lon:.3f}"), lugar or '',
+    )
+
+
+def _completos(filas, ruta):
+    """Eventos de las filas que los tienen completos; el resto se omite y se cuenta."""
+    omitidos = 0
+    for fila in filas:
+        try:
+            yield _evento(*fila)
+        except ValueError:
+            omitidos += 1
+    if omitidos:
+        logger.warning(f"Catálogo: {omitidos} eventos sin instante o coordenadas omitidos en {ruta}")
+
+
+# Nombres de columna admitidos en los CSV (USGS, CENAIS o propios)
+_ALIAS_CSV = {
+    'tiempo': ('time', 'tiempo', 'fecha', 'origin_time'),
+    'lat': ('latitude', 'latitud', 'lat'),
+    'lon': ('longitude', 'longitud', 'lon'),
+    'profundidad': ('depth', 'profundidad', 'prof'),
+    'magnitud': ('mag', 'magnitude', 'magnitud'),
+    'id': ('id', 'eventid', 'event_id'),
+    'lugar': ('place', 'lugar', 'region', 'localizacion'),
+}
+
+
+def leer_csv(ruta):
+    """Eventos de un CSV con cabecera; las líneas que empiezan por '#' se ignoran."""
+    with open(ruta, encoding='utf-8', newline='') as f:
+        lector = csv.DictReader(linea for linea in f if not linea.startswith('#'))
+        campos = {c.strip().lower(): c for c in lector.fieldnames or ()}
+        columnas = {
+            nombre: next((campos[a] for a in alias if a in campos), None)
+            for nombre, alias in _ALIAS_CSV.items()
+        }
+        if columnas['tiempo'] is None:
+            raise ValueError("falta la columna de tiempo")
+        # Las columnas van en el orden de los argumentos de _evento
+        yield from _completos(
+            ([fila.get(columna) if columna else None for columna in columnas.values()] for fila in lector),
+            ruta
+        )
+
+
+def leer_geojson(ruta):
+    """Eventos de una colección GeoJSON con el formato de los feeds del USGS."""
+    with open(ruta, encoding='utf-8') as f:
+        datos = json.load(f)
+    if not isinstance(datos, dict):
+        raise ValueError("no es una colección GeoJSON")
+
+    def filas():
+        for rasgo in datos.get('features') or ():
+            try:
+                props = rasgo.get('properties') or {}
+                coordenadas = list((rasgo.get('geometry') or {}).get('coordinates') or ()) + [math.nan] * 3
+                lon, lat, profundidad = coordenadas[:3]
+                yield props.get('time'), lat, lon, profundidad, props.get('mag'), rasgo.get('id'), props.get('place')
+            except (AttributeError, TypeError):
+                # Rasgo con otra estructura: se cuenta como incompleto
+                yield (None,) * 7
+    yield from _completos(filas(), ruta)
+
+
+def _hijo(elemento, *ruta):
+    # Busca por nombre local, sin depender del espacio de nombres de QuakeML
+    for nombre in ruta:
+        if elemento is None:
+            return None
+        elemento = next((e for e in elemento if e.tag.rpartition('}')[2] == nombre), None)
+    return elemento
+
+
+def _valor(elemento, *ruta):
+    encontrado = _hijo(elemento, *ruta)
+    return encontrado.text if encontrado is not None else None
+
+
+def leer_quakeml(ruta):
+    """Eventos de un QuakeML, en flujo: cada ``event`` se libera tras leerlo."""
+    yield from _completos(_filas_quakeml(ruta), ruta)
+
+
+def _filas_quakeml(ruta):
+    for _, elemento in ET.iterparse(ruta, events=('end',)):
+        if elemento.tag.rpartition('}')[2] != 'event':
+            continue
+        origenes = [e for e in elemento if e.tag.endswith('origin')]
+        magnitudes = [e for e in elemento if e.tag.endswith('magnitude')]
+        preferido = _valor(elemento, 'preferredOriginID')
+        origen = next((o for o in origenes if o.get('publicID') == preferido), origenes[0] if origenes else None)
+        preferida = _valor(elemento, 'preferredMagnitudeID')
+        magnitud = next((m for m in magnitudes if m.get('publicID') == preferida), magnitudes[0] if magnitudes else None)
+        if origen is not None:
+            yield (
+                _valor(origen, 'time', 'value'),
+                _valor(origen, 'latitude', 'value'),
+                _valor(origen, 'longitude', 'value'),
+                _numero(_valor(origen, 'depth', 'value')) / 1000.0,  # QuakeML da la profundidad en metros
+                _valor(magnitud, 'mag', 'value'),
+                elemento.get('publicID', ''),
+                _valor(elemento, 'description', 'text'),
+            )
+        elemento.clear()
+
+
+LECTORES = {
+    '.csv': leer_csv,
+    '.geojson': leer_geojson,
+    '.json': leer_geojson,
+    '.xml': leer_quakeml,
+    '.quakeml': leer_quakeml,
+}
+
+
+def _lotes(eventos, tamano):
+    lote = []
+    for evento in eventos:
+        lote.append(evento)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _columnas_de(lote) -> dict:
+    tiempo, lat, lon, profundidad, magnitud, ids, lugares = zip(*lote)
+    return {
+        'tiempo': np.array(tiempo, dtype=COLUMNAS['tiempo']),
+        'lat': np.array(lat, dtype=COLUMNAS['lat']),
+        'lon': np.array(lon, dtype=COLUMNAS['lon']),
+        'profundidad': np.array(profundidad, dtype=COLUMNAS['profundidad']),
+        'magnitud': np.array(magnitud, dtype=COLUMNAS['magnitud']),
+        'id': np.array([i.encode('utf-8')[:40] for i in ids], dtype=COLUMNAS['id']),
+        'lugar': np.array([l.encode('utf-8')[:80] for l in lugares], dtype=COLUMNAS['lugar']),
+    }
+
+
+# ========== ALMACÉN EN COLUMNAS ==========
+class CatalogoSismos:
+    """Columnas mapeadas en memoria con añadido incremental y consultas vectorizadas."""
+
+    def __init__(self, ruta: str = RUTA_CATALOGO):
+        self.ruta = ruta
+        self._columnas = {nombre: np.empty(0, dtype) for nombre, dtype in COLUMNAS.items()}
+
+    def _fichero(self, nombre):
+        return os.path.join(self.ruta, f'{nombre}.bin')
+
+    @property
+    def total(self) -> int:
+        return len(self._columnas['tiempo'])
+
+    def abrir(self, reparar: bool = True) -> bool:
+        """Mapea las columnas en disco.
+
+        Solo el proceso que escribe debe ``reparar``: los que solo leen
+        (varios trabajadores, ``reparto.py``) conservan la versión anterior
+        y devuelven ``False`` si encuentran una escritura a medias.
+        """
+        if reparar:
+            os.makedirs(self.ruta, exist_ok=True)
+            for nombre in COLUMNAS:
+                open(self._fichero(nombre), 'ab').close()
+        try:
+            filas = {n: os.path.getsize(self._fichero(n)) // dtype.itemsize for n, dtype in COLUMNAS.items()}
+        except FileNotFoundError:
+            return False
+        # Un añadido interrumpido puede dejar columnas de distinta longitud
+        total = min(filas.values())
+        if not reparar and max(filas.values()) != total:
+            return False
+        columnas = {}
+        for nombre, dtype in COLUMNAS.items():
+            if reparar and os.path.getsize(self._fichero(nombre)) != total * dtype.itemsize:
+                with open(self._fichero(nombre), 'ab') as f:
+                    f.truncate(total * dtype.itemsize)
+            if total:
+                columnas[nombre] = np.memmap(self._fichero(nombre), dtype=dtype, mode='r', shape=(total,))
+            else:
+                columnas[nombre] = np.empty(0, dtype)
+        # Se sustituye de una vez: las consultas en curso siguen con la versión anterior
+        self._columnas = columnas
+        return True
+
+    def agregar(self, lote: dict) -> int:
+        """Añade un lote de columnas; devuelve cuántos eventos nuevos había."""
+        orden = np.argsort(lote['tiempo'], kind='stable')
+        lote = {nombre: columna[orden] for nombre, columna in lote.items()}
+        # Quitar repetidos dentro del lote
+        _, unicos = np.unique(lote['id'], return_index=True)
+        if len(unicos) < len(orden):
+            unicos.sort()
+            lote = {nombre: columna[unicos] for nombre, columna in lote.items()}
+        # y los que ya están en el catálogo (solo se mira su intervalo de tiempo)
+        actual = self._columnas
+        if self.total:
+            desde = np.searchsorted(actual['tiempo'], lote['tiempo'][0], 'left')
+            hasta = np.searchsorted(actual['tiempo'], lote['tiempo'][-1], 'right')
+            nuevos = ~np.isin(lote['id'], actual['id'][desde:hasta])
+            lote = {nombre: columna[nuevos] for nombre, columna in lote.items()}
+        cantidad = len(lote['tiempo'])
+        if not cantidad:
+            return 0
+
+        if not self.total or lote['tiempo'][0] >= actual['tiempo'][-1]:
+            for nombre, columna in lote.items():
+                with open(self._fichero(nombre), 'ab') as f:
+                    columna.tofile(f)
+        else:
+            # Eventos anteriores al último: se mezcla y se reescribe todo
+            orden = np.argsort(np.concatenate([actual['tiempo'], lote['tiempo']]), kind='stable')
+            for nombre in COLUMNAS:
+                combinada = np.concatenate([actual[nombre], lote[nombre]])[orden]
+                temporal = self._fichero(nombre) + '.tmp'
+                combinada.tofile(temporal)
+                os.replace(temporal, self._fichero(nombre))
+        self.abrir()
+        return cantidad
+
+    def ingerir(self, eventos, tamano: int = CATALOGO_LOTE) -> int:
+        """Ingiere un iterable de eventos (tuplas) por lotes."""
+        return sum(self.agregar(_columnas_de(lote)) for lote in _lotes(eventos, tamano))
+
+    def ingerir_directorio(self, directorio: str = RUTA_ENTRADA) -> int:
+        """Ingiere los ficheros nuevos o modificados del directorio de entrada."""
+        if not os.path.isdir(directorio):
+            return 0
+        ruta_estado = os.path.join(self.ruta, 'ingeridos.json')
+        try:
+            with open(ruta_estado, encoding='utf-8') as f:
+                ingeridos = json.load(f)
+        except FileNotFoundError:
+            ingeridos = {}
+
+        total = 0
+        for nombre in sorted(os.listdir(directorio)):
+            lector = LECTORES.get(os.path.splitext(nombre)[1].lower())
+            ruta = os.path.join(directorio, nombre)
+            if lector is None or not os.path.isfile(ruta):
+                continue
+            info = os.stat(ruta)
+            firma = [info.st_size, info.st_mtime]
+            if ingeridos.get(nombre) == firma:
+                continue
+            try:
+                nuevos = self.ingerir(lector(ruta))
+            except (OSError, ValueError, KeyError, csv.Error, ET.ParseError) as e:
+                logger.error(f"Catálogo: no se pudo leer {nombre}: {e}")
+                continue
+            ingeridos[nombre] = firma
+            total += nuevos
+            logger.info(f"Catálogo: {nuevos} sismos nuevos de {nombre} (total {self.total})")
+
+        with open(ruta_estado + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(ingeridos, f)
+        os.replace(ruta_estado + '.tmp', ruta_estado)
+        return total
+
+    # ----- Consultas -----
+    def _sismo(self, c, i, km=None) -> Sismo:
+        return Sismo(
+            datetime.fromtimestamp(float(c['tiempo'][i]), timezone.utc),
+            float(c['lat'][i]), float(c['lon'][i]),
+            float(c['profundidad'][i]), float(c['magnitud'][i]),
+            _texto(c['id'][i]), _texto(c['lugar'][i]),
+            km,
+        )
+
+    def ultimos(self, n: int = 5, magnitud_min: float = 0.0) -> list:
+        """Los ``n`` sismos más recientes con magnitud ≥ ``magnitud_min``."""
+        c = self._columnas
+        fin, ventana = self.total, max(n * 4, 256)
+        while True:
+            inicio = max(0, fin - ventana)
+            indices = np.flatnonzero(c['magnitud'][inicio:fin] >= magnitud_min) + inicio
+            # Si la ventana no alcanza, se duplica hacia atrás
+            if len(indices) >= n or inicio == 0:
+                return [self._sismo(c, i) for i in indices[::-1][:n]]
+            ventana *= 2
+
+    def cerca(self, lat: float, lon: float, radio_km: float, desde: float = -math.inf,
+              magnitud_min: float = 0.0, limite: int = 10):
+        """Sismos a menos de ``radio_km`` del punto desde el instante ``desde``.
+
+        Devuelve ``(total, sismos)``: el número de coincidencias y las
+        ``limite`` más recientes, con su distancia.
+        """
+        c = self._columnas
+        inicio = int(np.searchsorted(c['tiempo'], desde, 'left'))
+        # Filtro barato por magnitud y caja envolvente antes de la distancia exacta
+        dlat = radio_km / 111.32
+        dlon = radio_km / (111.32 * max(math.cos(math.radians(lat)), 0.01))
+        lats, lons = c['lat'][inicio:], c['lon'][inicio:]
+        mascara = c['magnitud'][inicio:] >= magnitud_min
+        mascara &= (lats >= lat - dlat) & (lats <= lat + dlat)
+        mascara &= (lons >= lon - dlon) & (lons <= lon + dlon)
+        indices = np.flatnonzero(mascara)
+
+        fi, la = np.radians(lats[indices].astype(np.float64)), np.radians(lons[indices].astype(np.float64))
+        fi0, la0 = math.radians(lat), math.radians(lon)
+        a = np.sin((fi - fi0) / 2) ** 2 + math.cos(fi0) * np.cos(fi) * np.sin((la - la0) / 2) ** 2
+        km = 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(a))
+        dentro = km <= radio_km
+        indices, km = indices[dentro] + inicio, km[dentro]
+        recientes = range(len(indices) - 1, max(len(indices) - 1 - limite, -1), -1)
+        return len(indices), [self._sismo(c, indices[j], float(km[j])) for j in recientes]
+
+
+def formatear_sismo(sismo: Sismo) -> str:
+    lugar = sismo.lugar or f"{sismo.lat:.2f}, {sismo.lon:.2f}"
+    linea = f"• {sismo.tiempo:%d/%m/%Y %H:%M} UTC · M{sismo.magnitud:.1f} · {lugar}"
+    if not math.isnan(sismo.profundidad):
+        linea += f" · {sismo.profundidad:.0f} km de profundidad"
+    if sismo.distancia_km is not None:
+        linea += f" · a {sismo.distancia_km:.0f} km"
+    return linea
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    parser = argparse.ArgumentParser(description="Ingiere ficheros de sismos en el catálogo local")
+    parser.add_argument('ficheros', nargs='*', help="CSV, GeoJSON o QuakeML (por defecto, el directorio de entrada)")
+    parser.add_argument('--catalogo', default=RUTA_CATALOGO)
+    args = parser.parse_args()
+
+    catalogo = CatalogoSismos(args.catalogo)
+    catalogo.abrir()
+    if args.ficheros:
+        for ruta in args.ficheros:
+            lector = LECTORES[os.path.splitext(ruta)[1].lower()]
+            print(f"{ruta}: {catalogo.ingerir(lector(ruta))} sismos nuevos")
+    else:
+        catalogo.ingerir_directorio()
+    print(f"Catálogo: {catalogo.total} sismos")
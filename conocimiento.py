@@ -0,0 +1,267 @@
+"""Base de conocimiento local para las consultas a la IA.
+
+Las guías de la Defensa Civil, los resúmenes del catálogo del CENAIS y las
+preguntas frecuentes (``datos/conocimiento.json``) se dividen en pasajes y se
+indexan con BM25. El índice se guarda en disco junto a la huella del fichero
+de origen y se reconstruye solo si este cambia: una cabecera JSON con el
+vocabulario y los pasajes, seguida de las listas de apariciones como enteros
+de 32 bits que se leen con ``mmap`` sin copiarlas a memoria.
+
+Las preguntas que coinciden con una pregunta frecuente con suficiente
+confianza se responden directamente, sin llamar al modelo; para el resto se
+recuperan los pasajes más relevantes y se incluyen en un prompt más corto.
+"""
+import hashlib
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import time
+from array import array
+from collections import Counter, defaultdict
+from typing import NamedTuple, Optional
+
+from cache_respuestas import normalizar
+
+logger = logging.getLogger(__name__)
+
+RUTA_CONOCIMIENTO = os.getenv('CONOCIMIENTO_RUTA', 'datos/conocimiento.json')
+RUTA_INDICE = os.getenv('CONOCIMIENTO_INDICE', 'datos/conocimiento.idx')
+# Similitud mínima con una pregunta frecuente para responder sin el modelo
+CONOCIMIENTO_UMBRAL_FAQ = float(os.getenv('CONOCIMIENTO_UMBRAL_FAQ', '0.75'))
+# Pasajes que se añaden al prompt
+CONOCIMIENTO_PASAJES = int(os.getenv('CONOCIMIENTO_PASAJES', '3'))
+# Puntuación BM25 mínima para que un pasaje entre en el prompt
+CONOCIMIENTO_PUNTUACION_MIN = float(os.getenv('CONOCIMIENTO_PUNTUACION_MIN', '2.0'))
+
+_MAGIA = b'BM25KB1\0'
+_LARGO_RAIZ = 5
+
+_VACIAS = frozenset('''
+a al algo algun alguna como con cual cuales cuando cuanto de debe debo del
+donde el ella ellas ellos en entre era es esa ese eso esta estan estas este
+esto estos fue ha habra hace hacer hago hay la las le les lo los mas me mi
+mis mucho muy nada ni no nos o otra otro para pero por porque puede puedo
+que quien quiero saber se sea ser si sin sobre son su sus tambien te tengo
+tiene tu tus un una uno unos va y ya yo
+'''.split())
+
+
+def terminos(texto: str) -> list:
+    """Palabras normalizadas, sin vacías, sin plural y recortadas a su raíz."""
+    salida = []
+    for palabra in normalizar(texto).split():
+        if len(palabra) < 2 or palabra in _VACIAS:
+            continue
+        if len(palabra) > 3 and palabra.endswith('s'):
+            palabra = palabra[:-1]
+        salida.append(palabra[:_LARGO_RAIZ])
+    return salida
+
+
+class Pasaje(NamedTuple):
+    documento: str
+    titulo: str
+    texto: str
+    puntuacion: float
+
+
+# ========== CONSTRUCCIÓN DEL ÍNDICE ==========
+def _pasajes(datos):
+    for doc in datos['documentos']:
+        for parrafo in doc['texto']:
+            yield doc['id'], doc['titulo'], parrafo
+    for faq in datos['faq']:
+        yield faq['id'], faq['preguntas'][0], faq['respuesta']
+
+
+def construir_indice(ruta_fuente: str, ruta_indice: str) -> int:
+    """Construye el índice en disco; devuelve el número de pasajes."""
+    with open(ruta_fuente, 'rb') as f:
+        contenido = f.read()
+    datos = json.loads(contenido)
+
+    pasajes, longitudes = [], []
+    apariciones = defaultdict(list)
+    for i, (doc_id, titulo, texto) in enumerate(_pasajes(datos)):
+        frecuencias = Counter(terminos(f'{titulo} {texto}'))
+        pasajes.append((doc_id, titulo, texto))
+        longitudes.append(sum(frecuencias.values()))
+        for termino, tf in frecuencias.items():
+            apariciones[termino].append((i, tf))
+
+    vocabulario, listas = {}, array('I')
+    for termino, lista in apariciones.items():
+        vocabulario[termino] = (len(listas) // 2, len(lista))
+        for pasaje, tf in lista:
+            listas.extend((pasaje, tf))
+
+    cabecera = json.dumps({
+        'fuente': hashlib.sha1(contenido).hexdigest(),
+        'pasajes': pasajes,
+        'longitudes': longitudes,
+        'vocabulario': vocabulario,
+        'faq': [(faq['preguntas'], faq['respuesta']) for faq in datos['faq']],
+    }, ensure_ascii=False).encode('utf-8')
+    # Las listas empiezan alineadas a 4 bytes
+    relleno = b' ' * (-(len(_MAGIA) + 4 + len(cabecera)) % 4)
+
+    temporal = f'{ruta_indice}.tmp'
+    with open(temporal, 'wb') as f:
+        f.write(_MAGIA + struct.pack('<I', len(cabecera) + len(relleno)) + cabecera + relleno)
+        listas.tofile(f)
+    os.replace(temporal, ruta_indice)
+    return len(pasajes)
+
+
+def _huella(ruta):
+    with open(ruta, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+# ========== CONSULTA ==========
+class BaseConocimiento:
+    """Índice BM25 de pasajes y respuestas directas a preguntas frecuentes."""
+
+    def __init__(
+        self,
+        ruta: str = RUTA_CONOCIMIENTO,
+        ruta_indice: str = RUTA_INDICE,
+        umbral_faq: float = CONOCIMIENTO_UMBRAL_FAQ,
+        puntuacion_min: float = CONOCIMIENTO_PUNTUACION_MIN,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        self.ruta = ruta
+        self.ruta_indice = ruta_indice
+        self.umbral_faq = umbral_faq
+        self.puntuacion_min = puntuacion_min
+        self.k1 = k1
+        self.b = b
+        self._mmap = None
+        self._listas = None
+        self.pasajes = []
+        self._longitudes = []
+        self._vocabulario = {}
+        self._faq = []
+        self.estadisticas = {
+            'faq_directas': 0,
+            'con_contexto': 0,
+            'sin_contexto': 0,
+        }
+
+    def cargar(self):
+        """Abre el índice en disco, reconstruyéndolo si el origen cambió."""
+        fuente = _huella(self.ruta)
+        if not self._abrir(fuente):
+            inicio = time.perf_counter()
+            n = construir_indice(self.ruta, self.ruta_indice)
+            logger.info(f"Base de conocimiento: índice de {n} pasajes construido en {time.perf_counter() - inicio:.3f}s")
+            self._abrir(fuente)
+        logger.info(
+            f"Base de conocimiento: {len(self.pasajes)} pasajes, "
+            f"{len(self._vocabulario)} términos, {len(self._faq)} preguntas frecuentes"
+        )
+
+    def _abrir(self, fuente) -> bool:
+        self.cerrar()
+        try:
+            archivo = open(self.ruta_indice, 'rb')
+        except FileNotFoundError:
+            return False
+        with archivo:
+            if archivo.read(len(_MAGIA)) != _MAGIA:
+                return False
+            largo, = struct.unpack('<I', archivo.read(4))
+            cabecera = json.loads(archivo.read(largo))
+            if cabecera['fuente'] != fuente:
+                return False
+            self._mmap = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        self._listas = memoryview(self._mmap)[len(_MAGIA) + 4 + largo:].cast('I')
+
+        self.pasajes = cabecera['pasajes']
+        self._longitudes = cabecera['longitudes']
+        self._media = sum(self._longitudes) / len(self._longitudes) if self._longitudes else 0.0
+        self._vocabulario = cabecera['vocabulario']
+        n = len(self.pasajes)
+        self._idf = {
+            t: math.log(1 + (n - df + 0.5) / (df + 0.5)) for t, (_, df) in self._vocabulario.items()
+        }
+        # Un término que no aparece en la base pesa como el más raro
+        self._idf_desconocido = math.log(1 + (n + 0.5) / 0.5)
+        self._faq = [
+            (frozenset(terminos(pregunta)), respuesta)
+            for preguntas, respuesta in cabecera['faq']
+            for pregunta in preguntas
+        ]
+        return True
+
+    def cerrar(self):
+        if self._listas is not None:
+            self._listas.release()
+            self._listas = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _peso(self, conjunto):
+        return sum(self._idf.get(t, self._idf_desconocido) for t in conjunto)
+
+    def responder_faq(self, pregunta: str) -> Optional[str]:
+        """Respuesta de la pregunta frecuente equivalente, o ``None``.
+
+        La similitud es un coeficiente de Dice ponderado por IDF entre los
+        términos de la pregunta y los de cada variante de la FAQ.
+        """
+        consulta = frozenset(terminos(pregunta))
+        if not consulta or not self._faq:
+            return None
+        peso_consulta = self._peso(consulta)
+        mejor, respuesta = 0.0, None
+        for variante, texto in self._faq:
+            comunes = consulta & variante
+            if not comunes:
+                continue
+            valor = 2 * self._peso(comunes) / (peso_consulta + self._peso(variante))
+            if valor > mejor:
+                mejor, respuesta = valor, texto
+        if mejor >= self.umbral_faq:
+            self.estadisticas['faq_directas'] += 1
+            return respuesta
+        return None
+
+    def buscar(self, pregunta: str, k: int = CONOCIMIENTO_PASAJES) -> list:
+        """Los ``k`` pasajes más relevantes con puntuación BM25 suficiente."""
+        puntuaciones = defaultdict(float)
+        listas, longitudes, media = self._listas, self._longitudes, self._media
+        for termino in set(terminos(pregunta)):
+            entrada = self._vocabulario.get(termino)
+            if entrada is None:
+                continue
+            inicio, df = entrada
+            idf = self._idf[termino]
+            for j in range(2 * inicio, 2 * (inicio + df), 2):
+                pasaje, tf = listas[j], listas[j + 1]
+                normal = self.k1 * (1 - self.b + self.b * longitudes[pasaje] / media)
+                puntuaciones[pasaje] += idf * tf * (self.k1 + 1) / (tf + normal)
+
+        mejores = heapq.nlargest(k, puntuaciones.items(), key=lambda p: p[1])
+        resultado = [
+            Pasaje(*self.pasajes[i], puntuacion)
+            for i, puntuacion in mejores
+            if puntuacion >= self.puntuacion_min
+        ]
+        self.estadisticas['con_contexto' if resultado else 'sin_contexto'] += 1
+        return resultado
+
+    def resumen(self) -> dict:
+        e = self.estadisticas
+        total = e['faq_directas'] + e['con_contexto'] + e['sin_contexto']
+        return {
+            **e,
+            'pasajes': len(self.pasajes),
+            'tasa_sin_modelo': e['faq_directas'] / total if total else 0.0,
+        }
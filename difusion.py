@@ -0,0 +1,236 @@
+"""Difusión masiva de alertas a los usuarios suscritos a la Defensa Civil.
+
+Los destinatarios (``usuarios.recibir_info = 'Sí'``) se leen por páginas con
+paginación por clave (``user_id > ?``), sin cargarlos todos en memoria. Cada
+página se envía de forma concurrente respetando el límite global de Telegram
+mediante un cubo de fichas; los ``RetryAfter`` pausan el cubo para todos los
+envíos (sin gastar los reintentos del destinatario), los errores de red se
+reintentan con espera exponencial y cualquier otro rechazo de Telegram
+cuenta como fallido sin detener la difusión. Los envíos de una página
+avanzan en una ventana de ``concurrencia`` destinatarios, en orden de
+``user_id``: cada vez que termina el primero de la ventana se guarda como
+punto de control, de modo que una difusión interrumpida (reinicio, caída) se
+reanuda donde quedó y repite, como mucho, los envíos que estaban en curso.
+Mientras hay una difusión en curso (``activas``), los envíos programados de
+menor prioridad esperan (ver programacion.py).
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import NamedTuple
+
+from telegram.error import Forbidden, BadRequest, NetworkError, RetryAfter, TelegramError
+
+from base_datos import SUSCRITO_SQL, ahora
+from limitador import CuboTokens, segundos_espera
+
+logger = logging.getLogger(__name__)
+
+# Telegram admite unos 30 mensajes por segundo en total y 1 por segundo por chat
+DIFUSION_TASA = float(os.getenv('DIFUSION_TASA', '25'))
+DIFUSION_CONCURRENCIA = int(os.getenv('DIFUSION_CONCURRENCIA', '50'))
+DIFUSION_PAGINA = int(os.getenv('DIFUSION_PAGINA', '500'))
+DIFUSION_REINTENTOS = int(os.getenv('DIFUSION_REINTENTOS', '3'))
+
+LIMITE_MENSAJE = 4096
+
+
+class Informe(NamedTuple):
+    difusion_id: int
+    entregados: int
+    fallidos: int
+    segundos: float
+
+
+# ========== ACCESO A DATOS ==========
+def _crear(conn, mensaje):
+    with conn:
+        cursor = conn.execute(
+            "INSERT INTO difusiones (mensaje, estado, creada) VALUES (?, 'en_curso', ?)",
+            (mensaje, ahora())
+        )
+    return cursor.lastrowid
+
+
+def _leer(conn, difusion_id):
+    return conn.execute(
+        'SELECT mensaje, ultimo_user_id, entregados, fallidos, segundos FROM difusiones WHERE id = ?',
+        (difusion_id,)
+    ).fetchone()
+
+
+def _pagina_destinatarios(conn, despues_de, limite):
+    filas = conn.execute(
+        f"SELECT user_id FROM usuarios WHERE {SUSCRITO_SQL.format('usuarios')} "
+        "AND user_id > ? ORDER BY user_id LIMIT ?",
+        (despues_de, limite)
+    ).fetchall()
+    return [f[0] for f in filas]
+
+
+def _punto_control(conn, difusion_id, ultimo_user_id, entregados, fallidos, segundos, estado):
+    with conn:
+        conn.execute(
+            'UPDATE difusiones SET ultimo_user_id = ?, entregados = ?, fallidos = ?, '
+            'segundos = ?, estado = ?, terminada = ? WHERE id = ?',
+            (ultimo_user_id, entregados, fallidos, segundos, estado,
+             ahora() if estado != 'en_curso' else None, difusion_id)
+        )
+
+
+def _pendientes(conn):
+    return [f[0] for f in conn.execute("SELECT id FROM difusiones WHERE estado = 'en_curso'")]
+
+
+def partir_mensaje(texto: str, limite: int = LIMITE_MENSAJE):
+    """Divide el texto en partes de hasta ``limite`` caracteres por saltos de línea."""
+    partes = []
+    while len(texto) > limite:
+        corte = texto.rfind('\n', 0, limite)
+        if corte <= 0:
+            corte = limite
+        partes.append(texto[:corte])
+        texto = texto[corte:].lstrip('\n')
+    partes.append(texto)
+    return partes
+
+
+# ========== MOTOR DE DIFUSIÓN ==========
+class MotorDifusion:
+    """Envía un mensaje a todos los suscritos con control de tasa y reanudación."""
+
+    def __init__(
+        self,
+        bot,
+        bd,
+        tasa: float = DIFUSION_TASA,
+        concurrencia: int = DIFUSION_CONCURRENCIA,
+        pagina: int = DIFUSION_PAGINA,
+        reintentos: int = DIFUSION_REINTENTOS,
+    ):
+        self.bot = bot
+        self.bd = bd
+        self.cubo = CuboTokens(tasa)
+        self.concurrencia = concurrencia
+        self.pagina = pagina
+        self.reintentos = reintentos
+        self._semaforo = None
+        # Difusiones en curso en este proceso
+        self.activas = 0
+
+    async def enviar(self, chat_id, texto) -> bool:
+        """Envía un mensaje a un solo chat con el mismo control de tasa y reintentos."""
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.concurrencia)
+        return await self._enviar_chat(chat_id, partir_mensaje(texto))
+
+    async def _enviar_chat(self, chat_id, partes) -> bool:
+        async with self._semaforo:
+            for i, parte in enumerate(partes):
+                if i:
+                    # Límite por chat: un mensaje por segundo
+                    await asyncio.sleep(1.0)
+                if not await self._enviar_parte(chat_id, parte):
+                    return False
+            return True
+
+    async def _enviar_parte(self, chat_id, texto) -> bool:
+        intento = 0
+        while True:
+            await self.cubo.adquirir()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=texto)
+                return True
+            except RetryAfter as e:
+                # Control de flujo: se pausa el cubo global, no solo este envío.
+                # No es culpa del destinatario, así que no gasta sus reintentos
+                espera = segundos_espera(e.retry_after)
+                logger.warning(f"Difusión: control de flujo, pausa de {espera}s")
+                self.cubo.pausar(espera)
+            except (Forbidden, BadRequest) as e:
+                # Usuario que bloqueó el bot o chat inexistente: no se reintenta
+                logger.info(f"Difusión: no se pudo entregar a {chat_id}: {e}")
+                return False
+            except NetworkError as e:
+                if intento >= self.reintentos:
+                    logger.warning(f"Difusión: error de red con {chat_id}: {e}")
+                    return False
+                await asyncio.sleep(2 ** intento)
+                intento += 1
+            except TelegramError as e:
+                # Cualquier otro rechazo (p. ej. ChatMigrated) cuenta como fallido
+                # para este destinatario sin detener la difusión
+                logger.warning(f"Difusión: no se pudo entregar a {chat_id}: {e}")
+                return False
+
+
+    async def difundir(self, mensaje: str) -> Informe:
+        """Crea una difusión nueva y la ejecuta hasta el final."""
+        difusion_id = await self.bd.ejecutar(_crear, mensaje)
+        logger.info(f"Difusión {difusion_id} iniciada")
+        return await self.reanudar(difusion_id)
+
+    async def reanudar(self, difusion_id: int) -> Informe:
+        """Continúa una difusión desde su último punto de control."""
+        mensaje, ultimo, entregados, fallidos, segundos = await self.bd.ejecutar(_leer, difusion_id)
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.concurrencia)
+        partes = partir_mensaje(mensaje)
+        inicio = time.perf_counter() - segundos
+
+        self.activas += 1
+        try:
+            while True:
+                destinatarios = await self.bd.ejecutar(_pagina_destinatarios, ultimo, self.pagina)
+                if not destinatarios:
+                    break
+                # Ventana deslizante: como mucho ``concurrencia`` envíos empezados
+                # por delante del punto de control
+                ventana = deque()
+                try:
+                    for uid in destinatarios:
+                        if len(ventana) >= self.concurrencia:
+                            ultimo, entregados, fallidos = await self._cerrar_envio(
+                                difusion_id, ventana, entregados, fallidos, inicio
+                            )
+                        ventana.append((uid, asyncio.ensure_future(self._enviar_chat(uid, partes))))
+                    while ventana:
+                        ultimo, entregados, fallidos = await self._cerrar_envio(
+                            difusion_id, ventana, entregados, fallidos, inicio
+                        )
+                finally:
+                    # Interrumpida: los envíos en curso no siguen por su cuenta
+                    for _, tarea in ventana:
+                        tarea.cancel()
+        finally:
+            self.activas -= 1
+
+        total = time.perf_counter() - inicio
+        await self.bd.ejecutar(
+            _punto_control, difusion_id, ultimo, entregados, fallidos, total, 'terminada'
+        )
+        logger.info(
+            f"Difusión {difusion_id} terminada: {entregados} entregados, "
+            f"{fallidos} fallidos en {total:.1f}s"
+        )
+        return Informe(difusion_id, entregados, fallidos, total)
+
+    async def _cerrar_envio(self, difusion_id, ventana, entregados, fallidos, inicio):
+        """Espera al primer envío de la ventana y lo anota como punto de control."""
+        uid, tarea = ventana[0]
+        entregado = await tarea
+        ventana.popleft()
+        entregados += entregado
+        fallidos += not entregado
+        # Sin esperar: la escritura va en orden por el hilo de la base de datos
+        self.bd.enviar(
+            _punto_control, difusion_id, uid, entregados, fallidos,
+            time.perf_counter() - inicio, 'en_curso'
+        )
+        return uid, entregados, fallidos
+
+    async def pendientes(self):
+        """Difusiones que quedaron a medias (p. ej. por un reinicio)."""
+        return await self.bd.ejecutar(_pendientes)
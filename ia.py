@@ -0,0 +1,447 @@
+"""Cliente asíncrono para los modelos de lenguaje (Gemini).
+
+Los manejadores del bot son corrutinas que comparten un único bucle de
+eventos; una llamada síncrona a ``generate_content`` lo bloquea durante todo
+el viaje de ida y vuelta. Este módulo encapsula las llamadas al modelo con:
+
+- generación asíncrona nativa (``generate_content_async``) o, si el modelo no
+  la ofrece, un pool de hilos acotado;
+- un límite configurable de llamadas simultáneas;
+- un tiempo máximo por llamada y una respuesta alternativa cuando se agota;
+- generación por fragmentos (``generar_flujo``) para mostrar la respuesta
+  mientras se escribe;
+- un modelo falso (``ModeloFalso``) para medir el rendimiento sin conexión.
+
+``google.generativeai`` tarda cerca de un segundo en importarse, así que no
+se importa con este módulo: ``cargar_genai`` lo importa y configura al crear
+el primer modelo real, y ``ClienteIA.precalentar`` permite hacerlo en un hilo
+en cuanto el bot ya atiende actualizaciones.
+"""
+import asyncio
+import logging
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from metricas import IA_SEGUNDOS, IA_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# Configuración (variables de entorno)
+MODELO_GEMINI = os.getenv('GEMINI_MODEL', 'gemini-pro')
+IA_MAX_CONCURRENCIA = int(os.getenv('IA_MAX_CONCURRENCIA', '16'))
+IA_TIMEOUT = float(os.getenv('IA_TIMEOUT', '20'))
+
+
+class RespuestaIA(NamedTuple):
+    texto: str
+    alternativa: bool = False
+    latencia: float = 0.0
+
+
+# ========== MODELO FALSO ==========
+class _RespuestaFalsa:
+    def __init__(self, text):
+        self.text = text
+
+
+class ModeloFalso:
+    """Sustituto local de ``genai.GenerativeModel`` para pruebas y benchmarks.
+
+    Simula la latencia del modelo y devuelve un texto de longitud variable.
+    Con ``distribucion='uniforme'`` la latencia es fija o uniforme entre
+    ``latencia`` y ``latencia_max``; con ``'lognormal'``, ``latencia`` es la
+    mediana y ``latencia_max`` el tope de la cola larga. La longitud es fija
+    o uniforme entre ``longitud`` y ``longitud_max``.
+    """
+
+    def __init__(
+        self,
+        latencia=0.5,
+        latencia_max=None,
+        longitud=400,
+        tasa_error=0.0,
+        longitud_max=None,
+        distribucion='uniforme',
+    ):
+        self.latencia = latencia
+        self.latencia_max = latencia_max
+        self.longitud = longitud
+        self.longitud_max = longitud_max
+        self.tasa_error = tasa_error
+        self.distribucion = distribucion
+        self.llamadas = 0
+
+    def _demora(self):
+        if self.distribucion == 'lognormal':
+            demora = random.lognormvariate(math.log(self.latencia), 0.5)
+            return min(demora, self.latencia_max) if self.latencia_max else demora
+        if self.latencia_max is None:
+            return self.latencia
+        return random.uniform(self.latencia, self.latencia_max)
+
+    def _texto(self, prompt):
+        self.llamadas += 1
+        if self.tasa_error and random.random() < self.tasa_error:
+            raise RuntimeError("Error simulado del modelo")
+        longitud = self.longitud
+        if self.longitud_max:
+            longitud = random.randint(self.longitud, self.longitud_max)
+        base = f"Respuesta simulada a: {str(prompt)[-80:]}. "
+        return (base * (longitud // len(base) + 1))[:longitud]
+
+    def generate_content(self, contents, generation_config=None, **kwargs):
+        time.sleep(self._demora())
+        return _RespuestaFalsa(self._texto(contents))
+
+    async def generate_content_async(self, contents, generation_config=None, stream=False, **kwargs):
+        demora = self._demora()
+        if not stream:
+            await asyncio.sleep(demora)
+            return _RespuestaFalsa(self._texto(contents))
+        # En modo flujo el primer fragmento llega tras una fracción de la latencia
+        await asyncio.sleep(demora * 0.2)
+        return self._fragmentos(self._texto(contents), demora * 0.8)
+
+    async def _fragmentos(self, texto, duracion, tamano=40):
+        partes = [texto[i:i + tamano] for i in range(0, len(texto), tamano)]
+        for i, parte in enumerate(partes):
+            if i:
+                await asyncio.sleep(duracion / len(partes))
+            yield _RespuestaFalsa(parte)
+
+
+_genai = None
+_cargando_genai = threading.Lock()
+
+
+def cargar_genai():
+    """Importa y configura ``google.generativeai`` la primera vez que se necesita."""
+    global _genai
+    with _cargando_genai:
+        if _genai is None:
+            import google.generativeai as genai
+            genai.configure(
+                api_key=os.getenv('GEMINI_API_KEY'),
+                client_options={
+                    'api_endpoint': 'https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent'
+                }
+            )
+            _genai = genai
+    return _genai
+
+
+def crear_modelo(nombre=None):
+    """Crea el modelo indicado; ``falso`` devuelve un ``ModeloFalso``."""
+    nombre = nombre or MODELO_GEMINI
+    if nombre == 'falso':
+        return ModeloFalso(
+            latencia=float(os.getenv('IA_FALSO_LATENCIA', '0.5')),
+            latencia_max=float(os.getenv('IA_FALSO_LATENCIA_MAX', '1.5')),
+            longitud=int(os.getenv('IA_FALSO_LONGITUD', '400')),
+            longitud_max=int(os.getenv('IA_FALSO_LONGITUD_MAX', '0')) or None,
+            tasa_error=float(os.getenv('IA_FALSO_TASA_ERROR', '0')),
+            distribucion=os.getenv('IA_FALSO_DISTRIBUCION', 'uniforme'),
+        )
+    return cargar_genai().GenerativeModel(nombre)
+
+
+def _registrar_tokens(tipo, prompt, respuesta, texto):
+    uso = getattr(respuesta, 'usage_metadata', None)
+    if uso is not None and getattr(uso, 'candidates_token_count', None):
+        entrada, salida = uso.prompt_token_count, uso.candidates_token_count
+    else:
+        # Aproximación habitual: unos 4 caracteres por token
+        entrada, salida = len(prompt) // 4, len(texto) // 4
+    IA_TOKENS.etiquetas(tipo, 'entrada').inc(entrada)
+    IA_TOKENS.etiquetas(tipo, 'salida').inc(salida)
+
+
+# ========== LLAMADAS COMPARTIDAS ==========
+class _Vuelo:
+    """Llamada al modelo en curso compartida por varios solicitantes.
+
+    La tarea no pertenece a ningún solicitante: si uno se cancela, los demás
+    siguen esperando; solo cuando se van todos se cancela la llamada.
+    """
+
+    def __init__(self, tarea=None):
+        self.tarea = tarea
+        self.esperando = 0
+        self.cancelado = False
+
+    def _salir(self):
+        self.esperando -= 1
+        if self.esperando == 0 and not self.tarea.done():
+            # Nadie espera ya el resultado
+            self.cancelado = True
+            self.tarea.cancel()
+
+    async def esperar(self):
+        self.esperando += 1
+        try:
+            return await asyncio.shield(self.tarea)
+        finally:
+            self._salir()
+
+
+class _FlujoCompartido(_Vuelo):
+    """Flujo de fragmentos que se reparte a todos los lectores, desde el principio."""
+
+    def __init__(self):
+        super().__init__()
+        self.fragmentos = []
+        self.terminado = False
+        self.error = None
+        self._cambio = asyncio.Condition()
+
+    async def agregar(self, fragmento):
+        async with self._cambio:
+            self.fragmentos.append(fragmento)
+            self._cambio.notify_all()
+
+    async def terminar(self, error=None):
+        async with self._cambio:
+            self.terminado = True
+            self.error = error
+            self._cambio.notify_all()
+
+    async def leer(self):
+        self.esperando += 1
+        try:
+            leidos = 0
+            while True:
+                async with self._cambio:
+                    await self._cambio.wait_for(
+                        lambda: len(self.fragmentos) > leidos or self.terminado
+                    )
+                    nuevos = self.fragmentos[leidos:]
+                    terminado, error = self.terminado, self.error
+                for fragmento in nuevos:
+                    yield fragmento
+                leidos += len(nuevos)
+                if terminado and leidos == len(self.fragmentos):
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            self._salir()
+
+
+# ========== CLIENTE ASÍNCRONO ==========
+class ClienteIA:
+    """Ejecuta llamadas al modelo sin bloquear el bucle de eventos."""
+
+    def __init__(self, modelo=None, max_concurrencia=IA_MAX_CONCURRENCIA, timeout=IA_TIMEOUT):
+        self._modelo = modelo
+        self._creando = threading.Lock()
+        self.max_concurrencia = max_concurrencia
+        self.timeout = timeout
+        self._semaforo = None
+        self._pool = None
+        # Llamadas en curso por (tipo, prompt, configuración), para compartirlas
+        self._vuelos = {}
+        self.estadisticas = {'llamadas': 0, 'compartidas': 0, 'errores': 0, 'agotadas': 0}
+
+    @property
+    def modelo(self):
+        if self._modelo is None:
+            # Puede crearse a la vez desde el precalentamiento y desde una llamada
+            with self._creando:
+                if self._modelo is None:
+                    self._modelo = crear_modelo()
+        return self._modelo
+
+    async def obtener_modelo(self):
+        """El modelo, creándolo en un hilo si aún no existe (sin bloquear el bucle)."""
+        if self._modelo is None:
+            await asyncio.to_thread(lambda: self.modelo)
+        return self._modelo
+
+    async def precalentar(self):
+        inicio = time.perf_counter()
+        await self.obtener_modelo()
+        logger.info(f"Modelo de IA listo en {time.perf_counter() - inicio:.2f}s")
+
+    def _obtener_semaforo(self):
+        # Se crea de forma diferida para que pertenezca al bucle en ejecución
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.max_concurrencia)
+        return self._semaforo
+
+    async def _llamar(self, prompt, config):
+        modelo = await self.obtener_modelo()
+        if hasattr(modelo, 'generate_content_async'):
+            return await modelo.generate_content_async(prompt, generation_config=config)
+
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.max_concurrencia,
+                thread_name_prefix='ia'
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._pool,
+            lambda: modelo.generate_content(prompt, generation_config=config)
+        )
+
+    @staticmethod
+    def _configuracion(temperatura, max_tokens):
+        config = {'temperature': temperatura}
+        if max_tokens is not None:
+            config['max_output_tokens'] = max_tokens
+        return config
+
+    @staticmethod
+    def _clave(tipo, prompt, config):
+        return (tipo, prompt, tuple(sorted(config.items())))
+
+    def en_vuelo(self, prompt: str, temperatura: float = 0.7, max_tokens: Optional[int] = None) -> bool:
+        """Indica si ya hay una llamada idéntica en curso a la que unirse."""
+        config = self._configuracion(temperatura, max_tokens)
+        return any(self._clave(tipo, prompt, config) in self._vuelos for tipo in ('texto', 'flujo'))
+
+    def _registrar_vuelo(self, clave, vuelo):
+        self._vuelos[clave] = vuelo
+        vuelo.tarea.add_done_callback(
+            lambda _: self._vuelos.pop(clave) if self._vuelos.get(clave) is vuelo else None
+        )
+
+    async def _generar(self, prompt, config, plazo, tipo):
+        self.estadisticas['llamadas'] += 1
+        inicio = time.perf_counter()
+        try:
+            # El plazo incluye la espera por un hueco libre en el semáforo
+            async with asyncio.timeout(plazo):
+                async with self._obtener_semaforo():
+                    response = await self._llamar(prompt, config)
+            IA_SEGUNDOS.etiquetas(tipo, 'ok').observar(time.perf_counter() - inicio)
+            _registrar_tokens(tipo, prompt, response, response.text)
+            return response.text
+        except TimeoutError:
+            self.estadisticas['agotadas'] += 1
+            IA_SEGUNDOS.etiquetas(tipo, 'agotada').observar(time.perf_counter() - inicio)
+            logger.warning(f"Tiempo agotado ({plazo}s) esperando al modelo")
+            raise
+        except Exception:
+            self.estadisticas['errores'] += 1
+            IA_SEGUNDOS.etiquetas(tipo, 'error').observar(time.perf_counter() - inicio)
+            raise
+
+    async def generar(
+        self,
+        prompt: str,
+        temperatura: float = 0.7,
+        max_tokens: Optional[int] = None,
+        alternativa: Optional[str] = None,
+        timeout: Optional[float] = None,
+        tipo: str = 'general',
+    ) -> RespuestaIA:
+        """Genera una respuesta respetando el límite de concurrencia y el plazo.
+
+        Las peticiones idénticas (mismo prompt y configuración) que coinciden
+        en el tiempo comparten una sola llamada al modelo. Si el plazo se
+        agota o el modelo falla y se indicó ``alternativa``, devuelve ese
+        texto marcado como alternativo; si no, propaga el error. ``tipo``
+        solo sirve para clasificar las métricas.
+        """
+        config = self._configuracion(temperatura, max_tokens)
+        plazo = self.timeout if timeout is None else timeout
+        clave = self._clave('texto', prompt, config)
+
+        vuelo = self._vuelos.get(clave)
+        if vuelo is None or vuelo.cancelado:
+            vuelo = _Vuelo(asyncio.ensure_future(self._generar(prompt, config, plazo, tipo)))
+            self._registrar_vuelo(clave, vuelo)
+        else:
+            self.estadisticas['compartidas'] += 1
+
+        inicio = time.perf_counter()
+        try:
+            texto = await vuelo.esperar()
+            return RespuestaIA(texto, latencia=time.perf_counter() - inicio)
+        except TimeoutError:
+            if alternativa is None:
+                raise
+            return RespuestaIA(alternativa, alternativa=True)
+        except Exception as e:
+            if alternativa is None:
+                raise
+            logger.error(f"Error del modelo: {e}")
+            return RespuestaIA(alternativa, alternativa=True)
+
+    async def _producir_flujo(self, vuelo, prompt, config, plazo, tipo):
+        self.estadisticas['llamadas'] += 1
+        inicio = time.perf_counter()
+        # Todo dentro del try, también la creación del modelo (y la importación
+        # diferida de Gemini): si falla, los lectores deben enterarse
+        try:
+            async with asyncio.timeout(plazo) as limite:
+                modelo = await self.obtener_modelo()
+                async with self._obtener_semaforo():
+                    if not hasattr(modelo, 'generate_content_async'):
+                        response = await self._llamar(prompt, config)
+                        await vuelo.agregar(response.text)
+                    else:
+                        response = None
+                        flujo = await modelo.generate_content_async(
+                            prompt, generation_config=config, stream=True
+                        )
+                        async for response in flujo:
+                            if response.text:
+                                await vuelo.agregar(response.text)
+                            limite.reschedule(asyncio.get_running_loop().time() + plazo)
+            IA_SEGUNDOS.etiquetas(tipo, 'ok').observar(time.perf_counter() - inicio)
+            # El último fragmento trae el recuento de tokens de toda la respuesta
+            _registrar_tokens(tipo, prompt, response, ''.join(vuelo.fragmentos))
+            await vuelo.terminar()
+        except TimeoutError as e:
+            self.estadisticas['agotadas'] += 1
+            IA_SEGUNDOS.etiquetas(tipo, 'agotada').observar(time.perf_counter() - inicio)
+            logger.warning(f"Tiempo agotado ({plazo}s) esperando un fragmento del modelo")
+            await vuelo.terminar(e)
+        except Exception as e:
+            self.estadisticas['errores'] += 1
+            IA_SEGUNDOS.etiquetas(tipo, 'error').observar(time.perf_counter() - inicio)
+            await vuelo.terminar(e)
+
+    async def generar_flujo(
+        self,
+        prompt: str,
+        temperatura: float = 0.7,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+        tipo: str = 'general',
+    ):
+        """Genera la respuesta por fragmentos a medida que el modelo los produce.
+
+        El plazo se aplica a la espera de cada fragmento (incluido el primero y
+        el hueco en el semáforo), no a la respuesta completa. Los errores y el
+        agotamiento del plazo se propagan: el llamador decide qué mostrar.
+        Si el modelo no admite flujo asíncrono, se entrega la respuesta entera
+        como un único fragmento. Quien se une a un flujo idéntico ya en curso
+        recibe primero los fragmentos producidos hasta ese momento.
+        """
+        config = self._configuracion(temperatura, max_tokens)
+        plazo = self.timeout if timeout is None else timeout
+        clave = self._clave('flujo', prompt, config)
+
+        vuelo = self._vuelos.get(clave)
+        if vuelo is None or vuelo.cancelado:
+            vuelo = _FlujoCompartido()
+            vuelo.tarea = asyncio.ensure_future(self._producir_flujo(vuelo, prompt, config, plazo, tipo))
+            self._registrar_vuelo(clave, vuelo)
+        else:
+            self.estadisticas['compartidas'] += 1
+
+        async for fragmento in vuelo.leer():
+            yield fragmento
+
+    def cerrar(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
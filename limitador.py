@@ -0,0 +1,63 @@
+"""Limitadores de tasa basados en cubos de fichas (token bucket)."""
+import asyncio
+import time
+from datetime import timedelta
+
+
+def segundos_espera(valor) -> float:
+    """Segundos de un ``RetryAfter.retry_after`` (entero o ``timedelta`` según la versión)."""
+    if isinstance(valor, timedelta):
+        return valor.total_seconds()
+    return float(valor)
+
+
+class CuboTokens:
+    """Cubo de fichas que se rellena a ``tasa`` fichas por segundo.
+
+    ``adquirir`` espera hasta disponer de una ficha (en orden de llegada);
+    ``intentar`` la toma sin esperar y devuelve si lo consiguió. ``pausar``
+    vacía el cubo y bloquea las adquisiciones durante un tiempo, como exige
+    Telegram tras un error de control de flujo (``RetryAfter``).
+    """
+
+    def __init__(self, tasa: float, capacidad: float = None):
+        self.tasa = tasa
+        self.capacidad = capacidad if capacidad is not None else max(tasa, 1.0)
+        self._fichas = self.capacidad
+        self._ultimo = time.monotonic()
+        self._pausa_hasta = 0.0
+        self._lock = None
+
+    def _rellenar(self, ahora):
+        self._fichas = min(self.capacidad, self._fichas + (ahora - self._ultimo) * self.tasa)
+        self._ultimo = ahora
+
+    def intentar(self, fichas: float = 1.0) -> bool:
+        ahora = time.monotonic()
+        if ahora < self._pausa_hasta:
+            return False
+        self._rellenar(ahora)
+        if self._fichas >= fichas:
+            self._fichas -= fichas
+            return True
+        return False
+
+    async def adquirir(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                ahora = time.monotonic()
+                if ahora < self._pausa_hasta:
+                    await asyncio.sleep(self._pausa_hasta - ahora)
+                    continue
+                self._rellenar(ahora)
+                if self._fichas >= 1.0:
+                    self._fichas -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._fichas) / self.tasa)
+
+    def pausar(self, segundos: float):
+        self._pausa_hasta = max(self._pausa_hasta, time.monotonic() + segundos)
+        self._fichas = 0.0
+        self._ultimo = self._pausa_hasta
@@ -0,0 +1,508 @@
+"""Procesamiento en segundo plano de las fotos y notas de voz.
+
+El manejador solo registra el envío en ``medios`` y lo encola; el resto
+ocurre fuera del camino de la respuesta, en dos etapas con su propia cola:
+
+1. Descarga: unas pocas tareas comparten un cliente HTTP con un pool de
+   conexiones acotado y guardan cada archivo por su SHA-256
+   (``datos/medios/ab/abcdef…``). Un envío cuyo ``file_unique_id`` ya se
+   conoce (un reenvío) no se vuelve a descargar, y un contenido que ya está
+   guardado no se guarda dos veces.
+2. Análisis, en un pool de procesos: la huella perceptual de las imágenes
+   (dHash de 64 bits), el triaje de las imágenes (nitidez y brillo, para
+   revisar primero las útiles) y la transcripción local de las notas de voz.
+   Una imagen cuya huella está a poca distancia de Hamming de otra ya
+   analizada (la misma foto recomprimida) no se guarda ni se analiza: recibe
+   el resultado de la original.
+
+El resultado queda en ``archivos_medios`` (uno por contenido) y en la fila
+de ``medios`` de cada envío. Las imágenes se decodifican con Pillow y la voz
+se transcribe con faster-whisper; si no están instalados, el archivo se
+guarda igualmente y queda como 'sin_analisis'.
+"""
+import asyncio
+import hashlib
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import httpx
+import numpy as np
+
+from base_datos import SQL_ACTUALIZAR_MEDIO, ahora
+from metricas import registro
+
+logger = logging.getLogger(__name__)
+
+MEDIOS_RUTA = os.getenv('MEDIOS_RUTA', 'datos/medios')
+MEDIOS_DESCARGAS = int(os.getenv('MEDIOS_DESCARGAS', '4'))
+MEDIOS_PROCESOS = int(os.getenv('MEDIOS_PROCESOS', '2'))
+MEDIOS_CAPACIDAD = int(os.getenv('MEDIOS_CAPACIDAD', '1000'))
+# La Bot API no entrega archivos de más de 20 MB
+MEDIOS_MAX_BYTES = int(os.getenv('MEDIOS_MAX_BYTES', str(20 * 2 ** 20)))
+MEDIOS_TIMEOUT = float(os.getenv('MEDIOS_TIMEOUT', '60'))
+# Bits distintos (de 64) por debajo de los cuales dos imágenes son la misma
+MEDIOS_DISTANCIA = int(os.getenv('MEDIOS_DISTANCIA', '6'))
+MEDIOS_NITIDEZ_MIN = float(os.getenv('MEDIOS_NITIDEZ_MIN', '100'))
+MEDIOS_BRILLO_MIN = float(os.getenv('MEDIOS_BRILLO_MIN', '40'))
+MEDIOS_MODELO_VOZ = os.getenv('MEDIOS_MODELO_VOZ', 'small')
+# Los procesos de análisis ceden la CPU al bot (valor de nice)
+MEDIOS_NICE = int(os.getenv('MEDIOS_NICE', '10'))
+
+# Analizadores locales opcionales (se importan solo en los procesos del pool)
+PILLOW = importlib.util.find_spec('PIL') is not None
+TRANSCRIPTOR = importlib.util.find_spec('faster_whisper') is not None
+
+MEDIOS_SEGUNDOS = registro.histograma(
+    'bot_medios_segundos', 'Duración de cada etapa del procesamiento de medios', ('etapa',),
+    limites=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+)
+
+
+class ArchivoDemasiadoGrande(Exception):
+    pass
+
+
+# ========== ANÁLISIS (procesos del pool) ==========
+_modelo_voz = None
+
+
+def _iniciar_proceso(nice, modelo_voz):
+    if nice and hasattr(os, 'nice'):
+        os.nice(nice)
+    # Las bibliotecas de análisis se cargan al crear el pool, no con el primer medio
+    if PILLOW:
+        import PIL.Image  # noqa: F401
+    if TRANSCRIPTOR:
+        _cargar_modelo_voz(modelo_voz)
+
+
+def _cargar_modelo_voz(modelo):
+    global _modelo_voz
+    if _modelo_voz is None:
+        from faster_whisper import WhisperModel
+        _modelo_voz = WhisperModel(modelo, device='cpu', compute_type='int8')
+    return _modelo_voz
+
+
+def _nada():
+    return None
+
+
+def _abrir_imagen(ruta, lado):
+    from PIL import Image, ImageOps
+    with Image.open(ruta) as imagen:
+        imagen = ImageOps.exif_transpose(imagen)
+        tamano = imagen.size
+        gris = imagen.convert('L')
+    gris.thumbnail((lado, lado))
+    return gris, tamano
+
+
+def huella_imagen(ruta) -> int:
+    """dHash: compara cada píxel con su vecino en una miniatura de 9×8."""
+    from PIL import Image
+    gris, _ = _abrir_imagen(ruta, 256)
+    pixeles = np.asarray(gris.resize((9, 8), Image.Resampling.LANCZOS), dtype=np.int16)
+    bits = np.packbits(pixeles[:, 1:] > pixeles[:, :-1])
+    return int.from_bytes(bits.tobytes(), 'big')
+
+
+def clasificar_imagen(ruta, nitidez_min, brillo_min) -> dict:
+    """Triaje: una foto oscura o movida sirve de poco para evaluar daños."""
+    gris, (ancho, alto) = _abrir_imagen(ruta, 512)
+    a = np.asarray(gris, dtype=np.float32)
+    # Varianza del laplaciano: baja en las imágenes desenfocadas
+    laplaciano = 4 * a[1:-1, 1:-1] - a[:-2, 1:-1] - a[2:, 1:-1] - a[1:-1, :-2] - a[1:-1, 2:]
+    nitidez = float(laplaciano.var()) if laplaciano.size else 0.0
+    brillo = float(a.mean())
+    if brillo < brillo_min:
+        calidad = 'oscura'
+    elif nitidez < nitidez_min:
+        calidad = 'borrosa'
+    else:
+        calidad = 'util'
+    return {
+        'ancho': ancho, 'alto': alto,
+        'nitidez': round(nitidez, 1), 'brillo': round(brillo, 1),
+        'calidad': calidad,
+    }
+
+
+def transcribir(ruta, modelo) -> dict:
+    segmentos, info = _cargar_modelo_voz(modelo).transcribe(ruta, language='es', vad_filter=True)
+    return {
+        'texto': ' '.join(s.text.strip() for s in segmentos),
+        'duracion': round(info.duration, 1),
+    }
+
+
+# ========== ACCESO A DATOS ==========
+def _conocidos(conn):
+    ids = conn.execute(
+        'SELECT file_unique_id, sha256 FROM medios '
+        'WHERE file_unique_id IS NOT NULL AND sha256 IS NOT NULL GROUP BY file_unique_id'
+    ).fetchall()
+    huellas = conn.execute(
+        "SELECT sha256, huella FROM archivos_medios WHERE huella IS NOT NULL AND estado = 'procesado'"
+    ).fetchall()
+    return ids, huellas
+
+
+def _pendientes(conn, limite):
+    return conn.execute(
+        "SELECT user_id, tipo_medio, file_id, file_unique_id FROM medios "
+        "WHERE estado = 'pendiente' AND file_unique_id IS NOT NULL "
+        "GROUP BY file_unique_id ORDER BY min(id) LIMIT ?",
+        (limite,)
+    ).fetchall()
+
+
+def _leer_archivo(conn, sha256):
+    return conn.execute(
+        'SELECT estado, resultado FROM archivos_medios WHERE sha256 = ?', (sha256,)
+    ).fetchone()
+
+
+def _guardar_archivo(conn, sha256, tipo, ruta, tamano):
+    with conn:
+        conn.execute(
+            'INSERT OR IGNORE INTO archivos_medios (sha256, tipo_medio, ruta, tamano) VALUES (?, ?, ?, ?)',
+            (sha256, tipo, ruta, tamano)
+        )
+
+
+def _completar_archivo(conn, sha256, huella, duplicado_de, estado, resultado):
+    with conn:
+        conn.execute(
+            'UPDATE archivos_medios SET huella = ?, duplicado_de = ?, estado = ?, resultado = ?, '
+            'procesado = ?, ruta = CASE WHEN ? IS NULL THEN ruta END WHERE sha256 = ?',
+            (huella, duplicado_de, estado, resultado, ahora(), duplicado_de, sha256)
+        )
+
+
+def _borrar(ruta):
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+
+
+# ========== PROCESADOR ==========
+class ProcesadorMedios:
+    """Colas de descarga y análisis de los medios recibidos."""
+
+    def __init__(
+        self,
+        bot,
+        bd,
+        cola,
+        directorio: str = MEDIOS_RUTA,
+        descargas: int = MEDIOS_DESCARGAS,
+        procesos: int = MEDIOS_PROCESOS,
+        capacidad: int = MEDIOS_CAPACIDAD,
+        max_bytes: int = MEDIOS_MAX_BYTES,
+    ):
+        self.bot = bot
+        self.bd = bd
+        # Cola de escritura: las actualizaciones de ``medios`` van detrás de sus inserciones
+        self.cola = cola
+        self.directorio = directorio
+        self.descargas = descargas
+        self.procesos = procesos
+        self.max_bytes = max_bytes
+        self._por_descargar = asyncio.Queue(capacidad)
+        self._por_analizar = asyncio.Queue(capacidad)
+        self._http = None
+        self._pool = None
+        self._tareas = []
+        # file_unique_id -> sha256 de los ya descargados
+        self._ids = {}
+        self._descargando = set()
+        # sha256 -> file_unique_id que esperan su análisis
+        self._analizando = {}
+        # Huellas de las imágenes analizadas (índice -> sha256)
+        self._huellas = np.zeros(1024, dtype=np.uint64)
+        self._originales = []
+        self.estadisticas = {
+            'recibidos': 0,
+            'descartados': 0,
+            'descargados': 0,
+            'bytes_descargados': 0,
+            'duplicados_id': 0,
+            'duplicados_contenido': 0,
+            'duplicados_perceptuales': 0,
+            'analizados': 0,
+            'sin_analisis': 0,
+            'demasiado_grandes': 0,
+            'errores': 0,
+        }
+
+    async def iniciar(self):
+        temporal = os.path.join(self.directorio, 'tmp')
+        os.makedirs(temporal, exist_ok=True)
+        # Descargas que un reinicio dejó a medias (las recientes pueden ser
+        # de otro proceso que comparte el directorio)
+        limite = time.time() - 2 * MEDIOS_TIMEOUT
+        for entrada in os.scandir(temporal):
+            if entrada.stat().st_mtime < limite:
+                _borrar(entrada.path)
+        ids, huellas = await self.bd.ejecutar(_conocidos)
+        self._ids = dict(ids)
+        for sha256, huella in huellas:
+            self._indexar(int(huella, 16), sha256)
+
+        self._http = httpx.AsyncClient(
+            timeout=MEDIOS_TIMEOUT,
+            limits=httpx.Limits(max_connections=self.descargas, max_keepalive_connections=self.descargas),
+        )
+        self._tareas = [
+            asyncio.create_task(self._trabajador_descargas(), name=f'medios-descarga-{i}')
+            for i in range(self.descargas)
+        ] + [
+            asyncio.create_task(self._trabajador_analisis(), name=f'medios-analisis-{i}')
+            for i in range(self.procesos)
+        ]
+
+    async def detener(self):
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+        if self._http is not None:
+            await self._http.aclose()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def encolar(self, user_id, tipo, file_id, file_unique_id) -> bool:
+        """Encola un medio ya registrado en ``medios``; no espera a nada.
+
+        Con la cola llena el medio queda 'pendiente' y se retoma en el
+        próximo arranque (``reanudar``).
+        """
+        self.estadisticas['recibidos'] += 1
+        try:
+            self._por_descargar.put_nowait(
+                ({'user_id': user_id, 'tipo': tipo, 'file_id': file_id, 'file_unique_id': file_unique_id},
+                 time.monotonic())
+            )
+        except asyncio.QueueFull:
+            self.estadisticas['descartados'] += 1
+            return False
+        return True
+
+    async def reanudar(self) -> int:
+        """Encola los medios que quedaron pendientes en un reinicio."""
+        filas = await self.bd.ejecutar(_pendientes, self._por_descargar.maxsize - self._por_descargar.qsize())
+        for fila in filas:
+            self.encolar(*fila)
+        return len(filas)
+
+    def _ruta(self, sha256):
+        return os.path.join(self.directorio, sha256[:2], sha256)
+
+    # ----- Descarga -----
+    async def _trabajador_descargas(self):
+        while True:
+            medio, encolado = await self._por_descargar.get()
+            MEDIOS_SEGUNDOS.etiquetas('espera').observar(time.monotonic() - encolado)
+            try:
+                await self._atender_descarga(medio)
+            except Exception as e:
+                self.estadisticas['errores'] += 1
+                logger.error(f"Error al procesar el medio {medio['file_unique_id']}: {e}")
+
+    async def _atender_descarga(self, medio):
+        file_unique_id = medio['file_unique_id']
+        sha256 = self._ids.get(file_unique_id)
+        if sha256 is None:
+            if file_unique_id in self._descargando:
+                # Otro envío del mismo archivo ya está en curso: su resultado
+                # actualiza todas las filas con ese file_unique_id
+                self.estadisticas['duplicados_id'] += 1
+                return
+            self._descargando.add(file_unique_id)
+            inicio = time.perf_counter()
+            try:
+                sha256 = await self._descargar(medio)
+            except ArchivoDemasiadoGrande:
+                self.estadisticas['demasiado_grandes'] += 1
+                await self._actualizar([file_unique_id], None, 'demasiado_grande', None)
+                return
+            except Exception as e:
+                self.estadisticas['errores'] += 1
+                logger.warning(f"No se pudo descargar el medio {file_unique_id}: {e}")
+                await self._actualizar([file_unique_id], None, 'error', None)
+                return
+            finally:
+                self._descargando.discard(file_unique_id)
+            MEDIOS_SEGUNDOS.etiquetas('descarga').observar(time.perf_counter() - inicio)
+            self._ids[file_unique_id] = sha256
+        else:
+            self.estadisticas['duplicados_id'] += 1
+        await self._asignar(sha256, medio['tipo'], file_unique_id)
+
+    async def _descargar(self, medio) -> str:
+        """Descarga el archivo en flujo, calculando su SHA-256, y lo guarda por contenido."""
+        archivo = await self.bot.get_file(medio['file_id'])
+        if archivo.file_size and archivo.file_size > self.max_bytes:
+            raise ArchivoDemasiadoGrande()
+        resumen = hashlib.sha256()
+        tamano = 0
+        descriptor, temporal = tempfile.mkstemp(dir=os.path.join(self.directorio, 'tmp'))
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                async with self._http.stream('GET', archivo.file_path) as respuesta:
+                    respuesta.raise_for_status()
+                    async for trozo in respuesta.aiter_bytes(65536):
+                        tamano += len(trozo)
+                        if tamano > self.max_bytes:
+                            raise ArchivoDemasiadoGrande()
+                        resumen.update(trozo)
+                        f.write(trozo)
+            sha256 = resumen.hexdigest()
+            ruta = self._ruta(sha256)
+            if os.path.exists(ruta):
+                self.estadisticas['duplicados_contenido'] += 1
+            else:
+                os.makedirs(os.path.dirname(ruta), exist_ok=True)
+                os.replace(temporal, ruta)
+        finally:
+            _borrar(temporal)
+        self.estadisticas['descargados'] += 1
+        self.estadisticas['bytes_descargados'] += tamano
+        await self.bd.ejecutar(
+            _guardar_archivo, sha256, medio['tipo'], os.path.relpath(ruta, self.directorio), tamano
+        )
+        return sha256
+
+    async def _asignar(self, sha256, tipo, file_unique_id):
+        """Asocia el envío a su contenido: reutiliza el análisis o lo encola."""
+        if sha256 in self._analizando:
+            self._analizando[sha256].add(file_unique_id)
+            return
+        self._analizando[sha256] = {file_unique_id}
+        fila = await self.bd.ejecutar(_leer_archivo, sha256)
+        if fila is not None and fila[0] is not None:
+            estado, resultado = fila
+            if estado == 'duplicado':
+                _borrar(self._ruta(sha256))
+            await self._actualizar(self._analizando.pop(sha256), sha256, estado, resultado)
+            return
+        await self._por_analizar.put((sha256, tipo, time.monotonic()))
+
+    # ----- Análisis -----
+    async def _trabajador_analisis(self):
+        while True:
+            sha256, tipo, encolado = await self._por_analizar.get()
+            MEDIOS_SEGUNDOS.etiquetas('espera_analisis').observar(time.monotonic() - encolado)
+            try:
+                await self._analizar(sha256, tipo)
+            except Exception as e:
+                self.estadisticas['errores'] += 1
+                logger.error(f"Error al analizar el medio {sha256[:12]}: {e}")
+                await self.bd.ejecutar(_completar_archivo, sha256, None, None, 'error', None)
+                await self._actualizar(self._analizando.pop(sha256, ()), sha256, 'error', None)
+
+    async def _analizar(self, sha256, tipo):
+        ruta = self._ruta(sha256)
+        huella = duplicado_de = resultado = None
+        if tipo == 'foto' and PILLOW:
+            huella = await self._en_pool('huella', huella_imagen, ruta)
+            duplicado_de = self._parecida(huella)
+
+        if duplicado_de is not None:
+            self.estadisticas['duplicados_perceptuales'] += 1
+            estado = 'duplicado'
+            _, resultado = await self.bd.ejecutar(_leer_archivo, duplicado_de)
+            _borrar(ruta)
+        else:
+            if tipo == 'foto' and PILLOW:
+                resultado = await self._en_pool(
+                    'clasificacion', clasificar_imagen, ruta, MEDIOS_NITIDEZ_MIN, MEDIOS_BRILLO_MIN
+                )
+            elif tipo == 'voz' and TRANSCRIPTOR:
+                resultado = await self._en_pool('transcripcion', transcribir, ruta, MEDIOS_MODELO_VOZ)
+            if resultado is None:
+                self.estadisticas['sin_analisis'] += 1
+                estado = 'sin_analisis'
+            else:
+                self.estadisticas['analizados'] += 1
+                estado = 'procesado'
+                resultado = json.dumps(resultado, ensure_ascii=False)
+
+        huella = f'{huella:016x}' if huella is not None else None
+        await self.bd.ejecutar(_completar_archivo, sha256, huella, duplicado_de, estado, resultado)
+        if huella is not None and estado == 'procesado':
+            self._indexar(int(huella, 16), sha256)
+        await self._actualizar(self._analizando.pop(sha256, ()), sha256, estado, resultado)
+
+    def _obtener_pool(self):
+        if self._pool is None:
+            # Se crea con el primer medio (o al precalentar): sin fotos ni audios no hay procesos
+            self._pool = ProcessPoolExecutor(
+                self.procesos, mp_context=multiprocessing.get_context('spawn'),
+                initializer=_iniciar_proceso, initargs=(MEDIOS_NICE, MEDIOS_MODELO_VOZ)
+            )
+        return self._pool
+
+    async def precalentar(self):
+        """Arranca el pool de análisis y carga sus bibliotecas, si hay alguna instalada."""
+        if not (PILLOW or TRANSCRIPTOR):
+            return
+        inicio = time.perf_counter()
+        await asyncio.get_running_loop().run_in_executor(self._obtener_pool(), _nada)
+        logger.info(f"Pool de análisis de medios listo en {time.perf_counter() - inicio:.2f}s")
+
+    async def _en_pool(self, etapa, funcion, *args):
+        pool = self._obtener_pool()
+        inicio = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, funcion, *args)
+        except BrokenProcessPool:
+            # Un proceso murió (p. ej. sin memoria con un archivo corrupto)
+            self._pool = None
+            raise
+        finally:
+            MEDIOS_SEGUNDOS.etiquetas(etapa).observar(time.perf_counter() - inicio)
+
+    def _indexar(self, huella, sha256):
+        n = len(self._originales)
+        if n == len(self._huellas):
+            self._huellas = np.concatenate([self._huellas, np.zeros(n, dtype=np.uint64)])
+        self._huellas[n] = huella
+        self._originales.append(sha256)
+
+    def _parecida(self, huella):
+        """sha256 de una imagen ya analizada con casi la misma huella, o ``None``."""
+        n = len(self._originales)
+        # Las imágenes casi uniformes (todo negro) comparten huella sin ser la misma
+        if not n or not 8 <= huella.bit_count() <= 56:
+            return None
+        distancias = np.bitwise_count(self._huellas[:n] ^ np.uint64(huella))
+        i = int(distancias.argmin())
+        return self._originales[i] if distancias[i] <= MEDIOS_DISTANCIA else None
+
+    async def _actualizar(self, file_unique_ids, sha256, estado, resultado):
+        # Un duplicado comparte el resultado de la original
+        estado = 'procesado' if estado == 'duplicado' else estado
+        marca = ahora()
+        for file_unique_id in file_unique_ids:
+            await self.cola.encolar(SQL_ACTUALIZAR_MEDIO, (sha256, estado, resultado, marca, file_unique_id))
+
+    def resumen(self) -> dict:
+        return {
+            **self.estadisticas,
+            'por_descargar': self._por_descargar.qsize(),
+            'por_analizar': self._por_analizar.qsize(),
+            'descargando': len(self._descargando),
+            'analizando': len(self._analizando),
+            'huellas': len(self._originales),
+        }
@@ -0,0 +1,335 @@
+"""Métricas del bot en formato de texto de Prometheus.
+
+Sin dependencias externas: contadores e histogramas con etiquetas, más
+indicadores que se calculan al consultarlos (por ejemplo, las estadísticas
+que ya mantienen la caché, la cola de escritura o el control de admisión).
+Todo se sirve en ``/metrics`` con un servidor HTTP mínimo sobre ``asyncio``.
+
+Para que la instrumentación apenas cueste en los caminos calientes, cada
+combinación de etiquetas se resuelve una sola vez (``etiquetas``) y el
+objeto resultante se guarda: registrar un valor es una suma y una búsqueda
+binaria en los límites del histograma.
+"""
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+METRICAS_HOST = os.getenv('METRICAS_HOST', '127.0.0.1')
+# 0 desactiva el servidor de métricas
+METRICAS_PUERTO = int(os.getenv('METRICAS_PUERTO', '9464'))
+
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Manejadores que tarden más se registran con su actualización (0 no registra)
+MANEJADOR_LENTO = float(os.getenv('MANEJADOR_LENTO', '5'))
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatear_etiquetas(nombres, valores):
+    if not nombres:
+        return ''
+    return '{' + ','.join(f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)) + '}'
+
+
+# ========== TIPOS DE MÉTRICA ==========
+class _ValorContador:
+    __slots__ = ('valor', '_lock')
+
+    def __init__(self):
+        self.valor = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, cantidad: float = 1.0):
+        with self._lock:
+            self.valor += cantidad
+
+
+class _ValorHistograma:
+    __slots__ = ('limites', 'cubetas', 'suma', 'cuenta', '_lock')
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.cubetas = [0] * (len(limites) + 1)
+        self.suma = 0.0
+        self.cuenta = 0
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float):
+        i = bisect_left(self.limites, valor)
+        with self._lock:
+            self.cubetas[i] += 1
+            self.suma += valor
+            self.cuenta += 1
+
+
+class Familia:
+    """Métrica con nombre, ayuda y un valor por combinación de etiquetas."""
+
+    def __init__(self, nombre, ayuda, tipo, etiquetas=(), limites=None):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.tipo = tipo
+        self.nombres_etiquetas = tuple(etiquetas)
+        self.limites = tuple(limites) if limites else LIMITES_SEGUNDOS
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def etiquetas(self, *valores, **por_nombre):
+        """Devuelve (y crea si hace falta) el valor para esas etiquetas."""
+        if por_nombre:
+            valores = tuple(por_nombre[n] for n in self.nombres_etiquetas)
+        valor = self._valores.get(valores)
+        if valor is None:
+            with self._lock:
+                valor = self._valores.get(valores)
+                if valor is None:
+                    if self.tipo == 'histogram':
+                        valor = _ValorHistograma(self.limites)
+                    else:
+                        valor = _ValorContador()
+                    self._valores[valores] = valor
+        return valor
+
+    # Atajos para métricas sin etiquetas
+    def inc(self, cantidad: float = 1.0):
+        self.etiquetas().inc(cantidad)
+
+    def observar(self, valor: float):
+        self.etiquetas().observar(valor)
+
+    def exponer(self):
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} {self.tipo}']
+        for valores, valor in list(self._valores.items()):
+            if self.tipo == 'histogram':
+                acumulado = 0
+                for limite, cuenta in zip(self.limites + ('+Inf',), valor.cubetas):
+                    acumulado += cuenta
+                    etiquetas = _formatear_etiquetas(self.nombres_etiquetas + ('le',), valores + (limite,))
+                    lineas.append(f'{self.nombre}_bucket{etiquetas} {acumulado}')
+                etiquetas = _formatear_etiquetas(self.nombres_etiquetas, valores)
+                lineas.append(f'{self.nombre}_sum{etiquetas} {valor.suma}')
+                lineas.append(f'{self.nombre}_count{etiquetas} {valor.cuenta}')
+            else:
+                etiquetas = _formatear_etiquetas(self.nombres_etiquetas, valores)
+                lineas.append(f'{self.nombre}{etiquetas} {valor.valor}')
+        return lineas
+
+
+class _Indicador:
+    """Indicador cuyo valor se calcula al exponer las métricas.
+
+    ``funcion`` devuelve un número o un diccionario {valores de etiquetas: número};
+    puede ser una corrutina.
+    """
+
+    def __init__(self, nombre, ayuda, funcion, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.funcion = funcion
+        self.nombres_etiquetas = tuple(etiquetas)
+
+    async def exponer(self):
+        resultado = self.funcion()
+        if inspect.isawaitable(resultado):
+            resultado = await resultado
+        if not isinstance(resultado, dict):
+            resultado = {(): resultado}
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} gauge']
+        for valores, valor in resultado.items():
+            if not isinstance(valores, tuple):
+                valores = (valores,)
+            lineas.append(f'{self.nombre}{_formatear_etiquetas(self.nombres_etiquetas, valores)} {float(valor)}')
+        return lineas
+
+
+class _Estadisticas:
+    """Expone cada valor numérico de un diccionario de estadísticas como indicador."""
+
+    def __init__(self, prefijo, funcion):
+        self.prefijo = prefijo
+        self.funcion = funcion
+
+    async def exponer(self):
+        lineas = []
+        for clave, valor in self.funcion().items():
+            if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+                continue
+            nombre = f'{self.prefijo}_{clave}'
+            lineas.append(f'# TYPE {nombre} gauge')
+            lineas.append(f'{nombre} {float(valor)}')
+        return lineas
+
+
+# ========== REGISTRO ==========
+class Registro:
+
+    def __init__(self):
+        self._metricas = {}
+
+    def _agregar(self, nombre, metrica):
+        # Los indicadores calculados pueden volver a registrarse (p. ej. al
+        # recrear la aplicación); las familias con valores acumulados no
+        if isinstance(self._metricas.get(nombre), Familia):
+            raise ValueError(f"Métrica duplicada: {nombre}")
+        self._metricas[nombre] = metrica
+        return metrica
+
+    def contador(self, nombre, ayuda, etiquetas=()) -> Familia:
+        return self._agregar(nombre, Familia(nombre, ayuda, 'counter', etiquetas))
+
+    def histograma(self, nombre, ayuda, etiquetas=(), limites=None) -> Familia:
+        return self._agregar(nombre, Familia(nombre, ayuda, 'histogram', etiquetas, limites))
+
+    def indicador(self, nombre, ayuda, funcion, etiquetas=()):
+        return self._agregar(nombre, _Indicador(nombre, ayuda, funcion, etiquetas))
+
+    def estadisticas(self, prefijo, funcion):
+        """Publica un diccionario de estadísticas ya existente (p. ej. ``resumen``)."""
+        return self._agregar(prefijo, _Estadisticas(prefijo, funcion))
+
+    async def exponer(self) -> str:
+        lineas = []
+        for nombre, metrica in list(self._metricas.items()):
+            try:
+                if isinstance(metrica, Familia):
+                    lineas.extend(metrica.exponer())
+                else:
+                    lineas.extend(await metrica.exponer())
+            except Exception as e:
+                logger.error(f"Error al calcular la métrica {nombre}: {e}")
+        return '\n'.join(lineas) + '\n'
+
+
+registro = Registro()
+
+# ========== MÉTRICAS COMUNES ==========
+MANEJADOR_SEGUNDOS = registro.histograma(
+    'bot_manejador_segundos', 'Duración de cada manejador de Telegram', ('manejador',)
+)
+MANEJADOR_ERRORES = registro.contador(
+    'bot_manejador_errores_total', 'Excepciones no capturadas por manejador', ('manejador',)
+)
+IA_SEGUNDOS = registro.histograma(
+    'bot_ia_segundos', 'Duración de las llamadas al modelo', ('tipo', 'resultado')
+)
+IA_TOKENS = registro.contador(
+    'bot_ia_tokens_total', 'Tokens de las llamadas al modelo (estimados si el modelo no los informa)',
+    ('tipo', 'direccion')
+)
+BD_SEGUNDOS = registro.histograma(
+    'bot_bd_segundos', 'Duración de las operaciones en SQLite', ('operacion',),
+    limites=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+)
+ACTUALIZACION_RETRASO = registro.histograma(
+    'bot_actualizacion_retraso_segundos',
+    'Tiempo desde que el usuario envía un mensaje hasta que el bot empieza a procesarlo',
+    limites=(0.5, 1, 2, 5, 10, 30, 60, 300)
+)
+
+
+# Tarea -> (manejador, update_id, inicio) de los manejadores en curso; la
+# consulta el vigilante del bucle (vigilancia.py) al capturar un bloqueo
+EN_CURSO = {}
+# Nombres legibles de los estados de conversación para los registros
+ESTADOS_CONVERSACION = {}
+
+
+def _describir_update(update) -> str:
+    """Tipo de actualización sin su texto libre (comando, botón o tipo de mensaje)."""
+    if getattr(update, 'callback_query', None) is not None:
+        return f"botón {update.callback_query.data}"
+    mensaje = getattr(update, 'message', None)
+    if mensaje is None:
+        return 'otra'
+    if mensaje.text:
+        return mensaje.text.split()[0] if mensaje.text.startswith('/') else 'texto'
+    return 'foto' if mensaje.photo else 'voz' if mensaje.voice else 'otro mensaje'
+
+
+def medir(funcion=None, *, nombre=None):
+    """Decorador que mide la duración y los errores de un manejador asíncrono.
+
+    Los manejadores que tardan más de ``MANEJADOR_LENTO`` segundos se
+    registran con el id de la actualización, el usuario y el estado de
+    conversación al que pasan.
+    """
+    if funcion is None:
+        return functools.partial(medir, nombre=nombre)
+    nombre = nombre or funcion.__name__
+    duracion = MANEJADOR_SEGUNDOS.etiquetas(nombre)
+    errores = MANEJADOR_ERRORES.etiquetas(nombre)
+
+    @functools.wraps(funcion)
+    async def envoltura(*args, **kwargs):
+        update = args[0] if args else None
+        tarea = asyncio.current_task()
+        anterior = EN_CURSO.get(tarea)
+        inicio = time.perf_counter()
+        EN_CURSO[tarea] = (nombre, getattr(update, 'update_id', None), inicio)
+        resultado = None
+        try:
+            resultado = await funcion(*args, **kwargs)
+            return resultado
+        except Exception:
+            errores.inc()
+            raise
+        finally:
+            segundos = time.perf_counter() - inicio
+            duracion.observar(segundos)
+            # Un manejador puede llamar a otro (menu_principal -> start)
+            if anterior is None:
+                EN_CURSO.pop(tarea, None)
+            else:
+                EN_CURSO[tarea] = anterior
+            if MANEJADOR_LENTO and segundos > MANEJADOR_LENTO:
+                usuario = getattr(getattr(update, 'effective_user', None), 'id', None)
+                logger.warning(
+                    f"Manejador lento: {nombre} tardó {segundos:.2f}s "
+                    f"(update {getattr(update, 'update_id', None)}, usuario {usuario}, "
+                    f"{_describir_update(update)}, estado siguiente "
+                    f"{ESTADOS_CONVERSACION.get(resultado, resultado)})"
+                )
+    return envoltura
+
+
+# ========== SERVIDOR HTTP ==========
+async def _atender(reader, writer):
+    try:
+        linea = await reader.readline()
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        partes = linea.decode('latin-1').split()
+        if len(partes) >= 2 and partes[0] == 'GET' and partes[1].split('?')[0] == '/metrics':
+            cuerpo = (await registro.exponer()).encode('utf-8')
+            estado = '200 OK'
+            tipo = 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            cuerpo, estado, tipo = b'Not found\n', '404 Not Found', 'text/plain'
+        writer.write(
+            f'HTTP/1.1 {estado}\r\nContent-Type: {tipo}\r\n'
+            f'Content-Length: {len(cuerpo)}\r\nConnection: close\r\n\r\n'.encode('latin-1')
+            + cuerpo
+        )
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def iniciar_servidor(host: str = METRICAS_HOST, puerto: int = METRICAS_PUERTO):
+    """Arranca el servidor de ``/metrics``; devuelve ``None`` si está desactivado."""
+    if not puerto:
+        return None
+    servidor = await asyncio.start_server(_atender, host, puerto)
+    logger.info(f"Métricas disponibles en http://{host}:{puerto}/metrics")
+    return servidor
@@ -0,0 +1,196 @@
+"""Importación y exportación masiva de usuarios registrados en CSV.
+
+Sirve para dar de alta de una vez los listados de residentes que preparan
+las oficinas locales de la Defensa Civil, sin pasar por la conversación de
+registro. El CSV lleva una cabecera con las columnas de ``COLUMNAS`` (el
+orden da igual; ``user_id``, el id de Telegram, es obligatorio) y se lee en
+flujo: cada lote de ``PADRON_LOTE`` filas se guarda con un UPSERT en una
+sola transacción, así que las filas repetidas actualizan al usuario en
+lugar de fallar; al actualizar solo cambian las columnas que trae el CSV
+(reimportar un listado sin ``recibir_info`` no da de baja a nadie). Las
+filas no válidas se cuentan y se informan con su número de línea sin
+detener la importación.
+
+Uso desde la línea de comandos (además de /importar y /exportar en el bot):
+    python padron.py importar residentes.csv
+    python padron.py exportar usuarios.csv.gz
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import logging
+import os
+
+from base_datos import COLUMNAS_USUARIO, ahora, sql_guardar_usuario
+
+logger = logging.getLogger(__name__)
+
+PADRON_LOTE = int(os.getenv('PADRON_LOTE', '5000'))
+# Errores de validación que se informan (el resto solo se cuenta)
+PADRON_MAX_ERRORES = 20
+
+COLUMNAS = COLUMNAS_USUARIO
+OBLIGATORIAS = ('user_id', 'nombre', 'apellidos', 'edad', 'sexo', 'nivel_academico', 'residencia')
+SI = {'sí', 'si', 's', '1', 'x', 'true', 'verdadero'}
+
+
+class ErrorPadron(ValueError):
+    pass
+
+
+def _abrir(ruta, modo):
+    # utf-8-sig: los CSV guardados con Excel empiezan con BOM
+    if ruta.endswith('.gz'):
+        return gzip.open(ruta, modo + 't', encoding='utf-8-sig' if modo == 'r' else 'utf-8', newline='')
+    return open(ruta, modo, encoding='utf-8-sig' if modo == 'r' else 'utf-8', newline='')
+
+
+def _fila(registro):
+    """Tupla para ``sql_guardar_usuario`` a partir de una fila del CSV."""
+    faltan = [c for c in OBLIGATORIAS if not (registro.get(c) or '').strip()]
+    if faltan:
+        raise ErrorPadron(f"faltan {', '.join(faltan)}")
+    try:
+        user_id = int(registro['user_id'])
+    except ValueError:
+        raise ErrorPadron(f"user_id no válido: {registro['user_id']!r}")
+    try:
+        edad = int(registro['edad'])
+    except ValueError:
+        edad = 0
+    if not 1 <= edad <= 120:
+        raise ErrorPadron(f"edad no válida: {registro['edad']!r}")
+    texto = {c: ' '.join((registro.get(c) or '').split()) for c in COLUMNAS}
+    return (
+        user_id, texto['nombre'], texto['apellidos'], edad, texto['sexo'],
+        texto['nivel_academico'], texto['residencia'], texto['email'].lower() or None,
+        'Sí' if texto['recibir_info'].lower() in SI else 'No',
+        texto['fecha_registro'] or ahora(),
+        # Sin municipio, asignar_municipios lo resuelve a partir de la residencia
+        texto['municipio'] or None,
+    )
+
+
+def _lotes(ruta, lote, resumen):
+    """Genera pares (sentencia, filas válidas); las inválidas se anotan en ``resumen``."""
+    with _abrir(ruta, 'r') as f:
+        muestra = f.read(4096)
+        f.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+        except csv.Error:
+            dialecto = csv.excel
+        lector = csv.DictReader(f, dialect=dialecto)
+        columnas = {c.strip().lower() for c in lector.fieldnames or ()}
+        if 'user_id' not in columnas:
+            raise ErrorPadron("el CSV no tiene la columna user_id en la cabecera")
+        # Un usuario que ya existe conserva los valores de las columnas ausentes
+        sql = sql_guardar_usuario([c for c in COLUMNAS if c in columnas])
+        filas = []
+        for registro in lector:
+            resumen['leidas'] += 1
+            registro = {(c or '').strip().lower(): v for c, v in registro.items()}
+            try:
+                filas.append(_fila(registro))
+            except ErrorPadron as e:
+                resumen['rechazadas'] += 1
+                if len(resumen['errores']) < PADRON_MAX_ERRORES:
+                    resumen['errores'].append(f"línea {lector.line_num}: {e}")
+                continue
+            if len(filas) >= lote:
+                yield sql, filas
+                filas = []
+        if filas:
+            yield sql, filas
+
+
+def _guardar_lote(conn, sql, filas):
+    nuevos = conn.execute('SELECT count(*) FROM usuarios').fetchone()[0]
+    with conn:
+        conn.executemany(sql, filas)
+    return conn.execute('SELECT count(*) FROM usuarios').fetchone()[0] - nuevos
+
+
+async def importar_csv(bd, ruta, lote: int = PADRON_LOTE) -> dict:
+    """Importa (o actualiza) los usuarios de un CSV.
+
+    El análisis del CSV va en un hilo aparte y cada lote se escribe en el
+    hilo de la base de datos, de modo que ni el bucle de eventos ni las
+    demás escrituras esperan a la importación completa.
+    """
+    resumen = {'leidas': 0, 'importadas': 0, 'nuevas': 0, 'rechazadas': 0, 'errores': []}
+    lotes = _lotes(ruta, lote, resumen)
+    try:
+        while True:
+            siguiente = await asyncio.to_thread(next, lotes, None)
+            if siguiente is None:
+                break
+            sql, filas = siguiente
+            resumen['nuevas'] += await bd.ejecutar(_guardar_lote, sql, filas)
+            resumen['importadas'] += len(filas)
+    finally:
+        lotes.close()
+    logger.info(
+        f"Padrón importado de {ruta}: {resumen['importadas']} usuarios "
+        f"({resumen['nuevas']} nuevos), {resumen['rechazadas']} filas rechazadas"
+    )
+    return resumen
+
+
+def _leer_lote(conn, desde, lote):
+    return conn.execute(
+        f'SELECT {", ".join(COLUMNAS)} FROM usuarios WHERE user_id > ? ORDER BY user_id LIMIT ?',
+        (desde, lote)
+    ).fetchall()
+
+
+async def exportar_csv(bd, ruta, lote: int = PADRON_LOTE) -> int:
+    """Escribe todos los usuarios en ``ruta`` (comprimido si termina en .gz)."""
+    total = 0
+    desde = -1
+    with _abrir(ruta, 'w') as f:
+        escritor = csv.writer(f)
+        escritor.writerow(COLUMNAS)
+        while True:
+            # Paginación por clave: cada lote es una consulta corta
+            filas = await bd.ejecutar(_leer_lote, desde, lote)
+            if not filas:
+                break
+            await asyncio.to_thread(escritor.writerows, filas)
+            total += len(filas)
+            desde = filas[-1][0]
+    return total
+
+
+def formatear_resumen(resumen) -> str:
+    lineas = [
+        f"📥 Filas leídas: {resumen['leidas']}",
+        f"✅ Usuarios importados: {resumen['importadas']} ({resumen['nuevas']} nuevos)",
+        f"⚠️ Filas rechazadas: {resumen['rechazadas']}",
+    ]
+    lineas.extend(f"- {error}" for error in resumen['errores'])
+    if resumen['rechazadas'] > len(resumen['errores']):
+        lineas.append(f"- … y {resumen['rechazadas'] - len(resumen['errores'])} más")
+    return '\n'.join(lineas)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('accion', choices=['importar', 'exportar'])
+    parser.add_argument('ruta', help="fichero CSV (o .csv.gz)")
+    parser.add_argument('--lote', type=int, default=PADRON_LOTE)
+    args = parser.parse_args()
+
+    # bot.py ya no importa Gemini al cargarse: aquí solo aporta el esquema y
+    # la resolución de municipios
+    import bot
+    bot.init_db()
+    if args.accion == 'importar':
+        resultado = asyncio.run(importar_csv(bot.bd, args.ruta, args.lote))
+        bot.indice_riesgo.cargar()
+        bot.asignar_municipios(bot.municipio_de)
+        print(formatear_resumen(resultado))
+    else:
+        print(f"{asyncio.run(exportar_csv(bot.bd, args.ruta, args.lote))} usuarios exportados a {args.ruta}")
+    bot.bd.cerrar()
@@ -0,0 +1,185 @@
+"""Persistencia de conversaciones y ``user_data`` en la base de datos SQLite.
+
+A diferencia de ``PicklePersistence``, que vuelca todo el estado en cada
+intervalo, aquí cada cambio se escribe como una fila independiente: la
+aplicación solo entrega los usuarios y conversaciones modificados. El
+``user_data`` no se carga al arrancar sino la primera vez que el usuario
+interactúa (``refresh_user_data``), de modo que el tiempo de arranque no
+crece con el número de usuarios. Solo se cargan al inicio las conversaciones
+activas, que se borran al terminar. Cada cierto tiempo se eliminan los estados
+abandonados.
+"""
+import json
+import logging
+import os
+import time
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+PERSISTENCIA_INTERVALO = float(os.getenv('PERSISTENCIA_INTERVALO', '5'))
+PERSISTENCIA_COMPACTAR = float(os.getenv('PERSISTENCIA_COMPACTAR', str(3600)))
+# Tiempo tras el que se descarta una conversación o un user_data sin actividad
+PERSISTENCIA_RETENCION = float(os.getenv('PERSISTENCIA_RETENCION', str(7 * 24 * 3600)))
+
+
+# ========== ACCESO A DATOS ==========
+def _leer_usuario(conn, user_id):
+    fila = conn.execute('SELECT datos FROM estado_usuarios WHERE user_id = ?', (user_id,)).fetchone()
+    return json.loads(fila[0]) if fila else None
+
+
+def _guardar_usuario(conn, user_id, datos):
+    with conn:
+        if datos:
+            conn.execute(
+                'INSERT OR REPLACE INTO estado_usuarios VALUES (?, ?, ?)',
+                (user_id, datos, time.time())
+            )
+        else:
+            conn.execute('DELETE FROM estado_usuarios WHERE user_id = ?', (user_id,))
+
+
+def _leer_conversaciones(conn, nombre):
+    filas = conn.execute(
+        'SELECT clave, estado FROM estado_conversaciones WHERE nombre = ?', (nombre,)
+    ).fetchall()
+    return {tuple(json.loads(clave)): json.loads(estado) for clave, estado in filas}
+
+
+def _guardar_conversacion(conn, nombre, clave, estado):
+    with conn:
+        if estado is None:
+            conn.execute(
+                'DELETE FROM estado_conversaciones WHERE nombre = ? AND clave = ?',
+                (nombre, clave)
+            )
+        else:
+            conn.execute(
+                'INSERT OR REPLACE INTO estado_conversaciones VALUES (?, ?, ?, ?)',
+                (nombre, clave, estado, time.time())
+            )
+
+
+def _contar_conversaciones(conn):
+    filas = conn.execute(
+        'SELECT nombre, estado, COUNT(*) FROM estado_conversaciones GROUP BY nombre, estado'
+    ).fetchall()
+    return {(nombre, json.loads(estado)): n for nombre, estado, n in filas}
+
+
+def _compactar(conn, limite):
+    with conn:
+        usuarios = conn.execute(
+            'DELETE FROM estado_usuarios WHERE actualizado < ?', (limite,)
+        ).rowcount
+        conversaciones = conn.execute(
+            'DELETE FROM estado_conversaciones WHERE actualizado < ?', (limite,)
+        ).rowcount
+    conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+    return usuarios, conversaciones
+
+
+# ========== PERSISTENCIA ==========
+class PersistenciaSQLite(BasePersistence):
+    """Persistencia incremental y de carga diferida sobre ``BaseDatos``."""
+
+    def __init__(self, bd, update_interval: float = PERSISTENCIA_INTERVALO):
+        # bot_data guarda objetos en ejecución (p. ej. el motor de difusión): no se persiste
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+            update_interval=update_interval
+        )
+        self.bd = bd
+        self._cargados = set()
+        self._ultima_compactacion = time.monotonic()
+
+    # ----- user_data -----
+    async def get_user_data(self):
+        # Carga diferida: cada usuario se lee en refresh_user_data
+        return {}
+
+    async def refresh_user_data(self, user_id, user_data):
+        if user_id in self._cargados:
+            return
+        self._cargados.add(user_id)
+        datos = await self.bd.ejecutar(_leer_usuario, user_id)
+        if datos:
+            # Lo escrito en memoria antes de la carga tiene prioridad
+            for clave, valor in datos.items():
+                user_data.setdefault(clave, valor)
+
+    async def update_user_data(self, user_id, data):
+        self._cargados.add(user_id)
+        await self.bd.ejecutar(_guardar_usuario, user_id, json.dumps(data) if data else None)
+        self._compactar_si_toca()
+
+    def olvidar(self, user_id):
+        """Hace que el próximo ``refresh_user_data`` vuelva a leer al usuario de la base de datos."""
+        self._cargados.discard(user_id)
+
+    async def drop_user_data(self, user_id):
+        self._cargados.discard(user_id)
+        await self.bd.ejecutar(_guardar_usuario, user_id, None)
+
+    # ----- conversaciones -----
+    async def get_conversations(self, name):
+        conversaciones = await self.bd.ejecutar(_leer_conversaciones, name)
+        logger.info(f"Conversación '{name}': {len(conversaciones)} estados restaurados")
+        return conversaciones
+
+    async def update_conversation(self, name, key, new_state):
+        estado = None if new_state is None else json.dumps(new_state)
+        await self.bd.ejecutar(_guardar_conversacion, name, json.dumps(list(key)), estado)
+
+    async def conversaciones_activas(self):
+        """Número de conversaciones guardadas por (nombre, estado)."""
+        return await self.bd.ejecutar(_contar_conversaciones)
+
+    # ----- compactación -----
+    def _compactar_si_toca(self):
+        ahora = time.monotonic()
+        if ahora - self._ultima_compactacion < PERSISTENCIA_COMPACTAR:
+            return
+        self._ultima_compactacion = ahora
+        self.bd.enviar(self._compactar)
+
+    def _compactar(self, conn):
+        usuarios, conversaciones = _compactar(conn, time.time() - PERSISTENCIA_RETENCION)
+        logger.info(
+            f"Persistencia compactada: {usuarios} user_data y "
+            f"{conversaciones} conversaciones abandonadas eliminadas"
+        )
+
+    # ----- datos no persistidos -----
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        # Las escrituras ya se hicieron en cada actualización
+        pass
@@ -0,0 +1,67 @@
+"""Procesamiento concurrente de actualizaciones con orden por usuario.
+
+El bot atiende hasta ``BOT_CONCURRENCIA`` actualizaciones a la vez, pero los
+``ConversationHandler`` persistentes (registro, consulta a la IA, evaluación
+de riesgo) necesitan que las de un mismo usuario se procesen de una en una:
+si «Ana» y «Pérez» llegan seguidos, los dos los atendería el manejador del
+estado NOMBRE. ``ProcesadorPorUsuario`` mantiene la concurrencia entre
+usuarios y atiende las actualizaciones de cada uno en orden de llegada, con
+un candado por usuario (por chat si la actualización no tiene usuario).
+
+El candado se toma antes que el límite de concurrencia: las actualizaciones
+que esperan su turno no ocupan plazas, así que un usuario que envía muchos
+mensajes seguidos no frena a los demás. Para eso se redefine
+``process_update``, que PTB marca como ``@final`` solo para el comprobador de
+tipos; el límite sigue siendo el de PTB, al que se llega por
+``super().process_update``. Probado con python-telegram-bot 22.8.
+"""
+import asyncio
+import os
+
+from telegram.ext import SimpleUpdateProcessor
+
+BOT_CONCURRENCIA = int(os.getenv('BOT_CONCURRENCIA', '64'))
+
+
+def clave_usuario(update):
+    """Usuario que origina la actualización o, si no lo hay, su chat."""
+    usuario = getattr(update, 'effective_user', None)
+    if usuario is not None:
+        return usuario.id
+    chat = getattr(update, 'effective_chat', None)
+    return chat.id if chat is not None else None
+
+
+class ProcesadorPorUsuario(SimpleUpdateProcessor):
+    """Hasta ``max_concurrent_updates`` a la vez, pero de una en una por usuario."""
+
+    def __init__(self, max_concurrent_updates: int = BOT_CONCURRENCIA):
+        super().__init__(max_concurrent_updates)
+        # Usuario -> [candado, actualizaciones que lo usan o esperan]
+        self._candados = {}
+        self.esperas = 0
+
+    @property
+    def usuarios_en_curso(self) -> int:
+        return len(self._candados)
+
+    async def process_update(self, update, coroutine):
+        clave = clave_usuario(update)
+        if clave is None:
+            await super().process_update(update, coroutine)
+            return
+        entrada = self._candados.get(clave)
+        if entrada is None:
+            entrada = self._candados[clave] = [asyncio.Lock(), 0]
+        entrada[1] += 1
+        try:
+            if entrada[0].locked():
+                self.esperas += 1
+            # asyncio.Lock atiende a quien espera por orden de llegada; el
+            # límite de concurrencia de PTB se toma ya con el turno del usuario
+            async with entrada[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            entrada[1] -= 1
+            if not entrada[1]:
+                del self._candados[clave]
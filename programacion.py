@@ -0,0 +1,431 @@
+"""Envíos programados a los suscritos: resúmenes periódicos y seguimientos de sismos.
+
+Además de las alertas de /alerta (difusion.py), los usuarios suscritos
+(``recibir_info = 'Sí'``) reciben:
+
+- cada ``PROGRAMACION_RESUMEN_DIAS`` días, un resumen con los sismos cercanos
+  a su localidad y un recordatorio de preparación;
+- un seguimiento cuando el catálogo registra cerca de su municipio un sismo
+  de magnitud ≥ ``SEGUIMIENTO_MAGNITUD`` (uno por municipio y sismo más
+  fuerte de las últimas ``SEGUIMIENTO_HORAS``).
+
+Los destinatarios se agrupan por localidad (el municipio resuelto o, si no
+lo hay, la residencia): cada texto se genera una sola vez por localidad, con
+plantilla o, si se configura, con el recordatorio redactado por el modelo.
+
+Una tarea del job_queue lanza un paso cada ``PROGRAMACION_PASO`` segundos.
+Cada paso atiende como mucho ``tasa × paso`` destinatarios que estén dentro
+de su ventana de entrega (``/horario``), primero los seguimientos y luego los
+resúmenes, con un cubo de fichas propio muy por debajo del límite de
+Telegram; así una ventana que abre para miles de usuarios se reparte en
+varios minutos. Las prioridades son estrictas: mientras haya una difusión
+de /alerta en curso o el bot tenga actualizaciones esperando, los envíos
+programados se detienen.
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from base_datos import SUSCRITO_SQL, ahora
+from catalogo import formatear_sismo
+from difusion import MotorDifusion
+from limitador import CuboTokens
+from riesgo import NIVELES
+
+logger = logging.getLogger(__name__)
+
+PROGRAMACION_PASO = float(os.getenv('PROGRAMACION_PASO', '60'))
+# Mensajes por segundo de los envíos programados (Telegram admite unos 30 en total)
+PROGRAMACION_TASA = float(os.getenv('PROGRAMACION_TASA', '5'))
+# Ventana de entrega por defecto, en horas locales [desde, hasta)
+PROGRAMACION_VENTANA = os.getenv('PROGRAMACION_VENTANA', '8-20')
+PROGRAMACION_ZONA = os.getenv('PROGRAMACION_ZONA', 'America/Havana')
+PROGRAMACION_RESUMEN_DIAS = float(os.getenv('PROGRAMACION_RESUMEN_DIAS', '7'))
+SEGUIMIENTO_MAGNITUD = float(os.getenv('SEGUIMIENTO_MAGNITUD', '4.0'))
+SEGUIMIENTO_HORAS = float(os.getenv('SEGUIMIENTO_HORAS', '48'))
+RADIO_KM = float(os.getenv('PROGRAMACION_RADIO_KM', '100'))
+
+# Niveles de prioridad (menor, más urgente): las alertas detienen a los demás
+ALERTA, SEGUIMIENTO, RESUMEN = 0, 1, 2
+# Una difusión que sigue 'en_curso' en la base de datos más de este tiempo
+# se considera abandonada (p. ej. un reinicio sin reanudar)
+DIFUSION_VIGENCIA = timedelta(hours=1)
+
+RECORDATORIOS = (
+    "Revisa tu mochila de emergencia: agua, linterna, radio de pilas, botiquín y documentos.",
+    "Acuerda con tu familia un punto de encuentro fuera de la vivienda.",
+    "Fija a la pared los muebles altos y no pongas objetos pesados sobre las camas.",
+    "Identifica en cada habitación el lugar más seguro: junto a columnas o bajo una mesa resistente.",
+    "Aprende a cerrar las llaves del gas, el agua y la electricidad de tu casa.",
+    "Ten a mano los teléfonos de emergencia y de la Defensa Civil de tu municipio.",
+)
+
+PROMPT_RECORDATORIO = (
+    "Redacta en español, en no más de 60 palabras, un recordatorio práctico de preparación "
+    "ante sismos para los residentes de {localidad} (riesgo sísmico {nivel}). "
+    "Tema de esta semana: {tema}"
+)
+
+PIE_RESUMEN = "⏰ Cambia la hora de entrega con /horario o deja de recibir estos resúmenes con /horario no."
+
+
+def leer_ventana(texto):
+    """``(desde, hasta)`` a partir de un texto como ``8-20`` o ``9 18``."""
+    horas = [int(h) for h in re.findall(r'\d{1,2}', texto)]
+    if len(horas) != 2 or not 0 <= horas[0] < horas[1] <= 24:
+        raise ValueError(f"ventana no válida: {texto!r}")
+    return tuple(horas)
+
+
+def _zona_horaria(nombre):
+    try:
+        return ZoneInfo(nombre)
+    except ZoneInfoNotFoundError:
+        logger.warning(f"Zona horaria {nombre} desconocida, se usa la hora del sistema")
+        return None
+
+
+def texto_seguimiento(municipio, sismo) -> str:
+    return "\n".join([
+        f"📍 Seguimiento: sismo de magnitud {sismo.magnitud:.1f} cerca de {municipio}.",
+        formatear_sismo(sismo),
+        "- Revisa tu vivienda: grietas en muros, columnas y escaleras, y posibles fugas de gas.",
+        "- Puede haber réplicas en los próximos días: ten a mano tu mochila de emergencia.",
+        "- Sigue solo la información oficial de la Defensa Civil y del CENAIS.",
+    ])
+
+
+# ========== ACCESO A DATOS ==========
+_SUSCRITO = SUSCRITO_SQL.format('u')
+_EN_VENTANA = 'coalesce(p.hora_desde, ?) <= ? AND ? < coalesce(p.hora_hasta, ?)'
+
+
+def _resumenes_debidos(conn, hora, ventana, limite, cuota):
+    desde, hasta = ventana
+    return conn.execute(f'''
+    SELECT coalesce(u.municipio, trim(u.residencia)), u.user_id
+    FROM usuarios u LEFT JOIN preferencias_envio p USING (user_id)
+    WHERE {_SUSCRITO} AND coalesce(p.resumenes, 1) AND {_EN_VENTANA}
+      AND coalesce(p.ultimo_resumen, u.fecha_registro, '') < ?
+    ORDER BY 1 LIMIT ?''', (desde, hora, hora, hasta, limite, cuota)).fetchall()
+
+
+def _seguimientos_debidos(conn, hora, ventana, instante, cuota):
+    desde, hasta = ventana
+    return conn.execute(f'''
+    SELECT a.id, a.mensaje, u.user_id
+    FROM avisos a
+    JOIN usuarios u ON u.municipio = a.localidad
+    LEFT JOIN preferencias_envio p ON p.user_id = u.user_id
+    WHERE a.caduca > ? AND {_SUSCRITO} AND {_EN_VENTANA}
+      AND NOT EXISTS (
+          SELECT 1 FROM avisos_entregados e WHERE e.aviso_id = a.id AND e.user_id = u.user_id
+      )
+    ORDER BY a.nivel, a.id LIMIT ?''', (instante, desde, hora, hora, hasta, cuota)).fetchall()
+
+
+def _marcar_resumenes(conn, user_ids, marca):
+    with conn:
+        conn.executemany(
+            'INSERT INTO preferencias_envio (user_id, ultimo_resumen) VALUES (?, ?) '
+            'ON CONFLICT(user_id) DO UPDATE SET ultimo_resumen = excluded.ultimo_resumen',
+            [(uid, marca) for uid in user_ids]
+        )
+
+
+def _marcar_avisos(conn, filas):
+    with conn:
+        conn.executemany('INSERT OR IGNORE INTO avisos_entregados (aviso_id, user_id) VALUES (?, ?)', filas)
+
+
+def _crear_aviso(conn, clave, nivel, localidad, mensaje, caduca):
+    with conn:
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO avisos (clave, nivel, localidad, mensaje, creado, caduca) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (clave, nivel, localidad, mensaje, ahora(), caduca)
+        )
+    return cursor.rowcount
+
+
+def _purgar_avisos(conn, instante):
+    with conn:
+        conn.execute(
+            'DELETE FROM avisos_entregados WHERE aviso_id IN (SELECT id FROM avisos WHERE caduca <= ?)',
+            (instante,)
+        )
+        conn.execute('DELETE FROM avisos WHERE caduca <= ?', (instante,))
+
+
+def _difusion_reciente(conn, desde):
+    # Difusiones de /alerta lanzadas desde otro proceso (reparto.py)
+    return conn.execute(
+        "SELECT 1 FROM difusiones WHERE estado = 'en_curso' AND creada > ? LIMIT 1", (desde,)
+    ).fetchone() is not None
+
+
+def _leer_preferencias(conn, user_id):
+    return conn.execute(
+        'SELECT hora_desde, hora_hasta, resumenes FROM preferencias_envio WHERE user_id = ?',
+        (user_id,)
+    ).fetchone()
+
+
+def _guardar_preferencias(conn, user_id, desde, hasta, resumenes):
+    with conn:
+        conn.execute(
+            'INSERT INTO preferencias_envio (user_id, hora_desde, hora_hasta, resumenes) '
+            'VALUES (?, ?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET '
+            'hora_desde = excluded.hora_desde, hora_hasta = excluded.hora_hasta, '
+            'resumenes = excluded.resumenes',
+            (user_id, desde, hasta, resumenes)
+        )
+
+
+# ========== PLANIFICADOR ==========
+class Planificador:
+    """Resúmenes y seguimientos por localidad, repartidos en el tiempo y por debajo de las alertas."""
+
+    def __init__(
+        self,
+        bot,
+        bd,
+        alertas,
+        catalogo,
+        indice,
+        redactar=None,
+        ocupado=None,
+        paso: float = PROGRAMACION_PASO,
+        tasa: float = PROGRAMACION_TASA,
+        ventana: str = PROGRAMACION_VENTANA,
+        zona: str = PROGRAMACION_ZONA,
+    ):
+        self.bd = bd
+        # MotorDifusion de /alerta: sus difusiones activas detienen los envíos
+        self.alertas = alertas
+        self.catalogo = catalogo
+        self.indice = indice
+        # Corrutina prompt -> texto para redactar los recordatorios (opcional)
+        self.redactar = redactar
+        # Función sin argumentos: True si hay tráfico interactivo esperando
+        self.ocupado = ocupado
+        self.paso = paso
+        self.tasa = tasa
+        self.ventana = leer_ventana(ventana)
+        self.zona = _zona_horaria(zona)
+        self._envio = MotorDifusion(bot, bd, tasa=tasa, concurrencia=1)
+        # Sin ráfagas: un envío cada 1/tasa segundos
+        self._envio.cubo = CuboTokens(tasa, capacidad=1.0)
+        self._tarea = None
+        # (localidad, semana) -> recordatorio redactado
+        self._recordatorios = {}
+        # (localidad, sismos en el catálogo, día) -> texto del resumen
+        self._textos = {}
+        self.estadisticas = {
+            'pasos': 0,
+            'pasos_solapados': 0,
+            'pasos_cedidos': 0,
+            'esperas_prioridad': 0,
+            'seguimientos_creados': 0,
+            'seguimientos': 0,
+            'resumenes': 0,
+            'textos': 0,
+            'redactados': 0,
+            'fallidos': 0,
+            'errores': 0,
+        }
+
+    # ----- Preferencias de los usuarios -----
+    async def preferencias(self, user_id):
+        """``(desde, hasta, resumenes)`` del usuario, con la ventana por defecto si no eligió otra."""
+        fila = await self.bd.ejecutar(_leer_preferencias, user_id)
+        if fila is None:
+            return (*self.ventana, True)
+        desde, hasta, resumenes = fila
+        if desde is None:
+            desde, hasta = self.ventana
+        return desde, hasta, bool(resumenes)
+
+    async def guardar_preferencias(self, user_id, ventana=None, resumenes=True):
+        desde, hasta = ventana or (None, None)
+        if ventana is None:
+            fila = await self.bd.ejecutar(_leer_preferencias, user_id)
+            if fila is not None:
+                desde, hasta = fila[0], fila[1]
+        await self.bd.ejecutar(_guardar_preferencias, user_id, desde, hasta, int(resumenes))
+
+    # ----- Ciclo -----
+    def programar(self):
+        """Lanza un paso si no hay otro en curso (lo llama el job_queue)."""
+        if self._tarea is not None and not self._tarea.done():
+            self.estadisticas['pasos_solapados'] += 1
+            return
+        self._tarea = asyncio.create_task(self.ejecutar_paso(), name='programacion')
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+            self._tarea = None
+
+    def _hora(self):
+        return datetime.now(self.zona).hour
+
+    def _alerta_local(self):
+        return self.alertas is not None and self.alertas.activas > 0
+
+    async def _alerta_en_curso(self) -> bool:
+        if self._alerta_local():
+            return True
+        desde = (datetime.now() - DIFUSION_VIGENCIA).strftime("%Y-%m-%d %H:%M:%S")
+        return await self.bd.ejecutar(_difusion_reciente, desde)
+
+    async def _esperar_turno(self):
+        """Espera mientras haya trabajo de más prioridad: alertas y tráfico interactivo."""
+        esperando = False
+        while self._alerta_local() or (self.ocupado is not None and self.ocupado()):
+            if not esperando:
+                esperando = True
+                self.estadisticas['esperas_prioridad'] += 1
+            await asyncio.sleep(0.5)
+
+    async def ejecutar_paso(self):
+        try:
+            if await self._alerta_en_curso():
+                self.estadisticas['pasos_cedidos'] += 1
+                return
+            self.estadisticas['pasos'] += 1
+            instante = ahora()
+            await self.bd.ejecutar(_purgar_avisos, instante)
+            await self._detectar_sismos()
+            cuota = max(1, int(self.tasa * self.paso * 0.8))
+            hora = self._hora()
+            cuota -= await self._enviar_seguimientos(hora, instante, cuota)
+            if cuota > 0:
+                await self._enviar_resumenes(hora, cuota)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.estadisticas['errores'] += 1
+            logger.error(f"Error en los envíos programados: {e}")
+
+    async def _entregar(self, user_ids, texto):
+        for user_id in user_ids:
+            await self._esperar_turno()
+            if not await self._envio.enviar(user_id, texto):
+                self.estadisticas['fallidos'] += 1
+            yield user_id
+
+    # ----- Seguimientos -----
+    def _municipios(self):
+        for zona in self.indice.zonas.values():
+            if zona.tipo == 'municipio' and zona.id in self.indice.centros:
+                yield zona, self.indice.centros[zona.id]
+
+    async def _detectar_sismos(self):
+        desde = time.time() - SEGUIMIENTO_HORAS * 3600
+        for zona, centro in self._municipios():
+            total, sismos = self.catalogo.cerca(
+                *centro, RADIO_KM, desde=desde, magnitud_min=SEGUIMIENTO_MAGNITUD, limite=64
+            )
+            if not total:
+                continue
+            # Solo el más fuerte: una réplica menor no genera otro aviso
+            sismo = max(sismos, key=lambda s: s.magnitud)
+            caduca = (sismo.tiempo.astimezone() + timedelta(hours=SEGUIMIENTO_HORAS)).strftime("%Y-%m-%d %H:%M:%S")
+            clave = f"seguimiento:{zona.municipio}:{sismo.id or sismo.tiempo.timestamp()}"
+            creado = await self.bd.ejecutar(
+                _crear_aviso, clave, SEGUIMIENTO, zona.municipio, texto_seguimiento(zona.municipio, sismo), caduca
+            )
+            if creado:
+                self.estadisticas['seguimientos_creados'] += 1
+                logger.info(f"Seguimiento programado para {zona.municipio}: M{sismo.magnitud:.1f} ({sismo.id})")
+
+    async def _enviar_seguimientos(self, hora, instante, cuota) -> int:
+        filas = await self.bd.ejecutar(_seguimientos_debidos, hora, self.ventana, instante, cuota)
+        grupos = {}
+        for aviso_id, mensaje, user_id in filas:
+            grupos.setdefault((aviso_id, mensaje), []).append(user_id)
+        for (aviso_id, mensaje), user_ids in grupos.items():
+            entregados = []
+            try:
+                async for user_id in self._entregar(user_ids, mensaje):
+                    entregados.append((aviso_id, user_id))
+            finally:
+                # También si se cancela a medias: no se repite a quien ya lo recibió
+                await self.bd.ejecutar(_marcar_avisos, entregados)
+                self.estadisticas['seguimientos'] += len(entregados)
+        return len(filas)
+
+    # ----- Resúmenes -----
+    async def _recordatorio(self, localidad, zona):
+        semana = datetime.now().isocalendar()
+        tema = RECORDATORIOS[semana.week % len(RECORDATORIOS)]
+        if self.redactar is None:
+            return tema
+        clave = (localidad, semana.year, semana.week)
+        if clave not in self._recordatorios:
+            if len(self._recordatorios) > 10000:
+                self._recordatorios.clear()
+            prompt = PROMPT_RECORDATORIO.format(
+                localidad=localidad, nivel=zona.nivel if zona else 'desconocido', tema=tema
+            )
+            try:
+                self._recordatorios[clave] = await self.redactar(prompt)
+                self.estadisticas['redactados'] += 1
+            except Exception as e:
+                # El modelo ocupado o caído no retrasa el resumen: se usa la plantilla
+                logger.warning(f"Recordatorio de {localidad} sin redactar: {e}")
+                return tema
+        return self._recordatorios[clave]
+
+    async def texto_resumen(self, localidad) -> str:
+        """Resumen de una localidad: sismos cercanos, nivel de riesgo y recordatorio."""
+        coincidencia = self.indice.resolver(localidad or '')
+        zona = coincidencia.zona if coincidencia else None
+        centro = self.indice.centros.get(zona.id) if zona else None
+        dias = PROGRAMACION_RESUMEN_DIAS
+        lineas = [f"🗓️ Resumen sísmico para {localidad or 'tu localidad'}"]
+        if centro is not None:
+            total, sismos = self.catalogo.cerca(*centro, RADIO_KM, desde=time.time() - dias * 86400, limite=3)
+            if total:
+                lineas.append(f"🌐 {total} sismos a menos de {RADIO_KM:.0f} km en los últimos {dias:.0f} días:")
+                lineas.extend(formatear_sismo(s) for s in sismos)
+            else:
+                lineas.append(f"🌐 Ningún sismo registrado a menos de {RADIO_KM:.0f} km en los últimos {dias:.0f} días.")
+        if zona is not None:
+            lineas.append(f"{NIVELES.get(zona.nivel, '⚪')} Riesgo sísmico orientativo de {zona.nombre}: {zona.nivel}")
+        lineas.append(f"💡 {await self._recordatorio(localidad or '', zona)}")
+        lineas.append(PIE_RESUMEN)
+        return '\n'.join(lineas)
+
+    async def _enviar_resumenes(self, hora, cuota) -> int:
+        limite = (datetime.now() - timedelta(days=PROGRAMACION_RESUMEN_DIAS)).strftime("%Y-%m-%d %H:%M:%S")
+        filas = await self.bd.ejecutar(_resumenes_debidos, hora, self.ventana, limite, cuota)
+        grupos = {}
+        for localidad, user_id in filas:
+            grupos.setdefault(localidad, []).append(user_id)
+        for localidad, user_ids in grupos.items():
+            # Un solo texto por localidad, que solo cambia con sismos nuevos o el día
+            clave = (localidad, self.catalogo.total, datetime.now().date())
+            texto = self._textos.get(clave)
+            if texto is None:
+                if len(self._textos) > 10000:
+                    self._textos.clear()
+                texto = self._textos[clave] = await self.texto_resumen(localidad)
+                self.estadisticas['textos'] += 1
+            entregados = []
+            try:
+                async for user_id in self._entregar(user_ids, texto):
+                    entregados.append(user_id)
+            finally:
+                await self.bd.ejecutar(_marcar_resumenes, entregados, ahora())
+                self.estadisticas['resumenes'] += len(entregados)
+        return len(filas)
+
+    def resumen(self) -> dict:
+        return dict(self.estadisticas)
@@ -0,0 +1,214 @@
+"""Recomendaciones personalizadas generadas en segundo plano.
+
+Al terminar el registro el resumen se envía de inmediato y las
+recomendaciones llegan después en un mensaje aparte. Se generan por grupo de
+perfil (rango de edad, sexo, municipio o residencia, nivel académico), no
+por usuario: los perfiles del mismo grupo comparten una sola llamada al
+modelo, y una vez generada la respuesta queda en la caché persistente y se
+sirve al instante. Cada usuario guarda además la suya en ``recomendaciones``
+para poder mostrarla más adelante.
+
+Los grupos pendientes esperan en una cola acotada que atienden unos pocos
+trabajadores; si el modelo está saturado se reintenta más tarde y, agotados
+los reintentos, se envían los consejos generales.
+"""
+import asyncio
+import logging
+import os
+import time
+
+from telegram.error import TelegramError
+
+from base_datos import ahora
+from cache_respuestas import normalizar
+
+logger = logging.getLogger(__name__)
+
+RECOMENDACIONES_TRABAJADORES = int(os.getenv('RECOMENDACIONES_TRABAJADORES', '2'))
+RECOMENDACIONES_CAPACIDAD = int(os.getenv('RECOMENDACIONES_CAPACIDAD', '1000'))
+RECOMENDACIONES_REINTENTOS = int(os.getenv('RECOMENDACIONES_REINTENTOS', '3'))
+RECOMENDACIONES_ESPERA = float(os.getenv('RECOMENDACIONES_ESPERA', '30'))
+
+PROMPT_CONSEJOS = """Genera recomendaciones para preparación ante sismos basadas en estos datos:
+- Edad: {edad} años
+- Sexo: {sexo}
+- Residencia: {residencia} (Santiago de Cuba)
+- Nivel académico: {nivel_academico}"""
+
+CONSEJOS_GENERALES = (
+    "Aquí tienes algunos consejos generales:\n"
+    "- Prepara un kit de emergencia\n"
+    "- Identifica zonas seguras en tu vivienda"
+)
+
+# Límites inferiores de los rangos de edad
+RANGOS_EDAD = (0, 13, 18, 30, 45, 60, 75)
+
+
+def rango_edad(edad) -> str:
+    try:
+        edad = int(edad)
+    except (TypeError, ValueError):
+        return 'desconocida'
+    inferior = max(r for r in RANGOS_EDAD if r <= max(edad, 0))
+    siguientes = [r for r in RANGOS_EDAD if r > inferior]
+    return f"{inferior}-{siguientes[0] - 1}" if siguientes else f"{inferior} o más"
+
+
+def perfil(user_data) -> dict:
+    """Grupo de perfil del usuario: los campos que determinan el prompt."""
+    return {
+        'edad': rango_edad(user_data.get('edad')),
+        'sexo': user_data.get('sexo', ''),
+        'residencia': user_data.get('municipio') or ' '.join(str(user_data.get('residencia', '')).split()),
+        'nivel_academico': user_data.get('nivel_academico', ''),
+    }
+
+
+def clave_perfil(datos: dict) -> str:
+    return normalizar('|'.join(datos[c] for c in ('edad', 'sexo', 'residencia', 'nivel_academico')))
+
+
+# ========== ACCESO A DATOS ==========
+def _guardar(conn, filas):
+    with conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO recomendaciones (user_id, perfil, consejos, actualizada) '
+            'VALUES (?, ?, ?, ?)',
+            filas
+        )
+
+
+def _leer(conn, user_id):
+    fila = conn.execute('SELECT consejos FROM recomendaciones WHERE user_id = ?', (user_id,)).fetchone()
+    return fila[0] if fila else None
+
+
+class GeneradorRecomendaciones:
+    """Cola de generación de recomendaciones agrupadas por perfil."""
+
+    def __init__(
+        self,
+        bot,
+        bd,
+        generar,
+        cache,
+        trabajadores: int = RECOMENDACIONES_TRABAJADORES,
+        capacidad: int = RECOMENDACIONES_CAPACIDAD,
+        reintentos: int = RECOMENDACIONES_REINTENTOS,
+        espera: float = RECOMENDACIONES_ESPERA,
+    ):
+        self.bot = bot
+        self.bd = bd
+        # Corrutina prompt -> texto; lanza una excepción si no hay respuesta
+        self.generar = generar
+        self.cache = cache
+        self.trabajadores = trabajadores
+        self.reintentos = reintentos
+        self.espera = espera
+        self._cola = asyncio.Queue(capacidad)
+        # clave de perfil -> usuarios que esperan esa generación
+        self._pendientes = {}
+        self._tareas = []
+        self.estadisticas = {
+            'solicitadas': 0,
+            'desde_cache': 0,
+            'agrupadas': 0,
+            'generadas': 0,
+            'fallidas': 0,
+            'rechazadas': 0,
+            'entregadas': 0,
+        }
+
+    def iniciar(self):
+        self._tareas = [
+            asyncio.create_task(self._trabajador(), name=f'recomendaciones-{i}')
+            for i in range(self.trabajadores)
+        ]
+
+    async def detener(self):
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+
+    def solicitar(self, user_id, user_data):
+        """Pide las recomendaciones de un usuario.
+
+        Devuelve el texto si ya estaba generado para su grupo de perfil, los
+        consejos generales si la cola está llena, o ``None`` si se entregarán
+        más tarde en un mensaje aparte.
+        """
+        self.estadisticas['solicitadas'] += 1
+        datos = perfil(user_data)
+        clave = clave_perfil(datos)
+        consejos = self.cache.obtener(clave)
+        if consejos is not None:
+            self.estadisticas['desde_cache'] += 1
+            self.bd.enviar(_guardar, [(user_id, clave, consejos, ahora())])
+            return consejos
+
+        if clave in self._pendientes:
+            self.estadisticas['agrupadas'] += 1
+            self._pendientes[clave].append(user_id)
+            return None
+        try:
+            self._cola.put_nowait((clave, PROMPT_CONSEJOS.format(**datos)))
+        except asyncio.QueueFull:
+            self.estadisticas['rechazadas'] += 1
+            return CONSEJOS_GENERALES
+        self._pendientes[clave] = [user_id]
+        return None
+
+    async def de_usuario(self, user_id):
+        """Últimas recomendaciones guardadas del usuario, o ``None``."""
+        return await self.bd.ejecutar(_leer, user_id)
+
+    async def _trabajador(self):
+        while True:
+            clave, prompt = await self._cola.get()
+            try:
+                await self._atender(clave, prompt)
+            except Exception as e:
+                logger.error(f"Error al preparar recomendaciones: {e}")
+                self._pendientes.pop(clave, None)
+
+    async def _atender(self, clave, prompt):
+        consejos = None
+        for intento in range(self.reintentos + 1):
+            inicio = time.perf_counter()
+            try:
+                consejos = await self.generar(prompt)
+                break
+            except Exception as e:
+                logger.warning(f"Recomendaciones: intento {intento + 1} fallido: {e}")
+                if intento < self.reintentos:
+                    await asyncio.sleep(self.espera * (intento + 1))
+
+        # Los usuarios que se sumaron durante la generación también la reciben
+        usuarios = self._pendientes.pop(clave, [])
+        if consejos is None:
+            self.estadisticas['fallidas'] += 1
+            consejos = CONSEJOS_GENERALES
+        else:
+            self.estadisticas['generadas'] += 1
+            self.cache.guardar(clave, consejos, time.perf_counter() - inicio)
+            marca = ahora()
+            await self.bd.ejecutar(_guardar, [(uid, clave, consejos, marca) for uid in usuarios])
+
+        for user_id in usuarios:
+            try:
+                await self.bot.send_message(
+                    chat_id=user_id,
+                    text=f"🔍 Recomendaciones personalizadas:\n{consejos}"
+                )
+                self.estadisticas['entregadas'] += 1
+            except TelegramError as e:
+                logger.info(f"Recomendaciones: no se pudieron entregar a {user_id}: {e}")
+
+    def resumen(self) -> dict:
+        return {
+            **self.estadisticas,
+            'en_cola': self._cola.qsize(),
+            'pendientes': sum(len(u) for u in self._pendientes.values()),
+        }
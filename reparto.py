@@ -0,0 +1,687 @@
+"""Despliegue en varios procesos: un receptor y N trabajadores.
+
+Con un solo ``Application`` todo el tráfico pasa por un bucle de eventos en
+un único núcleo. En este modo un proceso receptor obtiene las
+actualizaciones de Telegram (sondeo largo o webhook, según ``BOT_MODO``) sin
+deserializarlas y las reparte entre ``REPARTO_TRABAJADORES`` procesos, cada
+uno con su propio ``Application`` completo, por una conexión TCP local con
+mensajes JSON precedidos de su longitud.
+
+El reparto es por afinidad: cada usuario (o chat, si la actualización no
+tiene usuario) cae en uno de ``REPARTO_FRAGMENTOS`` fragmentos fijos y cada
+fragmento pertenece a un trabajador. Todas las actualizaciones de un usuario
+llegan al mismo proceso y en orden, así que su ``user_data`` y el estado de
+sus ``ConversationHandler`` viven en un solo sitio; dentro del trabajador,
+``ProcesadorPorUsuario`` (procesador.py) las atiende de una en una. En los
+chats privados, los únicos que atiende el bot, usuario y chat coinciden.
+
+El receptor comprueba cada ``REPARTO_PING`` segundos que los trabajadores
+siguen vivos y responden. Un trabajador caído se reinicia y sus
+actualizaciones se retienen mientras arranca; las que ya le habían llegado
+se pierden, como en un reinicio del bot. Si cae ``REPARTO_CAIDAS`` veces en
+``REPARTO_VENTANA`` segundos se retira durante ``REPARTO_RETIRO`` segundos y
+sus fragmentos pasan a los demás, que los devuelven cuando vuelve. Para
+mover un fragmento, el dueño anterior termina lo que tiene en curso, guarda
+la persistencia y olvida a esos usuarios; el nuevo descarta lo que tuviera
+de ellos en memoria y relee su estado de la base de datos.
+
+Solo el trabajador 0 ingiere el catálogo de sismos y reanuda, en su primer
+arranque, las difusiones pendientes. Los límites de ``admision`` y ``ia``
+son por proceso.
+
+Uso:
+    REPARTO_TRABAJADORES=4 python reparto.py
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import secrets
+import signal
+import struct
+import time
+from collections import Counter, defaultdict, deque
+
+import httpx
+from dotenv import load_dotenv
+
+from metricas import METRICAS_PUERTO, iniciar_servidor, registro
+from procesador import BOT_CONCURRENCIA, ProcesadorPorUsuario
+
+# Cargar variables de entorno
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+REPARTO_TRABAJADORES = int(os.getenv('REPARTO_TRABAJADORES', str(os.cpu_count() or 2)))
+REPARTO_FRAGMENTOS = int(os.getenv('REPARTO_FRAGMENTOS', '256'))
+REPARTO_HOST = '127.0.0.1'
+# Actualizaciones retenidas por trabajador antes de dejar de leer de Telegram
+REPARTO_CAPACIDAD = int(os.getenv('REPARTO_CAPACIDAD', '10000'))
+REPARTO_PING = float(os.getenv('REPARTO_PING', '2'))
+# Sin respuesta al ping durante este tiempo, el trabajador se da por caído
+REPARTO_TIMEOUT = float(os.getenv('REPARTO_TIMEOUT', '15'))
+# Tiempo máximo para cargar el bot y presentarse al receptor
+REPARTO_ARRANQUE = float(os.getenv('REPARTO_ARRANQUE', '120'))
+REPARTO_CAIDAS = int(os.getenv('REPARTO_CAIDAS', '3'))
+REPARTO_VENTANA = float(os.getenv('REPARTO_VENTANA', '60'))
+REPARTO_RETIRO = float(os.getenv('REPARTO_RETIRO', '60'))
+# Espera máxima a que un trabajador termine lo que tiene en curso de un fragmento que cede
+REPARTO_PLAZO_CESION = float(os.getenv('REPARTO_PLAZO_CESION', '30'))
+REPARTO_LOG_NIVEL = os.getenv('REPARTO_LOG_NIVEL', 'INFO')
+
+_CABECERA = struct.Struct('>I')
+
+
+# ========== PROTOCOLO ==========
+def _escribir(writer, mensaje: dict):
+    datos = json.dumps(mensaje, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    writer.write(_CABECERA.pack(len(datos)) + datos)
+
+
+async def _leer(reader):
+    """Siguiente mensaje, o ``None`` si la conexión se cerró."""
+    try:
+        largo, = _CABECERA.unpack(await reader.readexactly(_CABECERA.size))
+        return json.loads(await reader.readexactly(largo))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+
+def fragmento(clave: int, total: int = REPARTO_FRAGMENTOS) -> int:
+    return clave % total
+
+
+def clave_reparto(datos: dict) -> int:
+    """Usuario que origina una actualización en JSON o, si no lo hay, su chat."""
+    for campo, objeto in datos.items():
+        if campo == 'update_id' or not isinstance(objeto, dict):
+            continue
+        for nombre in ('from', 'user'):
+            if isinstance(objeto.get(nombre), dict):
+                return objeto[nombre]['id']
+        chat = objeto.get('chat') or (objeto.get('message') or {}).get('chat')
+        if isinstance(chat, dict):
+            return chat['id']
+    return 0
+
+
+# ========== TRABAJADOR ==========
+class ProcesadorFragmentos(ProcesadorPorUsuario):
+    """Procesador por usuario que además cuenta las pendientes de cada fragmento."""
+
+    def __init__(self, max_concurrent_updates: int = BOT_CONCURRENCIA):
+        super().__init__(max_concurrent_updates)
+        self._fragmentos = {}
+        self.pendientes = Counter()
+        self.procesadas = 0
+
+    def anotar(self, update_id, fragmento_):
+        self._fragmentos[update_id] = fragmento_
+        self.pendientes[fragmento_] += 1
+
+    async def do_process_update(self, update, coroutine):
+        try:
+            await super().do_process_update(update, coroutine)
+        finally:
+            self.procesadas += 1
+            fragmento_ = self._fragmentos.pop(getattr(update, 'update_id', None), None)
+            if fragmento_ is not None:
+                self.pendientes[fragmento_] -= 1
+
+
+def _olvidar(application, fragmentos, total):
+    """Descarta el estado en memoria de los usuarios de esos fragmentos."""
+    for user_id, datos in application.user_data.items():
+        if fragmento(user_id, total) in fragmentos:
+            datos.clear()
+            application.persistence.olvidar(user_id)
+    # PTB no ofrece otra forma de sustituir el estado de una conversación: se
+    # modifica el diccionario interno sin marcar las claves para persistirlas
+    for conversaciones in application._conversation_handler_conversations.values():
+        for clave in [c for c in conversaciones.data if fragmento(c[-1], total) in fragmentos]:
+            del conversaciones.data[clave]
+
+
+async def _adoptar(application, fragmentos, total):
+    fragmentos = set(fragmentos)
+    _olvidar(application, fragmentos, total)
+    for nombre, conversaciones in application._conversation_handler_conversations.items():
+        guardadas = await application.persistence.get_conversations(nombre)
+        conversaciones.update_no_track({
+            clave: estado for clave, estado in guardadas.items()
+            if fragmento(clave[-1], total) in fragmentos
+        })
+    logger.info(f"{len(fragmentos)} fragmentos adoptados")
+
+
+async def _ceder(application, procesador, writer, fragmentos, total):
+    fragmentos = set(fragmentos)
+    limite = time.monotonic() + REPARTO_PLAZO_CESION
+    while any(procesador.pendientes[f] for f in fragmentos) and time.monotonic() < limite:
+        await asyncio.sleep(0.01)
+    await application.update_persistence()
+    _olvidar(application, fragmentos, total)
+    _escribir(writer, {'tipo': 'cedido', 'fragmentos': sorted(fragmentos)})
+    logger.info(f"{len(fragmentos)} fragmentos cedidos")
+
+
+async def ejecutar_trabajador(indice, puerto, secreto, token, base_url, total):
+    """Carga el bot, se presenta al receptor y procesa lo que este le envía."""
+    # Dentro del proceso trabajador: el receptor no carga el bot
+    import bot
+    from telegram import Update
+
+    bot.preparar()
+    procesador = ProcesadorFragmentos()
+    application = bot.crear_aplicacion(token, base_url, concurrencia=procesador)
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+
+    reader, writer = await asyncio.open_connection(REPARTO_HOST, puerto)
+    _escribir(writer, {
+        'tipo': 'hola',
+        'trabajador': indice,
+        'secreto': secreto,
+        'tipos': bot.tipos_de_actualizacion(application),
+    })
+    cesiones = set()
+    try:
+        while (mensaje := await _leer(reader)) is not None:
+            tipo = mensaje['tipo']
+            if tipo == 'update':
+                datos = mensaje['datos']
+                procesador.anotar(datos['update_id'], mensaje['fragmento'])
+                await application.update_queue.put(Update.de_json(datos, application.bot))
+            elif tipo == 'ping':
+                _escribir(writer, {
+                    'tipo': 'pong',
+                    'en_cola': application.update_queue.qsize(),
+                    'en_curso': procesador.current_concurrent_updates,
+                    'procesadas': procesador.procesadas,
+                })
+            elif tipo == 'ceder':
+                tarea = asyncio.create_task(
+                    _ceder(application, procesador, writer, mensaje['fragmentos'], total)
+                )
+                cesiones.add(tarea)
+                tarea.add_done_callback(cesiones.discard)
+            elif tipo == 'adoptar':
+                # Antes de leer las actualizaciones de esos fragmentos que vienen detrás
+                await _adoptar(application, mensaje['fragmentos'], total)
+            elif tipo == 'salir':
+                break
+    finally:
+        writer.close()
+        await application.stop()
+        await application.post_shutdown(application)
+        await application.shutdown()
+        bot.bd.cerrar()
+
+
+def _proceso_trabajador(indice, puerto, secreto, token, base_url, total):
+    logging.basicConfig(
+        format=f'%(asctime)s - trabajador {indice} - %(name)s - %(levelname)s - %(message)s',
+        level=REPARTO_LOG_NIVEL
+    )
+    # Ctrl+C llega a todo el grupo de procesos: el trabajador sale cuando el receptor se lo pide
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(ejecutar_trabajador(indice, puerto, secreto, token, base_url, total))
+
+
+# ========== RECEPTOR ==========
+class _Trabajador:
+    """Un proceso trabajador visto desde el receptor."""
+
+    def __init__(self, indice, propios):
+        self.indice = indice
+        # Fragmentos que le corresponden mientras está sano
+        self.propios = propios
+        self.estado = 'parado'  # arrancando, activo o retirado
+        self.proceso = None
+        self.writer = None
+        self.buzon = deque()
+        self.hay_buzon = asyncio.Event()
+        self.arranque = 0.0
+        self.arranques = 0
+        self.ultimo_pong = 0.0
+        self.caidas = deque()
+        self.retirado_hasta = 0.0
+        self.enviadas = 0
+        self.en_cola = 0
+
+
+class Receptor:
+    """Recibe las actualizaciones de Telegram y las reparte entre los trabajadores."""
+
+    def __init__(
+        self,
+        token: str,
+        base_url: str = 'https://api.telegram.org',
+        trabajadores: int = REPARTO_TRABAJADORES,
+        fragmentos: int = REPARTO_FRAGMENTOS,
+        modo: str = None,
+        capacidad: int = REPARTO_CAPACIDAD,
+    ):
+        self.token = token
+        self.base_url = base_url
+        self.total = fragmentos
+        self.modo = modo or os.getenv('BOT_MODO', 'polling')
+        self.webhook_url = os.getenv('WEBHOOK_URL', '').strip()
+        if self.modo == 'webhook' and not self.webhook_url:
+            # setWebhook con url vacía no registraría ningún destino útil
+            raise ValueError("BOT_MODO=webhook necesita WEBHOOK_URL: la URL pública a la que Telegram envía las actualizaciones")
+        self.capacidad = capacidad
+        self.trabajadores = [
+            _Trabajador(i, [f for f in range(fragmentos) if f % trabajadores == i])
+            for i in range(trabajadores)
+        ]
+        self.asignacion = [f % trabajadores for f in range(fragmentos)]
+        # Fragmento -> destino, mientras su dueño actual lo cede
+        self._traslados = {}
+        self._retenidas = defaultdict(list)
+        self._secreto = secrets.token_urlsafe(16)
+        self._contexto = multiprocessing.get_context('spawn')
+        self._servidor = None
+        self._puerto = None
+        self._webhook = None
+        self._cliente = None
+        self._tareas = []
+        self._tipos = None
+        self._deteniendo = False
+        self.estadisticas = {
+            'recibidas': 0,
+            'esperas_capacidad': 0,
+            'reinicios': 0,
+            'retiros': 0,
+            'fragmentos_trasladados': 0,
+        }
+
+    @property
+    def _api(self):
+        return f"{self.base_url}/bot{self.token}"
+
+    # ----- Ciclo de vida -----
+    async def iniciar(self):
+        self._servidor = await asyncio.start_server(self._conexion, REPARTO_HOST, 0)
+        self._puerto = self._servidor.sockets[0].getsockname()[1]
+        # El primero migra la base de datos y construye índices antes que el resto
+        primero = self.trabajadores[0]
+        self._arrancar(primero)
+        await self._esperar_activo(primero)
+        for t in self.trabajadores[1:]:
+            self._arrancar(t)
+
+        self._cliente = httpx.AsyncClient(timeout=30)
+        self._tareas.append(asyncio.create_task(self._vigilar(), name='reparto_vigilancia'))
+        if self.modo == 'webhook':
+            self._webhook = await self._servir_webhook()
+        else:
+            self._tareas.append(asyncio.create_task(self._sondear(), name='reparto_sondeo'))
+        logger.info(f"Receptor en modo {self.modo} con {len(self.trabajadores)} trabajadores")
+
+    async def _esperar_activo(self, t):
+        limite = time.monotonic() + REPARTO_ARRANQUE
+        while t.estado != 'activo':
+            if not t.proceso.is_alive() or time.monotonic() > limite:
+                raise RuntimeError(f"El trabajador {t.indice} no pudo arrancar")
+            await asyncio.sleep(0.05)
+
+    async def detener(self):
+        self._deteniendo = True
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        if self._webhook is not None:
+            self._webhook.close()
+            await self._webhook.wait_closed()
+
+        # Entregar lo retenido antes de pedir la salida
+        limite = time.monotonic() + 10
+        while time.monotonic() < limite and any(t.buzon and t.writer for t in self.trabajadores):
+            await asyncio.sleep(0.05)
+        for t in self.trabajadores:
+            if t.writer is not None:
+                _escribir(t.writer, {'tipo': 'salir'})
+        for t in self.trabajadores:
+            if t.proceso is not None:
+                await asyncio.to_thread(t.proceso.join, 30)
+                if t.proceso.is_alive():
+                    t.proceso.terminate()
+        self._servidor.close()
+        if self._cliente is not None:
+            await self._cliente.aclose()
+
+    async def ejecutar(self):
+        """Arranca, publica las métricas y espera a SIGINT o SIGTERM."""
+        await self.iniciar()
+        registro.estadisticas('reparto', self.resumen)
+        registro.indicador(
+            'reparto_fragmentos', 'Fragmentos asignados a cada trabajador',
+            lambda: {(str(i),): n for i, n in Counter(self.asignacion).items()}, ('trabajador',)
+        )
+        registro.indicador(
+            'reparto_pendientes', 'Actualizaciones retenidas o en cola en cada trabajador',
+            lambda: {(str(t.indice),): len(t.buzon) + t.en_cola for t in self.trabajadores}, ('trabajador',)
+        )
+        servidor_metricas = await iniciar_servidor()
+
+        parada = asyncio.Event()
+        bucle = asyncio.get_running_loop()
+        for senal in (signal.SIGINT, signal.SIGTERM):
+            try:
+                bucle.add_signal_handler(senal, parada.set)
+            except NotImplementedError:
+                # Windows: Ctrl+C llega como KeyboardInterrupt
+                pass
+        try:
+            await parada.wait()
+        finally:
+            await self.detener()
+            if servidor_metricas is not None:
+                servidor_metricas.close()
+
+    # ----- Procesos -----
+    def _arrancar(self, t):
+        entorno = {
+            'BOT_TAREAS_UNICAS': '1' if t.indice == 0 else '0',
+            'BOT_REANUDAR_DIFUSIONES': '1' if t.indice == 0 and not t.arranques else '0',
+            'METRICAS_PUERTO': str(METRICAS_PUERTO + 1 + t.indice) if METRICAS_PUERTO else '0',
+        }
+        t.proceso = self._contexto.Process(
+            target=_proceso_trabajador,
+            args=(t.indice, self._puerto, self._secreto, self.token, self.base_url, self.total),
+            name=f'bot-trabajador-{t.indice}',
+            # No demonio: el trabajador tiene su propio pool de procesos (medios.py);
+            # si el receptor muere, el trabajador termina al cerrarse su conexión
+        )
+        # El proceso hereda el entorno del momento en que arranca
+        anterior = {clave: os.environ.get(clave) for clave in entorno}
+        os.environ.update(entorno)
+        try:
+            t.proceso.start()
+        finally:
+            for clave, valor in anterior.items():
+                if valor is None:
+                    os.environ.pop(clave, None)
+                else:
+                    os.environ[clave] = valor
+        t.estado = 'arrancando'
+        t.arranque = time.monotonic()
+        t.arranques += 1
+
+    def _caida(self, t, motivo):
+        if self._deteniendo:
+            return
+        logger.warning(f"Trabajador {t.indice}: {motivo}")
+        writer, t.writer = t.writer, None
+        if writer is not None:
+            writer.close()
+        if t.proceso.is_alive():
+            t.proceso.terminate()
+
+        ahora = time.monotonic()
+        t.caidas.append(ahora)
+        while ahora - t.caidas[0] > REPARTO_VENTANA:
+            t.caidas.popleft()
+        # Lo que estaba cediendo pasa ya a su destino: no queda estado que guardar
+        self._completar_traslado([f for f in self._traslados if self.asignacion[f] == t.indice])
+        if len(t.caidas) >= REPARTO_CAIDAS:
+            logger.error(
+                f"Trabajador {t.indice}: {len(t.caidas)} caídas en {REPARTO_VENTANA:.0f}s, "
+                f"se retira durante {REPARTO_RETIRO:.0f}s"
+            )
+            t.estado = 'retirado'
+            t.retirado_hasta = ahora + REPARTO_RETIRO
+            self.estadisticas['retiros'] += 1
+            self._redistribuir(t)
+        else:
+            self.estadisticas['reinicios'] += 1
+            self._arrancar(t)
+
+    async def _vigilar(self):
+        while True:
+            await asyncio.sleep(REPARTO_PING)
+            ahora = time.monotonic()
+            for t in self.trabajadores:
+                if t.estado == 'retirado':
+                    if ahora >= t.retirado_hasta:
+                        self._arrancar(t)
+                elif not t.proceso.is_alive():
+                    self._caida(t, f"el proceso terminó (código {t.proceso.exitcode})")
+                elif t.estado == 'arrancando':
+                    if ahora - t.arranque > REPARTO_ARRANQUE:
+                        self._caida(t, f"no se presentó en {REPARTO_ARRANQUE:.0f}s")
+                elif ahora - t.ultimo_pong > REPARTO_TIMEOUT:
+                    self._caida(t, f"sin respuesta desde hace {ahora - t.ultimo_pong:.0f}s")
+                else:
+                    _escribir(t.writer, {'tipo': 'ping'})
+
+    # ----- Conexiones con los trabajadores -----
+    async def _conexion(self, reader, writer):
+        try:
+            hola = await asyncio.wait_for(_leer(reader), REPARTO_TIMEOUT)
+        except asyncio.TimeoutError:
+            hola = None
+        if not hola or hola.get('tipo') != 'hola' or hola.get('secreto') != self._secreto:
+            writer.close()
+            return
+        t = self.trabajadores[hola['trabajador']]
+        if self._tipos is None:
+            self._tipos = hola['tipos']
+        t.writer = writer
+        t.estado = 'activo'
+        t.ultimo_pong = time.monotonic()
+        logger.info(f"Trabajador {t.indice} activo (arranque {t.arranques})")
+        envio = asyncio.create_task(self._enviar_buzon(t, writer))
+        t.hay_buzon.set()
+        self._recuperar(t)
+        try:
+            while (mensaje := await _leer(reader)) is not None:
+                if mensaje['tipo'] == 'pong':
+                    t.ultimo_pong = time.monotonic()
+                    t.en_cola = mensaje['en_cola'] + mensaje['en_curso']
+                elif mensaje['tipo'] == 'cedido':
+                    self._completar_traslado(mensaje['fragmentos'])
+        finally:
+            envio.cancel()
+            if t.writer is writer:
+                self._caida(t, "conexión cerrada")
+
+    async def _enviar_buzon(self, t, writer):
+        while True:
+            await t.hay_buzon.wait()
+            t.hay_buzon.clear()
+            while t.buzon and t.writer is writer:
+                _escribir(writer, t.buzon.popleft())
+                t.enviadas += 1
+                if writer.transport.get_write_buffer_size() > 1 << 20:
+                    await writer.drain()
+            await writer.drain()
+
+    def _encolar(self, t, mensaje):
+        t.buzon.append(mensaje)
+        t.hay_buzon.set()
+
+    # ----- Reparto -----
+    async def repartir(self, datos: dict):
+        """Envía una actualización (JSON de la Bot API) al trabajador de su fragmento."""
+        self.estadisticas['recibidas'] += 1
+        f = fragmento(clave_reparto(datos), self.total)
+        mensaje = {'tipo': 'update', 'fragmento': f, 'datos': datos}
+        while True:
+            if f in self._traslados:
+                self._retenidas[f].append(mensaje)
+                return
+            t = self.trabajadores[self.asignacion[f]]
+            if len(t.buzon) < self.capacidad:
+                break
+            # Contrapresión: se deja de leer de Telegram hasta que haya hueco
+            self.estadisticas['esperas_capacidad'] += 1
+            await asyncio.sleep(0.05)
+        self._encolar(t, mensaje)
+
+    def _menos_cargado(self, excluido=None):
+        vivos = [t for t in self.trabajadores if t.estado == 'activo' and t is not excluido]
+        if not vivos:
+            return None
+        carga = Counter(self.asignacion)
+        return min(vivos, key=lambda t: carga[t.indice])
+
+    def _redistribuir(self, t):
+        """Reparte los fragmentos de un trabajador retirado entre los activos."""
+        if self._menos_cargado(excluido=t) is None:
+            logger.error("No hay trabajadores activos: las actualizaciones quedan retenidas")
+            return
+        movidos = defaultdict(list)
+        for f, dueno in enumerate(self.asignacion):
+            if dueno != t.indice or f in self._traslados:
+                continue
+            destino = self._menos_cargado(excluido=t)
+            self.asignacion[f] = destino.indice
+            movidos[destino.indice].append(f)
+        for indice, fragmentos in movidos.items():
+            self.estadisticas['fragmentos_trasladados'] += len(fragmentos)
+            _escribir(self.trabajadores[indice].writer, {'tipo': 'adoptar', 'fragmentos': fragmentos})
+        # Lo retenido para el retirado sigue a su fragmento, en orden
+        pendientes, t.buzon = t.buzon, deque()
+        for mensaje in pendientes:
+            self._encolar(self.trabajadores[self.asignacion[mensaje['fragmento']]], mensaje)
+
+    def _recuperar(self, t):
+        """Devuelve a un trabajador que vuelve los fragmentos que tiene otro."""
+        por_dueno = defaultdict(list)
+        for f in t.propios:
+            if self.asignacion[f] != t.indice and f not in self._traslados:
+                por_dueno[self.asignacion[f]].append(f)
+        for dueno, fragmentos in por_dueno.items():
+            origen = self.trabajadores[dueno]
+            for f in fragmentos:
+                self._traslados[f] = t.indice
+            # Lo que aún no se le envió se retiene junto con lo que llegue
+            cedidos = set(fragmentos)
+            quedan = deque()
+            for mensaje in origen.buzon:
+                if mensaje['fragmento'] in cedidos:
+                    self._retenidas[mensaje['fragmento']].append(mensaje)
+                else:
+                    quedan.append(mensaje)
+            origen.buzon = quedan
+            if origen.writer is None:
+                # Sin proceso vivo no hay estado que guardar
+                self._completar_traslado(fragmentos)
+            else:
+                _escribir(origen.writer, {'tipo': 'ceder', 'fragmentos': fragmentos})
+
+    def _completar_traslado(self, fragmentos):
+        por_destino = defaultdict(list)
+        for f in fragmentos:
+            indice = self._traslados.pop(f, None)
+            if indice is None:
+                continue
+            destino = self.trabajadores[indice]
+            if destino.estado == 'retirado':
+                destino = self._menos_cargado() or destino
+            self.asignacion[f] = destino.indice
+            por_destino[destino.indice].append(f)
+        for indice, fragmentos_ in por_destino.items():
+            destino = self.trabajadores[indice]
+            self.estadisticas['fragmentos_trasladados'] += len(fragmentos_)
+            if destino.writer is not None:
+                _escribir(destino.writer, {'tipo': 'adoptar', 'fragmentos': fragmentos_})
+            for f in fragmentos_:
+                for mensaje in self._retenidas.pop(f, ()):
+                    self._encolar(destino, mensaje)
+
+    # ----- Entrada desde Telegram -----
+    async def _llamar(self, metodo, **params):
+        respuesta = await self._cliente.post(f"{self._api}/{metodo}", json=params)
+        datos = respuesta.json()
+        if not datos.get('ok'):
+            raise RuntimeError(f"{metodo}: {datos.get('description')}")
+        return datos['result']
+
+    async def _sondear(self):
+        await self._llamar('deleteWebhook')
+        desplazamiento = None
+        while True:
+            try:
+                respuesta = await self._cliente.post(
+                    f"{self._api}/getUpdates",
+                    json={'offset': desplazamiento, 'timeout': 10, 'allowed_updates': self._tipos},
+                    timeout=20,
+                )
+                datos = respuesta.json()
+            except (httpx.HTTPError, ValueError) as e:
+                logger.warning(f"getUpdates falló: {e}")
+                await asyncio.sleep(1)
+                continue
+            if not datos.get('ok'):
+                logger.warning(f"getUpdates: {datos.get('description')}")
+                await asyncio.sleep((datos.get('parameters') or {}).get('retry_after', 1))
+                continue
+            for update in datos['result']:
+                desplazamiento = update['update_id'] + 1
+                await self.repartir(update)
+
+    async def _servir_webhook(self):
+        ruta = '/' + os.getenv('WEBHOOK_PATH', 'webhook').strip('/')
+        secreto = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+
+        async def atender(reader, writer):
+            try:
+                while linea := await reader.readline():
+                    metodo, destino, _ = linea.decode('latin-1').split(' ', 2)
+                    cabeceras = {}
+                    while (h := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        nombre, _, valor = h.decode('latin-1').partition(':')
+                        cabeceras[nombre.strip().lower()] = valor.strip()
+                    cuerpo = await reader.readexactly(int(cabeceras.get('content-length', 0)))
+                    if metodo != 'POST' or destino != ruta:
+                        estado = '404 Not Found'
+                    elif cabeceras.get('x-telegram-bot-api-secret-token') != secreto:
+                        estado = '403 Forbidden'
+                    else:
+                        await self.repartir(json.loads(cuerpo))
+                        estado = '200 OK'
+                    writer.write(f'HTTP/1.1 {estado}\r\nContent-Length: 0\r\n\r\n'.encode('latin-1'))
+                    await writer.drain()
+            except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                writer.close()
+
+        servidor = await asyncio.start_server(
+            atender, os.getenv('WEBHOOK_LISTEN', '0.0.0.0'), int(os.getenv('WEBHOOK_PORT', '8443'))
+        )
+        await self._llamar(
+            'setWebhook',
+            url=self.webhook_url,
+            secret_token=secreto,
+            max_connections=int(os.getenv('WEBHOOK_MAX_CONEXIONES', '40')),
+            allowed_updates=self._tipos,
+        )
+        return servidor
+
+    def resumen(self) -> dict:
+        return {
+            **self.estadisticas,
+            'trabajadores_activos': sum(t.estado == 'activo' for t in self.trabajadores),
+            'retenidas': sum(len(t.buzon) for t in self.trabajadores)
+            + sum(len(r) for r in self._retenidas.values()),
+            'fragmentos_en_traslado': len(self._traslados),
+        }
+
+
+def main() -> None:
+    logging.basicConfig(
+        format='%(asctime)s - receptor - %(name)s - %(levelname)s - %(message)s',
+        level=REPARTO_LOG_NIVEL
+    )
+    asyncio.run(Receptor(os.getenv('TELEGRAM_TOKEN')).ejecutar())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Mensajes de Telegram que se completan a medida que llega el texto.
+
+``RespuestaProgresiva`` publica un mensaje provisional y lo va editando con
+el texto acumulado, como mucho una vez cada ``intervalo`` segundos (Telegram
+limita la frecuencia de ediciones por chat). Cuando el texto supera el
+límite de un mensaje, el actual se cierra en un final de párrafo o de frase y
+el resto continúa en un mensaje nuevo.
+"""
+import asyncio
+import logging
+import os
+import time
+
+from telegram.error import BadRequest, RetryAfter
+
+from difusion import LIMITE_MENSAJE
+from limitador import segundos_espera
+
+logger = logging.getLogger(__name__)
+
+EDICION_INTERVALO = float(os.getenv('EDICION_INTERVALO', '1.0'))
+MARCADOR_ESCRIBIENDO = " ✍️"
+
+# Cortes preferidos, de mejor a peor: párrafo, línea, frase, palabra
+_SEPARADORES = ('\n\n', '\n', '. ', '? ', '! ', ' ')
+
+
+def punto_de_corte(texto: str, limite: int = LIMITE_MENSAJE) -> int:
+    """Posición donde partir ``texto`` para que la primera parte quepa en ``limite``."""
+    if len(texto) <= limite:
+        return len(texto)
+    for separador in _SEPARADORES:
+        corte = texto.rfind(separador, 0, limite - len(separador) + 1)
+        # Se evita dejar un mensaje casi vacío por un separador muy temprano
+        if corte > limite // 2:
+            return corte + len(separador)
+    return limite
+
+
+class RespuestaProgresiva:
+    """Respuesta a ``mensaje`` que se edita conforme llegan fragmentos."""
+
+    def __init__(self, mensaje, intervalo: float = EDICION_INTERVALO, limite: int = LIMITE_MENSAJE):
+        self.mensaje = mensaje
+        self.intervalo = intervalo
+        # Se reserva espacio para el marcador de escritura
+        self.limite = limite - len(MARCADOR_ESCRIBIENDO)
+        self.texto = ''
+        self._actual = None
+        self._publicado = None
+        self._ultima_edicion = 0.0
+        self._pausa_hasta = 0.0
+        self.ediciones = 0
+        self.mensajes = 0
+
+    async def iniciar(self, provisional: str = "✍️ Escribiendo…"):
+        """Publica el mensaje provisional que se irá sustituyendo."""
+        self._actual = await self.mensaje.reply_text(provisional)
+        self._publicado = provisional
+        self.mensajes += 1
+        self._ultima_edicion = time.monotonic()
+
+    async def agregar(self, fragmento: str):
+        """Añade texto y actualiza el mensaje si ha pasado el intervalo."""
+        self.texto += fragmento
+        await self._cerrar_completos()
+        if time.monotonic() - self._ultima_edicion >= self.intervalo:
+            await self._publicar(self.texto + MARCADOR_ESCRIBIENDO)
+
+    async def terminar(self, resto: str = ''):
+        """Añade ``resto`` y publica el texto final, sin marcador de escritura."""
+        if resto:
+            self.texto = (self.texto.rstrip() + resto).lstrip()
+            await self._cerrar_completos()
+        await self._publicar(self.texto.strip() or "…", forzar=True)
+
+    async def _cerrar_completos(self):
+        # Mensajes llenos: se cierran y el texto continúa en uno nuevo
+        while len(self.texto) > self.limite:
+            corte = punto_de_corte(self.texto, self.limite)
+            await self._publicar(self.texto[:corte].rstrip(), forzar=True)
+            self.texto = self.texto[corte:].lstrip()
+            self._actual = None
+
+    async def _publicar(self, texto: str, forzar: bool = False):
+        if self._actual is None:
+            self._actual = await self.mensaje.reply_text(texto)
+            self._publicado = texto
+            self.mensajes += 1
+            self._ultima_edicion = time.monotonic()
+            return
+        if texto == self._publicado:
+            return
+        ahora = time.monotonic()
+        if ahora < self._pausa_hasta and not forzar:
+            return
+        try:
+            await self._actual.edit_text(texto)
+        except RetryAfter as e:
+            # Control de flujo de Telegram: se omiten ediciones intermedias
+            espera = segundos_espera(e.retry_after)
+            self._pausa_hasta = ahora + espera
+            if not forzar:
+                return
+            logger.warning(f"Edición limitada por Telegram, reintento en {espera}s")
+            await asyncio.sleep(espera)
+            await self._actual.edit_text(texto)
+        except BadRequest as e:
+            if 'not modified' not in str(e).lower():
+                raise
+        self._publicado = texto
+        self.ediciones += 1
+        self._ultima_edicion = time.monotonic()
@@ -0,0 +1,165 @@
+"""Retención del registro de consultas.
+
+Las consultas con más de ``RETENCION_DIAS`` días (pregunta y respuesta
+completas) se pasan por lotes a un CSV comprimido por mes
+(``datos/archivo/consultas-2025-05.csv.gz``) y se borran de la base de
+datos. /stats no cambia: lee las tablas de resumen, que no se descuentan al
+borrar consultas.
+
+Cada lote se escribe y se sincroniza en disco antes de borrarse; si el
+proceso muere entre ambos pasos, el pase siguiente vuelve a archivar esas
+filas (cada una lleva su ``id`` para descartar los duplicados al leer). Un
+mes archivado en varios pases queda como varios miembros gzip en el mismo
+fichero, que ``gzip`` lee como uno solo.
+
+Después, el espacio libre se devuelve al sistema con ``PRAGMA
+incremental_vacuum`` en pasos cortos, para no retener el hilo de la base de
+datos, y se trunca el WAL.
+"""
+import asyncio
+import csv
+import gzip
+import io
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+RETENCION_RUTA = os.getenv('RETENCION_RUTA', 'datos/archivo')
+# 0 desactiva el archivo de consultas
+RETENCION_DIAS = float(os.getenv('RETENCION_DIAS', '180'))
+RETENCION_LOTE = int(os.getenv('RETENCION_LOTE', '5000'))
+RETENCION_INTERVALO = float(os.getenv('RETENCION_INTERVALO', str(24 * 3600)))
+# Páginas que libera cada paso del VACUUM incremental
+RETENCION_PAGINAS = int(os.getenv('RETENCION_PAGINAS', '1000'))
+
+COLUMNAS = ('id', 'user_id', 'tipo_consulta', 'contenido', 'respuesta', 'fecha')
+
+
+# ========== ACCESO A DATOS ==========
+def _leer_antiguas(conn, limite, lote):
+    return conn.execute(
+        f'SELECT {", ".join(COLUMNAS)} FROM consultas WHERE fecha < ? ORDER BY fecha, id LIMIT ?',
+        (limite, lote)
+    ).fetchall()
+
+
+def _borrar_hasta(conn, fecha, id_):
+    # Un rango del índice de fechas: más rápido que borrar id a id
+    with conn:
+        conn.execute(
+            'DELETE FROM consultas WHERE fecha <= ? AND (fecha < ? OR id <= ?)',
+            (fecha, fecha, id_)
+        )
+
+
+def _vacuum_paso(conn, paginas):
+    antes = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    if not antes:
+        return 0
+    # incremental_vacuum avanza una página por cada fila leída del resultado
+    conn.execute(f'PRAGMA incremental_vacuum({int(paginas)})').fetchall()
+    return antes - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def _truncar_wal(conn):
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+
+
+def _escribir_mes(ruta, filas):
+    nuevo = not os.path.exists(ruta)
+    with open(ruta, 'ab') as crudo:
+        with gzip.GzipFile(fileobj=crudo, mode='wb', compresslevel=6) as comprimido:
+            texto = io.TextIOWrapper(comprimido, encoding='utf-8', newline='')
+            escritor = csv.writer(texto)
+            if nuevo:
+                escritor.writerow(COLUMNAS)
+            escritor.writerows(filas)
+            texto.flush()
+            texto.detach()
+        crudo.flush()
+        os.fsync(crudo.fileno())
+
+
+# ========== RETENCIÓN ==========
+class Retencion:
+    """Archivo de las consultas antiguas y VACUUM incremental."""
+
+    def __init__(
+        self,
+        bd,
+        ruta: str = RETENCION_RUTA,
+        dias: float = RETENCION_DIAS,
+        lote: int = RETENCION_LOTE,
+        paginas: int = RETENCION_PAGINAS,
+    ):
+        self.bd = bd
+        self.ruta = ruta
+        self.dias = dias
+        self.lote = lote
+        self.paginas = paginas
+        self.estadisticas = {
+            'pases': 0,
+            'archivadas': 0,
+            'paginas_liberadas': 0,
+            'errores': 0,
+            'ultimo_pase_s': 0.0,
+        }
+
+    def _archivar(self, filas):
+        por_mes = {}
+        for fila in filas:
+            por_mes.setdefault(fila[-1][:7], []).append(fila)
+        os.makedirs(self.ruta, exist_ok=True)
+        for mes, filas_mes in por_mes.items():
+            _escribir_mes(os.path.join(self.ruta, f'consultas-{mes}.csv.gz'), filas_mes)
+
+    async def archivar(self) -> int:
+        """Archiva y borra las consultas antiguas; devuelve cuántas."""
+        if not self.dias:
+            return 0
+        limite = (datetime.now() - timedelta(days=self.dias)).strftime("%Y-%m-%d %H:%M:%S")
+        total = 0
+        while True:
+            filas = await self.bd.ejecutar(_leer_antiguas, limite, self.lote)
+            if not filas:
+                return total
+            # La compresión va en otro hilo: el de la base de datos sigue libre
+            await asyncio.to_thread(self._archivar, filas)
+            await self.bd.ejecutar(_borrar_hasta, filas[-1][-1], filas[-1][0])
+            total += len(filas)
+            self.estadisticas['archivadas'] += len(filas)
+
+    async def compactar(self) -> int:
+        """VACUUM incremental por pasos; devuelve las páginas liberadas."""
+        total = 0
+        while True:
+            liberadas = await self.bd.ejecutar(_vacuum_paso, self.paginas)
+            if not liberadas:
+                break
+            total += liberadas
+            self.estadisticas['paginas_liberadas'] += liberadas
+        await self.bd.ejecutar(_truncar_wal)
+        return total
+
+    async def ejecutar(self):
+        inicio = time.perf_counter()
+        try:
+            archivadas = await self.archivar()
+            liberadas = await self.compactar()
+        except Exception as e:
+            self.estadisticas['errores'] += 1
+            logger.error(f"Error en la retención de consultas: {e}")
+            return
+        self.estadisticas['pases'] += 1
+        self.estadisticas['ultimo_pase_s'] = time.perf_counter() - inicio
+        if archivadas or liberadas:
+            logger.info(
+                f"Retención: {archivadas} consultas archivadas en {self.ruta}, "
+                f"{liberadas} páginas liberadas en {self.estadisticas['ultimo_pase_s']:.1f}s"
+            )
+
+    def resumen(self) -> dict:
+        return dict(self.estadisticas)
@@ -0,0 +1,342 @@
+"""Índice local de riesgo sísmico por municipio y localidad.
+
+La tabla de zonas (``datos/zonas_riesgo.json``) se carga una vez al arrancar.
+El texto de ubicación que escribe el usuario se resuelve contra los nombres y
+alias de cada zona: primero por coincidencia exacta de n-gramas de palabras
+normalizadas y, si no la hay, por similitud de trigramas para tolerar errores
+de escritura. Los alias ambiguos («puerto», «palma», «josé martí»…), que
+también nombran lugares de otras provincias, solo cuentan si son todo el
+texto o si este menciona Santiago de Cuba; un texto que nombra otro
+Santiago («Santiago de las Vegas») no se resuelve. Las ubicaciones
+compartidas por GPS se resuelven en el mismo índice mediante
+punto-en-polígono sobre una rejilla de celdas o, fuera de todo polígono,
+por la zona más cercana. Las ubicaciones conocidas se responden desde el
+índice sin llamar al modelo.
+"""
+import json
+import logging
+import math
+from collections import defaultdict
+from typing import NamedTuple, Optional
+
+from cache_respuestas import normalizar, trigramas
+
+logger = logging.getLogger(__name__)
+
+RUTA_ZONAS = 'datos/zonas_riesgo.json'
+
+# Los datos de las zonas aún no están validados: toda evaluación lo advierte
+AVISO_ORIENTATIVO = "⚠️ Evaluación orientativa, no oficial: consulta a la Defensa Civil de tu municipio."
+
+# Longitud máxima (en palabras) de los alias que se buscan dentro del texto
+_MAX_PALABRAS = 4
+
+# Palabras que sitúan el texto en Santiago de Cuba y validan los alias ambiguos
+_CONTEXTO = frozenset({'santiago', 'stgo'})
+
+NIVELES = {
+    'bajo': '🟢',
+    'moderado': '🟡',
+    'alto': '🟠',
+    'muy alto': '🔴',
+}
+
+SUELOS = {
+    'A': 'roca dura',
+    'B': 'roca',
+    'C': 'suelo muy denso o roca blanda',
+    'D': 'suelo firme (amplifica las ondas)',
+    'E': 'suelo blando (amplificación fuerte)',
+    'F': 'suelo especial (posible licuefacción)',
+}
+
+
+class Zona(NamedTuple):
+    id: str
+    nombre: str
+    municipio: str
+    tipo: str
+    suelo: str
+    intensidad_historica: int
+    tipologia: str
+    nivel: str
+    notas: str = ''
+
+
+class Coincidencia(NamedTuple):
+    zona: Zona
+    puntuacion: float
+    exacta: bool
+
+
+# ========== ÍNDICE ESPACIAL ==========
+def distancia_km(lat1, lon1, lat2, lon2) -> float:
+    """Distancia de gran círculo (haversine) en kilómetros."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+def punto_en_poligono(lat, lon, poligono) -> bool:
+    """Algoritmo del rayo sobre una lista de vértices ``(lat, lon)``."""
+    dentro = False
+    j = len(poligono) - 1
+    for i in range(len(poligono)):
+        lat_i, lon_i = poligono[i]
+        lat_j, lon_j = poligono[j]
+        if (lat_i > lat) != (lat_j > lat):
+            corte = lon_i + (lat - lat_i) * (lon_j - lon_i) / (lat_j - lat_i)
+            if lon < corte:
+                dentro = not dentro
+        j = i
+    return dentro
+
+
+class _Geometria:
+    __slots__ = ('zona_id', 'poligono', 'caja', 'area', 'centro')
+
+    def __init__(self, zona_id, poligono, centro):
+        self.zona_id = zona_id
+        self.poligono = poligono
+        lats = [p[0] for p in poligono]
+        lons = [p[1] for p in poligono]
+        self.caja = (min(lats), max(lats), min(lons), max(lons))
+        # Área aproximada (fórmula del lazo en grados²), solo para desempatar
+        self.area = abs(sum(
+            poligono[i - 1][1] * poligono[i][0] - poligono[i][1] * poligono[i - 1][0]
+            for i in range(len(poligono))
+        )) / 2
+        self.centro = centro or ((self.caja[0] + self.caja[1]) / 2, (self.caja[2] + self.caja[3]) / 2)
+
+
+class IndiceEspacial:
+    """Rejilla de celdas de ``celda`` grados con los polígonos que las tocan.
+
+    Cada consulta solo examina los polígonos registrados en la celda del
+    punto, por lo que el coste no crece con el número total de zonas.
+    """
+
+    def __init__(self, celda: float = 0.02):
+        self.celda = celda
+        self._celdas = defaultdict(list)
+        self.geometrias = []
+
+    def _clave(self, lat, lon):
+        return (math.floor(lat / self.celda), math.floor(lon / self.celda))
+
+    def agregar(self, zona_id, poligono, centro=None):
+        geom = _Geometria(zona_id, [tuple(p) for p in poligono], centro and tuple(centro))
+        self.geometrias.append(geom)
+        lat_min, lat_max, lon_min, lon_max = geom.caja
+        f0, c0 = self._clave(lat_min, lon_min)
+        f1, c1 = self._clave(lat_max, lon_max)
+        for f in range(f0, f1 + 1):
+            for c in range(c0, c1 + 1):
+                self._celdas[(f, c)].append(geom)
+        return geom
+
+    def contiene(self, lat, lon):
+        """Zona más específica (de menor área) que contiene el punto."""
+        mejor = None
+        for geom in self._celdas.get(self._clave(lat, lon), ()):
+            lat_min, lat_max, lon_min, lon_max = geom.caja
+            if not (lat_min <= lat <= lat_max and lon_min <= lon <= lon_max):
+                continue
+            if (mejor is None or geom.area < mejor.area) and punto_en_poligono(lat, lon, geom.poligono):
+                mejor = geom
+        return mejor.zona_id if mejor else None
+
+    def mas_cercana(self, lat, lon, max_km: float):
+        """Zona cuyo centro está más cerca del punto, dentro de ``max_km``."""
+        fila, col = self._clave(lat, lon)
+        anillos = math.ceil(max_km / (self.celda * 111.32 * max(math.cos(math.radians(lat)), 0.1)))
+        mejor, mejor_km = None, max_km
+        vistos = set()
+        for r in range(anillos + 1):
+            # Un punto del anillo r está al menos a (r - 1) celdas de distancia
+            if mejor is not None and (r - 1) * self.celda * 111.32 * math.cos(math.radians(lat)) > mejor_km:
+                break
+            for f in range(fila - r, fila + r + 1):
+                for c in range(col - r, col + r + 1):
+                    if max(abs(f - fila), abs(c - col)) != r:
+                        continue
+                    for geom in self._celdas.get((f, c), ()):
+                        if id(geom) in vistos:
+                            continue
+                        vistos.add(id(geom))
+                        km = distancia_km(lat, lon, *geom.centro)
+                        if km <= mejor_km:
+                            mejor, mejor_km = geom, km
+        return (mejor.zona_id, mejor_km) if mejor else None
+
+
+# ========== ÍNDICE DE RIESGO ==========
+class IndiceRiesgo:
+    """Resuelve texto libre de ubicación a una zona con datos de riesgo."""
+
+    def __init__(self, ruta: str = RUTA_ZONAS, similitud: float = 0.6, max_km: float = 15.0):
+        self.ruta = ruta
+        self.similitud = similitud
+        # Distancia máxima para asignar la zona más cercana a un punto sin polígono
+        self.max_km = max_km
+        self.zonas = {}
+        # Procedencia y validez de los datos (campo ``fuente`` de la tabla)
+        self.fuente = ''
+        # Punto representativo de cada zona con geometría (lat, lon)
+        self.centros = {}
+        self._alias = {}
+        # Alias que solo cuentan solos o con contexto de Santiago
+        self._ambiguos = set()
+        self._trigramas_alias = {}
+        self._indice = defaultdict(set)
+        self.espacial = IndiceEspacial()
+
+    def cargar(self):
+        with open(self.ruta, encoding='utf-8') as f:
+            datos = json.load(f)
+        self.fuente = datos.get('fuente', '')
+        for fila in datos['zonas']:
+            alias = fila.pop('alias', [])
+            ambiguos = fila.pop('alias_ambiguos', [])
+            poligono = fila.pop('poligono', None)
+            centro = fila.pop('centro', None)
+            zona = Zona(**fila)
+            self.agregar(zona, alias, poligono, centro, ambiguos)
+        logger.info(
+            f"Índice de riesgo: {len(self.zonas)} zonas, {len(self._alias)} alias, "
+            f"{len(self.espacial.geometrias)} polígonos"
+        )
+
+    def agregar(self, zona: Zona, alias=(), poligono=None, centro=None, ambiguos=()):
+        # ambiguos: alias (o el propio nombre) que también nombran lugares de otras provincias
+        self.zonas[zona.id] = zona
+        if poligono:
+            self.centros[zona.id] = self.espacial.agregar(zona.id, poligono, centro).centro
+        ambiguos = {normalizar(a) for a in ambiguos}
+        for nombre in (zona.nombre, *alias, *ambiguos):
+            clave = normalizar(nombre)
+            if not clave:
+                continue
+            self._alias[clave] = zona.id
+            if clave in ambiguos:
+                self._ambiguos.add(clave)
+            tri = trigramas(clave)
+            self._trigramas_alias[clave] = tri
+            for t in tri:
+                self._indice[t].add(clave)
+
+    def _preferida(self, a, b):
+        # Ante varias coincidencias gana la localidad sobre el municipio y,
+        # a igualdad de tipo, el alias más largo
+        def peso(c):
+            clave, valor = c
+            return (valor, self.zonas[self._alias[clave]].tipo == 'localidad', len(clave))
+        return max(a, b, key=peso) if a else b
+
+    def _ventanas(self, palabras):
+        for n in range(min(_MAX_PALABRAS, len(palabras)), 0, -1):
+            for i in range(len(palabras) - n + 1):
+                yield ' '.join(palabras[i:i + n])
+
+    @staticmethod
+    def _contexto(palabras):
+        """True si el texto sitúa la ubicación en Santiago de Cuba, False si
+        nombra otro Santiago («Santiago de Chile», «Santiago de las Vegas») y
+        None si no dice nada."""
+        contexto = None
+        for i, palabra in enumerate(palabras):
+            if palabra not in _CONTEXTO:
+                continue
+            siguientes = palabras[i + 1:i + 3]
+            if palabra == 'santiago' and len(siguientes) == 2 and siguientes[0] == 'de' and siguientes[1] != 'cuba':
+                return False
+            contexto = True
+        return contexto
+
+    def _parecido(self, texto, ambiguos=True):
+        tri = trigramas(texto)
+        comunes = defaultdict(int)
+        for t in tri:
+            for clave in self._indice.get(t, ()):
+                comunes[clave] += 1
+        mejor = None
+        for clave, n in comunes.items():
+            if not ambiguos and clave in self._ambiguos:
+                continue
+            valor = n / (len(tri) + len(self._trigramas_alias[clave]) - n)
+            if valor >= self.similitud:
+                mejor = self._preferida(mejor, (clave, valor))
+        return mejor
+
+    def resolver(self, texto: str) -> Optional[Coincidencia]:
+        """Busca la zona mencionada en el texto o devuelve ``None``."""
+        palabras = normalizar(texto).split()
+        if not palabras:
+            return None
+        completo = ' '.join(palabras)
+        en_santiago = self._contexto(palabras)
+        if en_santiago is False:
+            return None
+
+        mejor = None
+        for ventana in self._ventanas(palabras):
+            if ventana not in self._alias:
+                continue
+            if ventana in self._ambiguos and not (en_santiago or ventana == completo):
+                continue
+            mejor = self._preferida(mejor, (ventana, 1.0))
+        if mejor:
+            return Coincidencia(self.zonas[self._alias[mejor[0]]], 1.0, True)
+
+        for ventana in self._ventanas(palabras):
+            if len(ventana) < 4:
+                continue
+            # Por similitud, los alias ambiguos solo con contexto de Santiago
+            candidata = self._parecido(ventana, bool(en_santiago))
+            if candidata:
+                mejor = self._preferida(mejor, candidata)
+        if mejor:
+            return Coincidencia(self.zonas[self._alias[mejor[0]]], mejor[1], False)
+        return None
+
+    def localizar(self, lat: float, lon: float) -> Optional[Coincidencia]:
+        """Zona que contiene el punto o, en su defecto, la más cercana."""
+        zona_id = self.espacial.contiene(lat, lon)
+        if zona_id:
+            return Coincidencia(self.zonas[zona_id], 1.0, True)
+        cercana = self.espacial.mas_cercana(lat, lon, self.max_km)
+        if cercana:
+            zona_id, km = cercana
+            return Coincidencia(self.zonas[zona_id], 1.0 - km / self.max_km, False)
+        return None
+
+    def aviso(self) -> str:
+        """Advertencia que acompaña a cada evaluación hecha con la tabla de zonas."""
+        return f"{AVISO_ORIENTATIVO}\nFuente: {self.fuente}" if self.fuente else AVISO_ORIENTATIVO
+
+
+def formatear_evaluacion(zona: Zona) -> str:
+    """Texto de evaluación a partir de los datos precalculados de la zona."""
+    lineas = [
+        f"{NIVELES.get(zona.nivel, '⚪')} Riesgo sísmico orientativo: *{zona.nivel.upper()}*",
+        f"🗺️ Zona: {zona.nombre} ({zona.municipio})",
+        f"🪨 Suelo: clase {zona.suelo} – {SUELOS.get(zona.suelo, 'sin clasificar')}",
+        f"📈 Intensidad histórica máxima: {zona.intensidad_historica} MSK",
+        f"🏚️ Construcciones predominantes: {zona.tipologia}",
+    ]
+    if zona.notas:
+        lineas.append(f"ℹ️ {zona.notas}")
+    return '\n'.join(lineas)
+
+
+PLANTILLA_REDACCION = (
+    "Redacta en español, en no más de 120 palabras, una evaluación de riesgo sísmico "
+    "para un residente usando solo estos datos y sin inventar cifras; aclara que el "
+    "nivel es orientativo y no oficial:\n{datos}"
+)
+
+
+def prompt_redaccion(zona: Zona) -> str:
+    """Prompt para que el modelo redacte la evaluación con los datos del índice."""
+    return PLANTILLA_REDACCION.format(datos=formatear_evaluacion(zona))
@@ -0,0 +1,20 @@
+"""Configuración común de las pruebas.
+
+Se ejecutan desde la raíz del repositorio (como los benchmarks) y nunca
+sobre ``sismos_bot.db``: ``DB_PATH`` apunta a una copia temporal por si
+algún módulo abre la base de datos al importarse.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.chdir(RAIZ)
+
+_directorio = tempfile.mkdtemp()
+os.environ['DB_PATH'] = os.path.join(_directorio, 'bot.db')
+shutil.copy('sismos_bot.db', os.environ['DB_PATH'])
+os.environ.setdefault('METRICAS_PUERTO', '0')
+os.environ.setdefault('GEMINI_MODEL', 'falso')
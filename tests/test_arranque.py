@@ -0,0 +1,23 @@
+"""Arranque: el modo webhook no empieza sin una URL pública."""
+import pytest
+
+
+def test_bot_en_modo_webhook_sin_url(monkeypatch):
+    # Importado aquí: DB_PATH ya apunta a la copia temporal (conftest.py)
+    import bot
+
+    monkeypatch.setenv('BOT_MODO', 'webhook')
+    monkeypatch.setenv('WEBHOOK_URL', ' ')
+    monkeypatch.setattr(bot, 'preparar', lambda: pytest.fail("no debe preparar el bot"))
+    with pytest.raises(SystemExit, match='WEBHOOK_URL'):
+        bot.main()
+
+
+def test_receptor_en_modo_webhook_sin_url(monkeypatch):
+    from reparto import Receptor
+
+    monkeypatch.delenv('WEBHOOK_URL', raising=False)
+    with pytest.raises(ValueError, match='WEBHOOK_URL'):
+        Receptor('123:falso', modo='webhook')
+    monkeypatch.setenv('WEBHOOK_URL', 'https://bot.example.org/webhook')
+    assert Receptor('123:falso', modo='webhook').webhook_url == 'https://bot.example.org/webhook'
@@ -0,0 +1,95 @@
+"""Caché de respuestas: normalización, caducidad, LRU, versión de la plantilla y preguntas opuestas."""
+import cache_respuestas
+from base_datos import BaseDatos, _migrar
+from cache_respuestas import CacheRespuestas, normalizar, version_plantilla
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1_000_000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+def test_normalizar_pliega_tildes_mayusculas_y_signos():
+    assert normalizar("  ¿Qué HACER   durante un sismo?! ") == "que hacer durante un sismo"
+    assert normalizar("¿Réplicas… en Santiago?") == normalizar("replicas en santiago")
+
+
+def test_coincidencia_exacta_por_defecto():
+    cache = CacheRespuestas('prueba', 'v1')
+    cache.guardar("¿Qué hacer durante un sismo?", "Agáchate, cúbrete y sujétate")
+    assert cache.obtener("que hacer durante un sismo") == "Agáchate, cúbrete y sujétate"
+    # Sin umbral explícito no hay búsqueda aproximada
+    assert cache.obtener("que hacer durante un sismo ya") is None
+    assert cache.estadisticas['aciertos'] == 1
+    assert cache.estadisticas['fallos'] == 1
+
+
+def test_similitud_no_junta_una_pregunta_con_su_negacion():
+    cache = CacheRespuestas('prueba', 'v1', similitud=0.85)
+    cache.guardar("¿Es seguro entrar al edificio?", "Sí, si no tiene grietas")
+    assert cache.obtener("¿No es seguro entrar al edificio?") is None
+    assert cache.obtener("¿Es seguro entrar al edificio sin revisarlo?") is None
+    # Una variante con el mismo sentido sí aprovecha la respuesta
+    assert cache.obtener("Es seguro entrar al edificio ya") == "Sí, si no tiene grietas"
+    assert cache.estadisticas['aciertos_similares'] == 1
+
+
+def test_similitud_elige_la_entrada_con_el_mismo_sentido():
+    cache = CacheRespuestas('prueba', 'v1', similitud=0.8)
+    cache.guardar("¿Es seguro entrar al edificio?", "afirmativa")
+    cache.guardar("¿No es seguro entrar al edificio?", "negativa")
+    assert cache.obtener("no es seguro entrar al edificio ya") == "negativa"
+    assert cache.obtener("es seguro entrar al edificio ya") == "afirmativa"
+
+
+def test_caducidad(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(cache_respuestas.time, 'time', reloj)
+    cache = CacheRespuestas('prueba', 'v1', ttl=60)
+    cache.guardar("réplicas", "Son normales tras un sismo")
+    reloj.ahora += 59
+    assert cache.obtener("replicas") is not None
+    reloj.ahora += 2
+    assert cache.obtener("replicas") is None
+    assert cache.estadisticas['caducadas'] == 1
+    assert cache.resumen()['entradas'] == 0
+
+
+def test_desalojo_lru():
+    cache = CacheRespuestas('prueba', 'v1', max_entradas=2)
+    cache.guardar("uno", "1")
+    cache.guardar("dos", "2")
+    # Leer «uno» lo hace reciente: el desalojado es «dos»
+    assert cache.obtener("uno") == "1"
+    cache.guardar("tres", "3")
+    assert cache.obtener("dos") is None
+    assert (cache.obtener("uno"), cache.obtener("tres")) == ("1", "3")
+    assert cache.estadisticas['desalojadas'] == 1
+
+
+def test_cambiar_la_plantilla_invalida_lo_persistido(tmp_path):
+    bd = BaseDatos(str(tmp_path / 'bot.db'))
+    bd.ejecutar_sync(_migrar)
+    try:
+        anterior = version_plantilla("Responde: {pregunta}", {'temperatura': 0.3})
+        cache = CacheRespuestas('consulta_ia', anterior, bd=bd)
+        cache.guardar("¿Qué es un tsunami?", "Una serie de olas")
+
+        misma = CacheRespuestas('consulta_ia', anterior, bd=bd)
+        misma.cargar()
+        assert misma.obtener("que es un tsunami") == "Una serie de olas"
+
+        nueva = version_plantilla("Responde en una frase: {pregunta}", {'temperatura': 0.3})
+        assert nueva != anterior
+        cambiada = CacheRespuestas('consulta_ia', nueva, bd=bd)
+        cambiada.cargar()
+        assert cambiada.obtener("que es un tsunami") is None
+        # Las filas de la versión anterior se borran al cargar
+        assert bd.ejecutar_sync(
+            lambda conn: conn.execute('SELECT count(*) FROM cache_respuestas').fetchone()[0]
+        ) == 0
+    finally:
+        bd.cerrar()
@@ -0,0 +1,51 @@
+"""Ingesta del catálogo con ficheros y filas mal formados."""
+import json
+import logging
+
+from catalogo import CatalogoSismos, leer_csv, leer_geojson
+
+CABECERA = 'time,latitude,longitude,depth,mag,id,place\n'
+
+
+def _escribir(ruta, texto):
+    ruta.write_text(texto, encoding='utf-8')
+    return str(ruta)
+
+
+def test_csv_omite_filas_incompletas(tmp_path, caplog):
+    ruta = _escribir(tmp_path / 'a.csv', CABECERA + (
+        '2024-01-01T00:00:00Z,20.0,-76.0,10,4.5,a1,Santiago\n'
+        ',20.0,-76.0,10,4.5,a2,sin instante\n'
+        'ayer,20.0,-76.0,10,4.5,a3,instante no válido\n'
+        '2024-01-02T00:00:00Z,,-76.0,10,4.5,a4,sin latitud\n'
+        '2024-01-03T00:00:00Z,20.1,-76.1\n'
+    ))
+    with caplog.at_level(logging.WARNING, logger='catalogo'):
+        eventos = list(leer_csv(ruta))
+    # La última fila no trae id: se genera a partir del instante y la posición
+    assert [e[5] for e in eventos] == ['a1', '1704240000:20.100:-76.100']
+    assert '3 eventos' in caplog.text
+
+
+def test_geojson_omite_rasgos_incompletos(tmp_path):
+    ruta = _escribir(tmp_path / 'b.geojson', json.dumps({'features': [
+        {'id': 'g1', 'properties': {'time': 1704067200000, 'mag': 3.1}, 'geometry': {'coordinates': [-76, 20, 5]}},
+        {'id': 'g2', 'properties': {'mag': 3.1}, 'geometry': {'coordinates': [-76, 20, 5]}},
+        {'id': 'g3', 'properties': {'time': None}, 'geometry': None},
+        'no es un rasgo',
+    ]}))
+    assert [e[5] for e in leer_geojson(ruta)] == ['g1']
+
+
+def test_ficheros_mal_formados_no_impiden_la_ingesta(tmp_path):
+    entrada = tmp_path / 'sismos'
+    entrada.mkdir()
+    _escribir(entrada / '1_sin_tiempo.csv', 'latitude,longitude,mag\n20,-76,4\n')
+    _escribir(entrada / '2_lista.json', '[1, 2, 3]')
+    _escribir(entrada / '3_roto.xml', '<quakeml><event>')
+    _escribir(entrada / '4_binario.csv', CABECERA + '\x00\x00\n')
+    _escribir(entrada / '5_bueno.csv', CABECERA + '2024-01-01T00:00:00Z,20.0,-76.0,10,4.5,ok,Santiago\n')
+    catalogo = CatalogoSismos(str(tmp_path / 'catalogo'))
+    catalogo.abrir()
+    assert catalogo.ingerir_directorio(str(entrada)) == 1
+    assert catalogo.ultimos(5)[0].id == 'ok'
@@ -0,0 +1,10 @@
+"""Argumentos de los comandos del catálogo."""
+
+
+def test_argumentos_numericos_no_finitos():
+    # Importado aquí: DB_PATH ya apunta a la copia temporal (conftest.py)
+    from bot import _numero_argumento
+
+    assert _numero_argumento('3,5') == 3.5
+    for texto in ('nan', 'inf', '-inf', 'NaN', 'abc'):
+        assert _numero_argumento(texto) is None
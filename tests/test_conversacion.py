@@ -0,0 +1,25 @@
+"""Flujo de registro con mensajes seguidos, contra la Bot API falsa."""
+import asyncio
+
+from benchmarks.entorno import entorno_bot, esperar_calma
+from benchmarks.telegram_falso import update_boton, update_mensaje
+
+USUARIO = 987654
+
+
+def test_registro_con_mensajes_seguidos():
+    async def probar():
+        async with entorno_bot() as e:
+            await e.entregar(update_boton(0, USUARIO, 'registro'))
+            await esperar_calma(e.servidor, USUARIO, 0.2)
+            # Nombre y apellidos sin esperar la respuesta al primero
+            await e.entregar(update_mensaje(0, USUARIO, 'Ana'))
+            await e.entregar(update_mensaje(0, USUARIO, 'Pérez'))
+            await e.entregar(update_mensaje(0, USUARIO, '30'))
+            await esperar_calma(e.servidor, USUARIO, 0.3)
+            return dict(e.application.user_data[USUARIO])
+
+    datos = asyncio.run(probar())
+    assert datos['nombre'] == 'Ana'
+    assert datos['apellidos'] == 'Pérez'
+    assert datos['edad'] == 30
@@ -0,0 +1,133 @@
+"""Difusión: reanudación sin reenvíos masivos, control de flujo sin castigar al destinatario y errores que no la detienen."""
+import asyncio
+from collections import Counter
+
+from telegram.error import ChatMigrated, NetworkError, RetryAfter, TimedOut
+
+from base_datos import BaseDatos, SQL_GUARDAR_USUARIO, _migrar
+from difusion import MotorDifusion
+
+SUSCRITOS = 300
+
+
+class BotFalso:
+    """Anota los envíos; ``fallos`` da, por chat, las excepciones a lanzar antes de entregar."""
+
+    def __init__(self, fallos=None, demora=0.001):
+        self.enviados = Counter()
+        self.fallos = fallos or {}
+        self.demora = demora
+
+    async def send_message(self, chat_id, text):
+        await asyncio.sleep(self.demora)
+        pendientes = self.fallos.get(chat_id)
+        if pendientes:
+            raise pendientes.pop(0)
+        self.enviados[chat_id] += 1
+
+
+def _base_datos(tmp_path, suscritos=SUSCRITOS):
+    bd = BaseDatos(str(tmp_path / 'bot.db'))
+    bd.ejecutar_sync(_migrar)
+    filas = [
+        (uid, 'Nombre', 'Apellido', 30, 'Femenino', 'Universitario', 'Palma Soriano',
+         None, 'Sí', '2020-01-01 00:00:00', None)
+        for uid in range(1, suscritos + 1)
+    ]
+
+    def guardar(conn):
+        with conn:
+            conn.executemany(SQL_GUARDAR_USUARIO, filas)
+    bd.ejecutar_sync(guardar)
+    return bd
+
+
+def test_reanudar_repite_como_mucho_los_envios_en_curso(tmp_path):
+    bd = _base_datos(tmp_path)
+    concurrencia = 10
+    bot = BotFalso()
+
+    async def probar():
+        motor = MotorDifusion(bot, bd, tasa=100000, concurrencia=concurrencia, pagina=100)
+        tarea = asyncio.create_task(motor.difundir("Simulacro"))
+        # Interrupción a mitad de una página
+        while sum(bot.enviados.values()) < 150:
+            await asyncio.sleep(0.001)
+        tarea.cancel()
+        await asyncio.gather(tarea, return_exceptions=True)
+        assert motor.activas == 0
+
+        motor = MotorDifusion(bot, bd, tasa=100000, concurrencia=concurrencia, pagina=100)
+        difusion_id, = await motor.pendientes()
+        return await motor.reanudar(difusion_id)
+
+    try:
+        informe = asyncio.run(probar())
+    finally:
+        bd.cerrar()
+    assert set(bot.enviados) == set(range(1, SUSCRITOS + 1))
+    repetidos = sum(n - 1 for n in bot.enviados.values())
+    assert repetidos <= concurrencia
+    assert informe.entregados == SUSCRITOS and informe.fallidos == 0
+
+
+def test_retry_after_no_gasta_los_reintentos(tmp_path):
+    bd = _base_datos(tmp_path, suscritos=3)
+    bot = BotFalso(fallos={
+        1: [RetryAfter(0) for _ in range(6)],
+        2: [NetworkError("red"), NetworkError("red")],
+    })
+
+    async def probar():
+        motor = MotorDifusion(bot, bd, tasa=100000, reintentos=1)
+        return await motor.difundir("Simulacro")
+
+    try:
+        informe = asyncio.run(probar())
+    finally:
+        bd.cerrar()
+    # El 1 llega tras seis pausas de control de flujo; el 2 agota su único reintento
+    assert bot.enviados == Counter({1: 1, 3: 1})
+    assert (informe.entregados, informe.fallidos) == (2, 1)
+
+
+def test_otros_errores_de_telegram_no_detienen_la_difusion(tmp_path):
+    bd = _base_datos(tmp_path, suscritos=3)
+    bot = BotFalso(fallos={2: [ChatMigrated(-1002)]})
+
+    async def probar():
+        motor = MotorDifusion(bot, bd, tasa=100000)
+        return await motor.difundir("Simulacro")
+
+    try:
+        informe = asyncio.run(probar())
+    finally:
+        bd.cerrar()
+    assert bot.enviados == Counter({1: 1, 3: 1})
+    assert (informe.entregados, informe.fallidos) == (2, 1)
+
+
+class MotorRoto:
+    async def difundir(self, mensaje):
+        raise TimedOut("sin conexión con la base de datos")
+
+
+class Contexto:
+    def __init__(self, motor):
+        self.bot_data = {'difusion': motor}
+        self.bot = self
+        self.mensajes = []
+
+    async def send_message(self, chat_id, text):
+        self.mensajes.append((chat_id, text))
+
+
+def test_alerta_interrumpida_se_informa_al_administrador():
+    # Importado aquí: DB_PATH ya apunta a la copia temporal (conftest.py)
+    from bot import ejecutar_alerta
+
+    contexto = Contexto(MotorRoto())
+    asyncio.run(ejecutar_alerta(contexto, 1, "Simulacro"))
+    (chat_id, texto), = contexto.mensajes
+    assert chat_id == 1
+    assert texto.startswith("❌") and "sin conexión" in texto
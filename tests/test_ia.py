@@ -0,0 +1,57 @@
+"""Caminos de error de ``ClienteIA``: nunca deja a un llamador esperando."""
+import asyncio
+
+import pytest
+
+import ia
+from ia import ClienteIA, ModeloFalso
+
+
+def _fallar_creacion(monkeypatch):
+    def crear_modelo(nombre=None):
+        raise ImportError("google.generativeai no disponible")
+    monkeypatch.setattr(ia, 'crear_modelo', crear_modelo)
+
+
+async def _leer_flujo(cliente, prompt, **kwargs):
+    return [f async for f in cliente.generar_flujo(prompt, **kwargs)]
+
+
+def test_flujo_con_fallo_al_crear_el_modelo(monkeypatch):
+    _fallar_creacion(monkeypatch)
+    cliente = ClienteIA()
+
+    async def probar():
+        # Dos lectores del mismo flujo compartido: ambos reciben el error
+        lectores = [asyncio.create_task(_leer_flujo(cliente, 'hola')) for _ in range(2)]
+        return await asyncio.wait_for(asyncio.gather(*lectores, return_exceptions=True), 2)
+
+    resultados = asyncio.run(probar())
+    assert all(isinstance(r, ImportError) for r in resultados)
+    assert cliente.estadisticas['errores'] == 1
+    assert not cliente._vuelos
+
+
+def test_generar_con_fallo_al_crear_el_modelo_devuelve_alternativa(monkeypatch):
+    _fallar_creacion(monkeypatch)
+    cliente = ClienteIA()
+    respuesta = asyncio.run(asyncio.wait_for(cliente.generar('hola', alternativa='sin modelo'), 2))
+    assert respuesta.alternativa and respuesta.texto == 'sin modelo'
+    with pytest.raises(ImportError):
+        asyncio.run(cliente.generar('hola'))
+
+
+def test_generar_con_error_del_modelo_devuelve_alternativa():
+    cliente = ClienteIA(modelo=ModeloFalso(latencia=0.01, tasa_error=1.0))
+    respuesta = asyncio.run(cliente.generar('hola', alternativa='alternativa'))
+    assert respuesta.alternativa
+    assert cliente.estadisticas['errores'] == 1
+
+
+def test_plazo_agotado():
+    cliente = ClienteIA(modelo=ModeloFalso(latencia=1.0), timeout=0.05)
+    respuesta = asyncio.run(cliente.generar('hola', alternativa='tarde'))
+    assert respuesta.alternativa and respuesta.texto == 'tarde'
+    with pytest.raises(TimeoutError):
+        asyncio.run(_leer_flujo(cliente, 'otra'))
+    assert cliente.estadisticas['agotadas'] == 2
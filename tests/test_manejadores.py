@@ -0,0 +1,114 @@
+"""Manejadores de la IA: cuota por usuario, saturación y respuestas locales."""
+import asyncio
+
+import pytest
+
+from admision import ControlAdmision
+from cache_respuestas import CacheRespuestas
+from ia import ClienteIA, ModeloFalso
+
+LIMITES = {'ia': (0.0, 2), 'boton': (0.0, 2)}
+
+
+class Usuario:
+    def __init__(self, user_id):
+        self.id = user_id
+
+
+class Mensaje:
+    def __init__(self, user_id, texto):
+        self.from_user = Usuario(user_id)
+        self.text = texto
+        self.location = None
+        self.respuestas = []
+
+    async def reply_text(self, texto, **kwargs):
+        self.respuestas.append((texto, kwargs.get('reply_markup')))
+
+
+class Actualizacion:
+    def __init__(self, user_id, texto):
+        self.message = Mensaje(user_id, texto)
+
+
+@pytest.fixture
+def bot(monkeypatch):
+    # Importado aquí: DB_PATH ya apunta a la copia temporal (conftest.py)
+    import bot
+
+    async def save_query(*args):
+        pass
+    monkeypatch.setattr(bot, 'save_query', save_query)
+    # Modelo que nunca responde dentro del plazo
+    monkeypatch.setattr(bot, 'cliente_ia', ClienteIA(modelo=ModeloFalso(latencia=1.0), timeout=0.05))
+    monkeypatch.setattr(bot, 'cache_consultas', CacheRespuestas('consulta_ia', 'prueba'))
+    # Dos consultas al modelo por usuario, sin recarga
+    monkeypatch.setattr(bot, 'admision', ControlAdmision(limites=LIMITES))
+    if not bot.indice_riesgo.zonas:
+        bot.indice_riesgo.cargar()
+    if not bot.base_conocimiento.pasajes:
+        bot.base_conocimiento.cargar()
+    return bot
+
+
+def _saturar(bot, monkeypatch):
+    # Sin huecos ni cola: toda llamada al modelo se rechaza enseguida
+    monkeypatch.setattr(bot, 'admision', ControlAdmision(max_en_curso=0, max_en_espera=0, limites=LIMITES))
+
+
+def test_evaluacion_de_ubicacion_desconocida_con_plazo_agotado(bot):
+    update = Actualizacion(5001, 'Planeta Marte')
+    estado = asyncio.run(bot.evaluar_riesgo(update, None))
+    assert estado == bot.ConversationHandler.END
+    (evaluacion, _), (_, teclado) = update.message.respuestas
+    assert bot.EVALUACION_GENERAL in evaluacion
+    assert bot.AVISO_ORIENTATIVO in evaluacion
+    assert 'modelo de lenguaje' not in evaluacion
+    assert teclado is not None
+
+
+def test_preguntas_frecuentes_y_cache_no_gastan_la_cuota(bot):
+    bot.cache_consultas.guardar("¿Hubo réplicas anoche en Guamá?", "Sí, tres réplicas leves")
+
+    async def probar():
+        for _ in range(3):
+            update = Actualizacion(5002, "hubo replicas anoche en guama")
+            assert await bot.consulta_ia(update, None) == bot.ConversationHandler.END
+            assert update.message.respuestas[0][0] == "Sí, tres réplicas leves"
+            update = Actualizacion(5002, "¿Qué hago durante un sismo?")
+            assert await bot.consulta_ia(update, None) == bot.ConversationHandler.END
+            assert update.message.respuestas[0][0].startswith("Durante un sismo")
+        # La cuota sigue intacta para las preguntas que sí llegan al modelo
+        return bot.admision.permitir(5002)
+
+    assert asyncio.run(probar())
+    assert bot.admision.estadisticas['limitadas_usuario'] == 0
+
+
+def test_evaluaciones_de_zonas_conocidas_no_gastan_la_cuota(bot):
+    async def probar():
+        for _ in range(5):
+            update = Actualizacion(5003, "Palma Soriano")
+            assert await bot.evaluar_riesgo(update, None) == bot.ConversationHandler.END
+            assert 'Palma Soriano' in update.message.respuestas[0][0]
+
+    asyncio.run(probar())
+    assert bot.admision.estadisticas['limitadas_usuario'] == 0
+
+
+def test_consulta_saturada_termina_con_el_menu(bot, monkeypatch):
+    _saturar(bot, monkeypatch)
+    update = Actualizacion(5004, "¿Cuándo será el próximo terremoto?")
+    assert asyncio.run(bot.consulta_ia(update, None)) == bot.ConversationHandler.END
+    (saturado, _), (_, teclado) = update.message.respuestas
+    assert saturado.startswith("⏳")
+    assert teclado is not None
+
+
+def test_evaluacion_saturada_responde_la_evaluacion_general(bot, monkeypatch):
+    _saturar(bot, monkeypatch)
+    update = Actualizacion(5005, 'Planeta Marte')
+    assert asyncio.run(bot.evaluar_riesgo(update, None)) == bot.ConversationHandler.END
+    (evaluacion, _), (_, teclado) = update.message.respuestas
+    assert bot.EVALUACION_GENERAL in evaluacion
+    assert teclado is not None
@@ -0,0 +1,204 @@
+"""Medios: huella perceptual, triaje, deduplicación, límite de tamaño y pool de análisis."""
+import asyncio
+import io
+import os
+from collections import Counter
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import pytest
+
+import medios
+from base_datos import SQL_INSERTAR_MEDIO, BaseDatos, ColaEscritura, _migrar, ahora
+from medios import MEDIOS_DISTANCIA, ProcesadorMedios
+
+URL = 'https://api.telegram.test/file/'
+
+
+def _pixeles(semilla, oscura=False):
+    bloques = np.random.default_rng(semilla).integers(0, 255, (24, 32, 3))
+    if oscura:
+        bloques //= 10
+    return np.kron(bloques, np.ones((10, 10, 1))).astype(np.uint8)
+
+
+def _imagen(pixeles, formato='PNG', calidad=90):
+    from PIL import Image
+    salida = io.BytesIO()
+    Image.fromarray(pixeles).save(salida, formato, quality=calidad)
+    return salida.getvalue()
+
+
+def _guardar(tmp_path, nombre, contenido):
+    ruta = tmp_path / nombre
+    ruta.write_bytes(contenido)
+    return str(ruta)
+
+
+# ========== ANÁLISIS ==========
+def test_huella_de_una_imagen_recomprimida(tmp_path):
+    pytest.importorskip('PIL')
+    original = medios.huella_imagen(_guardar(tmp_path, 'a.png', _imagen(_pixeles(1))))
+    recomprimida = medios.huella_imagen(_guardar(tmp_path, 'a.jpg', _imagen(_pixeles(1), 'JPEG', 40)))
+    otra = medios.huella_imagen(_guardar(tmp_path, 'b.png', _imagen(_pixeles(2))))
+    assert (original ^ recomprimida).bit_count() <= MEDIOS_DISTANCIA
+    assert (original ^ otra).bit_count() > MEDIOS_DISTANCIA
+
+
+def test_clasificar_imagen(tmp_path):
+    pytest.importorskip('PIL')
+    degradado = np.repeat(np.linspace(60, 200, 320, dtype=np.uint8)[None, :, None], 240, 0).repeat(3, 2)
+    casos = {
+        'util': _imagen(_pixeles(1)),
+        'oscura': _imagen(_pixeles(1, oscura=True)),
+        'borrosa': _imagen(degradado),
+    }
+    for calidad, contenido in casos.items():
+        resultado = medios.clasificar_imagen(_guardar(tmp_path, f'{calidad}.png', contenido), 100, 40)
+        assert resultado['calidad'] == calidad
+        assert (resultado['ancho'], resultado['alto']) == (320, 240)
+
+
+# ========== PROCESADOR ==========
+class BotFalso:
+    """``get_file`` de la Bot API; ``tamanos`` da el file_size declarado de cada archivo."""
+
+    def __init__(self, archivos, tamanos=None):
+        self.archivos = archivos
+        self.tamanos = tamanos or {}
+
+    async def get_file(self, file_id):
+        tamano = self.tamanos.get(file_id, len(self.archivos[file_id]))
+        return SimpleNamespace(file_size=tamano, file_path=URL + file_id)
+
+
+class Entorno:
+    def __init__(self, tmp_path, archivos, tamanos=None, max_bytes=10 ** 6):
+        self.bd = BaseDatos(str(tmp_path / 'bot.db'))
+        self.bd.ejecutar_sync(_migrar)
+        self.descargas = Counter()
+        # Sin iniciar: la cola escribe directamente (ver ColaEscritura.encolar)
+        self.medios = ProcesadorMedios(
+            BotFalso(archivos, tamanos), self.bd, ColaEscritura(self.bd),
+            directorio=str(tmp_path / 'medios'), descargas=2, procesos=1, max_bytes=max_bytes,
+        )
+        self.archivos = archivos
+
+    def _servir(self, peticion):
+        file_id = peticion.url.path.rsplit('/', 1)[-1]
+        self.descargas[file_id] += 1
+        return httpx.Response(200, content=self.archivos[file_id])
+
+    async def iniciar(self):
+        await self.medios.iniciar()
+        await self.medios._http.aclose()
+        self.medios._http = httpx.AsyncClient(transport=httpx.MockTransport(self._servir))
+
+    async def enviar(self, user_id, tipo, file_id, file_unique_id):
+        """Registra el envío como el manejador y espera a que quede procesado."""
+        await self.bd.ejecutar(lambda conn: conn.execute(
+            SQL_INSERTAR_MEDIO, (user_id, tipo, file_id, file_unique_id, ahora())
+        ) and conn.commit())
+        self.medios.encolar(user_id, tipo, file_id, file_unique_id)
+        while True:
+            await asyncio.sleep(0.01)
+            r = self.medios.resumen()
+            if not (r['por_descargar'] or r['por_analizar'] or r['descargando'] or r['analizando']):
+                return
+
+    def estados(self):
+        return dict(self.bd.ejecutar_sync(lambda conn: conn.execute(
+            'SELECT file_unique_id, estado FROM medios'
+        ).fetchall()))
+
+    async def cerrar(self):
+        await self.medios.detener()
+        self.estados_finales = self.estados()
+        self.bd.cerrar()
+
+
+def test_reenvios_y_contenido_repetido_se_descargan_y_guardan_una_vez(tmp_path):
+    contenido = os.urandom(5000)
+    e = Entorno(tmp_path, {'f1': contenido, 'f2': contenido})
+
+    async def probar():
+        await e.iniciar()
+        try:
+            await e.enviar(1, 'voz', 'f1', 'u1')
+            # Reenvío: el mismo file_unique_id no se vuelve a descargar
+            await e.enviar(2, 'voz', 'f1', 'u1')
+            # Otro envío con el mismo contenido: se descarga, pero no se guarda dos veces
+            await e.enviar(3, 'voz', 'f2', 'u2')
+        finally:
+            await e.cerrar()
+
+    asyncio.run(probar())
+    assert e.descargas == Counter({'f1': 1, 'f2': 1})
+    assert e.medios.estadisticas['duplicados_id'] == 1
+    assert e.medios.estadisticas['duplicados_contenido'] == 1
+    guardados = [f for _, _, fs in os.walk(tmp_path / 'medios') for f in fs]
+    assert len(guardados) == 1
+    assert set(e.estados_finales.values()) == {'sin_analisis' if not medios.TRANSCRIPTOR else 'procesado'}
+
+
+def test_archivos_demasiado_grandes(tmp_path):
+    # «declarado» miente sobre su tamaño: el límite se aplica también en la descarga
+    e = Entorno(
+        tmp_path, {'grande': os.urandom(3000), 'declarado': os.urandom(3000)},
+        tamanos={'declarado': 100}, max_bytes=2000,
+    )
+
+    async def probar():
+        await e.iniciar()
+        try:
+            await e.enviar(1, 'foto', 'grande', 'u1')
+            await e.enviar(1, 'foto', 'declarado', 'u2')
+        finally:
+            await e.cerrar()
+
+    asyncio.run(probar())
+    assert e.descargas == Counter({'declarado': 1})
+    assert e.estados_finales == {'u1': 'demasiado_grande', 'u2': 'demasiado_grande'}
+    assert e.medios.estadisticas['demasiado_grandes'] == 2
+    assert not [f for _, _, fs in os.walk(tmp_path / 'medios') for f in fs]
+
+
+def test_foto_recomprimida_reutiliza_el_analisis_de_la_original(tmp_path):
+    pytest.importorskip('PIL')
+    e = Entorno(tmp_path, {
+        'original': _imagen(_pixeles(1)),
+        'recomprimida': _imagen(_pixeles(1), 'JPEG', 40),
+        'otra': _imagen(_pixeles(2)),
+    })
+
+    async def probar():
+        await e.iniciar()
+        try:
+            for i, file_id in enumerate(('original', 'recomprimida', 'otra')):
+                await e.enviar(i, 'foto', file_id, file_id)
+        finally:
+            await e.cerrar()
+
+    asyncio.run(probar())
+    assert e.medios.estadisticas['duplicados_perceptuales'] == 1
+    assert e.medios.estadisticas['analizados'] == 2
+    assert set(e.estados_finales.values()) == {'procesado'}
+
+
+def test_pool_roto_se_recrea(tmp_path):
+    e = Entorno(tmp_path, {})
+
+    async def probar():
+        try:
+            # Un proceso del pool muere (p. ej. sin memoria con un archivo corrupto)
+            with pytest.raises(BrokenProcessPool):
+                await e.medios._en_pool('prueba', os._exit, 1)
+            assert e.medios._pool is None
+            # El siguiente análisis arranca un pool nuevo
+            return await e.medios._en_pool('prueba', abs, -3)
+        finally:
+            await e.cerrar()
+
+    assert asyncio.run(probar()) == 3
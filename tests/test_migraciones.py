@@ -0,0 +1,80 @@
+"""Migraciones: la base de datos distribuida llega a la última versión y un fallo no la deja a medias."""
+import shutil
+import sqlite3
+
+import pytest
+
+import base_datos
+from base_datos import MIGRACIONES, BaseDatos, _migrar
+
+
+def _version(ruta):
+    conn = sqlite3.connect(ruta)
+    try:
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _columnas(ruta, tabla):
+    conn = sqlite3.connect(ruta)
+    try:
+        return {fila[1] for fila in conn.execute(f'PRAGMA table_info({tabla})')}
+    finally:
+        conn.close()
+
+
+def _migrar_en(ruta):
+    bd = BaseDatos(ruta)
+    try:
+        return bd.ejecutar_sync(_migrar)
+    finally:
+        bd.cerrar()
+
+
+def test_migra_la_base_de_datos_distribuida(tmp_path):
+    ruta = str(tmp_path / 'bot.db')
+    shutil.copy('sismos_bot.db', ruta)
+    assert _migrar_en(ruta) == 0
+    assert _version(ruta) == len(MIGRACIONES)
+    assert {'municipio'} <= _columnas(ruta, 'usuarios')
+    assert {'file_unique_id', 'sha256', 'estado'} <= _columnas(ruta, 'medios')
+    conn = sqlite3.connect(ruta)
+    try:
+        # _migracion_7: auto_vacuum INCREMENTAL (2) tras el VACUUM
+        assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+        assert conn.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+    finally:
+        conn.close()
+    # Volver a migrar no hace nada
+    assert _migrar_en(ruta) == len(MIGRACIONES)
+
+
+def test_migra_una_base_de_datos_vacia(tmp_path):
+    ruta = str(tmp_path / 'bot.db')
+    _migrar_en(ruta)
+    assert _version(ruta) == len(MIGRACIONES)
+    assert 'user_id' in _columnas(ruta, 'preferencias_envio')
+
+
+def test_migracion_fallida_se_deshace_entera(tmp_path, monkeypatch):
+    ruta = str(tmp_path / 'bot.db')
+    shutil.copy('sismos_bot.db', ruta)
+    migracion_6 = MIGRACIONES[5]
+
+    def migracion_rota(conn):
+        # Falla después de añadir parte de las columnas
+        conn.execute('ALTER TABLE medios ADD COLUMN file_unique_id TEXT')
+        raise sqlite3.OperationalError("fallo simulado")
+
+    monkeypatch.setattr(base_datos, 'MIGRACIONES', MIGRACIONES[:5] + [migracion_rota])
+    with pytest.raises(sqlite3.OperationalError, match="fallo simulado"):
+        _migrar_en(ruta)
+    assert _version(ruta) == 5
+    assert 'file_unique_id' not in _columnas(ruta, 'medios')
+
+    # La siguiente ejecución repite la migración sin «duplicate column name»
+    monkeypatch.setattr(base_datos, 'MIGRACIONES', MIGRACIONES[:5] + [migracion_6])
+    assert _migrar_en(ruta) == 5
+    assert _version(ruta) == 6
+    assert 'file_unique_id' in _columnas(ruta, 'medios')
@@ -0,0 +1,64 @@
+"""Padrón: reimportar un listado no borra lo que el CSV no trae."""
+import asyncio
+
+from base_datos import SQL_GUARDAR_USUARIO, BaseDatos, _migrar
+from padron import importar_csv
+
+
+def _usuario(bd, user_id):
+    return bd.ejecutar_sync(lambda conn: conn.execute(
+        'SELECT nombre, email, recibir_info, fecha_registro, municipio FROM usuarios WHERE user_id = ?',
+        (user_id,)
+    ).fetchone())
+
+
+def _base_datos(tmp_path):
+    bd = BaseDatos(str(tmp_path / 'bot.db'))
+    bd.ejecutar_sync(_migrar)
+
+    def alta(conn):
+        with conn:
+            conn.execute(SQL_GUARDAR_USUARIO, (
+                777, 'Ana', 'Pérez', 30, 'Femenino', 'Universitario', 'Palma Soriano',
+                'ana@example.com', 'Sí', '2024-01-01 00:00:00', 'Palma Soriano',
+            ))
+    bd.ejecutar_sync(alta)
+    return bd
+
+
+def test_reimportar_sin_columnas_opcionales_conserva_la_suscripcion(tmp_path):
+    bd = _base_datos(tmp_path)
+    ruta = tmp_path / 'oficina.csv'
+    ruta.write_text(
+        'user_id,nombre,apellidos,edad,sexo,nivel_academico,residencia\n'
+        '777,Ana María,Pérez,31,Femenino,Universitario,Palma Soriano\n'
+        '778,Luis,Gómez,40,Masculino,Técnico,Contramaestre\n',
+        encoding='utf-8'
+    )
+    try:
+        resumen = asyncio.run(importar_csv(bd, str(ruta)))
+        assert (resumen['importadas'], resumen['nuevas']) == (2, 1)
+        assert _usuario(bd, 777) == (
+            'Ana María', 'ana@example.com', 'Sí', '2024-01-01 00:00:00', 'Palma Soriano'
+        )
+        # Los nuevos toman los valores por defecto
+        assert _usuario(bd, 778)[1:3] == (None, 'No')
+    finally:
+        bd.cerrar()
+
+
+def test_reimportar_actualiza_las_columnas_presentes_menos_el_alta(tmp_path):
+    bd = _base_datos(tmp_path)
+    ruta = tmp_path / 'oficina.csv'
+    ruta.write_text(
+        'user_id;nombre;apellidos;edad;sexo;nivel_academico;residencia;recibir_info;fecha_registro\n'
+        '777;Ana;Pérez;30;Femenino;Universitario;Palma Soriano;no;2025-06-01 00:00:00\n',
+        encoding='utf-8'
+    )
+    try:
+        asyncio.run(importar_csv(bd, str(ruta)))
+        assert _usuario(bd, 777) == (
+            'Ana', 'ana@example.com', 'No', '2024-01-01 00:00:00', 'Palma Soriano'
+        )
+    finally:
+        bd.cerrar()
@@ -0,0 +1,86 @@
+"""Orden por usuario y concurrencia entre usuarios de ``ProcesadorPorUsuario``."""
+import asyncio
+from types import SimpleNamespace
+
+from procesador import ProcesadorPorUsuario
+
+
+def _update(uid):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=uid), effective_chat=None)
+
+
+def test_mismo_usuario_en_orden_y_de_uno_en_uno():
+    async def probar():
+        procesador = ProcesadorPorUsuario(8)
+        orden, en_curso, maximo = [], 0, 0
+
+        async def manejar(i):
+            nonlocal en_curso, maximo
+            en_curso += 1
+            maximo = max(maximo, en_curso)
+            # El primero tarda más: el segundo no debe adelantarlo
+            await asyncio.sleep(0.05 if i == 0 else 0)
+            orden.append(i)
+            en_curso -= 1
+
+        await asyncio.gather(*(procesador.process_update(_update(7), manejar(i)) for i in range(5)))
+        return orden, maximo, procesador
+
+    orden, maximo, procesador = asyncio.run(probar())
+    assert orden == [0, 1, 2, 3, 4]
+    assert maximo == 1
+    assert procesador.esperas == 4
+    assert procesador.usuarios_en_curso == 0
+
+
+def test_un_usuario_en_espera_no_ocupa_plazas():
+    async def probar():
+        procesador = ProcesadorPorUsuario(2)
+        liberar = asyncio.Event()
+        atendidos = []
+
+        async def lento():
+            await liberar.wait()
+
+        async def rapido(uid):
+            atendidos.append(uid)
+
+        # Un usuario con muchas actualizaciones pendientes, bloqueado en la primera
+        inundacion = [asyncio.create_task(procesador.process_update(_update(1), lento())) for _ in range(10)]
+        await asyncio.sleep(0)
+        # Los demás siguen teniendo plaza
+        await asyncio.wait_for(
+            asyncio.gather(*(procesador.process_update(_update(uid), rapido(uid)) for uid in (2, 3))), 1
+        )
+        en_curso = procesador.current_concurrent_updates
+        liberar.set()
+        await asyncio.gather(*inundacion)
+        return atendidos, en_curso, procesador.current_concurrent_updates
+
+    atendidos, en_curso, al_final = asyncio.run(probar())
+    assert sorted(atendidos) == [2, 3]
+    assert en_curso == 1
+    assert al_final == 0
+
+
+def test_el_limite_de_ptb_se_respeta_entre_usuarios():
+    async def probar():
+        procesador = ProcesadorPorUsuario(2)
+        en_curso, maximo = 0, 0
+
+        async def manejar():
+            nonlocal en_curso, maximo
+            en_curso += 1
+            maximo = max(maximo, en_curso)
+            await asyncio.sleep(0.01)
+            en_curso -= 1
+
+        # Usuarios distintos y actualizaciones sin usuario ni chat
+        sin_usuario = SimpleNamespace(effective_user=None, effective_chat=None)
+        await asyncio.gather(
+            *(procesador.process_update(_update(uid), manejar()) for uid in range(6)),
+            *(procesador.process_update(sin_usuario, manejar()) for _ in range(3)),
+        )
+        return maximo, procesador.current_concurrent_updates
+
+    assert asyncio.run(probar()) == (2, 0)
@@ -0,0 +1,198 @@
+"""Envíos programados: ventana de entrega, agrupación por localidad, seguimientos sin repetir y prioridad de las alertas."""
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from base_datos import SQL_GUARDAR_USUARIO, BaseDatos, _migrar, ahora
+from programacion import (
+    SEGUIMIENTO, Planificador, _crear_aviso, _guardar_preferencias, _resumenes_debidos,
+)
+
+MUY_ATRAS = '2000-01-01 00:00:00'
+
+
+class BotFalso:
+    def __init__(self):
+        self.enviados = Counter()
+        self.textos = {}
+
+    async def send_message(self, chat_id, text):
+        self.enviados[chat_id] += 1
+        self.textos[chat_id] = text
+
+
+class IndiceFalso:
+    zonas = {}
+    centros = {}
+
+    def resolver(self, texto):
+        return None
+
+
+def _base_datos(tmp_path, usuarios):
+    """``usuarios``: ``user_id -> (residencia, municipio, recibir_info)``."""
+    bd = BaseDatos(str(tmp_path / 'bot.db'))
+    bd.ejecutar_sync(_migrar)
+    filas = [
+        (uid, 'Nombre', 'Apellido', 30, 'Femenino', 'Universitario', residencia,
+         None, recibir_info, '2020-01-01 00:00:00', municipio)
+        for uid, (residencia, municipio, recibir_info) in usuarios.items()
+    ]
+
+    def guardar(conn):
+        with conn:
+            conn.executemany(SQL_GUARDAR_USUARIO, filas)
+    bd.ejecutar_sync(guardar)
+    return bd
+
+
+def _planificador(bd, bot, alertas=None):
+    return Planificador(
+        bot, bd, alertas, SimpleNamespace(total=0), IndiceFalso(), tasa=1000, ventana='8-20', zona='UTC'
+    )
+
+
+def test_ventana_de_entrega(tmp_path):
+    bd = _base_datos(tmp_path, {
+        1: ('Songo', None, 'Sí'),
+        2: ('Songo', None, 'si'),
+        3: ('Songo', None, 'Sí'),
+        4: ('Songo', None, 'Sí'),
+        5: ('Songo', None, 'No'),
+    })
+    try:
+        # 1: ventana por defecto; 2: nocturna; 3: sin resúmenes (/horario no);
+        # 4: solo cambió los resúmenes y conserva la ventana por defecto
+        bd.ejecutar_sync(_guardar_preferencias, 2, 20, 24, 1)
+        bd.ejecutar_sync(_guardar_preferencias, 3, None, None, 0)
+        bd.ejecutar_sync(_guardar_preferencias, 4, None, None, 1)
+
+        def debidos(hora):
+            filas = bd.ejecutar_sync(_resumenes_debidos, hora, (8, 20), '2100-01-01 00:00:00', 100)
+            return {uid for _, uid in filas}
+
+        assert debidos(8) == {1, 4}
+        assert debidos(19) == {1, 4}
+        assert debidos(20) == {2}
+        assert debidos(23) == {2}
+        assert debidos(3) == set()
+        # Nadie recibió un resumen (ni se registró) antes del límite: no hay ninguno debido
+        assert bd.ejecutar_sync(_resumenes_debidos, 9, (8, 20), MUY_ATRAS, 100) == []
+    finally:
+        bd.cerrar()
+
+
+def test_un_texto_por_localidad(tmp_path):
+    bd = _base_datos(tmp_path, {
+        1: ('Reparto Sueño', 'Santiago de Cuba', 'Sí'),
+        2: ('Vista Alegre', 'Santiago de Cuba', 'Sí'),
+        3: ('  Songo ', None, 'Sí'),
+        4: ('Songo', None, 'Sí'),
+        5: ('Palma', 'Palma Soriano', 'Sí'),
+    })
+    bot = BotFalso()
+
+    async def probar():
+        plan = _planificador(bd, bot)
+        enviados = await plan._enviar_resumenes(9, 100)
+        # Ya marcados: el siguiente paso no los repite
+        return plan, enviados, await plan._enviar_resumenes(9, 100)
+
+    try:
+        plan, enviados, repetidos = asyncio.run(probar())
+    finally:
+        bd.cerrar()
+    assert (enviados, repetidos) == (5, 0)
+    assert plan.estadisticas['textos'] == 3
+    assert plan.estadisticas['resumenes'] == 5
+    assert bot.textos[1] == bot.textos[2] and 'Santiago de Cuba' in bot.textos[1]
+    assert bot.textos[3] == bot.textos[4] and 'para Songo' in bot.textos[3]
+    assert 'Palma Soriano' in bot.textos[5]
+
+
+def test_seguimiento_una_vez_por_usuario(tmp_path):
+    bd = _base_datos(tmp_path, {uid: ('Songo', 'Songo-La Maya', 'Sí') for uid in range(1, 6)} | {
+        6: ('Palma', 'Palma Soriano', 'Sí'),
+        7: ('Songo', 'Songo-La Maya', 'No'),
+    })
+    bot = BotFalso()
+    caduca = (datetime.now() + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S")
+    clave = 'seguimiento:Songo-La Maya:sismo1'
+    assert bd.ejecutar_sync(_crear_aviso, clave, SEGUIMIENTO, 'Songo-La Maya', 'Sismo M4.5', caduca) == 1
+    # El mismo sismo detectado en otro paso no crea otro aviso
+    assert bd.ejecutar_sync(_crear_aviso, clave, SEGUIMIENTO, 'Songo-La Maya', 'Sismo M4.5', caduca) == 0
+
+    async def probar():
+        plan = _planificador(bd, bot)
+        # La cuota corta el paso a medias: el siguiente sigue donde quedó
+        pasos = [await plan._enviar_seguimientos(9, ahora(), 3) for _ in range(3)]
+        return plan, pasos
+
+    try:
+        plan, pasos = asyncio.run(probar())
+    finally:
+        bd.cerrar()
+    assert pasos == [3, 2, 0]
+    assert bot.enviados == Counter({uid: 1 for uid in range(1, 6)})
+    assert plan.estadisticas['seguimientos'] == 5
+
+
+def test_las_alertas_detienen_los_envios_programados(tmp_path):
+    bd = _base_datos(tmp_path, {uid: ('Songo', None, 'Sí') for uid in range(1, 4)})
+    bot = BotFalso()
+    alertas = SimpleNamespace(activas=1)
+
+    async def probar():
+        plan = _planificador(bd, bot, alertas)
+        # Con una alerta en curso el paso entero se cede
+        await plan.ejecutar_paso()
+        assert plan.estadisticas['pasos_cedidos'] == 1 and not bot.enviados
+
+        # Una alerta que empieza a mitad de un paso lo detiene hasta que termina
+        alertas.activas = 0
+        enviar = bot.send_message
+
+        async def enviar_y_alertar(chat_id, text):
+            await enviar(chat_id, text)
+            bot.send_message = enviar
+            alertas.activas = 1
+        bot.send_message = enviar_y_alertar
+        tarea = asyncio.create_task(plan._enviar_resumenes(9, 100))
+        await asyncio.sleep(0.3)
+        assert sum(bot.enviados.values()) == 1
+        alertas.activas = 0
+        await tarea
+        assert plan.estadisticas['esperas_prioridad'] >= 1
+
+    try:
+        asyncio.run(probar())
+    finally:
+        bd.cerrar()
+    assert bot.enviados == Counter({1: 1, 2: 1, 3: 1})
+
+
+def test_difusion_de_otro_proceso(tmp_path):
+    bd = _base_datos(tmp_path, {})
+
+    def difusion(creada):
+        def insertar(conn):
+            with conn:
+                conn.execute(
+                    "INSERT INTO difusiones (mensaje, estado, creada) VALUES ('Alerta', 'en_curso', ?)", (creada,)
+                )
+        bd.ejecutar_sync(insertar)
+
+    async def en_curso():
+        return await _planificador(bd, BotFalso())._alerta_en_curso()
+
+    try:
+        assert not asyncio.run(en_curso())
+        # Una difusión abandonada hace horas no bloquea los envíos para siempre
+        difusion((datetime.now() - timedelta(hours=3)).strftime("%Y-%m-%d %H:%M:%S"))
+        assert not asyncio.run(en_curso())
+        # Una lanzada por reparto.py hace un momento sí
+        difusion(ahora())
+        assert asyncio.run(en_curso())
+    finally:
+        bd.cerrar()
@@ -0,0 +1,45 @@
+"""Índice de riesgo: evaluaciones orientativas y alias que no confunden lugares de otras provincias."""
+import pytest
+
+from riesgo import AVISO_ORIENTATIVO, IndiceRiesgo, formatear_evaluacion
+
+
+def test_evaluacion_orientativa_con_fuente():
+    indice = IndiceRiesgo()
+    indice.cargar()
+    zona = indice.resolver('Palma Soriano').zona
+    assert 'orientativo' in formatear_evaluacion(zona)
+    aviso = indice.aviso()
+    assert aviso.startswith(AVISO_ORIENTATIVO)
+    assert indice.fuente and indice.fuente in aviso
+
+
+@pytest.mark.parametrize('texto', [
+    'Puerto Padre',
+    'Caney de las Mercedes',
+    'Holguín, calle José Martí',
+    'Palma de Mallorca',
+    'Vista Alegre, Holguín',
+    'San Luis, Pinar del Río',
+    'Santiago de las Vegas',
+    'Calle 30 de Noviembre, Bayamo',
+])
+def test_lugares_de_otras_provincias_no_se_resuelven(texto):
+    indice = IndiceRiesgo()
+    indice.cargar()
+    assert indice.resolver(texto) is None
+
+
+@pytest.mark.parametrize('texto, zona', [
+    ('Palma', 'palma_soriano'),
+    ('Caney', 'el_caney'),
+    ('Puerto, Santiago', 'puerto'),
+    ('Reparto José Martí, Santiago de Cuba', 'jose_marti'),
+    ('Calle 5, Santiago', 'stgo'),
+    ('San Luis', 'san_luis'),
+    ('Santigo de Cuba', 'stgo'),
+])
+def test_alias_ambiguos_solos_o_con_contexto_de_santiago(texto, zona):
+    indice = IndiceRiesgo()
+    indice.cargar()
+    assert indice.resolver(texto).zona.id == zona
@@ -0,0 +1,217 @@
+"""Vigilancia del bucle de eventos y perfilador por muestreo.
+
+``VigilanteBucle`` programa un latido en el bucle cada ``VIGILANCIA_INTERVALO``
+segundos y mide su retraso (histograma ``bot_bucle_retraso_segundos``). Un
+hilo aparte comprueba el último latido: si el bucle lleva más de
+``VIGILANCIA_UMBRAL`` segundos sin latir, algo síncrono lo tiene ocupado
+(SQLite fuera de su hilo, una llamada bloqueante, CPU…) y el hilo captura en
+ese momento la pila del hilo del bucle, junto con el manejador y la
+actualización que se estaban atendiendo (ver ``metricas.EN_CURSO``), y la
+registra. El coste en marcha es un temporizador y una resta por intervalo,
+así que puede quedar activo en producción.
+
+``Perfilador`` toma muestras de las pilas de todos los hilos durante una
+ventana (/perfil) y las escribe en formato plegado (``pila;de;llamadas N``),
+que leen flamegraph.pl, speedscope o inferno.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+from metricas import EN_CURSO, registro
+
+logger = logging.getLogger(__name__)
+
+# 0 desactiva la vigilancia
+VIGILANCIA_UMBRAL = float(os.getenv('VIGILANCIA_UMBRAL', '0.25'))
+VIGILANCIA_INTERVALO = float(os.getenv('VIGILANCIA_INTERVALO', '0.1'))
+# Marcos de la pila que se registran en cada bloqueo
+VIGILANCIA_MARCOS = int(os.getenv('VIGILANCIA_MARCOS', '25'))
+PERFIL_RUTA = os.getenv('PERFIL_RUTA', 'datos/perfiles')
+PERFIL_FRECUENCIA = float(os.getenv('PERFIL_FRECUENCIA', '100'))
+PERFIL_MAX_SEGUNDOS = 300
+
+RETRASO_BUCLE = registro.histograma(
+    'bot_bucle_retraso_segundos',
+    'Retraso del latido del bucle de eventos sobre lo programado',
+    limites=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+
+# Funciones en las que un hilo está esperando, no trabajando
+_ESPERAS = {
+    ('selectors.py', 'select'),
+    ('threading.py', 'wait'),
+    ('queue.py', 'get'),
+    ('thread.py', '_worker'),
+}
+
+
+def _en_espera(marco) -> bool:
+    codigo = marco.f_code
+    return (os.path.basename(codigo.co_filename), codigo.co_name) in _ESPERAS
+
+
+def describir_tarea(tarea) -> str:
+    """Manejador y actualización que atiende la tarea, si los hay."""
+    if tarea is None:
+        return "fuera de cualquier tarea (callback del bucle)"
+    en_curso = EN_CURSO.get(tarea)
+    if en_curso is None:
+        return f"tarea {tarea.get_name()}"
+    nombre, update_id, inicio = en_curso
+    return f"manejador {nombre} (update {update_id}, iniciado hace {time.perf_counter() - inicio:.2f}s)"
+
+
+# ========== VIGILANTE DEL BUCLE ==========
+class VigilanteBucle:
+    """Mide el retraso del bucle y registra la pila de cada bloqueo largo."""
+
+    def __init__(self, umbral: float = VIGILANCIA_UMBRAL, intervalo: float = VIGILANCIA_INTERVALO):
+        self.umbral = umbral
+        self.intervalo = intervalo
+        self._bucle = None
+        self._hilo_bucle = None
+        self._hilo = None
+        self._parar = threading.Event()
+        self._ultimo_latido = 0.0
+        self._temporizador = None
+        # Se captura una sola pila por bloqueo
+        self._capturado = False
+        self.estadisticas = {
+            'bloqueos': 0,
+            'bloqueado_s': 0.0,
+            'bloqueo_max_s': 0.0,
+            'retraso_max_s': 0.0,
+        }
+
+    def iniciar(self):
+        if not self.umbral:
+            return
+        self._bucle = asyncio.get_running_loop()
+        self._hilo_bucle = threading.get_ident()
+        self._ultimo_latido = time.perf_counter()
+        self._temporizador = self._bucle.call_later(self.intervalo, self._latido)
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._vigilar, name='vigilante-bucle', daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        if self._hilo is None:
+            return
+        self._parar.set()
+        self._temporizador.cancel()
+        self._hilo.join()
+        self._hilo = None
+
+    def _latido(self):
+        ahora = time.perf_counter()
+        retraso = max(0.0, ahora - self._ultimo_latido - self.intervalo)
+        RETRASO_BUCLE.observar(retraso)
+        self.estadisticas['retraso_max_s'] = max(self.estadisticas['retraso_max_s'], retraso)
+        if retraso > self.umbral:
+            self.estadisticas['bloqueos'] += 1
+            self.estadisticas['bloqueado_s'] += retraso
+            self.estadisticas['bloqueo_max_s'] = max(self.estadisticas['bloqueo_max_s'], retraso)
+            logger.warning(f"Bucle de eventos bloqueado {retraso:.2f}s")
+        # Primero el latido y después la marca: el hilo vigilante no debe ver
+        # la marca limpia con el latido anterior
+        self._ultimo_latido = ahora
+        self._capturado = False
+        self._temporizador = self._bucle.call_later(self.intervalo, self._latido)
+
+    def _vigilar(self):
+        while not self._parar.wait(self.intervalo):
+            parado = time.perf_counter() - self._ultimo_latido - self.intervalo
+            if parado > self.umbral and not self._capturado:
+                self._capturado = True
+                self._capturar(parado)
+
+    def _capturar(self, parado):
+        marco = sys._current_frames().get(self._hilo_bucle)
+        if marco is None:
+            return
+        tarea = asyncio.current_task(self._bucle)
+        pila = ''.join(traceback.format_stack(marco)[-VIGILANCIA_MARCOS:])
+        logger.warning(
+            f"Bucle de eventos sin responder desde hace {parado:.2f}s en "
+            f"{describir_tarea(tarea)}; pila del hilo del bucle:\n{pila}"
+        )
+
+    def resumen(self) -> dict:
+        return dict(self.estadisticas)
+
+
+# ========== PERFILADOR POR MUESTREO ==========
+def _plegar(marco) -> str:
+    funciones = []
+    while marco is not None:
+        codigo = marco.f_code
+        funciones.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{marco.f_lineno})")
+        marco = marco.f_back
+    return ';'.join(reversed(funciones))
+
+
+class Perfilador:
+    """Muestrea las pilas de todos los hilos y las guarda en formato plegado."""
+
+    def __init__(self, ruta: str = PERFIL_RUTA, frecuencia: float = PERFIL_FRECUENCIA):
+        self.ruta = ruta
+        self.frecuencia = frecuencia
+        self.en_curso = False
+
+    def _muestrear(self, segundos):
+        propio = threading.get_ident()
+        pilas = Counter()
+        muestras = inactivas = 0
+        fin = time.perf_counter() + segundos
+        while time.perf_counter() < fin:
+            nombres = {h.ident: h.name for h in threading.enumerate()}
+            for ident, marco in sys._current_frames().items():
+                if ident == propio:
+                    continue
+                muestras += 1
+                # Hilos esperando (bucle sin trabajo, pool ocioso): no cuentan
+                if _en_espera(marco):
+                    inactivas += 1
+                    continue
+                pilas[f"{nombres.get(ident, ident)};{_plegar(marco)}"] += 1
+            time.sleep(1 / self.frecuencia)
+        return pilas, muestras, inactivas
+
+    async def perfilar(self, segundos: float) -> dict:
+        """Muestrea durante ``segundos`` y devuelve la ruta del perfil y un resumen."""
+        if self.en_curso:
+            raise RuntimeError("ya hay un perfil en curso")
+        self.en_curso = True
+        try:
+            segundos = min(max(segundos, 1), PERFIL_MAX_SEGUNDOS)
+            pilas, muestras, inactivas = await asyncio.to_thread(self._muestrear, segundos)
+            os.makedirs(self.ruta, exist_ok=True)
+            ruta = os.path.join(self.ruta, f"perfil-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+            await asyncio.to_thread(self._escribir, ruta, pilas)
+        finally:
+            self.en_curso = False
+        # Tiempo propio: la función en lo alto de cada pila
+        propias = Counter()
+        for pila, n in pilas.items():
+            propias[pila.rsplit(';', 1)[-1]] += n
+        activas = muestras - inactivas
+        logger.info(f"Perfil de {segundos:.0f}s guardado en {ruta}: {activas} muestras activas")
+        return {
+            'ruta': ruta,
+            'segundos': segundos,
+            'muestras': muestras,
+            'activas': activas,
+            'mas_costosas': propias.most_common(5),
+        }
+
+    @staticmethod
+    def _escribir(ruta, pilas):
+        with open(ruta, 'w', encoding='utf-8') as f:
+            for pila, n in pilas.most_common():
+                f.write(f"{pila} {n}\n")